@@ -0,0 +1,66 @@
+"""
+Indian-English amount in words ("Twelve Lakh, Thirty-Four Thousand, Five
+Hundred And Sixty-Seven Only") for receipts.
+
+Produces exactly what the receipts have always shown, i.e.
+num2words(n, lang="en_IN").title() + " Only", without going through
+num2words' generic split/merge machinery on every call. Every amount is
+built from sub-thousand chunks (memoised, 1000 entries at most) joined by
+crore / lakh / thousand, and whole amounts are kept in a bounded LRU since
+the same instalment amounts recur across receipts and imports.
+"""
+
+from functools import lru_cache
+
+# num2words (en_IN) refuses amounts from 1000 crore up
+MAX_AMOUNT = 10 ** 10
+
+# Whole amounts remembered per worker
+CACHE_SIZE = 4096
+
+_ONES = ("zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten",
+         "eleven", "twelve", "thirteen", "fourteen", "fifteen", "sixteen", "seventeen", "eighteen",
+         "nineteen")
+_TENS = ("", "", "twenty", "thirty", "forty", "fifty", "sixty", "seventy", "eighty", "ninety")
+
+_SCALES = ((10 ** 7, "crore"), (10 ** 5, "lakh"), (1000, "thousand"))
+
+
+@lru_cache(maxsize=1000)
+def _chunk(n):
+    """Words for 0 <= n < 1000 (lower case)."""
+    if n < 20:
+        return _ONES[n]
+    if n < 100:
+        tens, unit = divmod(n, 10)
+        return f"{_TENS[tens]}-{_ONES[unit]}" if unit else _TENS[tens]
+    hundreds, rest = divmod(n, 100)
+    words = f"{_ONES[hundreds]} hundred"
+    return f"{words} and {_chunk(rest)}" if rest else words
+
+
+def _words(n):
+    """Words for 0 <= n < MAX_AMOUNT (lower case), num2words' grouping and separators."""
+    for scale, name in _SCALES:
+        if n >= scale:
+            count, rest = divmod(n, scale)
+            words = f"{_chunk(count)} {name}"
+            if not rest:
+                return words
+            # A remainder under 100 is joined with "and", anything larger with a comma
+            return f"{words} and {_chunk(rest)}" if rest < 100 else f"{words}, {_words(rest)}"
+    return _chunk(n)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def rupees_in_words(amount):
+    """
+    "<Words> Only" for an integer amount. Raises OverflowError at or above
+    MAX_AMOUNT (callers fall back to the figure, as with num2words).
+    """
+    if abs(amount) >= MAX_AMOUNT:
+        raise OverflowError(f"abs({amount}) must be less than {MAX_AMOUNT}.")
+    words = _words(abs(amount))
+    if amount < 0:
+        words = f"minus {words}"
+    return words.title() + " Only"
@@ -0,0 +1,110 @@
+"""
+In-process caches validated against the per-tenant data_versions counters.
+
+A VersionedCache entry remembers the versions of the tables it was computed
+from. Reads cost one primary-key lookup on data_versions:
+
+- versions unchanged  -> cached value is returned as-is
+- versions moved on   -> the stale value is returned immediately and a
+                         background thread recomputes it (stale-while-revalidate)
+- no entry yet        -> computed inline once
+
+Write routes already bump data_versions in their transaction, so they
+invalidate every worker's cache without talking to it directly.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import database
+import data_versions
+
+
+class _Entry:
+    __slots__ = ("versions", "value", "computed_at")
+
+    def __init__(self, versions, value):
+        self.versions = versions
+        self.value = value
+        self.computed_at = time.time()
+
+
+class VersionedCache:
+    """Tenant-scoped, version-validated cache with stale-while-revalidate."""
+
+    def __init__(self, name, tables, max_entries=256):
+        self.name = name
+        self.tables = tuple(tables)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        """
+        Return the cached value for `key` in the current tenant.
+
+        `compute(db_config)` must open its own connection with
+        `database.get_db_connection(db_config)`, because stale entries are
+        recomputed on a background thread where flask.g is not available.
+        """
+        db_config = database.get_tenant_db_config()
+        cache_key = (database.get_tenant_key(db_config), key)
+        versions = self._current_versions()
+
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+
+        if entry is not None and entry.versions == versions:
+            return entry.value
+
+        if entry is not None:
+            self._refresh_in_background(cache_key, versions, compute, db_config)
+            return entry.value
+
+        value = compute(db_config)
+        self._store(cache_key, versions, value)
+        return value
+
+    def invalidate(self, key=None):
+        """Drop `key` (or every key) for the current tenant in this process."""
+        tenant = database.get_tenant_key()
+        with self._lock:
+            for cache_key in list(self._entries):
+                if cache_key[0] == tenant and (key is None or cache_key[1] == key):
+                    del self._entries[cache_key]
+
+    def _current_versions(self):
+        versions = data_versions.get_versions(self.tables)
+        return tuple(versions[t] for t in self.tables)
+
+    def _store(self, cache_key, versions, value):
+        with self._lock:
+            current = self._entries.get(cache_key)
+            # Never let a slow refresh overwrite a newer result
+            if current is not None and current.versions > versions:
+                return
+            self._entries[cache_key] = _Entry(versions, value)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _refresh_in_background(self, cache_key, versions, compute, db_config):
+        with self._lock:
+            if cache_key in self._refreshing:
+                return
+            self._refreshing.add(cache_key)
+
+        def worker():
+            try:
+                self._store(cache_key, versions, compute(db_config))
+            except Exception as e:
+                print(f"{self.name} cache refresh failed for {cache_key}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(cache_key)
+
+        threading.Thread(target=worker, name=f"{self.name}-refresh", daemon=True).start()
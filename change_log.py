@@ -0,0 +1,203 @@
+"""
+Append-only change feed of receipts and commissions (/api/changes).
+
+Every receipt or commission insert, update and delete made through the app
+(receipt forms, approvals, bulk deletes, imports, commission saves) appends
+one row per affected record to `change_log` inside the write's own
+transaction, with a JSON snapshot of the record as it stands after the
+change (before it, for deletes). PAN / Aadhaar are never copied.
+
+Accounting syncs page through the log in `seq` order with an opaque cursor
+("v1.<seq>"), so a weekly Tally / Excel refresh only transfers what changed.
+AUTO_INCREMENT values are handed out before commit, so a young gap in `seq`
+may still be filled by a transaction in flight: a page stops at such a gap
+until it is SETTLE_SECONDS old, which keeps the cursor from skipping rows.
+"""
+
+import json
+
+import database
+import project_ids
+from exports import RECEIPT_COLUMNS
+
+# MySQL error code for "Table doesn't exist"
+_ER_NO_SUCH_TABLE = 1146
+
+RECEIPT = "receipt"
+COMMISSION = "commission"
+
+INSERT = "insert"
+UPDATE = "update"
+DELETE = "delete"
+
+# Page size of /api/changes (default, upper bound)
+PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+# A gap in seq younger than this may belong to an uncommitted transaction
+SETTLE_SECONDS = 60
+
+_CURSOR_PREFIX = "v1."
+
+CREATE_SQL = """
+    CREATE TABLE IF NOT EXISTS change_log (
+        seq BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        entity VARCHAR(20) NOT NULL,
+        entity_id INT NOT NULL,
+        op VARCHAR(10) NOT NULL,
+        changed_by VARCHAR(255) NULL,
+        changed_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+        data JSON NULL,
+        KEY idx_change_log_entity (entity, entity_id)
+    )
+"""
+
+COMMISSION_COLUMNS = (
+    "id", "project_name", "plot_no", "sq_yards", "original_price", "negotiated_price", "total_amount",
+    "agreement_percentage", "balance_amount", "cgm_name", "cgm_total", "cgm_at_agreement",
+    "cgm_at_registration", "created_by", "created_at",
+)
+
+# (snapshot key, entries table) of the per-person role commissions
+_ROLE_ENTRY_TABLES = (
+    ("srgm_entries", "commission_srgm_entries"),
+    ("gm_entries", "commission_gm_entries"),
+    ("dgm_entries", "commission_dgm_entries"),
+    ("agm_entries", "commission_agm_entries"),
+)
+
+
+def _json_object(columns, alias):
+    # The project is snapshotted under its current name, not the one the row was written under
+    values = (project_ids.name_sql(alias) if col == "project_name" else f"{alias}.{col}" for col in columns)
+    return "JSON_OBJECT(" + ", ".join(f"'{col}', {value}" for col, value in zip(columns, values)) + ")"
+
+
+def _receipt_snapshot():
+    return _json_object([col for col, _ in RECEIPT_COLUMNS], "r")
+
+
+def _commission_snapshot():
+    entries = ", ".join(
+        f"'{key}', (SELECT JSON_ARRAYAGG(JSON_OBJECT('name', e.name, 'total_amount', e.total_amount, "
+        f"'at_agreement', e.at_agreement, 'at_registration', e.at_registration)) "
+        f"FROM {table} e WHERE e.commission_id = c.id)"
+        for key, table in _ROLE_ENTRY_TABLES
+    )
+    return f"JSON_MERGE_PATCH({_json_object(COMMISSION_COLUMNS, 'c')}, JSON_OBJECT({entries}))"
+
+
+def _record(cursor, entity, op, select_sql, params, changed_by):
+    sql = f"INSERT INTO change_log (entity, entity_id, op, changed_by, data) {select_sql}"
+    params = (entity, op, changed_by, *params)
+    try:
+        cursor.execute(sql, params)
+    except database.Error as e:
+        if getattr(e, 'errno', None) != _ER_NO_SUCH_TABLE:
+            raise
+        print("Auto-migrating: Creating change_log table...")
+        cursor.execute(CREATE_SQL)
+        cursor.execute(sql, params)
+
+
+def record_receipts(cursor, op, where_sql, params, changed_by=None):
+    """
+    Log `op` for every receipt matching `where_sql` (columns of `receipts r`)
+    using the caller's cursor, before it commits. For deletes call this
+    before the DELETE so the snapshot still has the row.
+    """
+    _record(cursor, RECEIPT, op,
+            f"SELECT %s, r.id, %s, %s, {_receipt_snapshot()} FROM receipts r WHERE {where_sql} ORDER BY r.id",
+            params, changed_by)
+
+
+def record_commissions(cursor, op, where_sql, params, changed_by=None):
+    """As record_receipts, for `commissions c` (role entries included in the snapshot)."""
+    _record(cursor, COMMISSION, op,
+            f"SELECT %s, c.id, %s, %s, {_commission_snapshot()} FROM commissions c WHERE {where_sql} ORDER BY c.id",
+            params, changed_by)
+
+
+def encode_cursor(seq):
+    return f"{_CURSOR_PREFIX}{int(seq)}"
+
+
+def decode_cursor(token):
+    """seq after which to continue; 0 for a missing token. Raises ValueError for a malformed one."""
+    if not token:
+        return 0
+    if not token.startswith(_CURSOR_PREFIX):
+        raise ValueError(f"Unrecognised cursor {token!r}")
+    seq = int(token[len(_CURSOR_PREFIX):])
+    if seq < 0:
+        raise ValueError(f"Unrecognised cursor {token!r}")
+    return seq
+
+
+def _data(value):
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode("utf-8")
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def high_water(cursor):
+    """
+    seq up to which the feed is settled: every change at or below it is
+    committed (0 if none), so reading on from it later skips nothing.
+    """
+    try:
+        cursor.execute(
+            "SELECT seq FROM change_log WHERE changed_at < NOW() - INTERVAL %s SECOND ORDER BY seq DESC LIMIT 1",
+            (SETTLE_SECONDS,),
+        )
+    except database.Error as e:
+        if getattr(e, 'errno', None) != _ER_NO_SUCH_TABLE:
+            raise
+        return 0
+    row = cursor.fetchone()
+    last = int(row[0] or 0) if row else 0
+    cursor.execute("SELECT seq FROM change_log WHERE seq > %s ORDER BY seq", (last,))
+    for (seq,) in cursor.fetchall():
+        if seq != last + 1:
+            break
+        last = seq
+    return last
+
+
+def changes_since(cursor, after, limit=PAGE_SIZE):
+    """
+    One page of the feed after seq `after`:
+    {"changes": [...], "next_cursor": token, "has_more": bool}.
+    next_cursor is `after` again when nothing is ready yet.
+    """
+    try:
+        cursor.execute(
+            "SELECT seq, entity, entity_id, op, changed_by, changed_at, data, "
+            "TIMESTAMPDIFF(SECOND, changed_at, NOW()) AS age "
+            "FROM change_log WHERE seq > %s ORDER BY seq LIMIT %s",
+            (after, limit + 1),
+        )
+    except database.Error as e:
+        if getattr(e, 'errno', None) != _ER_NO_SUCH_TABLE:
+            raise
+        return {"changes": [], "next_cursor": encode_cursor(after), "has_more": False}
+    rows = database.fetch_all(cursor)
+
+    changes, last = [], after
+    has_more = len(rows) > limit
+    for row in rows[:limit]:
+        if row["seq"] != last + 1 and (row["age"] or 0) < SETTLE_SECONDS:
+            # An earlier seq may still commit; hand this out next time
+            has_more = False
+            break
+        changes.append({
+            "seq": row["seq"],
+            "entity": row["entity"],
+            "id": row["entity_id"],
+            "op": row["op"],
+            "changed_by": row["changed_by"],
+            "changed_at": row["changed_at"].isoformat() if row["changed_at"] else None,
+            "data": _data(row["data"]),
+        })
+        last = row["seq"]
+    return {"changes": changes, "next_cursor": encode_cursor(last), "has_more": has_more}
@@ -0,0 +1,115 @@
+"""
+Per-person Sr.GM / GM / DGM / AGM commission entries of a commission.
+
+A commission splits each role's rate between several named people, one row
+per person in commission_<role>_entries. write_entries() writes all four
+roles of a commission inside the caller's transaction (after the parent
+row's INSERT / UPDATE, whose row lock serialises concurrent edits):
+
+- the stored entries of all four roles are read with one UNION query;
+- each submitted entry is matched to a stored row of the same name, and
+  left alone if its amounts are unchanged;
+- leftover submitted entries reuse leftover stored rows (a rename or rate
+  change is one UPDATE), then the rest are inserted or deleted;
+- inserts, updates and deletes are one executemany / statement per table.
+
+Re-saving an unchanged commission writes no entry rows at all, where the
+old code deleted and re-inserted every DGM / AGM entry row by row.
+"""
+
+ROLES = ("srgm", "gm", "dgm", "agm")
+
+TABLES = {role: f"commission_{role}_entries" for role in ROLES}
+
+# Differences below this (in rupees) are float noise, not changes
+TOLERANCE = 0.005
+
+
+def submitted_entries(form_data, role, rules, inputs):
+    """
+    [(name, total, at_agreement, at_registration)] of a role's entries in
+    `form_data` ((name, rate) tuples or {"name", "rate"} dicts), amounts
+    from the compiled commission `rules`. Entries without a name or rate
+    are skipped.
+    """
+    entries = []
+    for entry in form_data.get(f"{role}_entries") or []:
+        if isinstance(entry, (list, tuple)):
+            name = entry[0]
+            rate = entry[1] if len(entry) > 1 else 0
+        else:
+            name, rate = entry.get("name", ""), entry.get("rate", 0)
+        name = (name or "").strip()
+        if name and rate:
+            entries.append((name, *rules.entry(role, float(rate), **inputs)))
+    return entries
+
+
+def load_entries(cursor, commission_id):
+    """{role: [(id, name, total, at_agreement, at_registration)]} of a commission, in id order."""
+    sql = " UNION ALL ".join(
+        f"SELECT '{role}', id, name, total_amount, at_agreement, at_registration "
+        f"FROM {TABLES[role]} WHERE commission_id = %s" for role in ROLES)
+    cursor.execute(sql + " ORDER BY 2", (commission_id,) * len(ROLES))
+    stored = {role: [] for role in ROLES}
+    for role, *row in cursor.fetchall():
+        stored[role].append(tuple(row))
+    return stored
+
+
+def _same(row, entry):
+    return all(value is not None and abs(float(value) - amount) <= TOLERANCE
+               for value, amount in zip(row[2:], entry[1:]))
+
+
+def diff(stored, submitted):
+    """
+    (inserts, updates, deletes) turning stored rows into the submitted
+    entries: [entry], [(entry, id)], [id].
+    """
+    remaining = list(stored)
+    unmatched = []
+    updates = []
+    for entry in submitted:
+        row = next((row for row in remaining if row[1] == entry[0]), None)
+        if row is None:
+            unmatched.append(entry)
+            continue
+        remaining.remove(row)
+        if not _same(row, entry):
+            updates.append((entry, row[0]))
+    # Reuse the rows of removed names before inserting new ones
+    reused = min(len(unmatched), len(remaining))
+    updates += [(entry, row[0]) for entry, row in zip(unmatched, remaining)]
+    return unmatched[reused:], updates, [row[0] for row in remaining[reused:]]
+
+
+def write_entries(cursor, commission_id, form_data, rules, inputs, new=False):
+    """
+    Bring all four roles' entries of `commission_id` in line with
+    `form_data` (caller commits). `new` skips reading stored entries of a
+    just-inserted commission. Returns {table: rows written}.
+    """
+    stored = {role: [] for role in ROLES} if new else load_entries(cursor, commission_id)
+    written = {}
+    for role in ROLES:
+        table = TABLES[role]
+        inserts, updates, deletes = diff(stored[role], submitted_entries(form_data, role, rules, inputs))
+        if inserts:
+            cursor.executemany(
+                f"INSERT INTO {table} (commission_id, name, total_amount, at_agreement, at_registration) "
+                f"VALUES (%s, %s, %s, %s, %s)",
+                [(commission_id, *entry) for entry in inserts],
+            )
+        if updates:
+            cursor.executemany(
+                f"UPDATE {table} SET name = %s, total_amount = %s, at_agreement = %s, at_registration = %s "
+                f"WHERE id = %s",
+                [(*entry, row_id) for entry, row_id in updates],
+            )
+        if deletes:
+            cursor.execute(f"DELETE FROM {table} WHERE id IN ({','.join(['%s'] * len(deletes))})",
+                           tuple(deletes))
+        if inserts or updates or deletes:
+            written[table] = len(inserts) + len(updates) + len(deletes)
+    return written
@@ -0,0 +1,223 @@
+"""
+Vectorised recomputation of a project's commissions.
+
+When a project's rates or rules change, every stored commission used to
+have to be re-opened and re-saved in the calculator. recompute() loads all
+commissions of a project into NumPy arrays (one column per input), derives
+every field calculate_commission() stores - totals, W / B values, balances
+and the agreement / registration split per role - for all rows at once
+with the project's compiled commission_rules evaluator, diffs them against
+the stored values and writes back only the rows that changed, with one
+executemany per table.
+
+The Sr.GM / GM / DGM / AGM entry rows keep their stored totals (their rates
+are not stored) and get their agreement / registration split recomputed
+from the parent's agreement percentage.
+
+A dry run reports what would change without writing, optionally under
+candidate rules that are not saved yet. From the command line, per tenant
+database:
+
+    python commission_recompute.py <project> [--db DB] [--rules rules.json] [--apply]
+
+NumPy is imported on first use, so the app starts without it.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import change_log
+import commission_entries
+import commission_rules
+import data_versions
+import database
+import project_ids
+
+# Differences below this (in rupees) are float noise, not changes
+TOLERANCE = 0.005
+
+# Changed rows listed individually in a report
+REPORT_ROWS = 100
+
+ROLES = commission_rules.ROLES
+
+INPUT_COLUMNS = commission_rules.INPUTS + tuple(f"{role}_rate" for role in ROLES)
+
+DERIVED_COLUMNS = ("total_amount", "w_value", "b_value", "balance_amount", "actual_agreement_amount",
+                   "agreement_balance") + tuple(
+    f"{role}_{part}" for role in ROLES for part in ("total", "at_agreement", "at_registration"))
+
+ENTRY_TABLES = tuple(commission_entries.TABLES.values())
+
+_UPDATE_SQL = (f"UPDATE commissions SET {', '.join(f'{col} = %s' for col in DERIVED_COLUMNS)} "
+               f"WHERE id = %s")
+
+
+def _np():
+    try:
+        import numpy
+    except ImportError as e:
+        raise RuntimeError("Commission recompute needs numpy (pip install numpy)") from e
+    return numpy
+
+
+def compute(inputs, rules=commission_rules.DEFAULT_EVALUATOR):
+    """
+    Derived columns for arrays of INPUT_COLUMNS (NULLs as 0) under the
+    compiled `rules`. Returns {column: array}.
+    """
+    return rules.calculate(**inputs)
+
+
+def _column(np, rows, index, nan_for_null):
+    return np.array([np.nan if row[index] is None and nan_for_null else float(row[index] or 0) for row in rows],
+                    dtype=np.float64)
+
+
+def _changed(np, stored, computed):
+    """Boolean mask of rows where stored (NaN = NULL) differs from computed."""
+    return np.isnan(stored) | (np.abs(stored - computed) > TOLERANCE)
+
+
+def _load_commissions(cursor, project_name):
+    columns = ("id", "plot_no") + INPUT_COLUMNS + DERIVED_COLUMNS
+    cursor.execute(f"SELECT {', '.join(columns)} FROM commissions WHERE {project_ids.filter_sql()} ORDER BY id",
+                   (project_name,))
+    return cursor.fetchall()
+
+
+def _load_entries(cursor, table, project_name):
+    cursor.execute(
+        f"SELECT e.id, e.commission_id, e.total_amount, e.at_agreement, e.at_registration, "
+        f"c.agreement_percentage FROM {table} e JOIN commissions c ON e.commission_id = c.id "
+        f"WHERE {project_ids.filter_sql('c')} ORDER BY e.id",
+        (project_name,),
+    )
+    return cursor.fetchall()
+
+
+def _diff_entries(np, rows, fixed_agreement=None):
+    """(mask of changed rows, at_agreement, at_registration) for entry rows."""
+    total = _column(np, rows, 2, False)
+    pct = _column(np, rows, 5, False) if fixed_agreement is None else np.full(len(rows), fixed_agreement)
+    at_agreement = total * pct
+    at_registration = total - at_agreement
+    mask = (_changed(np, _column(np, rows, 3, True), at_agreement)
+            | _changed(np, _column(np, rows, 4, True), at_registration))
+    return mask, at_agreement, at_registration
+
+
+def recompute(conn, project_name, rules=None, dry_run=True, changed_by=None):
+    """
+    Recompute every commission of `project_name` under `rules` (a rule
+    definition, dry runs only; default: the project's stored rules);
+    unless `dry_run`, write the changed rows and commit. Raises
+    commission_rules.RuleError for invalid rules. Returns the report:
+    {"project", "dry_run", "rules", "commissions", "changed", "fields": {column: rows changed},
+     "entries_changed": {table: rows}, "rows": [{"id", "plot_no", "changes": {column: [old, new]}}]}
+    """
+    if rules is not None and not dry_run:
+        raise ValueError("Candidate rules can only be dry-run; save them to apply")
+    np = _np()
+    if rules is None:
+        evaluator = commission_rules.evaluator_for(project_name, conn)
+    else:
+        evaluator = commission_rules.Evaluator(rules)
+        evaluator.check()
+    c = conn.cursor()
+    rows = _load_commissions(c, project_name)
+    report = {"project": project_name, "dry_run": dry_run, "rules": evaluator.rules, "commissions": len(rows),
+              "changed": 0, "fields": {}, "entries_changed": {}, "rows": []}
+
+    updates, changed_ids = [], []
+    if rows:
+        base = 2
+        inputs = {col: _column(np, rows, base + i, False) for i, col in enumerate(INPUT_COLUMNS)}
+        computed = compute(inputs, evaluator)
+        base += len(INPUT_COLUMNS)
+        stored = {col: _column(np, rows, base + i, True) for i, col in enumerate(DERIVED_COLUMNS)}
+
+        masks = {col: _changed(np, stored[col], computed[col]) for col in DERIVED_COLUMNS}
+        any_changed = np.logical_or.reduce([masks[col] for col in DERIVED_COLUMNS])
+        report["fields"] = {col: int(masks[col].sum()) for col in DERIVED_COLUMNS if masks[col].any()}
+
+        for i in np.flatnonzero(any_changed):
+            values = [float(computed[col][i]) for col in DERIVED_COLUMNS]
+            updates.append((*values, rows[i][0]))
+            changed_ids.append(rows[i][0])
+            if len(report["rows"]) < REPORT_ROWS:
+                report["rows"].append({
+                    "id": rows[i][0],
+                    "plot_no": rows[i][1],
+                    "changes": {col: [None if np.isnan(stored[col][i]) else float(stored[col][i]),
+                                      round(float(computed[col][i]), 2)]
+                                for col in DERIVED_COLUMNS if masks[col][i]},
+                })
+    report["changed"] = len(updates)
+
+    entry_updates = {}
+    for table in ENTRY_TABLES:
+        entries = _load_entries(c, table, project_name)
+        if not entries:
+            continue
+        mask, at_agreement, at_registration = _diff_entries(np, entries, evaluator.fixed_agreement)
+        params = [(float(at_agreement[i]), float(at_registration[i]), entries[i][0])
+                  for i in np.flatnonzero(mask)]
+        if params:
+            entry_updates[table] = params
+            report["entries_changed"][table] = len(params)
+            changed_ids.extend(entries[i][1] for i in np.flatnonzero(mask))
+
+    if dry_run or not (updates or entry_updates):
+        return report
+
+    try:
+        if updates:
+            c.executemany(_UPDATE_SQL, updates)
+        for table, params in entry_updates.items():
+            c.executemany(f"UPDATE {table} SET at_agreement = %s, at_registration = %s WHERE id = %s", params)
+        ids = sorted(set(changed_ids))
+        change_log.record_commissions(c, change_log.UPDATE, f"c.id IN ({','.join(['%s'] * len(ids))})",
+                                      tuple(ids), changed_by)
+        data_versions.bump(c, data_versions.COMMISSIONS)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute stored commissions of a project")
+    parser.add_argument("project", help="project name")
+    parser.add_argument("--db", help="tenant database name (default: DB_NAME)")
+    parser.add_argument("--rules", help="JSON file of candidate rules (default: the project's stored rules)")
+    parser.add_argument("--apply", action="store_true", help="write the changes (default: dry run)")
+    args = parser.parse_args(argv)
+
+    config = None
+    if args.db:
+        config = {"host": os.getenv("DB_HOST", "localhost"), "user": os.getenv("DB_USER", "root"),
+                  "password": os.getenv("DB_PASSWORD", ""), "database": args.db}
+    conn = database.get_db_connection(config)
+    try:
+        rules = None
+        if args.rules:
+            with open(args.rules) as f:
+                rules = json.load(f)
+        report = recompute(conn, args.project, rules, dry_run=not args.apply, changed_by="recompute")
+    finally:
+        conn.close()
+    print(f"{report['project']}: {report['changed']} of {report['commissions']} commissions "
+          f"{'would change' if report['dry_run'] else 'updated'}")
+    for column, count in report["fields"].items():
+        print(f"  {column}: {count}")
+    for table, count in report["entries_changed"].items():
+        print(f"  {table}: {count} entries")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
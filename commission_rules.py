@@ -0,0 +1,365 @@
+"""
+Per-project commission rules, compiled into cached evaluators.
+
+The commission formula used to be written out three times with magic
+constants: calculate_commission(), the fallback maths of the commission
+preview, and the calculator page's JavaScript. It now lives in one rule
+definition per project, stored in `commission_rules` (projects without a
+row use DEFAULT_RULES, which is the original formula):
+
+    {
+      "w_rate": 5500,                 # W value per sq. yard
+      "agreement_percentage": null,   # fixed agreement split (0-1), or null
+                                      # to use each commission's own
+      "total_amount": "sq_yards * negotiated_price + amc_charges * sq_yards",
+      "roles": {"cgm": "rate * sq_yards", "srgm": ..., "gm": ..., "dgm": ..., "agm": ...}
+    }
+
+Formulas are arithmetic (+ - * / and parentheses, numbers, min(a, b),
+max(a, b)) over the commission inputs (INPUTS); role formulas may also use
+`rate` (that role's rate) and `total_amount`. They are validated as Python
+ASTs and compiled once into a plain Python function, cached per tenant and
+project and revalidated against the data_versions counter of
+commission_rules (one primary-key read). The same compiled function works
+on floats for a single save and on NumPy arrays for commission_recompute,
+and the validated formulas are valid JavaScript for the calculator page.
+
+Throughput of a compiled evaluator:
+    python commission_rules.py --benchmark [evaluations]
+"""
+
+import ast
+import json
+import sys
+import threading
+import time
+
+import database
+import data_versions
+
+# MySQL error code for "Table doesn't exist"
+_ER_NO_SUCH_TABLE = 1146
+
+ROLES = ("cgm", "srgm", "gm", "dgm", "agm")
+
+# Inputs every formula may use
+INPUTS = ("sq_yards", "negotiated_price", "original_price", "amc_charges", "advance_received",
+          "agreement_percentage", "amount_paid_at_agreement")
+
+DEFAULT_RULES = {
+    "w_rate": 5500,
+    "agreement_percentage": None,
+    "total_amount": "sq_yards * negotiated_price + amc_charges * sq_yards",
+    "roles": {role: "rate * sq_yards" for role in ROLES},
+}
+
+CREATE_SQL = """
+    CREATE TABLE IF NOT EXISTS commission_rules (
+        project_name VARCHAR(255) NOT NULL PRIMARY KEY,
+        rules TEXT NOT NULL,
+        updated_by VARCHAR(255) NULL,
+        updated_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+"""
+
+_BINARY_OPS = (ast.Add, ast.Sub, ast.Mult, ast.Div)
+_FUNCTIONS = {"min": "_minimum", "max": "_maximum"}
+
+
+class RuleError(ValueError):
+    """A rule definition that cannot be compiled or evaluated."""
+
+
+def _guarded(function, label):
+    """`function` with arithmetic errors (e.g. a division by zero) raised as RuleError."""
+    def evaluate(*args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        except ArithmeticError as e:
+            raise RuleError(f"{label} cannot be evaluated: {e}") from e
+    return evaluate
+
+
+def _minimum(a, b):
+    if hasattr(a, "shape") or hasattr(b, "shape"):
+        import numpy
+        return numpy.minimum(a, b)
+    return min(a, b)
+
+
+def _maximum(a, b):
+    if hasattr(a, "shape") or hasattr(b, "shape"):
+        import numpy
+        return numpy.maximum(a, b)
+    return max(a, b)
+
+
+class _Formula(ast.NodeTransformer):
+    """Validates a formula and renames `rate` / min / max for the generated code."""
+
+    def __init__(self, names, rate_name=None):
+        self.names = names
+        self.rate_name = rate_name
+
+    def generic_visit(self, node):
+        if not isinstance(node, (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Name, ast.Call,
+                                 ast.Load, ast.USub, ast.UAdd) + _BINARY_OPS):
+            raise RuleError(f"{type(node).__name__} is not allowed in a formula")
+        return super().generic_visit(node)
+
+    def visit_Constant(self, node):
+        if not isinstance(node.value, (int, float)) or isinstance(node.value, bool):
+            raise RuleError(f"Only numbers are allowed, not {node.value!r}")
+        return node
+
+    def visit_Name(self, node):
+        if node.id == "rate" and self.rate_name:
+            return ast.copy_location(ast.Name(id=self.rate_name, ctx=ast.Load()), node)
+        if node.id not in self.names:
+            raise RuleError(f"Unknown name {node.id!r}")
+        return node
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.func.id not in _FUNCTIONS:
+            raise RuleError("Only min(a, b) and max(a, b) may be called")
+        if len(node.args) != 2 or node.keywords:
+            raise RuleError(f"{node.func.id}() takes exactly two arguments")
+        node.args = [self.visit(arg) for arg in node.args]
+        node.func = ast.copy_location(ast.Name(id=_FUNCTIONS[node.func.id], ctx=ast.Load()), node.func)
+        return node
+
+
+def _expression(source, names, rate_name=None, label="formula"):
+    if not isinstance(source, str) or not source.strip():
+        raise RuleError(f"{label} must be a non-empty formula")
+    try:
+        tree = ast.parse(source.strip(), mode="eval")
+    except SyntaxError as e:
+        raise RuleError(f"{label}: {e.msg}") from e
+    try:
+        tree = _Formula(names, rate_name).visit(tree)
+    except RuleError as e:
+        raise RuleError(f"{label}: {e}") from e
+    return f"({ast.unparse(tree.body)})"
+
+
+def _number(value, label, low=None, high=None):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise RuleError(f"{label} must be a number")
+    if (low is not None and value < low) or (high is not None and value > high):
+        raise RuleError(f"{label} must be between {low} and {high}")
+    return float(value)
+
+
+def normalize(rules):
+    """DEFAULT_RULES overlaid with `rules` (a dict or JSON text). Raises RuleError if malformed."""
+    if isinstance(rules, (str, bytes)):
+        try:
+            rules = json.loads(rules)
+        except ValueError as e:
+            raise RuleError(f"Rules are not valid JSON: {e}") from e
+    if not isinstance(rules, dict):
+        raise RuleError("Rules must be an object")
+    unknown = set(rules) - set(DEFAULT_RULES)
+    if unknown:
+        raise RuleError(f"Unknown rule keys: {', '.join(sorted(unknown))}")
+    roles = rules.get("roles") or {}
+    if not isinstance(roles, dict) or set(roles) - set(ROLES):
+        raise RuleError(f"roles may only define {', '.join(ROLES)}")
+    merged = dict(DEFAULT_RULES, **{k: v for k, v in rules.items() if k != "roles"})
+    merged["roles"] = dict(DEFAULT_RULES["roles"], **roles)
+    return merged
+
+
+class Evaluator:
+    """
+    Compiled rules. calculate(**inputs) returns the fields calculate_commission
+    stores; entry(role, rate, **inputs) returns (total, at_agreement,
+    at_registration) of one role entry. Inputs may be floats or NumPy arrays.
+    """
+
+    def __init__(self, rules):
+        self.rules = normalize(rules)
+        self.w_rate = _number(self.rules["w_rate"], "w_rate", 0)
+        fixed = self.rules["agreement_percentage"]
+        self.fixed_agreement = None if fixed is None else _number(fixed, "agreement_percentage", 0, 1)
+        self.source = self._generate()
+        namespace = {"_minimum": _minimum, "_maximum": _maximum, "__builtins__": {}}
+        exec(compile(self.source, "<commission rules>", "exec"), namespace)
+        self.calculate = _guarded(namespace["calculate"], "Commission rules")
+        self._entries = {role: _guarded(namespace[f"{role}_entry"], f"roles.{role}") for role in ROLES}
+
+    def entry(self, role, rate, **inputs):
+        return self._entries[role](rate, **inputs)
+
+    def check(self):
+        """Trial-evaluate every formula on sample inputs; raises RuleError (e.g. for `x / 0`)."""
+        sample = {name: 1.0 for name in INPUTS}
+        self.calculate(**sample, **{f"{role}_rate": 1.0 for role in ROLES})
+        for role in ROLES:
+            self.entry(role, 1.0, **sample)
+
+    def _generate(self):
+        rate_args = ", ".join(f"{role}_rate=0" for role in ROLES)
+        inputs = ", ".join(f"{name}=0" for name in INPUTS)
+        agreement = repr(self.fixed_agreement) if self.fixed_agreement is not None else "agreement_percentage"
+        total = _expression(self.rules["total_amount"], set(INPUTS), label="total_amount")
+        role_names = set(INPUTS) | {"total_amount"}
+
+        lines = [
+            f"def calculate({inputs}, {rate_args}):",
+            f"    agreement_percentage = {agreement}",
+            f"    total_amount = {total}",
+            f"    w_value = sq_yards * {self.w_rate!r}",
+            "    actual_agreement_amount = total_amount * agreement_percentage",
+        ]
+        result = [
+            "'total_amount': total_amount", "'w_value': w_value", "'b_value': total_amount - w_value",
+            "'balance_amount': total_amount - advance_received",
+            "'actual_agreement_amount': actual_agreement_amount",
+            "'agreement_balance': actual_agreement_amount - amount_paid_at_agreement - advance_received",
+        ]
+        for role in ROLES:
+            formula = _expression(self.rules["roles"][role], role_names, f"{role}_rate", f"roles.{role}")
+            lines.append(f"    {role}_total = {formula}")
+            lines.append(f"    {role}_at_agreement = {role}_total * agreement_percentage")
+            result += [f"'{role}_total': {role}_total", f"'{role}_at_agreement': {role}_at_agreement",
+                       f"'{role}_at_registration': {role}_total - {role}_at_agreement"]
+        lines.append("    return {" + ", ".join(result) + "}")
+
+        for role in ROLES:
+            formula = _expression(self.rules["roles"][role], role_names, "rate", f"roles.{role}")
+            lines += [
+                "",
+                f"def {role}_entry(rate, {inputs}):",
+                f"    agreement_percentage = {agreement}",
+                f"    total_amount = {total}",
+                f"    total = {formula}",
+                "    at_agreement = total * agreement_percentage",
+                "    return total, at_agreement, total - at_agreement",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def javascript(self):
+        """The rules for the calculator page: formulas as JS expression bodies."""
+        def js(source, rate_name=None, names=None):
+            return _expression(source, names or set(INPUTS), rate_name).replace("_minimum(", "Math.min(") \
+                .replace("_maximum(", "Math.max(")
+        role_names = set(INPUTS) | {"total_amount"}
+        return {
+            "w_rate": self.w_rate,
+            "agreement_percentage": self.fixed_agreement,
+            "total_amount": js(self.rules["total_amount"]),
+            "roles": {role: js(self.rules["roles"][role], "rate", role_names) for role in ROLES},
+        }
+
+
+DEFAULT_EVALUATOR = Evaluator(DEFAULT_RULES)
+
+# (tenant, project) -> (rules version, Evaluator)
+_cache = {}
+_lock = threading.Lock()
+
+
+def load_rules(cursor, project_name):
+    """Stored rules text of a project, or None."""
+    try:
+        cursor.execute("SELECT rules FROM commission_rules WHERE project_name = %s", (project_name,))
+    except database.Error as e:
+        if getattr(e, 'errno', None) != _ER_NO_SUCH_TABLE:
+            raise
+        return None
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def save_rules(cursor, project_name, rules, updated_by=None):
+    """Validate and upsert a project's rules (caller commits). Returns the compiled Evaluator."""
+    evaluator = Evaluator(rules)
+    evaluator.check()
+    sql = ("INSERT INTO commission_rules (project_name, rules, updated_by) VALUES (%s, %s, %s) "
+           "ON DUPLICATE KEY UPDATE rules = VALUES(rules), updated_by = VALUES(updated_by)")
+    params = (project_name, json.dumps(evaluator.rules), updated_by)
+    try:
+        cursor.execute(sql, params)
+    except database.Error as e:
+        if getattr(e, 'errno', None) != _ER_NO_SUCH_TABLE:
+            raise
+        print("Auto-migrating: Creating commission_rules table...")
+        cursor.execute(CREATE_SQL)
+        cursor.execute(sql, params)
+    data_versions.bump(cursor, data_versions.COMMISSION_RULES)
+    return evaluator
+
+
+def evaluator_for(project_name, conn=None):
+    """
+    Compiled evaluator of a project's rules in the current tenant, from the
+    cache unless the rules changed. Pass `conn` to reuse an open connection.
+    """
+    if not project_name:
+        return DEFAULT_EVALUATOR
+    own_conn = conn is None
+    if own_conn:
+        conn = database.get_db_connection()
+    try:
+        version = data_versions.get_versions((data_versions.COMMISSION_RULES,), conn=conn)[
+            data_versions.COMMISSION_RULES]
+        key = (database.get_tenant_key(), project_name)
+        with _lock:
+            cached = _cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        stored = load_rules(conn.cursor(), project_name)
+    finally:
+        if own_conn:
+            conn.close()
+
+    evaluator = DEFAULT_EVALUATOR
+    if stored:
+        try:
+            evaluator = Evaluator(stored)
+        except (RuleError, TypeError) as e:
+            # Rules are validated when saved, so this is a hand-edited row
+            print(f"Commission rules of {project_name!r} are invalid ({e}); using the defaults")
+    with _lock:
+        _cache[key] = (version, evaluator)
+    return evaluator
+
+
+def invalidate(project_name=None):
+    """Drop cached evaluators of the current tenant in this process."""
+    tenant = database.get_tenant_key()
+    with _lock:
+        for key in list(_cache):
+            if key[0] == tenant and (project_name is None or key[1] == project_name):
+                del _cache[key]
+
+
+def benchmark(evaluations=100_000):
+    """Time `evaluations` single-plot evaluations, and the same as one NumPy batch if available."""
+    evaluator = Evaluator(dict(DEFAULT_RULES, roles={"gm": "min(rate * sq_yards, total_amount * 0.02)"}))
+    inputs = {"sq_yards": 200.0, "negotiated_price": 6000.0, "amc_charges": 100.0, "advance_received": 50000.0,
+              "agreement_percentage": 0.3, "amount_paid_at_agreement": 100000.0}
+    started = time.perf_counter()
+    for i in range(evaluations):
+        evaluator.calculate(cgm_rate=500.0 + i % 7, srgm_rate=300.0, gm_rate=200.0, **inputs)
+    elapsed = time.perf_counter() - started
+    print(f"compiled, per plot:  {evaluations} evaluations in {elapsed:.2f}s "
+          f"({evaluations / elapsed:,.0f}/s, {elapsed / evaluations * 1e6:.1f} us each)")
+    try:
+        import numpy
+    except ImportError:
+        return
+    arrays = {name: numpy.full(evaluations, value) for name, value in inputs.items()}
+    started = time.perf_counter()
+    evaluator.calculate(cgm_rate=numpy.arange(evaluations) % 7 + 500.0, srgm_rate=300.0, gm_rate=200.0, **arrays)
+    elapsed = time.perf_counter() - started
+    print(f"compiled, vectorised: {evaluations} evaluations in {elapsed:.3f}s ({evaluations / elapsed:,.0f}/s)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 100_000)
+    else:
+        print("usage: python commission_rules.py --benchmark [evaluations]")
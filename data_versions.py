@@ -0,0 +1,130 @@
+"""
+Per-tenant data version counters.
+
+Each tenant database carries a tiny `data_versions` table with one row per
+tracked table and a monotonically increasing counter. Write routes bump the
+counter of every table they touch, inside the same transaction as the write,
+so the new version becomes visible exactly when the data does.
+
+Caches, ETags and SSE streams validate against the counter with a single
+primary-key read instead of relying on TTLs:
+
+    version = data_versions.get_version('receipts')
+"""
+
+import hashlib
+
+import database
+
+# Tables whose changes readers care about
+RECEIPTS = 'receipts'
+PENDING_RECEIPTS = 'pending_receipts'
+COMMISSIONS = 'commissions'
+PROJECTS = 'projects'
+PLOT_LAYOUTS = 'plot_layouts'
+COMMISSION_RULES = 'commission_rules'
+
+TRACKED_TABLES = (RECEIPTS, PENDING_RECEIPTS, COMMISSIONS, PROJECTS, PLOT_LAYOUTS, COMMISSION_RULES)
+
+# MySQL error code for "Table doesn't exist"
+_ER_NO_SUCH_TABLE = 1146
+
+CREATE_SQL = """
+    CREATE TABLE IF NOT EXISTS data_versions (
+        table_name VARCHAR(64) NOT NULL PRIMARY KEY,
+        version BIGINT UNSIGNED NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+"""
+
+
+def init_data_versions(conn=None):
+    """Create the data_versions table if it does not exist yet."""
+    own_conn = conn is None
+    if own_conn:
+        conn = database.get_db_connection()
+    c = conn.cursor()
+    c.execute(CREATE_SQL)
+    conn.commit()
+    if own_conn:
+        conn.close()
+
+
+def bump(cursor, *tables):
+    """
+    Increment the version of each table in `tables` using the caller's cursor.
+
+    Call this before the caller commits so the bump shares the write's
+    transaction. The table comes from migrate_tenants; a tenant that has not
+    been migrated yet gets it created on a separate connection, since a
+    CREATE TABLE on the caller's cursor would implicitly commit its write.
+    """
+    for table in tables:
+        try:
+            _bump_one(cursor, table)
+        except database.Error as e:
+            if getattr(e, 'errno', None) != _ER_NO_SUCH_TABLE:
+                raise
+            print("Auto-migrating: Creating data_versions table...")
+            init_data_versions()
+            _bump_one(cursor, table)
+
+
+def _bump_one(cursor, table):
+    cursor.execute(
+        "INSERT INTO data_versions (table_name, version) VALUES (%s, 1) "
+        "ON DUPLICATE KEY UPDATE version = version + 1",
+        (table,),
+    )
+
+
+def get_version(table, conn=None):
+    """Return the current version of `table` (0 if never written)."""
+    return get_versions((table,), conn=conn)[table]
+
+
+def get_versions(tables=TRACKED_TABLES, conn=None):
+    """
+    Return {table: version} for `tables` with one primary-key lookup.
+
+    Pass `conn` to reuse an open connection; otherwise a connection to the
+    current tenant's database is opened and closed here.
+    """
+    tables = tuple(tables)
+    versions = {t: 0 for t in tables}
+    if not tables:
+        return versions
+
+    own_conn = conn is None
+    if own_conn:
+        conn = database.get_db_connection()
+    try:
+        c = conn.cursor()
+        placeholders = ','.join(['%s'] * len(tables))
+        try:
+            c.execute(
+                f"SELECT table_name, version FROM data_versions WHERE table_name IN ({placeholders})",
+                tables,
+            )
+            rows = c.fetchall()
+        except database.Error as e:
+            if getattr(e, 'errno', None) != _ER_NO_SUCH_TABLE:
+                raise
+            rows = []
+        for table_name, version in rows:
+            versions[table_name] = int(version or 0)
+    finally:
+        if own_conn:
+            conn.close()
+    return versions
+
+
+def etag_for(tables, *parts, conn=None):
+    """
+    Build a strong ETag from the versions of `tables` plus any extra `parts`
+    (e.g. a project name). Changes whenever any of the tables is written.
+    `conn` is passed on to get_versions.
+    """
+    versions = get_versions(tables, conn=conn)
+    raw = '|'.join([database.get_tenant_key()] + [f"{t}.{versions[t]}" for t in tables] + [str(p) for p in parts])
+    return '"' + hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20] + '"'
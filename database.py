@@ -6,7 +6,8 @@ from mysql.connector import Error, IntegrityError, OperationalError
 load_dotenv()
 
 # Export these for use in receipt_app.py
-__all__ = ['get_db_connection', 'fetch_one', 'fetch_all', 'IntegrityError', 'OperationalError', 'Error']
+__all__ = ['get_db_connection', 'get_tenant_db_config', 'get_tenant_key', 'fetch_one', 'fetch_all',
+           'IntegrityError', 'OperationalError', 'Error']
 
 
 def get_db_connection(config=None):
@@ -44,6 +45,33 @@ def get_db_connection(config=None):
         )
     return conn
 
+def get_tenant_db_config():
+    """
+    Return the DB config of the current request's tenant, or None outside a
+    tenant request. Capture this before handing work to a background thread,
+    since flask.g is not available there.
+    """
+    try:
+        import flask
+        if flask.has_app_context() and hasattr(flask.g, 'tenant_db_config'):
+            return dict(flask.g.tenant_db_config)
+    except ImportError:
+        pass
+    return None
+
+
+def get_tenant_key(config=None):
+    """
+    Stable identifier for the tenant whose data a connection would see.
+    Each tenant has its own database, so the database name is the key.
+    """
+    if config is None:
+        config = get_tenant_db_config()
+    if config and config.get("database"):
+        return config["database"]
+    return os.getenv("DB_NAME", "receipt_app")
+
+
 class MySQLRow(dict):
     """
     A wrapper to provide dictionary-like access to rows.
@@ -0,0 +1,216 @@
+"""
+Streaming CSV / XLSX exports for accountants (/export/<dataset>).
+
+Each dataset is a query read through an unbuffered cursor FETCH_SIZE rows
+at a time, so memory stays flat however many receipts a tenant has:
+
+- receipts     one row per receipt (PAN / Aadhaar are left out)
+- commissions  one row per payee: the CGM row of every commission, then
+               its Sr.GM / GM / DGM / AGM entries
+- plot_ledger  one row per (project, plot): sq. yards, basic price, sale
+               value, amount paid and balance, worked out as on the
+               Account Summary page
+
+CSV is written to the response in chunks of CSV_CHUNK_ROWS rows. XLSX goes
+through an openpyxl write_only workbook spooled to a temporary file, which
+is then streamed back and deleted.
+
+Filters: project, and a from/to date range (YYYY-MM-DD, inclusive). The
+receipt date is used for receipts; commissions use created_at; the plot
+ledger treats `to` as an as-of date and ignores `from`.
+"""
+
+import csv
+import io
+import tempfile
+from datetime import datetime
+
+import openpyxl
+
+import project_ids
+
+# Rows per round trip from the server-side cursor
+FETCH_SIZE = 2000
+
+# Rows per chunk of a streamed CSV response
+CSV_CHUNK_ROWS = 1000
+
+FORMATS = ("csv", "xlsx")
+
+RECEIPT_COLUMNS = (
+    ("id", "Receipt ID"), ("no", "Receipt No"), ("date", "Date"), ("project_name", "Project"),
+    ("plot_no", "Plot No"), ("customer_name", "Customer"), ("amount_numeric", "Amount"),
+    ("payment_mode", "Payment Mode"), ("instrument_no", "Instrument No"), ("drawn_bank", "Bank"),
+    ("branch", "Branch"), ("square_yards", "Sq. Yards"), ("basic_price", "Basic Price"),
+    ("purpose", "Purpose"), ("created_at", "Created At"),
+)
+
+COMMISSION_HEADER = ("Commission ID", "Project", "Plot No", "Created At", "Sq. Yards", "Negotiated Price",
+                     "Total Amount", "Role", "Name", "Role Total", "At Agreement", "At Registration")
+
+PLOT_LEDGER_HEADER = ("Project", "Plot No", "Customer", "Sq. Yards", "Basic Price", "Sale Value",
+                      "Amount Paid", "Balance", "Receipts")
+
+# (role label, entries table) in output order, after the CGM columns of commissions
+_ROLE_ENTRY_TABLES = (
+    ("Sr.GM", "commission_srgm_entries"),
+    ("GM", "commission_gm_entries"),
+    ("DGM", "commission_dgm_entries"),
+    ("AGM", "commission_agm_entries"),
+)
+
+
+def parse_filters(args):
+    """{"project", "date_from", "date_to"} from query args. Raises ValueError for a bad date."""
+    filters = {"project": (args.get("project") or "").strip() or None}
+    for key, arg in (("date_from", "from"), ("date_to", "to")):
+        value = (args.get(arg) or "").strip()
+        filters[key] = datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d") if value else None
+    return filters
+
+
+def _where(filters, alias, date_col, date_is_timestamp=False, as_of=False):
+    clauses, params = [], []
+    if filters.get("project"):
+        clauses.append(project_ids.filter_sql(alias))
+        params.append(filters["project"])
+    if filters.get("date_from") and not as_of:
+        clauses.append(f"{date_col} >= %s")
+        params.append(filters["date_from"])
+    if filters.get("date_to"):
+        if date_is_timestamp:
+            clauses.append(f"{date_col} < %s + INTERVAL 1 DAY")
+        else:
+            # receipts.date is stored as YYYY-MM-DD text, which sorts as a date
+            clauses.append(f"{date_col} <= %s")
+        params.append(filters["date_to"])
+    return (" AND ".join(clauses) or "1=1"), params
+
+
+def _stream(cursor, sql, params):
+    cursor.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            return
+        yield from rows
+
+
+def receipts_rows(cursor, filters):
+    where, params = _where(filters, "r", "r.date")
+    select = ", ".join(project_ids.name_sql("r") if col == "project_name" else f"r.{col}"
+                       for col, _ in RECEIPT_COLUMNS)
+    yield tuple(label for _, label in RECEIPT_COLUMNS)
+    yield from _stream(
+        cursor,
+        f"SELECT {select} FROM receipts r WHERE {where} ORDER BY r.date, r.id",
+        params,
+    )
+
+
+def commissions_rows(cursor, filters):
+    where, params = _where(filters, "c", "c.created_at", date_is_timestamp=True)
+    base = (f"c.id, {project_ids.name_sql('c')}, c.plot_no, c.created_at, c.sq_yards, c.negotiated_price, "
+            f"c.total_amount")
+    parts = [f"SELECT {base}, 'CGM' AS role, 0 AS role_order, c.cgm_name, c.cgm_total, "
+             f"c.cgm_at_agreement, c.cgm_at_registration FROM commissions c WHERE {where}"]
+    for order, (role, table) in enumerate(_ROLE_ENTRY_TABLES, start=1):
+        parts.append(
+            f"SELECT {base}, '{role}', {order}, e.name, e.total_amount, e.at_agreement, e.at_registration "
+            f"FROM {table} e JOIN commissions c ON e.commission_id = c.id WHERE {where}"
+        )
+    sql = " UNION ALL ".join(parts) + " ORDER BY 1, 9"
+    yield COMMISSION_HEADER
+    for row in _stream(cursor, sql, params * len(parts)):
+        # Drop role_order
+        yield row[:8] + row[9:]
+
+
+def _number(value):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def plot_ledger_rows(cursor, filters):
+    where, params = _where(filters, "r", "r.date", as_of=True)
+    yield PLOT_LEDGER_HEADER
+    rows = _stream(
+        cursor,
+        f"SELECT {project_ids.name_sql('r')}, r.plot_no, r.customer_name, r.square_yards, r.basic_price, "
+        f"r.amount_numeric FROM receipts r WHERE {where} AND r.plot_no IS NOT NULL AND r.plot_no != '' "
+        f"ORDER BY 1, 2, r.date DESC, r.id DESC",
+        params,
+    )
+    group = None
+    for project, plot_no, customer, sq_yards, basic_price, amount in rows:
+        if group is None or (project, plot_no) != tuple(group[:2]):
+            if group is not None:
+                yield _ledger_row(*group)
+            # Newest receipt first: its customer and sq. yards describe the plot
+            group = [project, plot_no, customer, _number(sq_yards) or 0, None, 0.0, 0]
+        if group[4] is None:
+            group[4] = _number(basic_price)
+        group[5] += amount or 0
+        group[6] += 1
+    if group is not None:
+        yield _ledger_row(*group)
+
+
+def _ledger_row(project, plot_no, customer, sq_yards, basic_price, paid, count):
+    # Same fallback as account_summary: price implied by what was paid
+    if not basic_price and sq_yards > 0 and paid > 0:
+        basic_price = paid / sq_yards
+    basic_price = basic_price or 0
+    sale = basic_price * sq_yards
+    return (project, plot_no, customer, sq_yards, round(basic_price, 2), round(sale, 2), round(paid, 2),
+            round(sale - paid, 2), count)
+
+
+DATASETS = {
+    "receipts": receipts_rows,
+    "commissions": commissions_rows,
+    "plot_ledger": plot_ledger_rows,
+}
+
+
+def csv_chunks(rows, chunk_rows=CSV_CHUNK_ROWS):
+    """Encode rows as CSV (UTF-8 with BOM, so Excel detects it), chunk_rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def write_xlsx(rows, title):
+    """Write rows into a write_only workbook on a temporary file. Returns the file, rewound."""
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title[:31])
+    for row in rows:
+        ws.append(row)
+    out = tempfile.TemporaryFile()
+    wb.save(out)
+    out.seek(0)
+    return out
+
+
+def filename(dataset, filters, fmt):
+    parts = [dataset]
+    if filters.get("project"):
+        parts.append("".join(ch if ch.isalnum() else "_" for ch in filters["project"]))
+    if filters.get("date_from") or filters.get("date_to"):
+        parts.append(f"{filters.get('date_from') or 'start'}_to_{filters.get('date_to') or 'today'}")
+    return "_".join(parts) + "." + fmt
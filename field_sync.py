@@ -0,0 +1,205 @@
+"""
+Offline delta sync for field agents' devices (/api/sync).
+
+A device with no token (or one that no longer applies) gets the compact
+state of every project it may view - the plot_state columnar payload per
+project - and a sync token. Sent back, the token returns only the plots
+that changed since, read from plot_status_log, so a refresh over a slow
+link costs a few hundred bytes instead of a full plots_list or layout page.
+
+The token is "s1.<seq>.<digest>": the plot_status_log high-water mark and a
+digest of the project set it covers. The mark never passes a change still
+in flight (plot_status_log.high_water), as a device keeps its token for as
+long as it stays offline. A change in the agent's permitted
+projects, or a seq the log has not reached (tenant restored), falls back to
+a full snapshot.
+
+Receipts captured offline are uploaded in bulk into pending_receipts (one
+executemany per request) for the usual admin approval. Every receipt
+carries a device-generated `client_ref`; refs already seen for the user
+are recorded in `sync_uploads` and reported as duplicates, so a retry after
+a dropped response never files a receipt twice, even once approved.
+"""
+
+import hashlib
+from datetime import datetime
+
+import database
+import plot_state
+import plot_status_log
+
+# MySQL error code for "Table doesn't exist"
+_ER_NO_SUCH_TABLE = 1146
+
+TOKEN_PREFIX = "s1."
+
+# Receipts accepted per upload request
+MAX_UPLOAD = 500
+
+MAX_CLIENT_REF = 64
+
+CREATE_SQL = """
+    CREATE TABLE IF NOT EXISTS sync_uploads (
+        submitted_by VARCHAR(255) NOT NULL,
+        client_ref VARCHAR(64) NOT NULL,
+        created_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (submitted_by, client_ref)
+    )
+"""
+
+# Optional text fields of an uploaded receipt, as in the receipt form
+_TEXT_FIELDS = ("no", "date", "venture", "customer_name", "square_yards", "purpose", "drawn_bank",
+                "branch", "payment_mode", "instrument_no")
+
+_INSERT_SQL = """
+    INSERT INTO pending_receipts
+    (no, project_name, date, venture, customer_name, amount_numeric, amount_words,
+     plot_no, square_yards, purpose, drawn_bank, branch, payment_mode, instrument_no,
+     submitted_by, submitted_at, status)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'pending')
+"""
+
+
+def _digest(projects):
+    return hashlib.sha1("\n".join(sorted(projects)).encode("utf-8")).hexdigest()[:12]
+
+
+def make_token(seq, projects):
+    return f"{TOKEN_PREFIX}{int(seq)}.{_digest(projects)}"
+
+
+def parse_token(token):
+    """(seq, digest) of a sync token. Raises ValueError for a malformed one."""
+    if not token.startswith(TOKEN_PREFIX):
+        raise ValueError(f"Unrecognised sync token {token!r}")
+    seq, _, digest = token[len(TOKEN_PREFIX):].partition(".")
+    if not digest or int(seq) < 0:
+        raise ValueError(f"Unrecognised sync token {token!r}")
+    return int(seq), digest
+
+
+def _changed_projects(cursor, since, upto):
+    if since == upto:
+        return set()
+    cursor.execute("SELECT DISTINCT project_name FROM plot_status_log WHERE seq > %s AND seq <= %s",
+                   (since, upto))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def sync_payload(cursor, projects, token=None):
+    """
+    Snapshot or delta payload for a device allowed to view `projects`.
+
+    Snapshot: {"full": true, "projects": {name: plot_state columns}}.
+    Delta: {"full": false, "projects": {name: [{"plot_no", "sold", "layout"}]}},
+    listing only projects with changes. Both carry the next "token".
+    """
+    projects = sorted(set(projects))
+    # High-water mark first, capped below seqs still in flight (see plot_status_log)
+    seq = plot_status_log.high_water(cursor)
+    since = None
+    if token:
+        try:
+            since, digest = parse_token(token)
+        except ValueError:
+            since = None
+        else:
+            if digest != _digest(projects) or since > seq:
+                since = None
+
+    if since is None:
+        payload = {"full": True,
+                   "projects": {name: plot_state.load_columns(cursor, name) for name in projects}}
+    else:
+        changed = _changed_projects(cursor, since, seq)
+        payload = {"full": False,
+                   "projects": {name: plot_status_log.changes_since(cursor, name, since, seq)
+                                for name in projects if name in changed}}
+    payload["token"] = make_token(seq, projects)
+    return payload
+
+
+def _number(value):
+    try:
+        return float(str(value).replace(",", "").strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def _validate(receipt, projects):
+    """Cleaned receipt dict, or raises ValueError with the reason."""
+    if not isinstance(receipt, dict):
+        raise ValueError("not an object")
+    client_ref = str(receipt.get("client_ref") or "").strip()
+    if not client_ref or len(client_ref) > MAX_CLIENT_REF:
+        raise ValueError(f"client_ref is required (at most {MAX_CLIENT_REF} characters)")
+    project_name = str(receipt.get("project_name") or "").strip()
+    if project_name not in projects:
+        raise ValueError(f"project {project_name!r} is not available to you")
+    plot_no = str(receipt.get("plot_no") or "").strip()
+    if not plot_no:
+        raise ValueError("plot_no is required")
+    amount = _number(receipt.get("amount_numeric", receipt.get("amount")))
+    if not amount or amount <= 0:
+        raise ValueError("amount must be a positive number")
+    cleaned = {field: str(receipt.get(field) or "").strip() for field in _TEXT_FIELDS}
+    cleaned.update(client_ref=client_ref, project_name=project_name, plot_no=plot_no, amount=amount)
+    return cleaned
+
+
+def _seen_refs(cursor, submitted_by, refs):
+    try:
+        cursor.execute(
+            f"SELECT client_ref FROM sync_uploads WHERE submitted_by = %s "
+            f"AND client_ref IN ({','.join(['%s'] * len(refs))})",
+            (submitted_by, *refs),
+        )
+    except database.Error as e:
+        if getattr(e, 'errno', None) != _ER_NO_SUCH_TABLE:
+            raise
+        print("Auto-migrating: Creating sync_uploads table...")
+        cursor.execute(CREATE_SQL)
+        return set()
+    return {row[0] for row in cursor.fetchall()}
+
+
+def upload_receipts(cursor, receipts, projects, submitted_by, amount_words):
+    """
+    Queue offline receipts into pending_receipts using the caller's cursor
+    (the caller bumps PENDING_RECEIPTS and commits). Returns
+    {"accepted": [refs], "duplicates": [refs], "errors": [{"index", "client_ref", "error"}]}.
+    """
+    result = {"accepted": [], "duplicates": [], "errors": []}
+    valid = {}
+    for index, receipt in enumerate(receipts):
+        try:
+            cleaned = _validate(receipt, projects)
+        except ValueError as e:
+            ref = receipt.get("client_ref") if isinstance(receipt, dict) else None
+            result["errors"].append({"index": index, "client_ref": ref, "error": str(e)})
+            continue
+        if cleaned["client_ref"] in valid:
+            result["duplicates"].append(cleaned["client_ref"])
+        else:
+            valid[cleaned["client_ref"]] = cleaned
+    if not valid:
+        return result
+
+    seen = _seen_refs(cursor, submitted_by, list(valid))
+    fresh = [r for ref, r in valid.items() if ref not in seen]
+    result["duplicates"].extend(ref for ref in valid if ref in seen)
+    if not fresh:
+        return result
+
+    submitted_at = datetime.utcnow().isoformat()
+    cursor.executemany(_INSERT_SQL, [
+        (r["no"], r["project_name"], r["date"], r["venture"], r["customer_name"], r["amount"],
+         amount_words(r["amount"]), r["plot_no"], r["square_yards"], r["purpose"], r["drawn_bank"],
+         r["branch"], r["payment_mode"], r["instrument_no"], submitted_by, submitted_at)
+        for r in fresh
+    ])
+    # A concurrent retry of the same refs fails here on the primary key and rolls back
+    cursor.executemany("INSERT INTO sync_uploads (submitted_by, client_ref) VALUES (%s, %s)",
+                       [(submitted_by, r["client_ref"]) for r in fresh])
+    result["accepted"] = [r["client_ref"] for r in fresh]
+    return result
@@ -0,0 +1,268 @@
+"""
+Background receipt import jobs (/import_receipts/process).
+
+Imports used to run inside the POST, so large sheets were cut off by nginx's
+proxy_read_timeout and left their upload behind in static/images. Now the
+POST records an `import_jobs` row and returns at once; a daemon thread runs
+receipt_import.import_rows and, inside the transaction of every committed
+batch, saves the job's checkpoint (last sheet row covered) and running
+counts. import_receipts.html polls /api/import-jobs/<id> for progress.
+
+A job that failed, or whose worker died (no heartbeat for STALE_SECONDS),
+can be resumed: the sheet is re-read from the top to rebuild the grouped
+plot context, but only rows after the checkpoint are written, so nothing is
+inserted twice. The upload is deleted once the job is done.
+
+Uploads are kept in a per-tenant directory under the upload folder
+(upload_dir), so cleaning up one tenant's abandoned sheets never touches
+another tenant's resumable uploads.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+
+import database
+import receipt_import
+
+# MySQL error code for "Table doesn't exist"
+_ER_NO_SUCH_TABLE = 1146
+
+# A running job that has not checkpointed for this long is presumed dead
+STALE_SECONDS = 600
+
+# Error messages kept in the job row (the count is always exact)
+MAX_STORED_ERRORS = 200
+
+# Uploads not claimed by an unfinished job are removed after this long
+UPLOAD_MAX_AGE = 24 * 3600
+
+_FILE_UNSAFE = re.compile(r"[^A-Za-z0-9_-]")
+
+CREATE_SQL = """
+    CREATE TABLE IF NOT EXISTS import_jobs (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        filename VARCHAR(255) NOT NULL,
+        mapping TEXT NOT NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'queued',
+        checkpoint_row INT NOT NULL DEFAULT 0,
+        rows_read INT NOT NULL DEFAULT 0,
+        imported INT NOT NULL DEFAULT 0,
+        skipped INT NOT NULL DEFAULT 0,
+        error_count INT NOT NULL DEFAULT 0,
+        errors MEDIUMTEXT NULL,
+        message TEXT NULL,
+        created_by VARCHAR(255) NULL,
+        created_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        KEY idx_import_jobs_status (status)
+    )
+"""
+
+_SELECT_SQL = """
+    SELECT id, filename, mapping, status, checkpoint_row, rows_read, imported, skipped,
+           error_count, errors, message, created_by, created_at,
+           TIMESTAMPDIFF(SECOND, updated_at, NOW()) AS idle_seconds
+    FROM import_jobs WHERE id = %s
+"""
+
+# A job may be (re)started if it never ran, failed, or its worker went quiet
+_CLAIM_SQL = f"""
+    UPDATE import_jobs SET status = 'running', message = NULL, updated_at = CURRENT_TIMESTAMP
+    WHERE id = %s AND (status IN ('queued', 'failed')
+          OR (status = 'running' AND updated_at < NOW() - INTERVAL {STALE_SECONDS} SECOND))
+"""
+
+_CHECKPOINT_SQL = """
+    UPDATE import_jobs SET checkpoint_row = %s, rows_read = %s, imported = %s, skipped = %s,
+           error_count = %s, errors = %s, updated_at = CURRENT_TIMESTAMP
+    WHERE id = %s
+"""
+
+# (tenant, job id) pairs running in this worker
+_active = set()
+_lock = threading.Lock()
+
+
+def create_job(conn, filename, mapping, created_by=None):
+    """Record a queued job for an uploaded sheet and commit. Returns its id."""
+    c = conn.cursor()
+    sql = "INSERT INTO import_jobs (filename, mapping, created_by) VALUES (%s, %s, %s)"
+    params = (filename, json.dumps(mapping), created_by)
+    try:
+        c.execute(sql, params)
+    except database.Error as e:
+        if getattr(e, 'errno', None) != _ER_NO_SUCH_TABLE:
+            raise
+        print("Auto-migrating: Creating import_jobs table...")
+        c.execute(CREATE_SQL)
+        c.execute(sql, params)
+    conn.commit()
+    return c.lastrowid
+
+
+def get_job(cursor, job_id):
+    try:
+        cursor.execute(_SELECT_SQL, (job_id,))
+    except database.Error as e:
+        if getattr(e, 'errno', None) != _ER_NO_SUCH_TABLE:
+            raise
+        return None
+    return database.fetch_one(cursor)
+
+
+def is_resumable(job):
+    return job["status"] == "failed" or (
+        job["status"] in ("queued", "running") and (job["idle_seconds"] or 0) > STALE_SECONDS)
+
+
+def progress(job):
+    """JSON-ready progress of a job row."""
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "rows_read": job["rows_read"],
+        "imported": job["imported"],
+        "skipped": job["skipped"],
+        "error_count": job["error_count"],
+        "errors": json.loads(job["errors"]) if job["errors"] else [],
+        "checkpoint_row": job["checkpoint_row"],
+        "message": job["message"],
+        "resumable": is_resumable(job),
+    }
+
+
+def _restore_summary(job):
+    summary = receipt_import.new_summary()
+    summary['total_rows'] = job["rows_read"]
+    summary['imported'] = job["imported"]
+    summary['skipped'] = job["skipped"]
+    summary['errors'] = json.loads(job["errors"]) if job["errors"] else []
+    return summary
+
+
+def _counts(summary):
+    errors = summary['errors']
+    return (summary['total_rows'], summary['imported'], summary['skipped'],
+            len(errors), json.dumps(errors[:MAX_STORED_ERRORS]))
+
+
+def run_job(db_config, job_id, upload_folder, amount_words):
+    """
+    Claim and run job `job_id` to completion in the calling thread, resuming
+    after its checkpoint. Returns the final status, or None if another
+    worker holds the job.
+    """
+    conn = database.get_db_connection(db_config)
+    try:
+        c = conn.cursor()
+        c.execute(_CLAIM_SQL, (job_id,))
+        claimed = c.rowcount == 1
+        conn.commit()
+        if not claimed:
+            return None
+        job = get_job(c, job_id)
+        filepath = os.path.join(upload_folder, job["filename"])
+        if not os.path.exists(filepath):
+            raise FileNotFoundError(f"Uploaded file {job['filename']} no longer exists")
+
+        summary = _restore_summary(job)
+
+        def checkpoint(cursor, last_row):
+            cursor.execute(_CHECKPOINT_SQL, (last_row, *_counts(summary), job_id))
+
+        print(f"Import job {job_id}: starting after row {job['checkpoint_row']}")
+        receipt_import.import_rows(
+            conn, receipt_import.iter_rows(filepath), json.loads(job["mapping"]), summary,
+            amount_words, resume_after=job["checkpoint_row"], checkpoint=checkpoint,
+            changed_by=job["created_by"])
+
+        c.execute(
+            "UPDATE import_jobs SET status = 'done', rows_read = %s, imported = %s, skipped = %s, "
+            "error_count = %s, errors = %s WHERE id = %s",
+            (*_counts(summary), job_id),
+        )
+        conn.commit()
+        print(f"Import job {job_id}: done, {summary['imported']} imported, {summary['skipped']} skipped")
+        try:
+            os.remove(filepath)
+        except OSError:
+            pass
+        return "done"
+    except Exception as e:
+        print(f"Import job {job_id} failed: {e}")
+        _mark_failed(db_config, job_id, str(e))
+        return "failed"
+    finally:
+        conn.close()
+
+
+def _mark_failed(db_config, job_id, message):
+    # Fresh connection: the job's own one may be what broke
+    try:
+        conn = database.get_db_connection(db_config)
+        try:
+            c = conn.cursor()
+            c.execute("UPDATE import_jobs SET status = 'failed', message = %s WHERE id = %s",
+                      (message[:1000], job_id))
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"Import job {job_id}: could not record failure: {e}")
+
+
+def start(db_config, job_id, upload_folder, amount_words):
+    """Run the job on a daemon thread unless this worker is already running it."""
+    key = (database.get_tenant_key(db_config), job_id)
+    with _lock:
+        if key in _active:
+            return None
+        _active.add(key)
+
+    def run():
+        try:
+            run_job(db_config, job_id, upload_folder, amount_words)
+        finally:
+            with _lock:
+                _active.discard(key)
+
+    thread = threading.Thread(target=run, name=f"import-job-{job_id}", daemon=True)
+    thread.start()
+    return thread
+
+
+def upload_dir(upload_folder, db_config=None):
+    """The current tenant's import upload directory under `upload_folder` (created if missing)."""
+    tenant = _FILE_UNSAFE.sub("_", database.get_tenant_key(db_config))
+    path = os.path.join(upload_folder, "imports", tenant)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def remove_stale_uploads(cursor, upload_folder, max_age=UPLOAD_MAX_AGE):
+    """
+    Delete import uploads older than `max_age` that no unfinished job still
+    needs (sheets abandoned on the mapping page). `upload_folder` must be the
+    tenant's upload_dir: only `cursor`'s import_jobs are consulted.
+    """
+    try:
+        cursor.execute("SELECT filename FROM import_jobs WHERE status != 'done'")
+        keep = {row[0] for row in cursor.fetchall()}
+    except database.Error as e:
+        if getattr(e, 'errno', None) != _ER_NO_SUCH_TABLE:
+            raise
+        keep = set()
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(upload_folder):
+        if (entry.name.startswith("import_") and entry.name not in keep and entry.is_file()
+                and entry.stat().st_mtime < cutoff):
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except OSError:
+                pass
+    return removed
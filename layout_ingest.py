@@ -0,0 +1,376 @@
+"""
+Upload-time processing of project layout SVGs.
+
+ingest_layout() parses an uploaded layout once and:
+
+- strips editor metadata (Inkscape/Sodipodi/Illustrator/Sketch namespaces,
+  <metadata>, comments) and insignificant whitespace
+- gives every plot-candidate shape a stable id, using the same
+  "gen-shape-<n>" scheme the viewer used to assign in the browser, so
+  existing plot_layouts.svg_element_id mappings keep working, and the
+  viewer's `plot-shape` class; the root is marked with INDEXED_ATTR so the
+  viewer skips its own walk of the DOM and uses delegated event handlers
+- records each element's id and bounding box in the `layout_elements` table
+- writes <name>.min.svg next to the upload, plus .gz and (if the optional
+  `brotli` package is installed) .br variants for serving precompressed
+
+The original upload is left untouched so it can be re-ingested.
+"""
+
+import gzip
+import math
+import os
+import re
+import xml.etree.ElementTree as ET
+
+import database
+
+try:
+    import brotli
+except ImportError:  # optional: only the .br variant is skipped
+    brotli = None
+
+SVG_NS = "http://www.w3.org/2000/svg"
+XLINK_NS = "http://www.w3.org/1999/xlink"
+
+# Namespaces that only carry editor state
+EDITOR_NAMESPACES = (
+    "http://www.inkscape.org/namespaces/inkscape",
+    "http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd",
+    "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "http://purl.org/dc/elements/1.1/",
+    "http://creativecommons.org/ns#",
+    "http://www.bohemiancoding.com/sketch/ns",
+    "http://ns.adobe.com/",
+    "http://www.serif.com/",
+)
+
+# Elements the viewer treats as clickable shapes (its first selector)
+SHAPE_TAGS = ("rect", "polygon", "path", "circle", "line", "polyline", "g", "ellipse", "text")
+GENERATED_ID_PREFIX = "gen-shape-"
+
+# Marker on the root element telling the viewer ids and classes are already
+# assigned; version 1 layouts (ids only) still get the viewer's full scan
+INDEXED_ATTR = "data-plot-index"
+INDEX_VERSION = "2"
+SHAPE_CLASS = "plot-shape"
+
+_TEXT_TAGS = ("text", "tspan", "textPath", "style", "script", "title", "desc")
+
+# MySQL error code for "Table doesn't exist"
+_ER_NO_SUCH_TABLE = 1146
+
+CREATE_SQL = """
+    CREATE TABLE IF NOT EXISTS layout_elements (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        project_name VARCHAR(255) NOT NULL,
+        element_id VARCHAR(255) NOT NULL,
+        tag VARCHAR(32) NOT NULL,
+        min_x DOUBLE NULL,
+        min_y DOUBLE NULL,
+        max_x DOUBLE NULL,
+        max_y DOUBLE NULL,
+        UNIQUE KEY unique_layout_element (project_name, element_id)
+    )
+"""
+
+ET.register_namespace("", SVG_NS)
+ET.register_namespace("xlink", XLINK_NS)
+
+_NUMBER = r"[-+]?(?:\d*\.\d+|\d+\.?)(?:[eE][-+]?\d+)?"
+_PATH_TOKEN = re.compile(r"[MmZzLlHhVvCcSsQqTtAa]|" + _NUMBER)
+_NUMBERS = re.compile(_NUMBER)
+_TRANSFORM = re.compile(r"(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)")
+_PATH_ARITY = {"m": 2, "l": 2, "h": 1, "v": 1, "c": 6, "s": 4, "q": 4, "t": 2, "a": 7, "z": 0}
+
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+# -------------------------------
+# Geometry helpers
+# -------------------------------
+def _local(tag):
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else ""
+
+
+def _namespace(name):
+    return name[1:].split("}", 1)[0] if name.startswith("{") else ""
+
+
+def _multiply(m, n):
+    a, b, c, d, e, f = m
+    a2, b2, c2, d2, e2, f2 = n
+    return (a * a2 + c * b2, b * a2 + d * b2,
+            a * c2 + c * d2, b * c2 + d * d2,
+            a * e2 + c * f2 + e, b * e2 + d * f2 + f)
+
+
+def parse_transform(value):
+    """SVG transform attribute -> affine matrix (a, b, c, d, e, f)."""
+    m = IDENTITY
+    for name, args in _TRANSFORM.findall(value or ""):
+        v = [float(x) for x in _NUMBERS.findall(args)]
+        if name == "matrix" and len(v) == 6:
+            t = tuple(v)
+        elif name == "translate" and v:
+            t = (1, 0, 0, 1, v[0], v[1] if len(v) > 1 else 0)
+        elif name == "scale" and v:
+            t = (v[0], 0, 0, v[1] if len(v) > 1 else v[0], 0, 0)
+        elif name == "rotate" and v:
+            r = math.radians(v[0])
+            cos, sin = math.cos(r), math.sin(r)
+            t = (cos, sin, -sin, cos, 0, 0)
+            if len(v) == 3:
+                cx, cy = v[1], v[2]
+                t = _multiply(_multiply((1, 0, 0, 1, cx, cy), t), (1, 0, 0, 1, -cx, -cy))
+        elif name == "skewX" and v:
+            t = (1, 0, math.tan(math.radians(v[0])), 1, 0, 0)
+        elif name == "skewY" and v:
+            t = (1, math.tan(math.radians(v[0])), 0, 1, 0, 0)
+        else:
+            continue
+        m = _multiply(m, t)
+    return m
+
+
+def _apply(m, x, y):
+    a, b, c, d, e, f = m
+    return a * x + c * y + e, b * x + d * y + f
+
+
+def _num(el, name, default=0.0):
+    v = _NUMBERS.match((el.get(name) or "").strip())
+    return float(v.group()) if v else default
+
+
+def path_points(d):
+    """End and control points of an SVG path (enough for a bounding box)."""
+    tokens = _PATH_TOKEN.findall(d or "")
+    points = []
+    cmd = None
+    x = y = start_x = start_y = 0.0
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        if tok.isalpha():
+            cmd = tok
+            i += 1
+            if cmd in "Zz":
+                x, y = start_x, start_y
+                continue
+        if cmd is None:
+            break
+        arity = _PATH_ARITY[cmd.lower()]
+        args = tokens[i:i + arity]
+        if len(args) < arity or any(a.isalpha() for a in args):
+            break
+        v = [float(a) for a in args]
+        i += arity
+        rel = cmd.islower()
+        kind = cmd.lower()
+        if kind == "h":
+            x = x + v[0] if rel else v[0]
+            points.append((x, y))
+        elif kind == "v":
+            y = y + v[0] if rel else v[0]
+            points.append((x, y))
+        elif kind == "a":
+            x, y = (x + v[5], y + v[6]) if rel else (v[5], v[6])
+            points.append((x, y))
+        else:
+            for j in range(0, arity, 2):
+                px, py = (x + v[j], y + v[j + 1]) if rel else (v[j], v[j + 1])
+                points.append((px, py))
+            x, y = points[-1]
+            if kind == "m":
+                start_x, start_y = x, y
+                # Further pairs after a moveto are implicit linetos
+                cmd = "l" if rel else "L"
+    return points
+
+
+def local_points(el):
+    """Geometry points of a shape in its own coordinate system."""
+    tag = _local(el.tag)
+    if tag == "rect":
+        x, y, w, h = _num(el, "x"), _num(el, "y"), _num(el, "width"), _num(el, "height")
+        return [(x, y), (x + w, y + h), (x + w, y), (x, y + h)]
+    if tag in ("circle", "ellipse"):
+        cx, cy = _num(el, "cx"), _num(el, "cy")
+        rx = _num(el, "r") if tag == "circle" else _num(el, "rx")
+        ry = _num(el, "r") if tag == "circle" else _num(el, "ry")
+        return [(cx - rx, cy - ry), (cx + rx, cy + ry), (cx + rx, cy - ry), (cx - rx, cy + ry)]
+    if tag == "line":
+        return [(_num(el, "x1"), _num(el, "y1")), (_num(el, "x2"), _num(el, "y2"))]
+    if tag in ("polyline", "polygon"):
+        v = [float(n) for n in _NUMBERS.findall(el.get("points") or "")]
+        return list(zip(v[0::2], v[1::2]))
+    if tag == "path":
+        return path_points(el.get("d"))
+    if tag == "text":
+        return [(_num(el, "x"), _num(el, "y"))]
+    return []
+
+
+def _union(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def _bbox(points, matrix):
+    if not points:
+        return None
+    xs, ys = zip(*(_apply(matrix, px, py) for px, py in points))
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+# -------------------------------
+# Ingest
+# -------------------------------
+def _strip_editor_data(root):
+    """Remove editor-only elements/attributes and insignificant whitespace."""
+    removed = 0
+    stack = [root]
+    while stack:
+        parent = stack.pop()
+        for child in list(parent):
+            tag = child.tag if isinstance(child.tag, str) else ""
+            if _local(tag) == "metadata" or _namespace(tag).startswith(EDITOR_NAMESPACES):
+                parent.remove(child)
+                removed += 1
+            else:
+                stack.append(child)
+    for el in root.iter():
+        for name in list(el.attrib):
+            if _namespace(name).startswith(EDITOR_NAMESPACES):
+                del el.attrib[name]
+        if _local(el.tag) not in _TEXT_TAGS:
+            if el.text is not None and not el.text.strip():
+                el.text = None
+        if el.tail is not None and not el.tail.strip():
+            el.tail = None
+    return removed
+
+
+def _index_elements(root):
+    """
+    Assign ids and compute root-space bounding boxes for the viewer's shape
+    elements, in document order. Returns [(element_id, tag, bbox), ...].
+    """
+    elements = []
+    counter = [0]
+
+    def walk(el, matrix):
+        # Returns the element's bbox (union of its children for groups)
+        matrix = _multiply(matrix, parse_transform(el.get("transform")))
+        tag = _local(el.tag)
+        record = None
+        if tag in SHAPE_TAGS:
+            index = counter[0]
+            counter[0] += 1
+            if not el.get("id"):
+                el.set("id", f"{GENERATED_ID_PREFIX}{index}")
+            classes = (el.get("class") or "").split()
+            if SHAPE_CLASS not in classes:
+                el.set("class", " ".join(classes + [SHAPE_CLASS]))
+            record = [el.get("id"), tag, None]
+            elements.append(record)
+
+        bbox = _bbox(local_points(el), matrix)
+        for child in el:
+            if isinstance(child.tag, str) and _local(child.tag) not in ("defs", "clipPath", "mask", "symbol"):
+                bbox = _union(bbox, walk(child, matrix))
+            elif isinstance(child.tag, str):
+                # Shapes in <defs> still count for id numbering, not for geometry
+                walk(child, matrix)
+        if record is not None:
+            record[2] = bbox
+        return bbox
+
+    for child in root:
+        if isinstance(child.tag, str):
+            walk(child, IDENTITY)
+    return [tuple(r) for r in elements]
+
+
+def variant_paths(svg_path):
+    """Paths of the minified variants written next to `svg_path`."""
+    base = svg_path[:-4] if svg_path.lower().endswith(".svg") else svg_path
+    minified = base + ".min.svg"
+    return {"min": minified, "gzip": minified + ".gz", "br": minified + ".br"}
+
+
+def write_variants(svg_bytes, svg_path):
+    """Write the minified, gzip and brotli variants; returns {kind: size}."""
+    paths = variant_paths(svg_path)
+    sizes = {}
+    with open(paths["min"], "wb") as f:
+        f.write(svg_bytes)
+    sizes["min"] = len(svg_bytes)
+
+    # mtime=0 keeps the output (and therefore its ETag) byte-identical across re-ingests
+    gz = gzip.compress(svg_bytes, compresslevel=9, mtime=0)
+    with open(paths["gzip"], "wb") as f:
+        f.write(gz)
+    sizes["gzip"] = len(gz)
+
+    if brotli is not None:
+        br = brotli.compress(svg_bytes, quality=11)
+        with open(paths["br"], "wb") as f:
+            f.write(br)
+        sizes["br"] = len(br)
+    elif os.path.exists(paths["br"]):
+        # Do not leave a stale .br behind from an older upload
+        os.remove(paths["br"])
+    return sizes
+
+
+def store_elements(conn, project_name, elements):
+    """Replace the project's rows in layout_elements (caller commits)."""
+    c = conn.cursor()
+    try:
+        c.execute("DELETE FROM layout_elements WHERE project_name = %s", (project_name,))
+    except database.Error as e:
+        if getattr(e, "errno", None) != _ER_NO_SUCH_TABLE:
+            raise
+        print("Auto-migrating: Creating layout_elements table...")
+        c.execute(CREATE_SQL)
+    rows = [(project_name, element_id, tag) + (bbox or (None, None, None, None))
+            for element_id, tag, bbox in elements]
+    for start in range(0, len(rows), 1000):
+        c.executemany(
+            "INSERT INTO layout_elements (project_name, element_id, tag, min_x, min_y, max_x, max_y) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            rows[start:start + 1000],
+        )
+
+
+def process_svg(svg_path):
+    """Parse, clean and index `svg_path`. Returns (minified bytes, elements, stripped count)."""
+    tree = ET.parse(svg_path)
+    root = tree.getroot()
+    if _local(root.tag) != "svg":
+        raise ValueError("Not an SVG document (root element is not <svg>)")
+    stripped = _strip_editor_data(root)
+    elements = _index_elements(root)
+    root.set(INDEXED_ATTR, INDEX_VERSION)
+    return ET.tostring(root, encoding="utf-8"), elements, stripped
+
+
+def ingest_layout(svg_path, project_name, conn):
+    """
+    Run the upload pipeline for one layout. Writes the variants and the
+    layout_elements rows (the caller commits). Returns a summary dict.
+    """
+    svg_bytes, elements, stripped = process_svg(svg_path)
+    sizes = write_variants(svg_bytes, svg_path)
+    store_elements(conn, project_name, elements)
+    return {
+        "elements": len(elements),
+        "stripped": stripped,
+        "original_bytes": os.path.getsize(svg_path),
+        **{f"{kind}_bytes": size for kind, size in sizes.items()},
+    }
@@ -0,0 +1,206 @@
+"""
+Server-side status-coloured layout variants.
+
+For an ingested layout (see layout_ingest) the viewer can load an SVG that
+is already painted with plot statuses instead of recolouring every mapped
+element in JavaScript. The colouring is a single <style> block injected
+after the root <svg> tag, with one rule per status listing the mapped
+element ids, so producing a variant is a byte splice of the minified layout
+rather than a re-parse.
+
+Variants are keyed by the project's plot_status_log high-water seq (which
+moves on every receipt or mapping change of that project) and the mtime of
+the minified layout, written to disk next to it (plain and .gz) and shared
+by all workers. Layout files are named after the project, which tenants can
+share, so variant file names also carry the tenant key. Each worker keeps the element -> status map of the last
+variant it built per project, so a newer seq only re-reads the plots logged
+in between (plot_status_log.changes_since) instead of the whole project.
+The seq is plot_status_log.high_water, which stops below changes still in
+flight, so a late-committing plot is picked up by the next variant.
+
+Superseded variants are removed once older than STALE_SECONDS: another
+worker may have just built one and still be sending it.
+"""
+
+import gzip
+import os
+import re
+import threading
+import time
+
+import database
+import plot_events
+import plot_status_log
+from plot_utils import normalize_plot_key
+
+STYLE_ID = "plot-status-style"
+
+# Same colours as the viewer's .plot-available / .plot-sold / .plot-hold classes
+STATUS_COLOURS = {
+    "available": ("#dcfce7", "#16a34a"),
+    "sold": ("#fee2e2", "#dc2626"),
+    "hold": ("#fef9c3", "#ca8a04"),
+}
+
+# Age after which a superseded variant file is removed
+STALE_SECONDS = 300
+
+_CSS_SAFE = re.compile(r"[A-Za-z0-9_-]")
+_FILE_UNSAFE = re.compile(r"[^A-Za-z0-9_-]")
+
+
+def plot_status(layout, sold_keys):
+    """Status the viewer would paint for a mapped plot (see applyPlotStatuses)."""
+    status = layout.get("status") or ("sold" if normalize_plot_key(layout["plot_no"]) in sold_keys else "available")
+    return status if status in ("sold", "hold") else "available"
+
+
+def _css_id(ident):
+    out = []
+    for i, ch in enumerate(ident):
+        if _CSS_SAFE.match(ch) and not (i == 0 and ch.isdigit()):
+            out.append(ch)
+        else:
+            out.append(f"\\{ord(ch):x} ")
+    return "#" + "".join(out)
+
+
+def build_style(element_status):
+    """<style> block colouring `element_status` ({element_id: status})."""
+    by_status = {}
+    for element_id, status in element_status.items():
+        by_status.setdefault(status, []).append(element_id)
+    rules = []
+    for status in sorted(by_status):
+        fill, stroke = STATUS_COLOURS[status]
+        selectors = ",".join(_css_id(e) for e in sorted(by_status[status]))
+        rules.append(f"{selectors}{{fill:{fill}!important;stroke:{stroke}!important}}")
+    return f'<style id="{STYLE_ID}">{"".join(rules)}</style>'.encode("utf-8")
+
+
+def splice(svg_bytes, style):
+    """Insert `style` as the first child of the root <svg> element."""
+    start = svg_bytes.find(b"<svg")
+    end = svg_bytes.find(b">", start)
+    if start < 0 or end < 0:
+        raise ValueError("No <svg> root element")
+    if svg_bytes[end - 1:end] == b"/":
+        # Empty <svg/>: open it so the style can go inside
+        return svg_bytes[:end - 1] + b">" + style + b"</svg>" + svg_bytes[end + 1:]
+    return svg_bytes[:end + 1] + style + svg_bytes[end + 1:]
+
+
+def etag(minified_path, seq, encoding=None):
+    """Strong ETag of the variant for (layout file, status seq, content encoding)."""
+    tag = f"{os.stat(minified_path).st_mtime_ns:x}-{seq}"
+    return f"{tag}-{encoding}" if encoding else tag
+
+
+def _variant_prefix(minified_path):
+    """Variant file name prefix for the current tenant."""
+    base = minified_path[:-len(".min.svg")] if minified_path.endswith(".min.svg") else minified_path
+    tenant = _FILE_UNSAFE.sub("_", database.get_tenant_key())
+    return f"{base}.status-{tenant}."
+
+
+def variant_path(minified_path, seq):
+    return f"{_variant_prefix(minified_path)}{os.stat(minified_path).st_mtime_ns:x}-{seq}.svg"
+
+
+class _ProjectVariant:
+    __slots__ = ("minified_path", "mtime", "seq", "element_status", "plot_elements")
+
+    def __init__(self, minified_path, mtime, seq, element_status, plot_elements):
+        self.minified_path = minified_path
+        self.mtime = mtime
+        self.seq = seq
+        self.element_status = element_status   # element_id -> status
+        self.plot_elements = plot_elements     # plot_key -> element_id
+
+
+_variants = {}
+# Builds are serialised per worker; they are a splice and a file write
+_lock = threading.Lock()
+
+
+def _full_state(cursor, project_name):
+    sold, layouts = plot_events.load_project_state(cursor, project_name)
+    sold_keys = {normalize_plot_key(p) for p in sold}
+    element_status, plot_elements = {}, {}
+    for layout in layouts.values():
+        element_id = layout.get("svg_element_id")
+        if element_id:
+            element_status[element_id] = plot_status(layout, sold_keys)
+            plot_elements[normalize_plot_key(layout["plot_no"])] = element_id
+    return element_status, plot_elements
+
+
+def _apply_changes(variant, changes):
+    for change in changes:
+        key = normalize_plot_key(change["plot_no"])
+        old_element = variant.plot_elements.pop(key, None)
+        if old_element is not None:
+            variant.element_status.pop(old_element, None)
+        layout = change["layout"]
+        if layout and layout.get("svg_element_id"):
+            sold_keys = {key} if change["sold"] else set()
+            variant.element_status[layout["svg_element_id"]] = plot_status(layout, sold_keys)
+            variant.plot_elements[key] = layout["svg_element_id"]
+
+
+def _write(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _remove_stale(minified_path, keep):
+    directory, prefix = os.path.split(_variant_prefix(minified_path))
+    cutoff = time.time() - STALE_SECONDS
+    for entry in os.listdir(directory):
+        path = os.path.join(directory, entry)
+        if not entry.startswith(prefix) or entry.endswith(".tmp") or path in keep:
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            # Already removed by another worker
+            pass
+
+
+def ensure_variant(cursor, project_name, minified_path, seq):
+    """
+    Path of the coloured variant for `seq`, building it (incrementally when
+    this worker built an earlier one) if it is not on disk yet. A .gz copy is
+    written alongside.
+    """
+    path = variant_path(minified_path, seq)
+    if os.path.exists(path) and os.path.exists(path + ".gz"):
+        return path
+
+    slot_key = (database.get_tenant_key(), project_name)
+    mtime = os.stat(minified_path).st_mtime_ns
+    with _lock:
+        return _build(slot_key, cursor, project_name, minified_path, mtime, seq, path)
+
+
+def _build(slot_key, cursor, project_name, minified_path, mtime, seq, path):
+    variant = _variants.get(slot_key)
+    if (variant is not None and variant.minified_path == minified_path
+            and variant.mtime == mtime and 0 < variant.seq <= seq):
+        if variant.seq < seq:
+            _apply_changes(variant, plot_status_log.changes_since(cursor, project_name, variant.seq, seq))
+            variant.seq = seq
+    else:
+        element_status, plot_elements = _full_state(cursor, project_name)
+        variant = _ProjectVariant(minified_path, mtime, seq, element_status, plot_elements)
+
+    with open(minified_path, "rb") as f:
+        data = splice(f.read(), build_style(variant.element_status))
+    _write(path, data)
+    _write(path + ".gz", gzip.compress(data, compresslevel=6, mtime=0))
+    _remove_stale(minified_path, {path, path + ".gz"})
+    _variants[slot_key] = variant
+    return path
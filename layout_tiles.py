@@ -0,0 +1,206 @@
+"""
+Raster tile pyramids for very large project layouts.
+
+Huge survey drawings make the vector viewer sluggish to pan and zoom, so
+layouts above a size threshold are rasterised once, offline, into a
+z/x/y pyramid of 256px WebP (or PNG) tiles under
+static/layouts/tiles/<layout name>/<version>/, plus a tiles.json manifest.
+Tile paths are versioned by the source file's mtime, so they can be served
+with long cache lifetimes. The viewer shows the tiles and overlays the
+layout_elements bounding boxes for clicks, mapping and status colours.
+
+Rendering needs `cairosvg` for SVG sources (in requirements.txt) or
+`PyMuPDF` (fitz) for PDF sources, which stays optional. A layout upload
+that crosses the threshold without a renderer is reported to the uploader.
+
+Usage (e.g. to regenerate after changing the settings below):
+    python layout_tiles.py static/layouts/vishvam_layout.svg [--force]
+"""
+
+import io
+import json
+import math
+import os
+import re
+import shutil
+import sys
+import threading
+import xml.etree.ElementTree as ET
+
+from PIL import Image, features
+
+try:
+    import cairosvg
+except ImportError:
+    cairosvg = None
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+TILE_SIZE = 256
+# Longest side of the full-resolution render (the deepest zoom level)
+MAX_DIMENSION = 8192
+# Layouts below both of these are left to the vector viewer
+MIN_SVG_BYTES = 2 * 1024 * 1024
+MIN_ELEMENTS = 2500
+
+MANIFEST_NAME = "tiles.json"
+
+_NUMBER = r"[-+]?(?:\d*\.\d+|\d+\.?)(?:[eE][-+]?\d+)?"
+
+Image.MAX_IMAGE_PIXELS = MAX_DIMENSION * MAX_DIMENSION
+
+
+def tile_format():
+    return "webp" if features.check("webp") else "png"
+
+
+def can_render(source_path):
+    ext = os.path.splitext(source_path)[1].lower()
+    return (ext == ".svg" and cairosvg is not None) or (ext == ".pdf" and fitz is not None)
+
+
+def should_tile(svg_bytes, element_count):
+    """Whether a layout is large enough to be served as tiles."""
+    return svg_bytes >= MIN_SVG_BYTES or element_count >= MIN_ELEMENTS
+
+
+def tiles_dir(layout_dir, source_path):
+    name = os.path.basename(source_path).split(".", 1)[0]
+    return os.path.join(layout_dir, "tiles", name)
+
+
+def load_manifest(tiles_path):
+    try:
+        with open(os.path.join(tiles_path, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _svg_viewbox(source_path):
+    """(min_x, min_y, width, height) of the root <svg>, read from its start tag only."""
+    for _, root in ET.iterparse(source_path, events=("start",)):
+        numbers = [float(n) for n in re.findall(_NUMBER, root.get("viewBox") or "")]
+        if len(numbers) == 4 and numbers[2] > 0 and numbers[3] > 0:
+            return tuple(numbers)
+        size = []
+        for attr in ("width", "height"):
+            m = re.match(_NUMBER, (root.get(attr) or "").strip())
+            size.append(float(m.group()) if m else 0)
+        if size[0] > 0 and size[1] > 0:
+            return (0.0, 0.0, size[0], size[1])
+        raise ValueError("SVG has neither a viewBox nor width/height")
+    raise ValueError("Empty SVG")
+
+
+def render(source_path, max_dimension=MAX_DIMENSION):
+    """Rasterise the first page/canvas of the layout. Returns (RGB image, viewbox)."""
+    ext = os.path.splitext(source_path)[1].lower()
+    if ext == ".svg":
+        if cairosvg is None:
+            raise RuntimeError("cairosvg is not installed")
+        viewbox = _svg_viewbox(source_path)
+        scale = max_dimension / max(viewbox[2], viewbox[3])
+        png = cairosvg.svg2png(url=source_path, output_width=round(viewbox[2] * scale),
+                               output_height=round(viewbox[3] * scale), background_color="white")
+        return Image.open(io.BytesIO(png)).convert("RGB"), viewbox
+    if ext == ".pdf":
+        if fitz is None:
+            raise RuntimeError("PyMuPDF is not installed")
+        with fitz.open(source_path) as doc:
+            page = doc[0]
+            zoom = max_dimension / max(page.rect.width, page.rect.height)
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+            return image, (0.0, 0.0, page.rect.width, page.rect.height)
+    raise ValueError(f"Unsupported layout type: {ext}")
+
+
+def build_pyramid(image, out_dir, fmt):
+    """Cut `image` into z/x/y tiles, halving it per level. Returns the deepest zoom."""
+    max_zoom = max(0, math.ceil(math.log2(max(image.size) / TILE_SIZE)))
+    save_args = {"quality": 80, "method": 4} if fmt == "webp" else {"optimize": True}
+    for z in range(max_zoom, -1, -1):
+        width, height = image.size
+        for x in range(math.ceil(width / TILE_SIZE)):
+            column = os.path.join(out_dir, str(z), str(x))
+            os.makedirs(column, exist_ok=True)
+            for y in range(math.ceil(height / TILE_SIZE)):
+                box = (x * TILE_SIZE, y * TILE_SIZE,
+                       min((x + 1) * TILE_SIZE, width), min((y + 1) * TILE_SIZE, height))
+                tile = image.crop(box)
+                if tile.size != (TILE_SIZE, TILE_SIZE):
+                    # Edge tiles are padded so the viewer never stretches them
+                    padded = Image.new("RGB", (TILE_SIZE, TILE_SIZE), "white")
+                    padded.paste(tile, (0, 0))
+                    tile = padded
+                tile.save(os.path.join(column, f"{y}.{fmt}"), **save_args)
+        if z:
+            image = image.reduce(2)
+    return max_zoom
+
+
+def generate_tiles(source_path, tiles_path, force=False):
+    """
+    Build the pyramid for `source_path` into `tiles_path` and write the
+    manifest. Older versions are removed once the new manifest is in place.
+    """
+    version = f"{os.stat(source_path).st_mtime_ns:x}"
+    manifest = load_manifest(tiles_path)
+    if manifest and manifest.get("version") == version and not force:
+        return manifest
+
+    image, viewbox = render(source_path)
+    fmt = tile_format()
+    version_dir = os.path.join(tiles_path, version)
+    shutil.rmtree(version_dir, ignore_errors=True)
+    os.makedirs(version_dir)
+    width, height = image.size
+    max_zoom = build_pyramid(image, version_dir, fmt)
+
+    manifest = {
+        "version": version,
+        "format": fmt,
+        "tile_size": TILE_SIZE,
+        "max_zoom": max_zoom,
+        "width": width,
+        "height": height,
+        "viewbox": list(viewbox),
+    }
+    tmp = os.path.join(tiles_path, MANIFEST_NAME + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(tiles_path, MANIFEST_NAME))
+
+    for entry in os.listdir(tiles_path):
+        if entry != version and os.path.isdir(os.path.join(tiles_path, entry)):
+            shutil.rmtree(os.path.join(tiles_path, entry), ignore_errors=True)
+    return manifest
+
+
+def generate_in_background(source_path, tiles_path):
+    """Run generate_tiles on a daemon thread so the upload request returns immediately."""
+    def run():
+        try:
+            manifest = generate_tiles(source_path, tiles_path)
+            print(f"Layout tiles ready for {source_path}: zoom 0-{manifest['max_zoom']}")
+        except Exception as e:
+            print(f"Layout tile generation failed for {source_path}: {e}")
+
+    thread = threading.Thread(target=run, name="layout-tiles", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if a != "--force"]
+    if len(args) != 1:
+        print(__doc__)
+        sys.exit(1)
+    source = args[0]
+    out = tiles_dir(os.path.dirname(os.path.abspath(source)), source)
+    result = generate_tiles(source, out, force="--force" in sys.argv)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,397 @@
+"""
+Versioned schema migrations for tenant databases.
+
+Each tenant DB records the migrations it has received in `schema_migrations`.
+Running this script applies every pending migration, in order, to the
+default DB and to every tenant registered in plotpro_master:
+
+    python migrate_tenants.py            # all tenants
+    python migrate_tenants.py --db plotpro_srinidhi
+
+Migrations are idempotent (they inspect information_schema before changing
+anything), so re-running on a partially migrated tenant is safe. The app
+queries columns added here (plot_key, project_id, ...), so start.sh runs
+this script before starting gunicorn and exits if any database failed.
+"""
+import os
+import sys
+
+import mysql.connector
+from dotenv import load_dotenv
+
+import change_log
+import commission_rules
+import data_versions
+import database
+import field_sync
+import plot_master
+import project_ids
+from plot_utils import PLOT_KEY_SQL, PLOT_NUM_SQL
+import import_jobs
+import layout_ingest
+import plot_status_log
+
+load_dotenv()
+
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_USER = os.getenv("DB_USER", "root")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "")
+
+# Prefix length used when an indexed column is TEXT (older tenants created
+# commissions.project_name as TEXT via migrate_commissions_table)
+TEXT_INDEX_PREFIX = 191
+
+
+# -------------------------------
+# Helpers
+# -------------------------------
+def _table_exists(c, table):
+    c.execute(
+        "SELECT 1 FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s",
+        (table,),
+    )
+    return c.fetchone() is not None
+
+
+def _column_types(c, table):
+    c.execute(
+        "SELECT column_name, data_type FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = %s",
+        (table,),
+    )
+    return {name: dtype.lower() for name, dtype in c.fetchall()}
+
+
+def _index_columns(c, table):
+    """Return {index_name: [col, ...]} for `table`."""
+    c.execute(
+        "SELECT index_name, column_name FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = %s ORDER BY index_name, seq_in_index",
+        (table,),
+    )
+    indexes = {}
+    for index_name, column_name in c.fetchall():
+        indexes.setdefault(index_name, []).append(column_name)
+    return indexes
+
+
+def ensure_index(c, table, index_name, columns):
+    """
+    Create `index_name` on `table(columns)` unless an index with the same
+    leading columns already exists. Returns True if an index was created.
+    """
+    if not _table_exists(c, table):
+        print(f"  - {table}: table missing, skipping {index_name}")
+        return False
+
+    types = _column_types(c, table)
+    missing = [col for col in columns if col not in types]
+    if missing:
+        print(f"  - {table}: columns {missing} missing, skipping {index_name}")
+        return False
+
+    for existing_name, existing_cols in _index_columns(c, table).items():
+        if existing_cols[:len(columns)] == list(columns):
+            print(f"  = {table}({', '.join(columns)}) already covered by {existing_name}")
+            return False
+
+    parts = []
+    for col in columns:
+        if types[col] in ("text", "mediumtext", "longtext", "blob"):
+            parts.append(f"`{col}`({TEXT_INDEX_PREFIX})")
+        else:
+            parts.append(f"`{col}`")
+    c.execute(f"ALTER TABLE `{table}` ADD INDEX `{index_name}` ({', '.join(parts)})")
+    print(f"  + {table}.{index_name} ({', '.join(columns)})")
+    return True
+
+
+# -------------------------------
+# Migrations
+# -------------------------------
+# Secondary indexes for the predicates the app filters on
+HOT_PATH_INDEXES = [
+    ("receipts", "idx_receipts_project_plot", ("project_name", "plot_no")),
+    ("receipts", "idx_receipts_no", ("no",)),
+    ("receipts", "idx_receipts_instrument_no", ("instrument_no",)),
+    ("commissions", "idx_commissions_project_plot_id", ("project_name", "plot_no", "id")),
+    ("pending_receipts", "idx_pending_status_submitted", ("status", "submitted_at")),
+    ("plot_layouts", "idx_plot_layouts_project_plot", ("project_name", "plot_no")),
+    ("commission_srgm_entries", "idx_name", ("name",)),
+    ("commission_gm_entries", "idx_name", ("name",)),
+    ("commission_dgm_entries", "idx_name", ("name",)),
+    ("commission_agm_entries", "idx_name", ("name",)),
+]
+
+
+def migration_001_hot_path_indexes(c):
+    for table, index_name, columns in HOT_PATH_INDEXES:
+        ensure_index(c, table, index_name, columns)
+
+
+# Tables that get the generated plot_key / plot_num columns
+PLOT_KEY_TABLES = ("receipts", "commissions")
+
+
+def migration_002_plot_key(c):
+    """
+    Add STORED generated columns plot_key (normalised plot number, see
+    plot_utils.normalize_plot_key) and plot_num (natural-sort integer), and
+    index them so plot lookups no longer wrap plot_no in functions.
+    """
+    for table in PLOT_KEY_TABLES:
+        if not _table_exists(c, table):
+            print(f"  - {table}: table missing, skipping plot_key")
+            continue
+        types = _column_types(c, table)
+        if "plot_key" not in types:
+            c.execute(
+                f"ALTER TABLE `{table}` ADD COLUMN plot_key VARCHAR(255) "
+                f"GENERATED ALWAYS AS ({PLOT_KEY_SQL}) STORED"
+            )
+            print(f"  + {table}.plot_key")
+        if "plot_num" not in types:
+            c.execute(
+                f"ALTER TABLE `{table}` ADD COLUMN plot_num INT UNSIGNED "
+                f"GENERATED ALWAYS AS ({PLOT_NUM_SQL}) STORED"
+            )
+            print(f"  + {table}.plot_num")
+        ensure_index(c, table, f"idx_{table}_project_plot_key", ("project_name", "plot_key", "plot_num"))
+        # Plot-only lookups (plot_detail, search without a project)
+        ensure_index(c, table, f"idx_{table}_plot_key", ("plot_key",))
+
+
+def migration_003_plot_status_log(c):
+    c.execute(plot_status_log.CREATE_SQL)
+    print("  + plot_status_log")
+
+
+def migration_004_layout_elements(c):
+    c.execute(layout_ingest.CREATE_SQL)
+    print("  + layout_elements")
+
+
+def migration_005_plot_layouts_unique(c):
+    """
+    Bulk mapping saves upsert on (project_name, plot_no); make sure the
+    unique key exists, keeping the newest row of any duplicates.
+    """
+    if not _table_exists(c, "plot_layouts"):
+        print("  - plot_layouts: table missing, skipping unique key")
+        return
+    c.execute(
+        "SELECT index_name FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = 'plot_layouts' AND non_unique = 0 "
+        "GROUP BY index_name HAVING GROUP_CONCAT(column_name ORDER BY seq_in_index) = 'project_name,plot_no'"
+    )
+    if c.fetchone():
+        print("  = plot_layouts(project_name, plot_no) already unique")
+        return
+    c.execute("""
+        DELETE older FROM plot_layouts older
+        JOIN plot_layouts newer
+          ON newer.project_name = older.project_name AND newer.plot_no = older.plot_no AND newer.id > older.id
+    """)
+    if c.rowcount:
+        print(f"  - plot_layouts: removed {c.rowcount} duplicate mappings")
+    c.execute("ALTER TABLE plot_layouts ADD UNIQUE KEY unique_plot (project_name, plot_no)")
+    print("  + plot_layouts.unique_plot")
+
+
+def migration_006_import_jobs(c):
+    c.execute(import_jobs.CREATE_SQL)
+    print("  + import_jobs")
+
+
+def migration_007_change_log(c):
+    c.execute(change_log.CREATE_SQL)
+    print("  + change_log")
+
+
+def migration_008_sync_uploads(c):
+    c.execute(field_sync.CREATE_SQL)
+    print("  + sync_uploads")
+
+
+def migration_009_commission_rules(c):
+    c.execute(commission_rules.CREATE_SQL)
+    print("  + commission_rules")
+
+
+def migration_010_plots(c):
+    """Plot master table, backfilled from the newest receipts of each plot (see plot_master)."""
+    c.execute(plot_master.CREATE_SQL)
+    c.execute(plot_master.BACKFILL_SQL)
+    print(f"  + plots ({c.rowcount} rows backfilled)")
+
+
+def _foreign_keys(c, table):
+    c.execute(
+        "SELECT constraint_name FROM information_schema.referential_constraints "
+        "WHERE constraint_schema = DATABASE() AND table_name = %s",
+        (table,),
+    )
+    return {row[0] for row in c.fetchall()}
+
+
+def migration_011_project_ids(c):
+    """
+    project_id INT + (project_id, plot_no) index + foreign key on the
+    project-scoped tables, backfilled online (see project_ids).
+    """
+    for table in project_ids.TABLES:
+        if not _table_exists(c, table):
+            print(f"  - {table}: table missing, skipping project_id")
+            continue
+        if "project_id" not in _column_types(c, table):
+            # Nullable column without a default: an instant ALTER on MySQL 8
+            c.execute(f"ALTER TABLE `{table}` ADD COLUMN project_id INT NULL")
+            print(f"  + {table}.project_id")
+        ensure_index(c, table, f"idx_{table}_project_id", ("project_id", "plot_no"))
+        added = project_ids.add_missing_projects(c, table)
+        if added:
+            print(f"  + projects: {added} names used by {table}")
+        print(f"  + {table}: {project_ids.backfill(c, table)} rows backfilled")
+        name = f"fk_{table}_project"
+        if name not in _foreign_keys(c, table):
+            # Values come from projects.id, so skip the check and add the key in place
+            c.execute("SET foreign_key_checks = 0")
+            try:
+                c.execute(f"ALTER TABLE `{table}` ADD CONSTRAINT `{name}` FOREIGN KEY (project_id) "
+                          f"REFERENCES projects (id) ON DELETE SET NULL")
+            finally:
+                c.execute("SET foreign_key_checks = 1")
+            print(f"  + {table}.{name}")
+
+
+def migration_012_data_versions(c):
+    c.execute(data_versions.CREATE_SQL)
+    print("  + data_versions")
+
+
+def migration_013_project_id_keys(c):
+    """
+    Readers filter on project_id now (see project_ids), and a rename no
+    longer rewrites plot_layouts.project_name: index project_id with
+    plot_key, and make plot_layouts unique on (project_id, plot_no) instead
+    of the name, keeping the newest row of any duplicates.
+    """
+    for table in PLOT_KEY_TABLES:
+        ensure_index(c, table, f"idx_{table}_project_id_plot_key", ("project_id", "plot_key", "plot_num"))
+    if not _table_exists(c, "plot_layouts"):
+        print("  - plot_layouts: table missing, skipping unique key")
+        return
+    indexes = _index_columns(c, "plot_layouts")
+    if "unique_project_plot" not in indexes:
+        c.execute("""
+            DELETE older FROM plot_layouts older
+            JOIN plot_layouts newer
+              ON newer.project_id = older.project_id AND newer.plot_no = older.plot_no AND newer.id > older.id
+        """)
+        if c.rowcount:
+            print(f"  - plot_layouts: removed {c.rowcount} duplicate mappings")
+        c.execute("ALTER TABLE plot_layouts ADD UNIQUE KEY unique_project_plot (project_id, plot_no)")
+        print("  + plot_layouts.unique_project_plot")
+    if "unique_plot" in indexes:
+        c.execute("ALTER TABLE plot_layouts DROP INDEX unique_plot")
+        print("  - plot_layouts.unique_plot")
+
+
+# (version, description, function) - append only, never renumber
+MIGRATIONS = [
+    (1, "hot-path secondary indexes", migration_001_hot_path_indexes),
+    (2, "generated plot_key / plot_num columns", migration_002_plot_key),
+    (3, "plot_status_log change log", migration_003_plot_status_log),
+    (4, "layout_elements SVG index", migration_004_layout_elements),
+    (5, "unique plot_layouts (project_name, plot_no)", migration_005_plot_layouts_unique),
+    (6, "import_jobs background imports", migration_006_import_jobs),
+    (7, "change_log receipt / commission change feed", migration_007_change_log),
+    (8, "sync_uploads offline receipt refs", migration_008_sync_uploads),
+    (9, "commission_rules per-project formulas", migration_009_commission_rules),
+    (10, "plots master table (price, sq. yards, customer)", migration_010_plots),
+    (11, "project_id foreign keys on receipts / commissions / plot_layouts", migration_011_project_ids),
+    (12, "data_versions write counters", migration_012_data_versions),
+    (13, "project_id plot keys: (project_id, plot_key) indexes, unique plot_layouts (project_id, plot_no)",
+     migration_013_project_id_keys),
+]
+
+
+def apply_migrations(conn):
+    """Apply every pending migration to the DB behind `conn`. Returns versions applied."""
+    c = conn.cursor()
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT NOT NULL PRIMARY KEY,
+            description VARCHAR(255),
+            applied_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    c.execute("SELECT version FROM schema_migrations")
+    done = {row[0] for row in c.fetchall()}
+
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        print(f"Applying migration {version}: {description}")
+        migrate(c)
+        c.execute(
+            "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+            (version, description),
+        )
+        conn.commit()
+        applied.append(version)
+    return applied
+
+
+def tenant_databases():
+    """Return the DB names of every registered tenant (empty if master is unreachable)."""
+    try:
+        conn = mysql.connector.connect(host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database="plotpro_master")
+        c = conn.cursor(dictionary=True)
+        c.execute("SELECT db_name, db_host, db_user, db_password FROM tenants ORDER BY id")
+        rows = c.fetchall()
+        conn.close()
+        return rows
+    except mysql.connector.Error as e:
+        print(f"⚠️  Could not read tenants from plotpro_master: {e}")
+        return []
+
+
+def migrate_all(only_db=None):
+    """Migrate the default DB and every tenant. Returns the names of the DBs that failed."""
+    targets = [{"db_name": os.getenv("DB_NAME", "receipt_app"), "db_host": DB_HOST,
+                "db_user": DB_USER, "db_password": DB_PASSWORD}]
+    targets += tenant_databases()
+
+    seen = set()
+    failed = []
+    for t in targets:
+        if t["db_name"] in seen or (only_db and t["db_name"] != only_db):
+            continue
+        seen.add(t["db_name"])
+        print(f"--- {t['db_name']} ---")
+        try:
+            conn = database.get_db_connection({
+                "host": t["db_host"] or DB_HOST,
+                "user": t["db_user"] or DB_USER,
+                "password": t["db_password"] or "",
+                "database": t["db_name"],
+            })
+            applied = apply_migrations(conn)
+            conn.close()
+            print(f"✅ {t['db_name']}: applied {applied or 'nothing (up to date)'}")
+        except Exception as e:
+            print(f"❌ {t['db_name']}: migration failed: {e}")
+            failed.append(t["db_name"])
+    return failed
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations to tenant databases")
+    parser.add_argument("--db", help="Only migrate this database name")
+    args = parser.parse_args()
+
+    if migrate_all(args.db):
+        sys.exit(1)
@@ -0,0 +1,284 @@
+"""
+Server-sent plot status events for the layout viewer.
+
+Every open viewer subscribes to the PlotEventHub of its worker. Per tenant
+there is a single watcher thread that polls data_versions once a second
+(one primary-key read, shared by all of that tenant's streams). When the
+receipts or plot_layouts version moves it reloads the sold plots and plot
+mappings of the projects that have subscribers, diffs them against the
+previous state and fans the changes out to each subscriber queue.
+
+Event ids are "<receipts version>-<plot_layouts version>". The versions
+come from the database, so an id means the same thing on every worker and
+a reconnect with Last-Event-ID can be resumed from the watcher's recent
+history. If that history does not reach back far enough, the client gets a
+fresh snapshot.
+
+A stream holds one gthread request thread for up to MAX_STREAM_SECONDS, so
+each worker serves at most MAX_STREAMS of them (well below the 16 threads
+start.sh gives it). Past that, subscribe() raises StreamLimitError and the
+viewer falls back to polling /api/plot-status.
+"""
+
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+import database
+import data_versions
+import project_ids
+from plot_utils import LAYOUT_COLUMNS
+
+# Seconds between data_versions polls per tenant
+POLL_INTERVAL = 1.0
+# Seconds of silence before a heartbeat comment is sent
+HEARTBEAT_INTERVAL = 15
+# Streams are closed after this long; EventSource reconnects with Last-Event-ID
+MAX_STREAM_SECONDS = 300
+# Change batches kept per project for Last-Event-ID resume
+HISTORY_SIZE = 200
+# Open streams per worker; the rest of the thread pool stays free for requests
+MAX_STREAMS = 6
+
+_TABLES = (data_versions.RECEIPTS, data_versions.PLOT_LAYOUTS)
+
+
+class StreamLimitError(RuntimeError):
+    """Raised by PlotEventHub.subscribe when the worker already serves MAX_STREAMS streams."""
+
+
+def _event_id(versions):
+    return f"{versions[0]}-{versions[1]}"
+
+
+def _parse_event_id(value):
+    try:
+        r, l = (value or '').split('-')
+        return int(r), int(l)
+    except ValueError:
+        return None
+
+
+def format_sse(event, data, event_id=None):
+    """Serialise one SSE message."""
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append("data: " + json.dumps(data, default=str))
+    return "\n".join(lines) + "\n\n"
+
+
+def load_project_state(c, project_name):
+    """Return (sold plot set, {plot_no: layout row}) for one project."""
+    c.execute(
+        "SELECT DISTINCT plot_no FROM receipts "
+        f"WHERE {project_ids.filter_sql()} AND plot_no IS NOT NULL AND plot_no != ''",
+        (project_name,),
+    )
+    sold = {str(row[0]) for row in c.fetchall()}
+    c.execute(f"SELECT {', '.join(LAYOUT_COLUMNS)} FROM plot_layouts WHERE {project_ids.filter_sql()}",
+              (project_name,))
+    layouts = {str(row[0]): dict(zip(LAYOUT_COLUMNS, row)) for row in c.fetchall()}
+    return sold, layouts
+
+
+def diff_state(old, new):
+    """Change batch between two project states, or None if nothing changed."""
+    old_sold, old_layouts = old
+    new_sold, new_layouts = new
+    changes = {
+        "sold": sorted(new_sold - old_sold),
+        "released": sorted(old_sold - new_sold),
+        "layouts": [row for plot_no, row in sorted(new_layouts.items()) if old_layouts.get(plot_no) != row],
+        "layouts_removed": sorted(set(old_layouts) - set(new_layouts)),
+    }
+    if not any(changes.values()):
+        return None
+    return changes
+
+
+class Subscription:
+    def __init__(self, tenant_key, project_name):
+        self.tenant_key = tenant_key
+        self.project_name = project_name
+        self.queue = queue.Queue()
+
+
+class _ProjectState:
+    def __init__(self, state, versions):
+        self.state = state
+        self.versions = versions
+        # Versions the oldest history entry was diffed from
+        self.since = versions
+        self.history = deque()  # (versions, changes)
+
+    def record(self, versions, changes):
+        self.history.append((versions, changes))
+        while len(self.history) > HISTORY_SIZE:
+            self.since = self.history.popleft()[0]
+
+    def messages_after(self, last_versions):
+        """Change messages after `last_versions`, or None if they cannot be replayed exactly."""
+        if last_versions == self.versions:
+            return []
+        boundaries = [self.since] + [v for v, _ in self.history]
+        if last_versions not in boundaries:
+            return None
+        start = boundaries.index(last_versions)
+        return [format_sse("changes", ch, _event_id(v)) for v, ch in list(self.history)[start:]]
+
+
+class _TenantWatcher:
+    """Polls one tenant's data_versions and publishes project changes."""
+
+    def __init__(self, hub, tenant_key, db_config):
+        self.hub = hub
+        self.tenant_key = tenant_key
+        self.db_config = db_config
+        self.projects = {}       # project_name -> _ProjectState
+        self.subscribers = {}    # project_name -> set(Subscription)
+        self.thread = threading.Thread(target=self._run, name=f"plot-events-{tenant_key}", daemon=True)
+
+    def load(self, project_name):
+        """Fresh tracked state of a project (call without the hub lock)."""
+        conn = database.get_db_connection(self.db_config)
+        try:
+            versions = self._versions(conn)
+            state = load_project_state(conn.cursor(), project_name)
+        finally:
+            conn.close()
+        return _ProjectState(state, versions)
+
+    def _versions(self, conn):
+        v = data_versions.get_versions(_TABLES, conn=conn)
+        return tuple(v[t] for t in _TABLES)
+
+    def _run(self):
+        while True:
+            time.sleep(POLL_INTERVAL)
+            with self.hub.lock:
+                if not self.subscribers:
+                    self.hub.watchers.pop(self.tenant_key, None)
+                    return
+                projects = list(self.subscribers)
+            try:
+                self._poll(projects)
+            except Exception as e:
+                print(f"Plot event watcher for {self.tenant_key} failed to poll: {e}")
+
+    def _poll(self, projects):
+        conn = database.get_db_connection(self.db_config)
+        try:
+            versions = self._versions(conn)
+            c = conn.cursor()
+            for project_name in projects:
+                tracked = self.projects.get(project_name)
+                if tracked is None or tracked.versions == versions:
+                    continue
+                new_state = load_project_state(c, project_name)
+                changes = diff_state(tracked.state, new_state)
+                with self.hub.lock:
+                    tracked.state = new_state
+                    tracked.versions = versions
+                    if changes is None:
+                        continue
+                    tracked.record(versions, changes)
+                    subs = list(self.subscribers.get(project_name, ()))
+                message = format_sse("changes", changes, _event_id(versions))
+                for sub in subs:
+                    sub.queue.put(message)
+        finally:
+            conn.close()
+
+
+class PlotEventHub:
+    """Per-worker registry of tenant watchers and their subscribers."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.watchers = {}
+        self.streams = 0
+
+    def subscribe(self, project_name, last_event_id=None):
+        """
+        Subscribe the current tenant to `project_name`. Returns the
+        Subscription and the message(s) to send first: the changes missed
+        since `last_event_id` if they are still in history, otherwise a full
+        snapshot. Raises StreamLimitError when this worker is at MAX_STREAMS.
+        """
+        db_config = database.get_tenant_db_config()
+        tenant_key = database.get_tenant_key(db_config)
+        sub = Subscription(tenant_key, project_name)
+
+        with self.lock:
+            if self.streams >= MAX_STREAMS:
+                raise StreamLimitError(f"{self.streams} plot event streams already open")
+            self.streams += 1
+            watcher = self.watchers.get(tenant_key)
+            start = watcher is None
+            if start:
+                watcher = _TenantWatcher(self, tenant_key, db_config)
+                self.watchers[tenant_key] = watcher
+            # Registered before loading so the watcher keeps running meanwhile
+            watcher.subscribers.setdefault(project_name, set()).add(sub)
+            tracked = watcher.projects.get(project_name)
+        if start:
+            watcher.thread.start()
+
+        if tracked is None:
+            # First subscriber of the project: load it without blocking other streams
+            try:
+                loaded = watcher.load(project_name)
+            except Exception:
+                self.unsubscribe(sub)
+                raise
+        with self.lock:
+            if tracked is None:
+                tracked = watcher.projects.setdefault(project_name, loaded)
+            initial = self._initial_messages(tracked, _parse_event_id(last_event_id))
+        return sub, initial
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            self.streams -= 1
+            watcher = self.watchers.get(sub.tenant_key)
+            if watcher is None:
+                return
+            subs = watcher.subscribers.get(sub.project_name)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    # Stop polling the project; it is reloaded on the next subscribe
+                    del watcher.subscribers[sub.project_name]
+                    watcher.projects.pop(sub.project_name, None)
+
+    @staticmethod
+    def _initial_messages(tracked, last_versions):
+        if last_versions is not None:
+            missed = tracked.messages_after(last_versions)
+            if missed is not None:
+                return missed
+        sold, layouts = tracked.state
+        return [format_sse("snapshot", {"sold": sorted(sold), "layouts": list(layouts.values())},
+                           _event_id(tracked.versions))]
+
+    def stream(self, sub, initial):
+        """Generator of SSE text for one subscriber; unsubscribes when closed."""
+        try:
+            yield "retry: 3000\n\n"
+            for message in initial:
+                yield message
+            deadline = time.monotonic() + MAX_STREAM_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    yield sub.queue.get(timeout=HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+        finally:
+            self.unsubscribe(sub)
+
+
+hub = PlotEventHub()
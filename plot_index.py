@@ -0,0 +1,372 @@
+"""
+In-process plot / customer search index for type-ahead and plot filters.
+
+One PlotIndex is kept per (tenant, project) in each worker, plus one per
+tenant covering every project (project=None). It is built lazily from the
+receipts and commissions tables on first use and then served from memory:
+
+- plot numbers are matched by prefix of their normalised plot_key
+- customer names are matched by word prefix
+- terms of three or more characters also match anywhere via trigrams
+
+Plot filters (plots_only=True) keep the semantics of the LIKE '%term%' they
+replaced: customer names are ignored and plot numbers match anywhere, also
+for one- and two-character terms (a scan in natural order).
+
+Freshness: write routes in this worker call note_plot() / invalidate() after
+they commit, so their own results show up immediately. Writes made by other
+workers are picked up by comparing the receipts/commissions/projects
+data_versions counters, at most once every CHECK_INTERVAL seconds per index.
+A receipts or commissions bump is applied as a delta: the change_log rows
+after the index's seq name the plots touched, and only those plots of the
+index's project are re-read. Only a projects bump (e.g. a rename) or a delta
+of more than MAX_DELTA_PLOTS plots rebuilds the index from the tables.
+"""
+
+import heapq
+import threading
+import time
+
+import change_log
+import database
+import data_versions
+import project_ids
+from plot_utils import clean_plot_no, natural_sort_key, normalize_plot_key
+
+# Seconds between data_versions checks for an index
+CHECK_INTERVAL = 2.0
+
+# Longest prefix stored per plot key / customer name word
+MAX_PREFIX = 12
+
+# Plots a delta may touch before a full rebuild is cheaper
+MAX_DELTA_PLOTS = 2000
+
+SOURCE_RECEIPT = 'receipt'
+SOURCE_COMMISSION = 'commission'
+
+_TABLES = (data_versions.RECEIPTS, data_versions.COMMISSIONS, data_versions.PROJECTS)
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _prefixes(text):
+    return [text[:i] for i in range(1, min(len(text), MAX_PREFIX) + 1)]
+
+
+def _discard(postings, term, ident):
+    idents = postings.get(term)
+    if idents is not None:
+        idents.discard(ident)
+        if not idents:
+            del postings[term]
+
+
+class PlotIndex:
+    """Prefix/trigram index over the plots of one project (or all projects)."""
+
+    def __init__(self):
+        # (project_name, plot_key) -> {"plot_no", "customer_name", "name", "sources", "sort_key"}
+        self.entries = {}
+        self._by_key = {}
+        self._plot_prefix = {}
+        self._name_prefix = {}
+        self._trigrams = {}
+        self._ordered = None
+        # (source, row id) -> (project_name, plot_key) the row was indexed under
+        self._rows = {}
+
+    def add(self, project_name, plot_no, customer_name=None, source=SOURCE_RECEIPT, row_id=None):
+        plot_no = clean_plot_no(plot_no)
+        key = normalize_plot_key(plot_no)
+        if not key:
+            return
+        ident = (project_name, key)
+        if row_id is not None:
+            self._rows[(source, row_id)] = ident
+        entry = self.entries.get(ident)
+        if entry is None:
+            entry = {"plot_no": plot_no, "customer_name": None, "name": '', "sources": set(),
+                     "sort_key": (natural_sort_key(key), project_name or '')}
+            self.entries[ident] = entry
+            self._ordered = None
+            self._by_key.setdefault(key, set()).add(ident)
+            for p in _prefixes(key):
+                self._plot_prefix.setdefault(p, set()).add(ident)
+            for t in _trigrams(key):
+                self._trigrams.setdefault(t, set()).add(ident)
+        entry["sources"].add(source)
+
+        customer_name = (customer_name or '').strip()
+        if customer_name and not entry["customer_name"]:
+            entry["customer_name"] = customer_name
+            # Single-spaced, lower-cased copy used to verify matches
+            entry["name"] = ' '.join(customer_name.lower().split())
+            for word in entry["name"].split():
+                for p in _prefixes(word):
+                    self._name_prefix.setdefault(p, set()).add(ident)
+            for t in _trigrams(entry["name"]):
+                self._trigrams.setdefault(t, set()).add(ident)
+
+    def remove(self, ident):
+        """Drop the (project_name, plot_key) entry, if indexed."""
+        entry = self.entries.pop(ident, None)
+        if entry is None:
+            return
+        self._ordered = None
+        key = ident[1]
+        _discard(self._by_key, key, ident)
+        for p in _prefixes(key):
+            _discard(self._plot_prefix, p, ident)
+        for t in _trigrams(key) | _trigrams(entry["name"]):
+            _discard(self._trigrams, t, ident)
+        for word in entry["name"].split():
+            for p in _prefixes(word):
+                _discard(self._name_prefix, p, ident)
+
+    def row_plot(self, source, row_id):
+        """(project_name, plot_key) a receipt / commission row was last indexed under, or None."""
+        return self._rows.get((source, row_id))
+
+    def search(self, term, limit=10, source=None, plots_only=False):
+        """
+        Return matching entries, best first: exact plot, plot prefix,
+        customer prefix, then substring matches; natural plot order within
+        each group. `limit=None` returns every match. With `plots_only`
+        customer names are not matched and any plot number containing the
+        term matches, however short the term.
+        """
+        term = ' '.join((term or '').lower().split())
+        plot_term = normalize_plot_key(term)
+        if not term or (plots_only and not plot_term):
+            return []
+        entries = self.entries
+
+        # Callables returning (candidate set, predicate), in rank order
+        tiers = [
+            lambda: (self._by_key.get(plot_term, ()), None),
+            lambda: (self._plot_prefix.get(plot_term[:MAX_PREFIX], ()),
+                     None if len(plot_term) <= MAX_PREFIX else lambda i: i[1].startswith(plot_term)),
+        ]
+        if plots_only:
+            # Short terms have no trigram: check every plot
+            tiers.append(lambda: (self._trigram_candidates(plot_term) if len(plot_term) >= 3 else entries.keys(),
+                                  lambda i: plot_term in i[1]))
+        else:
+            tiers.append(lambda: self._name_prefix_tier(term))
+        if len(term) >= 3 and not plots_only:
+            tiers.append(lambda: (self._trigram_candidates(term),
+                                  lambda i: term in i[1] or term in entries[i]["name"]))
+
+        seen = set()
+        results = []
+        for tier in tiers:
+            want = None if limit is None else limit - len(results)
+            if want is not None and want <= 0:
+                break
+            candidates, predicate = tier()
+
+            def accept(i, predicate=predicate):
+                return (i not in seen
+                        and (source is None or source in entries[i]["sources"])
+                        and (predicate is None or predicate(i)))
+
+            matches = self._take(candidates, accept, want)
+            seen.update(matches)
+            results.extend(matches)
+
+        return [{"plot_no": entries[ident]["plot_no"], "project_name": ident[0],
+                 "customer_name": entries[ident]["customer_name"]} for ident in results]
+
+    def _take(self, candidates, accept, want):
+        """The first `want` accepted candidates in natural order (all if want is None)."""
+        sort_key = lambda i: self.entries[i]["sort_key"]
+        if want is None:
+            return sorted(filter(accept, candidates), key=sort_key)
+        if len(candidates) <= 8 * want:
+            return heapq.nsmallest(want, filter(accept, candidates), key=sort_key)
+        # Large candidate set: walk plots in natural order and stop early
+        out = []
+        for ident in self._natural_order():
+            if ident in candidates and accept(ident):
+                out.append(ident)
+                if len(out) == want:
+                    break
+        return out
+
+    def _natural_order(self):
+        if self._ordered is None:
+            self._ordered = sorted(self.entries, key=lambda i: self.entries[i]["sort_key"])
+        return self._ordered
+
+    def _name_prefix_tier(self, term):
+        words = term.split()
+        sets = [self._name_prefix.get(w[:MAX_PREFIX]) for w in words]
+        if any(s is None for s in sets):
+            return (), None
+        candidates = sets[0] if len(sets) == 1 else set.intersection(*sorted(sets, key=len))
+        if len(words) == 1 and len(term) <= MAX_PREFIX:
+            return candidates, None
+        # Words must be consecutive and start at a word boundary
+        return candidates, lambda i: (' ' + self.entries[i]["name"]).find(' ' + term) >= 0
+
+    def _trigram_candidates(self, term):
+        """Entries sharing the term's rarest trigram; callers verify the substring."""
+        sets = [self._trigrams.get(t) for t in _trigrams(term)]
+        if not sets or any(s is None for s in sets):
+            return set()
+        return min(sets, key=len)
+
+
+class _Slot:
+    __slots__ = ("index", "versions", "seq", "checked_at")
+
+    def __init__(self, index, versions, seq):
+        self.index = index
+        self.versions = versions
+        self.seq = seq              # change_log seq the index is current to
+        self.checked_at = time.monotonic()
+
+
+_slots = {}
+_lock = threading.Lock()
+
+
+def _read_rows(c, where, params):
+    """
+    (receipt rows, commission rows) matching `where` (columns of `t`),
+    newest receipt first so its customer name wins.
+    """
+    c.execute(
+        f"SELECT t.id, {project_ids.name_sql('t')}, t.plot_no, t.customer_name FROM receipts t "
+        f"WHERE {where} AND t.plot_no IS NOT NULL AND t.plot_no != '' ORDER BY t.id DESC",
+        params,
+    )
+    receipts = c.fetchall()
+    c.execute(
+        f"SELECT t.id, {project_ids.name_sql('t')}, t.plot_no FROM commissions t "
+        f"WHERE {where} AND t.plot_no IS NOT NULL AND t.plot_no != ''",
+        params,
+    )
+    return receipts, c.fetchall()
+
+
+def _add_rows(index, receipts, commissions):
+    for row_id, proj, plot_no, customer_name in receipts:
+        index.add(proj, plot_no, customer_name, SOURCE_RECEIPT, row_id)
+    for row_id, proj, plot_no in commissions:
+        index.add(proj, plot_no, None, SOURCE_COMMISSION, row_id)
+
+
+def _build(project_name, conn):
+    index = PlotIndex()
+    where = project_ids.filter_sql("t") if project_name else "t.project_name IS NOT NULL AND t.project_name != ''"
+    params = (project_name,) if project_name else ()
+    _add_rows(index, *_read_rows(conn.cursor(), where, params))
+    return index
+
+
+def _read_delta(index, c, seq, project_name):
+    """
+    (new seq, touched plots, their current rows) from the change_log rows
+    after `seq`, limited to `project_name` (None = all projects), or None if
+    more than MAX_DELTA_PLOTS plots were touched.
+    """
+    idents = set()
+    while True:
+        page = change_log.changes_since(c, seq)
+        for change in page["changes"]:
+            # change_log entity names are the index's source names
+            old = index.row_plot(change["entity"], change["id"])
+            if old is not None:
+                idents.add(old)
+            data = change["data"] or {}
+            key = normalize_plot_key(clean_plot_no(data.get("plot_no")))
+            if key and data.get("project_name"):
+                idents.add((data["project_name"], key))
+        seq = change_log.decode_cursor(page["next_cursor"])
+        if len(idents) > MAX_DELTA_PLOTS:
+            return None
+        if not page["has_more"]:
+            break
+    if project_name:
+        idents = {ident for ident in idents if ident[0] == project_name}
+
+    by_project = {}
+    for proj, key in idents:
+        by_project.setdefault(proj, []).append(key)
+    receipts, commissions = [], []
+    for proj, keys in sorted(by_project.items()):
+        r, cm = _read_rows(c, f"{project_ids.filter_sql('t')} AND t.plot_key IN ({','.join(['%s'] * len(keys))})",
+                           (proj, *sorted(keys)))
+        receipts.extend(r)
+        commissions.extend(cm)
+    return seq, idents, (receipts, commissions)
+
+
+def get_index(project_name=None):
+    """Return the current tenant's PlotIndex for `project_name` (None = all projects)."""
+    slot_key = (database.get_tenant_key(), project_name or None)
+    with _lock:
+        slot = _slots.get(slot_key)
+    if slot is not None and time.monotonic() - slot.checked_at < CHECK_INTERVAL:
+        return slot.index
+
+    conn = database.get_db_connection()
+    try:
+        versions = data_versions.get_versions(_TABLES, conn=conn)
+        if slot is not None and slot.versions == versions:
+            slot.checked_at = time.monotonic()
+            return slot.index
+        c = conn.cursor()
+        if slot is not None and slot.versions[data_versions.PROJECTS] == versions[data_versions.PROJECTS]:
+            delta = _read_delta(slot.index, c, slot.seq, project_name or None)
+            if delta is not None:
+                seq, idents, rows = delta
+                with _lock:
+                    for ident in idents:
+                        slot.index.remove(ident)
+                    _add_rows(slot.index, *rows)
+                    slot.versions, slot.seq, slot.checked_at = versions, seq, time.monotonic()
+                return slot.index
+        # Settled change_log position first, so the delta after it covers this build
+        seq = change_log.high_water(c)
+        index = _build(project_name or None, conn)
+    finally:
+        conn.close()
+
+    with _lock:
+        _slots[slot_key] = _Slot(index, versions, seq)
+    return index
+
+
+def suggest(term, project_name=None, limit=10, source=None, plots_only=False):
+    index = get_index(project_name)
+    # Deltas and note_plot() mutate the index under _lock from other threads
+    with _lock:
+        return index.search(term, limit=limit, source=source, plots_only=plots_only)
+
+
+def note_plot(project_name, plot_no, customer_name=None, source=SOURCE_RECEIPT):
+    """Record a committed plot write in this worker's loaded indexes."""
+    tenant = database.get_tenant_key()
+    with _lock:
+        for key in ((tenant, project_name or None), (tenant, None)):
+            slot = _slots.get(key)
+            if slot is not None:
+                slot.index.add(project_name, plot_no, customer_name, source)
+
+
+def invalidate(project_name=None):
+    """
+    Make this worker's indexes for `project_name` (None = every project) in
+    the current tenant re-check the data versions on next use, so a write
+    just committed here is applied before the next search.
+    """
+    tenant = database.get_tenant_key()
+    with _lock:
+        for key, slot in _slots.items():
+            if key[0] == tenant and (project_name is None or key[1] in (project_name, None)):
+                slot.checked_at = float("-inf")
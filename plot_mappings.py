@@ -0,0 +1,107 @@
+"""
+Plot mapping (plot_layouts) writes.
+
+upsert_mappings() validates a batch of plot mappings for one project and
+writes every valid row with a single multi-row
+INSERT ... ON DUPLICATE KEY UPDATE on the unique (project_id, plot_no)
+key, reporting a result per input row. Both /api/plot-mapping/save (one
+plot) and /api/plot-mapping/bulk-save go through it.
+"""
+
+import data_versions
+import plot_status_log
+import project_ids
+
+# Largest batch accepted by /api/plot-mapping/bulk-save
+MAX_BATCH = 2000
+
+_BOUNDARY_FIELDS = ("boundary_east", "boundary_west", "boundary_north", "boundary_south")
+_NUMBER_FIELDS = ("length", "width", "sq_yards")
+
+_COLUMNS = ("project_name", "plot_no", "facing", "length", "width", "area", "sq_yards", "status",
+            "boundary_east", "boundary_west", "boundary_north", "boundary_south", "svg_element_id")
+
+# mapping_row() values, then the project name again for its project_id
+UPSERT_SQL = (
+    f"INSERT INTO plot_layouts ({', '.join(_COLUMNS)}, project_id) "
+    f"VALUES ({', '.join(['%s'] * len(_COLUMNS))}, {project_ids.ID_SQL}) "
+    "ON DUPLICATE KEY UPDATE "
+    + ", ".join(f"{col} = VALUES({col})" for col in _COLUMNS[2:] + ("project_id",))
+)
+
+
+def mapping_row(project_name, data):
+    """
+    Column values for one mapping (same defaults as the mapping form).
+    Raises ValueError for a missing plot number or a non-numeric size.
+    """
+    plot_no = str(data.get('plot_no') or '').strip()
+    if not plot_no:
+        raise ValueError("Missing plot_no")
+    numbers = {}
+    for field in _NUMBER_FIELDS:
+        try:
+            numbers[field] = float(data.get(field) or 0)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid {field}: {data.get(field)!r}")
+    length, width, sq_yards = numbers["length"], numbers["width"], numbers["sq_yards"]
+    # Area falls back to length x width when sq_yards is not given
+    area = sq_yards if sq_yards > 0 else (length * width if length and width else 0)
+    return ((project_name, plot_no, data.get('facing'), length, width, area, sq_yards,
+             data.get('status', 'available'))
+            + tuple(data.get(field, '') for field in _BOUNDARY_FIELDS)
+            + (data.get('element_id'),))
+
+
+def upsert_mappings(conn, project_name, mappings):
+    """
+    Validate and write `mappings` (list of dicts as posted by the viewer) in
+    one transaction. Returns a result per input row, in order:
+    {"index", "plot_no", "result": "inserted" | "updated" | "error", ["error"]}.
+    The caller owns the connection; it is committed here if anything was written.
+    """
+    results = []
+    rows = []
+    seen = set()
+    for index, data in enumerate(mappings):
+        plot_no = str(data.get('plot_no') or '').strip() if isinstance(data, dict) else ''
+        try:
+            if not isinstance(data, dict):
+                raise ValueError("Mapping must be an object")
+            if plot_no.lower() in seen:
+                raise ValueError("Duplicate plot_no in request")
+            row = mapping_row(project_name, data)
+        except ValueError as e:
+            results.append({"index": index, "plot_no": plot_no, "result": "error", "error": str(e)})
+            continue
+        seen.add(plot_no.lower())
+        rows.append(row)
+        results.append({"index": index, "plot_no": plot_no, "result": None})
+
+    if not rows:
+        return results
+
+    c = conn.cursor()
+    plot_nos = [row[1] for row in rows]
+    c.execute(
+        f"SELECT plot_no FROM plot_layouts WHERE {project_ids.filter_sql()} "
+        f"AND plot_no IN ({', '.join(['%s'] * len(plot_nos))})",
+        (project_name, *plot_nos),
+    )
+    # Compared the way the unique key's collation does (case-insensitive)
+    existing = {str(r[0]).lower() for r in c.fetchall()}
+
+    try:
+        project_ids.ensure(c, project_name)
+        c.executemany(UPSERT_SQL, [row + (project_name,) for row in rows])
+        plot_status_log.record(c, [(project_name, plot_no) for plot_no in plot_nos])
+        data_versions.bump(c, data_versions.PLOT_LAYOUTS)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    for result in results:
+        if result["result"] is None:
+            result["result"] = "updated" if result["plot_no"].lower() in existing else "inserted"
+    return results
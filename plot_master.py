@@ -0,0 +1,161 @@
+"""
+Plot master table: price, sq. yards and customer per (project, plot).
+
+A plot's basic price used to live on every one of its receipts, so saving
+a receipt with a price ran `UPDATE receipts SET basic_price ... WHERE
+plot_no = ...` over all of them (and, when editing, over that plot number
+in every project), and readers scanned the receipts for the first one with
+a price. `plots` keeps one row per (project_name, plot_key) instead:
+
+- receipt writes (create, edit, approval, import) upsert the plot's row in
+  their own transaction - one row, whatever the number of receipts;
+- blank values never overwrite known ones, so a receipt without a price
+  keeps the plot's price;
+- plot_detail and account_summary read the price and sq. yards from it.
+
+The receipt's own basic_price / square_yards columns stay as entered, as
+the history the dated plot ledger export folds. Migration 10 creates the
+table and backfills it from the newest receipts of each plot.
+"""
+
+import database
+import project_ids
+from plot_utils import PLOT_KEY_SQL, clean_plot_no, normalize_plot_key
+
+# MySQL error code for "Table doesn't exist"
+_ER_NO_SUCH_TABLE = 1146
+
+CREATE_SQL = """
+    CREATE TABLE IF NOT EXISTS plots (
+        project_name VARCHAR(255) NOT NULL,
+        plot_key VARCHAR(255) NOT NULL,
+        plot_no VARCHAR(255) NOT NULL,
+        basic_price DOUBLE NULL,
+        square_yards DOUBLE NULL,
+        customer_name VARCHAR(255) NULL,
+        updated_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (project_name, plot_key)
+    )
+"""
+
+_UPSERT_SQL = (
+    "INSERT INTO plots (project_name, plot_key, plot_no, basic_price, square_yards, customer_name) "
+    "VALUES (%s, %s, %s, %s, %s, %s) "
+    "ON DUPLICATE KEY UPDATE plot_no = VALUES(plot_no), "
+    "basic_price = COALESCE(VALUES(basic_price), basic_price), "
+    "square_yards = COALESCE(VALUES(square_yards), square_yards), "
+    "customer_name = COALESCE(VALUES(customer_name), customer_name)"
+)
+
+# Receipt text columns that hold a plain number
+_NUMERIC = "'^[0-9]+([.][0-9]+)?$'"
+
+# One row per plot from its receipts: the newest non-blank value of each
+# column, newest first as plot_detail always read them. Existing rows win.
+BACKFILL_SQL = f"""
+    INSERT INTO plots (project_name, plot_key, plot_no, basic_price, square_yards, customer_name)
+    SELECT project_name, plot_key, plot_no, price, sq_yards, customer
+    FROM (
+        SELECT project_name, plot_key, plot_no,
+               ROW_NUMBER() OVER (PARTITION BY project_name, plot_key ORDER BY date DESC, id DESC) AS rn,
+               FIRST_VALUE(price) OVER (PARTITION BY project_name, plot_key
+                                        ORDER BY price IS NULL, date DESC, id DESC) AS price,
+               FIRST_VALUE(sq_yards) OVER (PARTITION BY project_name, plot_key
+                                           ORDER BY sq_yards IS NULL, date DESC, id DESC) AS sq_yards,
+               FIRST_VALUE(customer) OVER (PARTITION BY project_name, plot_key
+                                           ORDER BY customer IS NULL, date DESC, id DESC) AS customer
+        FROM (
+            SELECT id, date, project_name, {PLOT_KEY_SQL} AS plot_key, TRIM(plot_no) AS plot_no,
+                   IF(TRIM(basic_price) REGEXP {_NUMERIC}, TRIM(basic_price) + 0, NULL) AS price,
+                   IF(TRIM(square_yards) REGEXP {_NUMERIC}, TRIM(square_yards) + 0, NULL) AS sq_yards,
+                   NULLIF(TRIM(customer_name), '') AS customer
+            FROM receipts
+            WHERE project_name IS NOT NULL AND project_name != '' AND plot_no IS NOT NULL AND TRIM(plot_no) != ''
+        ) r
+    ) t
+    WHERE rn = 1
+    ON DUPLICATE KEY UPDATE plot_no = plots.plot_no
+"""
+
+
+def _number(raw):
+    if raw is None:
+        return None
+    try:
+        return float(str(raw).replace(",", "").strip())
+    except ValueError:
+        return None
+
+
+def _row(project_name, plot_no, basic_price=None, square_yards=None, customer_name=None):
+    project_name = (project_name or "").strip()
+    plot_no = clean_plot_no(plot_no)
+    if not project_name or not plot_no:
+        return None
+    customer_name = (customer_name or "").strip() or None
+    return (project_name, normalize_plot_key(plot_no), plot_no, _number(basic_price), _number(square_yards),
+            customer_name)
+
+
+def record(cursor, plots):
+    """
+    Upsert (project_name, plot_no, basic_price, square_yards, customer_name)
+    tuples into `plots` with the caller's cursor (caller commits). Blank or
+    unparseable values keep what the plot already has; rows without a
+    project or plot are skipped. Tenants created before this table existed
+    are healed on first use (migration 10 backfills them).
+    """
+    rows = [row for row in (_row(*plot) for plot in plots) if row]
+    if not rows:
+        return
+    try:
+        cursor.executemany(_UPSERT_SQL, rows)
+    except database.Error as e:
+        if getattr(e, 'errno', None) != _ER_NO_SUCH_TABLE:
+            raise
+        print("Auto-migrating: Creating plots table...")
+        cursor.execute(CREATE_SQL)
+        cursor.executemany(_UPSERT_SQL, rows)
+
+
+def get(cursor, project_name, plot_no):
+    """
+    {"plot_no", "basic_price", "square_yards", "customer_name"} of a plot,
+    or None (also before the tenant has a plots table).
+    """
+    try:
+        cursor.execute(
+            "SELECT plot_no, basic_price, square_yards, customer_name FROM plots "
+            "WHERE project_name = %s AND plot_key = %s",
+            (project_name, normalize_plot_key(plot_no)),
+        )
+    except database.Error as e:
+        if getattr(e, 'errno', None) != _ER_NO_SUCH_TABLE:
+            raise
+        return None
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return {"plot_no": row[0], "basic_price": row[1], "square_yards": row[2], "customer_name": row[3]}
+
+
+def plot_totals(cursor, project_name=None):
+    """
+    (project_name, plot_no, amount paid, basic_price, square_yards) per sold
+    plot, in one grouped query over receipts joined to their plots rows.
+    """
+    where = "r.plot_no IS NOT NULL AND r.plot_no != ''"
+    params = ()
+    if project_name:
+        where = f"{project_ids.filter_sql('r')} AND " + where
+        params = (project_name,)
+    # Receipts keep the name they were filed under; plots rows carry the current one
+    name = "COALESCE(pr.name, r.project_name)"
+    cursor.execute(
+        f"SELECT {name}, r.plot_no, SUM(r.amount_numeric), p.basic_price, p.square_yards "
+        f"FROM receipts r LEFT JOIN projects pr ON pr.id = r.project_id "
+        f"LEFT JOIN plots p ON p.project_name = {name} AND p.plot_key = r.plot_key "
+        f"WHERE {where} GROUP BY {name}, r.plot_no, p.basic_price, p.square_yards",
+        params,
+    )
+    return [(row[0], row[1], float(row[2] or 0), row[3], row[4]) for row in cursor.fetchall()]
@@ -0,0 +1,90 @@
+"""
+Columnar plot-state payload for the layout viewer.
+
+Instead of a dict of full plot_layouts rows per plot embedded in the page,
+the viewer fetches one JSON document of parallel arrays (one entry per plot,
+in natural plot order) merging sold state, layout metadata and commission
+presence. Low-cardinality columns (facing, status) are dictionary-encoded
+as {"values": [...], "codes": [...]} with -1 for NULL, and flags are 0/1
+arrays, so key names appear once per payload instead of once per plot.
+"""
+
+import gzip
+import json
+
+import project_ids
+from plot_utils import LAYOUT_COLUMNS, clean_plot_no, natural_sort_key, normalize_plot_key
+
+FORMAT_VERSION = 1
+
+_DICT_COLUMNS = ("facing", "status")
+
+# Responses smaller than this are not worth compressing
+MIN_GZIP_BYTES = 1024
+
+
+def _dictionary_encode(values):
+    lookup = {}
+    codes = []
+    for value in values:
+        if value is None:
+            codes.append(-1)
+        else:
+            codes.append(lookup.setdefault(value, len(lookup)))
+    return {"values": list(lookup), "codes": codes}
+
+
+def build_columns(sold_plots, layouts, commission_plots):
+    """
+    Merge the three sources (matched on normalised plot number) into the
+    columnar payload. `layouts` are plot_layouts rows keyed by LAYOUT_COLUMNS.
+    """
+    plots = {}
+    for layout in layouts:
+        plots.setdefault(normalize_plot_key(layout["plot_no"]), {"plot_no": str(layout["plot_no"])})["layout"] = layout
+    for plot_no in sold_plots:
+        plots.setdefault(normalize_plot_key(plot_no), {"plot_no": clean_plot_no(plot_no)})["sold"] = 1
+    for plot_no in commission_plots:
+        plots.setdefault(normalize_plot_key(plot_no), {"plot_no": clean_plot_no(plot_no)})["commission"] = 1
+    plots.pop('', None)
+    order = sorted(plots.values(), key=lambda p: natural_sort_key(p["plot_no"]))
+
+    payload = {
+        "v": FORMAT_VERSION,
+        "plots": [p["plot_no"] for p in order],
+        "sold": [p.get("sold", 0) for p in order],
+        "commission": [p.get("commission", 0) for p in order],
+        "layout": [1 if "layout" in p else 0 for p in order],
+    }
+    for column in LAYOUT_COLUMNS[1:]:
+        values = [p["layout"].get(column) if "layout" in p else None for p in order]
+        payload[column] = _dictionary_encode(values) if column in _DICT_COLUMNS else values
+    return payload
+
+
+def load_columns(cursor, project_name):
+    """Read sold plots, plot_layouts rows and commission plots of a project into the payload."""
+    cursor.execute(
+        "SELECT DISTINCT plot_no FROM receipts "
+        f"WHERE {project_ids.filter_sql()} AND plot_no IS NOT NULL AND plot_no != ''",
+        (project_name,),
+    )
+    sold = [row[0] for row in cursor.fetchall()]
+    cursor.execute(f"SELECT {', '.join(LAYOUT_COLUMNS)} FROM plot_layouts WHERE {project_ids.filter_sql()}",
+                   (project_name,))
+    layouts = [dict(zip(LAYOUT_COLUMNS, row)) for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT DISTINCT plot_no FROM commissions "
+        f"WHERE {project_ids.filter_sql()} AND plot_no IS NOT NULL AND plot_no != ''",
+        (project_name,),
+    )
+    commissions = [row[0] for row in cursor.fetchall()]
+    return build_columns(sold, layouts, commissions)
+
+
+def encode(payload, accept_gzip):
+    """Compact JSON bytes, gzip-compressed if accepted and worthwhile. Returns (body, encoding)."""
+    body = json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+    if accept_gzip and len(body) >= MIN_GZIP_BYTES:
+        return gzip.compress(body, compresslevel=6, mtime=0), "gzip"
+    return body, None
@@ -0,0 +1,135 @@
+"""
+Per-project plot status change log.
+
+Every write that can change whether a plot is sold (receipt insert, update,
+delete, import, approval) or its plot_layouts mapping appends one row per
+affected (project, plot) to `plot_status_log`, inside the write's own
+transaction. The AUTO_INCREMENT `seq` is the sequence number clients pass
+back as `?since=` to /api/plot-status/<project>, so a refresh only returns
+the plots that changed after it.
+
+AUTO_INCREMENT values are handed out before commit, so a transaction that
+took a lower seq may commit after a higher one is visible. high_water()
+therefore stops below the first gap in `seq` younger than SETTLE_SECONDS:
+a client never gets a watermark past a change that is still in flight.
+"""
+
+import database
+import project_ids
+from plot_utils import LAYOUT_COLUMNS, normalize_plot_key
+
+# MySQL error code for "Table doesn't exist"
+_ER_NO_SUCH_TABLE = 1146
+
+# A gap in seq younger than this may belong to an uncommitted transaction
+SETTLE_SECONDS = 60
+
+CREATE_SQL = """
+    CREATE TABLE IF NOT EXISTS plot_status_log (
+        seq BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        project_name VARCHAR(255) NOT NULL,
+        plot_no VARCHAR(255) NOT NULL,
+        changed_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+        KEY idx_plot_status_log_project_seq (project_name, seq)
+    )
+"""
+
+
+def record(cursor, changes):
+    """
+    Append (project_name, plot_no) pairs to the log using the caller's cursor.
+
+    Call before the caller commits. Blank projects/plots are skipped and
+    duplicates collapsed. Tenants created before this table existed are
+    healed on first use.
+    """
+    rows = sorted({(str(p).strip(), str(n).strip()) for p, n in changes
+                   if p and n and str(p).strip() and str(n).strip()})
+    if not rows:
+        return
+    sql = "INSERT INTO plot_status_log (project_name, plot_no) VALUES (%s, %s)"
+    try:
+        cursor.executemany(sql, rows)
+    except database.Error as e:
+        if getattr(e, 'errno', None) != _ER_NO_SUCH_TABLE:
+            raise
+        print("Auto-migrating: Creating plot_status_log table...")
+        cursor.execute(CREATE_SQL)
+        cursor.executemany(sql, rows)
+
+
+def receipt_plots(cursor, where_sql, params):
+    """(project_name, plot_no) of the receipts matching `where_sql`; read before an update/delete."""
+    cursor.execute(f"SELECT DISTINCT {project_ids.name_sql('r')}, r.plot_no FROM receipts r WHERE {where_sql}",
+                   params)
+    return [(row[0], row[1]) for row in cursor.fetchall()]
+
+
+def _settled_seq(cursor):
+    """Highest seq with every seq at or below it committed (or settled as a rollback gap)."""
+    cursor.execute(
+        "SELECT seq FROM plot_status_log WHERE changed_at < NOW() - INTERVAL %s SECOND ORDER BY seq DESC LIMIT 1",
+        (SETTLE_SECONDS,),
+    )
+    row = cursor.fetchone()
+    last = int(row[0] or 0) if row else 0
+    # Rows logged in the last SETTLE_SECONDS count only while contiguous
+    cursor.execute("SELECT seq FROM plot_status_log WHERE seq > %s ORDER BY seq", (last,))
+    for (seq,) in cursor.fetchall():
+        if seq != last + 1:
+            break
+        last = seq
+    return last
+
+
+def high_water(cursor, project_name=None):
+    """
+    Watermark to hand out as the next `since` (0 if none): the latest seq
+    logged for `project_name` (any project if None) that no transaction
+    still in flight can precede.
+    """
+    try:
+        settled = _settled_seq(cursor)
+        if project_name is None:
+            return settled
+        cursor.execute("SELECT MAX(seq) FROM plot_status_log WHERE project_name = %s AND seq <= %s",
+                       (project_name, settled))
+    except database.Error as e:
+        if getattr(e, 'errno', None) != _ER_NO_SUCH_TABLE:
+            raise
+        return 0
+    row = cursor.fetchone()
+    return int(row[0] or 0) if row else 0
+
+
+def changes_since(cursor, project_name, since, upto):
+    """
+    Current state of every plot of `project_name` logged in (since, upto]:
+    [{"plot_no", "sold", "layout"}, ...] where layout is the plot_layouts
+    row or None.
+    """
+    cursor.execute(
+        "SELECT DISTINCT plot_no FROM plot_status_log WHERE project_name = %s AND seq > %s AND seq <= %s",
+        (project_name, since, upto),
+    )
+    plot_nos = [row[0] for row in cursor.fetchall()]
+    if not plot_nos:
+        return []
+
+    keys = sorted({normalize_plot_key(p) for p in plot_nos})
+    cursor.execute(
+        f"SELECT DISTINCT plot_key FROM receipts "
+        f"WHERE {project_ids.filter_sql()} AND plot_key IN ({','.join(['%s'] * len(keys))})",
+        (project_name, *keys),
+    )
+    sold = {row[0] for row in cursor.fetchall()}
+    placeholders = ','.join(['%s'] * len(plot_nos))
+    cursor.execute(
+        f"SELECT {', '.join(LAYOUT_COLUMNS)} FROM plot_layouts "
+        f"WHERE {project_ids.filter_sql()} AND plot_no IN ({placeholders})",
+        (project_name, *plot_nos),
+    )
+    layouts = {normalize_plot_key(row[0]): dict(zip(LAYOUT_COLUMNS, row)) for row in cursor.fetchall()}
+    return [{"plot_no": plot_no, "sold": normalize_plot_key(plot_no) in sold,
+             "layout": layouts.get(normalize_plot_key(plot_no))}
+            for plot_no in sorted(plot_nos)]
@@ -0,0 +1,63 @@
+"""
+Plot number normalisation shared by the routes, the importer and SQL.
+
+receipts.plot_key / commissions.plot_key are STORED generated columns built
+with PLOT_KEY_SQL; normalize_plot_key() must produce the same value in
+Python so lookups can compare `plot_key = %s` against an index.
+"""
+import re
+
+# MySQL expression behind the generated plot_key column: trimmed, lower-cased,
+# with a trailing ".0" (Excel float artefact) removed. Mirrors normalize_plot_key.
+PLOT_KEY_SQL = (
+    "IF(TRIM(plot_no) LIKE '%.0', "
+    "LOWER(LEFT(TRIM(plot_no), CHAR_LENGTH(TRIM(plot_no)) - 2)), "
+    "LOWER(TRIM(plot_no)))"
+)
+
+# First run of digits, used as the natural-sort number (NULL if none)
+PLOT_NUM_SQL = "CAST(REGEXP_SUBSTR(plot_no, '[0-9]+') AS UNSIGNED)"
+
+# plot_layouts columns sent to the viewer (plot events, status deltas, plot state)
+LAYOUT_COLUMNS = ("plot_no", "facing", "length", "width", "area", "sq_yards", "status", "notes",
+                  "svg_element_id", "boundary_east", "boundary_west", "boundary_north", "boundary_south")
+
+_DIGITS = re.compile(r'\d+')
+
+
+def clean_plot_no(raw):
+    """Display form of a plot number: stripped, without a trailing '.0'."""
+    if raw is None:
+        return ''
+    plot_no = str(raw).strip()
+    if plot_no.endswith('.0'):
+        plot_no = plot_no[:-2]
+    return plot_no
+
+
+def normalize_plot_key(raw):
+    """Lookup key for a plot number; equal to the SQL plot_key column."""
+    if raw is None:
+        return None
+    # MySQL TRIM() only strips spaces, so match it exactly here
+    key = str(raw).strip(' ')
+    if key.endswith('.0'):
+        key = key[:-2]
+    return key.lower()
+
+
+def plot_num(raw):
+    """Natural-sort number of a plot (first digit run), or None."""
+    m = _DIGITS.search(str(raw or ''))
+    return int(m.group()) if m else None
+
+
+def natural_sort_key(raw):
+    """Sort key ordering '2' < '10' < '10A' < 'B1' < 'B2'."""
+    parts = []
+    for chunk in re.split(r'(\d+)', normalize_plot_key(raw) or ''):
+        if chunk.isdigit():
+            parts.append((0, int(chunk), ''))
+        elif chunk:
+            parts.append((1, 0, chunk))
+    return tuple(parts)
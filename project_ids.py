@@ -0,0 +1,133 @@
+"""
+Integer project ids on receipts, commissions and plot_layouts.
+
+These tables were keyed only by the free-text `project_name`. Each now
+also carries `project_id` (a foreign key to projects.id, indexed with
+plot_no and, on receipts / commissions, with plot_key), and the id is what
+identifies a row's project:
+
+- writers call ensure() for the project names they write, so every named
+  project has a projects row, and fill project_id in the same statement as
+  the row with the ID_SQL scalar subquery (also inside executemany batches);
+- readers filter with filter_sql() (project_id = ID_SQL, taking the name as
+  the parameter), join and group on project_id, and read a row's project
+  name through name_sql() / columns();
+- rename() is a single-row UPDATE of projects for these tables. The stored
+  project_name is only the name the row was written under, and the fallback
+  when its project has been deleted (the key is ON DELETE SET NULL);
+- creating a project claims rows already filed under its name.
+
+Permissions, caches, logs, layout files and the name-keyed tables without
+an id (_NAMED_TABLES) still key on the name, so rename() rewrites those.
+
+Migration 11 adds the columns, indexes and foreign keys and backfills
+existing rows with backfill(), in primary-key batches committed one at a
+time so a large tenant is never locked for the whole run. Names used by
+rows but missing from `projects` are added to it first, so every filed
+row gets an id. Migration 13 adds the (project_id, plot_key) indexes and
+makes plot_layouts unique on (project_id, plot_no).
+"""
+
+import database
+
+# Tables that carry project_id
+TABLES = ("receipts", "commissions", "plot_layouts")
+
+# Rows updated per committed backfill batch
+BATCH_SIZE = 5000
+
+# Scalar subquery for a project's id, e.g. "INSERT ... VALUES (..., {ID_SQL})"
+ID_SQL = "(SELECT id FROM projects WHERE name = %s)"
+
+# Name-keyed tables renamed along with the project
+_NAMED_TABLES = ("pending_receipts", "plots", "commission_rules", "layout_elements", "plot_status_log")
+
+# MySQL error code for "Table doesn't exist"
+_ER_NO_SUCH_TABLE = 1146
+
+
+def filter_sql(alias=None):
+    """Condition selecting one project's rows by id; its parameter is the project name."""
+    column = f"{alias}.project_id" if alias else "project_id"
+    return f"{column} = {ID_SQL}"
+
+
+def name_sql(alias):
+    """Current name of the project row `alias` is filed under."""
+    return f"COALESCE((SELECT pj.name FROM projects pj WHERE pj.id = {alias}.project_id), {alias}.project_name)"
+
+
+def columns(alias):
+    """
+    Select list of every column of `alias` with project_name replaced by its
+    current name. The override comes after `alias`.*, so positional indexes
+    are unchanged and MySQLRow keeps the later value.
+    """
+    return f"{alias}.*, {name_sql(alias)} AS project_name"
+
+
+def ensure(cursor, *names):
+    """Create the missing projects rows for `names` (blank names are skipped) with the caller's cursor."""
+    names = sorted({name for name in names if name and name.strip()})
+    if names:
+        cursor.executemany("INSERT IGNORE INTO projects (name) VALUES (%s)", [(name,) for name in names])
+
+
+def claim(cursor, project_id, name):
+    """Give the rows filed under `name` without an id (written before the project existed) its id."""
+    for table in TABLES:
+        cursor.execute(f"UPDATE `{table}` SET project_id = %s WHERE project_name = %s AND project_id IS NULL",
+                       (project_id, name))
+
+
+def rename(cursor, project_id, new_name):
+    """
+    Rename project `project_id` (caller commits): one row of projects, plus
+    the name-keyed tables. Returns the old name, or None if there is no
+    such project.
+    """
+    cursor.execute("SELECT name FROM projects WHERE id = %s", (project_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    old_name = row[0]
+    cursor.execute("UPDATE projects SET name = %s WHERE id = %s", (new_name, project_id))
+    for table in _NAMED_TABLES:
+        try:
+            cursor.execute(f"UPDATE `{table}` SET project_name = %s WHERE project_name = %s", (new_name, old_name))
+        except database.Error as e:
+            # Tables created on first use may not exist yet
+            if getattr(e, 'errno', None) != _ER_NO_SUCH_TABLE:
+                raise
+    return old_name
+
+
+def add_missing_projects(cursor, table):
+    """Add the non-blank project names used in `table` that have no projects row."""
+    cursor.execute(
+        f"INSERT INTO projects (name) SELECT DISTINCT t.project_name FROM `{table}` t "
+        f"WHERE t.project_name IS NOT NULL AND t.project_name != '' "
+        f"AND NOT EXISTS (SELECT 1 FROM projects p WHERE p.name = t.project_name)"
+    )
+    return cursor.rowcount
+
+
+def backfill(cursor, table, batch_size=BATCH_SIZE):
+    """
+    Set project_id on the rows of `table` that lack it, batch_size ids at a
+    time, committing each batch. Safe to re-run. Returns rows updated.
+    """
+    cursor.execute(f"SELECT MIN(id), MAX(id) FROM `{table}` WHERE project_id IS NULL")
+    low, high = cursor.fetchone()
+    updated = 0
+    if low is None:
+        return updated
+    for start in range(low, high + 1, batch_size):
+        cursor.execute(
+            f"UPDATE `{table}` t JOIN projects p ON p.name = t.project_name SET t.project_id = p.id "
+            f"WHERE t.id BETWEEN %s AND %s AND t.project_id IS NULL",
+            (start, start + batch_size - 1),
+        )
+        updated += cursor.rowcount
+        cursor.execute("COMMIT")
+    return updated
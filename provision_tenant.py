@@ -67,6 +67,16 @@ def provision_new_tenant(name, subdomain, brand_color="#f16924", logo_url=None):
         print(f"❌ Schema import failed: {e}")
         return False
 
+    # 2b. Apply versioned migrations (indexes etc.) on top of the base schema
+    try:
+        from migrate_tenants import apply_migrations
+        t_conn = mysql.connector.connect(host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database=tenant_db_name)
+        applied = apply_migrations(t_conn)
+        t_conn.close()
+        print(f"✅ Migrations applied: {applied}")
+    except Exception as e:
+        print(f"⚠️  Migrations failed (run migrate_tenants.py later): {e}")
+
     # 3. Create Default Admin User
     try:
         t_conn = mysql.connector.connect(host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database=tenant_db_name)
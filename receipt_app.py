@@ -1,6 +1,29 @@
 # receipt_app.py
 import re
 import database
+import data_versions
+from cache_utils import VersionedCache
+from plot_utils import natural_sort_key, normalize_plot_key
+import plot_index
+import plot_master
+import plot_events
+import plot_status_log
+import plot_mappings
+import plot_state
+import project_ids
+import receipt_import
+import amount_words
+import change_log
+import commission_entries
+import commission_recompute
+import commission_rules
+import exports
+import field_sync
+import import_jobs
+import layout_ingest
+import layout_status
+import layout_tiles
+import migrate_tenants
 import mysql.connector
 from flask import (
     Flask,
@@ -108,6 +131,12 @@ def init_db():
     migrate_users_table()
     init_users()
     init_pending_receipts()
+    data_versions.init_data_versions()
+
+    # Versioned migrations (indexes etc.) for the default DB
+    conn = database.get_db_connection()
+    migrate_tenants.apply_migrations(conn)
+    conn.close()
 
 
 def migrate_commissions_table():
@@ -295,10 +324,8 @@ def format_inr(number):
 
 def number_to_words(n):
     try:
-        from num2words import num2words
-
-        out = num2words(int(float(n)), lang="en_IN")
-        return out.replace("  ", " ").strip().title() + " Only"
+        # Same text as num2words(lang="en_IN").title(), memoised (see amount_words)
+        return amount_words.rupees_in_words(int(float(n)))
     except Exception:
         return f"{format_inr(n)} Only"
 
@@ -942,13 +969,14 @@ def create():
     
     if is_admin:
         # Admin: Save directly to receipts table
+        project_ids.ensure(c, project_name)
         c.execute(
-            """
+            f"""
             INSERT INTO receipts
             (no, project_name, date, venture, customer_name, amount_numeric, amount_words,
              plot_no, square_yards, purpose, drawn_bank, branch, payment_mode, instrument_no, 
-             pan_no, aadhar_no, basic_price, created_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+             pan_no, aadhar_no, basic_price, created_at, project_id)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, {project_ids.ID_SQL})
         """,
             (
                 no,
@@ -969,22 +997,18 @@ def create():
                 aadhar_no,
                 basic_price,
                 created_at,
+                project_name,
             ),
         )
         rid = c.lastrowid
-        
-        # If basic_price is provided, update it for all other receipts of this plot
-        if basic_price and plot_no and project_name:
-            try:
-                c.execute(
-                    "UPDATE receipts SET basic_price = %s WHERE plot_no = %s AND project_name = %s",
-                    (basic_price, plot_no, project_name),
-                )
-            except database.OperationalError:
-                pass
-                
+        change_log.record_receipts(c, change_log.INSERT, "r.id = %s", (rid,), session.get("username"))
+        # The plot's price / sq. yards live in one plots row, not on each of its receipts
+        plot_master.record(c, [(project_name, plot_no, basic_price, square_yards, customer_name)])
+        plot_status_log.record(c, [(project_name, plot_no)])
+        data_versions.bump(c, data_versions.RECEIPTS)
         conn.commit()
         conn.close()
+        plot_index.note_plot(project_name, plot_no, customer_name)
         flash("Receipt created successfully!", "success")
         return redirect(url_for("view_receipt", receipt_id=rid))
     else:
@@ -1020,6 +1044,7 @@ def create():
                 created_at,
             ),
         )
+        data_versions.bump(c, data_versions.PENDING_RECEIPTS)
         conn.commit()
         conn.close()
         flash("Receipt submitted for admin approval. You will be notified once approved.", "info")
@@ -1030,7 +1055,7 @@ def create():
 def view_receipt(receipt_id):
     conn = database.get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT * FROM receipts WHERE id = %s", (receipt_id,))
+    c.execute(f"SELECT {project_ids.columns('receipts')} FROM receipts WHERE id = %s", (receipt_id,))
     row = database.fetch_one(c)
     conn.close()
     if not row:
@@ -1044,7 +1069,7 @@ def view_receipt(receipt_id):
 def receipt_view_html(receipt_id):
     conn = database.get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT * FROM receipts WHERE id = %s", (receipt_id,))
+    c.execute(f"SELECT {project_ids.columns('receipts')} FROM receipts WHERE id = %s", (receipt_id,))
     row = database.fetch_one(c)
     conn.close()
     if not row:
@@ -1061,19 +1086,33 @@ def edit_receipt(receipt_id):
     """
     conn = database.get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT * FROM receipts WHERE id = %s", (receipt_id,))
+    c.execute(f"SELECT {project_ids.columns('receipts')} FROM receipts WHERE id = %s", (receipt_id,))
     row = database.fetch_one(c)
-    conn.close()
     if not row:
+        conn.close()
         abort(404)
     r = dict_from_row(row)
     idx = get_column_index("receipts", "basic_price")
     if idx is not None and idx < len(row):
         r["basic_price"] = row[idx]
+    # Saving the form records its price for the plot, so prefill the plot's current one
+    _prefill_plot_price(c, r)
+    conn.close()
     projects = get_projects()
     return render_template("form.html", recent=[], r=r, edit_mode=True, projects=projects)
 
 
+def _prefill_plot_price(c, r):
+    """
+    Replace receipt `r`'s own basic_price with its plot's current one
+    (plot_master), which may have changed since the receipt was saved.
+    """
+    plot = plot_master.get(c, r.get("project_name"), r.get("plot_no"))
+    if plot and plot["basic_price"] is not None:
+        price = plot["basic_price"]
+        r["basic_price"] = str(int(price)) if float(price).is_integer() else str(price)
+
+
 @app.route("/receipt/<int:receipt_id>/update", methods=["POST"])
 def update_receipt(receipt_id):
     form = request.form
@@ -1097,12 +1136,16 @@ def update_receipt(receipt_id):
 
     conn = database.get_db_connection()
     c = conn.cursor()
+    # The plot the receipt belonged to before the edit may stop being sold
+    changed_plots = plot_status_log.receipt_plots(c, "id = %s", (receipt_id,))
+    project_ids.ensure(c, project_name)
     c.execute(
-        """
+        f"""
         UPDATE receipts SET
             no=%s, project_name=%s, date=%s, venture=%s, customer_name=%s,
             amount_numeric=%s, amount_words=%s, plot_no=%s, square_yards=%s,
-            purpose=%s, drawn_bank=%s, branch=%s, payment_mode=%s, instrument_no=%s, basic_price=%s
+            purpose=%s, drawn_bank=%s, branch=%s, payment_mode=%s, instrument_no=%s, basic_price=%s,
+            project_id={project_ids.ID_SQL}
         WHERE id=%s
     """,
         (
@@ -1121,19 +1164,18 @@ def update_receipt(receipt_id):
             payment_mode,
             instrument_no,
             basic_price,
+            project_name,
             receipt_id,
         ),
     )
-    if basic_price and plot_no:
-        try:
-            c.execute(
-                "UPDATE receipts SET basic_price = %s WHERE plot_no = %s",
-                (basic_price, plot_no),
-            )
-        except database.OperationalError:
-            pass
+    change_log.record_receipts(c, change_log.UPDATE, "r.id = %s", (receipt_id,), session.get("username"))
+    plot_master.record(c, [(project_name, plot_no, basic_price, square_yards, customer_name)])
+    plot_status_log.record(c, changed_plots + [(project_name, plot_no)])
+    data_versions.bump(c, data_versions.RECEIPTS)
     conn.commit()
     conn.close()
+    # The receipt may have moved plot or project
+    plot_index.invalidate()
     return redirect(url_for("view_receipt", receipt_id=receipt_id))
 
 
@@ -1145,8 +1187,12 @@ def delete_receipt(receipt_id):
     conn = database.get_db_connection()
     c = conn.cursor()
     try:
+        plot_status_log.record(c, plot_status_log.receipt_plots(c, "id = %s", (receipt_id,)))
+        change_log.record_receipts(c, change_log.DELETE, "r.id = %s", (receipt_id,), session.get("username"))
         c.execute("DELETE FROM receipts WHERE id = %s", (receipt_id,))
+        data_versions.bump(c, data_versions.RECEIPTS)
         conn.commit()
+        plot_index.invalidate()
         return jsonify({"success": True})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -1246,7 +1292,7 @@ def receipt_pdf(receipt_id):
     # fetch receipt
     conn = database.get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT * FROM receipts WHERE id = %s", (receipt_id,))
+    c.execute(f"SELECT {project_ids.columns('receipts')} FROM receipts WHERE id = %s", (receipt_id,))
     row = database.fetch_one(c)
     conn.close()
     if not row:
@@ -1343,11 +1389,13 @@ def search_by_plot():
             conn = database.get_db_connection()
             c = conn.cursor()
 
-            query = "SELECT * FROM receipts WHERE LOWER(TRIM(plot_no)) = LOWER(TRIM(%s))"
-            params = [plot_no]
+            # plot_key is the indexed, normalised plot number (see plot_utils)
+            plot_key = normalize_plot_key(plot_no)
+            query = f"SELECT {project_ids.columns('receipts')} FROM receipts WHERE plot_key = %s"
+            params = [plot_key]
             
             if project_name:
-                query += " AND project_name = %s"
+                query += f" AND {project_ids.filter_sql()}"
                 params.append(project_name)
                 
             query += " ORDER BY id DESC"
@@ -1356,16 +1404,12 @@ def search_by_plot():
             rows = database.fetch_all(c)
 
             if not rows:
-                like = f"%{plot_no}%"
-                query = "SELECT * FROM receipts WHERE plot_no LIKE %s"
-                params = [like]
-                if project_name:
-                    query += " AND project_name = %s"
-                    params.append(project_name)
-                query += " ORDER BY id DESC"
-                
-                c.execute(query, tuple(params))
-                rows = database.fetch_all(c)
+                # Partial match: resolve candidate plots from the in-memory
+                # index, then fetch them through the plot_key index
+                matches = plot_index.suggest(plot_no, project_name or None, limit=50,
+                                             source=plot_index.SOURCE_RECEIPT, plots_only=True)
+                if matches:
+                    rows = _receipts_for_plots(c, matches)
 
             conn.close()
 
@@ -1378,6 +1422,37 @@ def search_by_plot():
     return render_template("search_by_plot.html", results=results, plot_no=plot_no, projects=projects, selected_project=project_name)
 
 
+def _receipts_for_plots(c, plots):
+    """Fetch receipts for [{"plot_no", "project_name"}, ...] via the (project_id, plot_key) index."""
+    clauses = " OR ".join([f"({project_ids.filter_sql()} AND plot_key = %s)"] * len(plots))
+    params = []
+    for p in plots:
+        params += [p["project_name"], normalize_plot_key(p["plot_no"])]
+    c.execute(f"SELECT {project_ids.columns('receipts')} FROM receipts WHERE {clauses} ORDER BY id DESC", tuple(params))
+    return database.fetch_all(c)
+
+
+# -----------------------------
+# API Endpoint (plot type-ahead)
+# -----------------------------
+@app.route("/api/plots/suggest")
+def suggest_plots():
+    """Top-k plot numbers / customer names matching `q`, served from memory."""
+    term = request.args.get("q", "").strip()
+    project_name = request.args.get("project_name", "").strip() or None
+    source = request.args.get("source")
+    if source not in (plot_index.SOURCE_RECEIPT, plot_index.SOURCE_COMMISSION):
+        source = None
+    try:
+        limit = max(1, min(int(request.args.get("limit", 10)), 50))
+    except ValueError:
+        limit = 10
+
+    if not term:
+        return jsonify({"results": []})
+    return jsonify({"results": plot_index.suggest(term, project_name, limit=limit, source=source)})
+
+
 # -----------------------------
 # API Endpoint (JSON lookup)
 # -----------------------------
@@ -1396,12 +1471,12 @@ def plot_lookup():
     c = conn.cursor()
     
     # Lookup using both plot_no AND project_name as unique key
-    c.execute("SELECT * FROM receipts WHERE plot_no = %s AND project_name = %s ORDER BY id DESC LIMIT 1", (plot_no, project_name))
+    c.execute(f"SELECT {project_ids.columns('receipts')} FROM receipts WHERE plot_key = %s AND {project_ids.filter_sql()} ORDER BY id DESC LIMIT 1",
+              (normalize_plot_key(plot_no), project_name))
         
     row = database.fetch_one(c)
-    conn.close()
-
     if not row:
+        conn.close()
         return jsonify({"found": False}), 200
 
     r = dict_from_row(row)
@@ -1409,35 +1484,36 @@ def plot_lookup():
     idx = get_column_index("receipts", "basic_price")
     if idx is not None and idx < len(row):
         r["basic_price"] = row[idx]
+    _prefill_plot_price(c, r)
+    conn.close()
     return jsonify({"found": True, **r})
 
 
 # -----------------------------
 # Dashboard & Analytics
 # -----------------------------
-@app.route("/dashboard")
-def dashboard():
-    """Display project dashboard with statistics"""
-    # If user doesn't have dashboard access but has Vishvam access, redirect to Vishvam Layout
-    if not (session.get("role") == "admin" or session.get("can_view_dashboard")):
-        if session.get("can_view_vishvam_layout"):
-            return redirect(url_for("plot_layout_viewer", project_name="Vishvam"))
-        abort(403)
-    selected_project = request.args.get("project", "").strip()
-    
-    conn = database.get_db_connection()
+# Dashboard tiles are cached per tenant and project filter. The write routes
+# that change receipts, projects or pending receipts bump data_versions, which
+# marks the cached tiles stale; stale tiles are served while a background
+# thread recomputes them.
+dashboard_cache = VersionedCache(
+    "dashboard",
+    (data_versions.RECEIPTS, data_versions.PROJECTS, data_versions.PENDING_RECEIPTS),
+)
+
+
+def _compute_dashboard_tiles(db_config, selected_project):
+    """Run the dashboard aggregate queries against the given tenant DB."""
+    conn = database.get_db_connection(db_config)
     c = conn.cursor()
     
-    # Get all projects
-    projects = get_projects()
-    
     # Build query based on filter
     if selected_project:
         # Count unique plots sold for this project
-        c.execute("""
+        c.execute(f"""
             SELECT COUNT(DISTINCT plot_no) 
             FROM receipts 
-            WHERE project_name = %s AND plot_no IS NOT NULL AND plot_no != ''
+            WHERE {project_ids.filter_sql()} AND plot_no IS NOT NULL AND plot_no != ''
         """, (selected_project,))
         plots_sold_row = database.fetch_one(c)
         num_plots = plots_sold_row[0] if plots_sold_row and plots_sold_row[0] is not None else 0
@@ -1462,19 +1538,42 @@ def dashboard():
         total_plots = row[0] if row and row[0] else 0
         plots_to_landowners = row[1] if row and row[1] else 0
     
+    # Pending receipts count for admin notification
+    c.execute("SELECT COUNT(*) FROM pending_receipts WHERE status = 'pending'")
+    row = database.fetch_one(c)
+    pending_count = row[0] if row else 0
+    
     conn.close()
     
-    # Get pending receipts count for admin notification
-    pending_count = 0
-    if session.get("role") == "admin":
-        conn2 = database.get_db_connection()
-        c2 = conn2.cursor()
-        c2.execute("SELECT COUNT(*) FROM pending_receipts WHERE status = 'pending'")
-        row = database.fetch_one(c2)
-        pending_count = row[0] if row else 0
-        conn2.close()
+    return {
+        'total_plots': total_plots or 0,
+        'num_plots': num_plots,
+        'plots_to_landowners': plots_to_landowners or 0,
+        'plots_remaining': max(0, (total_plots or 0) - (plots_to_landowners or 0) - num_plots),
+        'pending_count': pending_count,
+    }
+
+
+@app.route("/dashboard")
+def dashboard():
+    """Display project dashboard with statistics"""
+    # If user doesn't have dashboard access but has Vishvam access, redirect to Vishvam Layout
+    if not (session.get("role") == "admin" or session.get("can_view_dashboard")):
+        if session.get("can_view_vishvam_layout"):
+            return redirect(url_for("plot_layout_viewer", project_name="Vishvam"))
+        abort(403)
+    selected_project = request.args.get("project", "").strip()
+    
+    # Get all projects
+    projects = get_projects()
+    
+    tiles = dashboard_cache.get(
+        selected_project,
+        lambda db_config: _compute_dashboard_tiles(db_config, selected_project),
+    )
     
-    plots_remaining = max(0, total_plots - plots_to_landowners - num_plots)
+    # Pending receipts count is only shown to admins
+    pending_count = tiles['pending_count'] if session.get("role") == "admin" else 0
     
     # Get Layout Metadata for Dynamic Tile Rendering
     project_metadata = get_projects_full()
@@ -1484,10 +1583,10 @@ def dashboard():
         projects=projects,
         project_metadata=project_metadata, # Pass full metadata for layout tiles
         selected_project=selected_project,
-        total_plots=total_plots,
-        num_plots=num_plots,
-        plots_remaining=plots_remaining,
-        plots_to_landowners=plots_to_landowners,
+        total_plots=tiles['total_plots'],
+        num_plots=tiles['num_plots'],
+        plots_remaining=tiles['plots_remaining'],
+        plots_to_landowners=tiles['plots_to_landowners'],
         pending_count=pending_count
     )
 
@@ -1587,14 +1686,40 @@ def project_layout_manager():
                     # Create new project
                     insert_query = f"INSERT INTO projects ({col_name}, layout_svg_path) VALUES (%s, %s)"
                     c.execute(insert_query, (target_project, relative_path))
+                    project_ids.claim(c, c.lastrowid, target_project)
                     flash(f"Created new project '{target_project}' with layout", "success")
                     
+                data_versions.bump(c, data_versions.PROJECTS)
                 conn.commit()
             except Exception as e:
                 conn.rollback()
                 flash(f"Database error: {e}", "danger")
             finally:
                 conn.close()
+
+            # Index plot elements and write the minified variants. The raw
+            # upload is kept (and still served) if this fails.
+            conn = database.get_db_connection()
+            try:
+                summary = layout_ingest.ingest_layout(filepath, target_project, conn)
+                conn.commit()
+                print(f"Layout ingest for {target_project}: {summary}")
+
+                # Very large layouts are also served as raster tiles
+                if layout_tiles.should_tile(summary["min_bytes"], summary["elements"]):
+                    minified = layout_ingest.variant_paths(filepath)["min"]
+                    if layout_tiles.can_render(minified):
+                        layout_tiles.generate_in_background(minified, layout_tiles.tiles_dir(layout_dir, minified))
+                    else:
+                        print(f"Layout tiles skipped for {target_project}: cairosvg is not installed")
+                        flash("This layout is large enough to be served as map tiles, but the tile renderer "
+                              "(cairosvg) is not installed on the server, so it will load slowly.", "warning")
+            except Exception as e:
+                conn.rollback()
+                print(f"Layout ingest failed for {target_project}: {e}")
+                flash(f"Layout saved, but it could not be optimised: {e}", "warning")
+            finally:
+                conn.close()
                 
             return redirect(url_for("project_layout_manager")) # Redirect back to manager to see list
         else:
@@ -1626,7 +1751,7 @@ def stats_amount_by_month():
     params = []
 
     if selected_project:
-        query += " AND project_name = %s"
+        query += f" AND {project_ids.filter_sql()}"
         params.append(selected_project)
 
     query += " GROUP BY ym ORDER BY ym ASC"
@@ -1662,20 +1787,22 @@ def stats_amount_by_project():
     conn = database.get_db_connection()
     c = conn.cursor()
 
+    # Named through projects, so a renamed project is one group under its current name
     query = """
         SELECT
-            COALESCE(NULLIF(TRIM(project_name), ''), 'Unknown') AS project_name,
-            COALESCE(SUM(amount_numeric), 0.0) AS total
-        FROM receipts
+            COALESCE(NULLIF(TRIM(COALESCE(p.name, r.project_name)), ''), 'Unknown') AS project_name,
+            COALESCE(SUM(r.amount_numeric), 0.0) AS total
+        FROM receipts r
+        LEFT JOIN projects p ON p.id = r.project_id
         WHERE 1 = 1
     """
     params = []
 
     if selected_project:
-        query += " AND project_name = %s"
+        query += f" AND {project_ids.filter_sql('r')}"
         params.append(selected_project)
 
-    query += " GROUP BY project_name ORDER BY total DESC"
+    query += " GROUP BY 1 ORDER BY total DESC"
 
     c.execute(query, params)
     rows = database.fetch_all(c)
@@ -1716,7 +1843,7 @@ def stats_amount_by_payment_mode():
     params = []
 
     if selected_project:
-        query += " AND project_name = %s"
+        query += f" AND {project_ids.filter_sql()}"
         params.append(selected_project)
 
     query += " GROUP BY mode ORDER BY total DESC"
@@ -1750,20 +1877,22 @@ def stats_commission_by_project():
     conn = database.get_db_connection()
     c = conn.cursor()
 
+    # Named through projects, so a renamed project is one group under its current name
     query = """
         SELECT
-            COALESCE(NULLIF(TRIM(project_name), ''), 'Unknown') AS project_name,
-            COALESCE(SUM(cgm_rate + srgm_rate + gm_rate), 0.0) AS total
-        FROM commissions
+            COALESCE(NULLIF(TRIM(COALESCE(p.name, c.project_name)), ''), 'Unknown') AS project_name,
+            COALESCE(SUM(c.cgm_rate + c.srgm_rate + c.gm_rate), 0.0) AS total
+        FROM commissions c
+        LEFT JOIN projects p ON p.id = c.project_id
         WHERE 1 = 1
     """
     params = []
 
     if selected_project:
-        query += " AND project_name = %s"
+        query += f" AND {project_ids.filter_sql('c')}"
         params.append(selected_project)
 
-    query += " GROUP BY project_name ORDER BY total DESC"
+    query += " GROUP BY 1 ORDER BY total DESC"
 
     c.execute(query, params)
     rows = database.fetch_all(c)
@@ -1805,10 +1934,10 @@ def stats_projects_inventory():
         total_plots = proj_row[0] if proj_row else 0
 
         # Count sold plots for this project
-        c.execute("""
+        c.execute(f"""
             SELECT COUNT(DISTINCT plot_no)
             FROM receipts
-            WHERE project_name = %s AND plot_no IS NOT NULL AND plot_no != ''
+            WHERE {project_ids.filter_sql()} AND plot_no IS NOT NULL AND plot_no != ''
         """, (selected_project,))
         sold_row = database.fetch_one(c)
         sold_plots = sold_row[0] if sold_row else 0
@@ -1825,10 +1954,10 @@ def stats_projects_inventory():
         proj_rows = database.fetch_all(c)
         for proj_name, total_plots in proj_rows:
             # Count sold plots for this project
-            c.execute("""
+            c.execute(f"""
                 SELECT COUNT(DISTINCT plot_no)
                 FROM receipts
-                WHERE project_name = %s AND plot_no IS NOT NULL AND plot_no != ''
+                WHERE {project_ids.filter_sql()} AND plot_no IS NOT NULL AND plot_no != ''
             """, (proj_name,))
             sold_row = database.fetch_one(c)
             sold_plots = sold_row[0] if sold_row else 0
@@ -1864,13 +1993,13 @@ def stats_cgm_plot_sales():
             COALESCE(c.cgm_name, 'Unknown') AS cgm_name,
             COUNT(DISTINCT r.plot_no) AS plots_sold
         FROM receipts r
-        LEFT JOIN commissions c ON r.project_name = c.project_name AND r.plot_no = c.plot_no
+        LEFT JOIN commissions c ON c.project_id = r.project_id AND c.plot_key = r.plot_key
         WHERE r.plot_no IS NOT NULL AND r.plot_no != ''
     """
     params = []
 
     if selected_project:
-        query += " AND r.project_name = %s"
+        query += f" AND {project_ids.filter_sql('r')}"
         params.append(selected_project)
 
     query += " GROUP BY cgm_name ORDER BY plots_sold DESC"
@@ -1966,10 +2095,10 @@ def plot_management():
             project = database.fetch_one(c)
             
             # Get number of plots sold for this project
-            c.execute("""
+            c.execute(f"""
                 SELECT COUNT(DISTINCT plot_no) 
                 FROM receipts 
-                WHERE project_name = %s AND plot_no IS NOT NULL AND plot_no != ''
+                WHERE {project_ids.filter_sql()} AND plot_no IS NOT NULL AND plot_no != ''
             """, (selected_project,))
             plots_sold_row = database.fetch_one(c)
             plots_sold = plots_sold_row[0] if plots_sold_row and plots_sold_row[0] is not None else 0
@@ -1991,8 +2120,10 @@ def plot_management():
                     INSERT INTO projects (name, total_plots, plots_to_landowners)
                     VALUES (%s, %s, %s)
                 """, (selected_project, total_plots, plots_to_landowners))
+                project_ids.claim(c, c.lastrowid, selected_project)
                 flash(f"Added {selected_project}: {total_plots} total plots, {plots_to_landowners} to landowners", "success")
             
+            data_versions.bump(c, data_versions.PROJECTS)
             conn.commit()
             conn.close()
         else:
@@ -2008,10 +2139,10 @@ def plot_management():
         row = database.fetch_one(c)
         
         # Get number of plots sold for this project
-        c.execute("""
+        c.execute(f"""
             SELECT COUNT(DISTINCT plot_no) 
             FROM receipts 
-            WHERE project_name = %s AND plot_no IS NOT NULL AND plot_no != ''
+            WHERE {project_ids.filter_sql()} AND plot_no IS NOT NULL AND plot_no != ''
         """, (selected_project,))
         plots_sold_row = database.fetch_one(c)
         plots_sold = plots_sold_row[0] if plots_sold_row and plots_sold_row[0] is not None else 0
@@ -2066,6 +2197,7 @@ def update_plot_settings():
         # Assuming project exists from context
         c.execute("UPDATE projects SET total_plots = %s, plots_to_landowners = %s WHERE name = %s", 
                  (total_plots, plots_to_landowners, project_name))
+        data_versions.bump(c, data_versions.PROJECTS)
         conn.commit()
         flash("Plot settings updated successfully", "success")
     except Exception as e:
@@ -2133,6 +2265,8 @@ def add_project():
             
         # Insert new project
         c.execute("INSERT INTO projects (name, total_plots, plots_to_landowners) VALUES (%s, 0, 0)", (project_name,))
+        project_ids.claim(c, c.lastrowid, project_name)
+        data_versions.bump(c, data_versions.PROJECTS)
         conn.commit()
         conn.close()
         
@@ -2170,17 +2304,17 @@ def update_project():
             conn.close()
             return redirect(url_for('plot_management'))
             
-        # Update name
-        c.execute("UPDATE projects SET name = %s WHERE id = %s", (new_name, project_id))
-        
-        # Also update receipts table? (Since receipts store project_name...)
-        # Ideally we should use foreign keys, but currently it seems to store name string.
-        # So we probably need to update receipts too to keep data consistent.
-        c.execute("UPDATE receipts SET project_name = %s WHERE project_name = (SELECT name FROM projects WHERE id = %s)", 
-                 (new_name, project_id))
+        # Rename the project and its receipts, commissions and layouts (by project_id)
+        if project_ids.rename(c, project_id, new_name) is None:
+            flash("Project not found", "warning")
+            conn.close()
+            return redirect(url_for('plot_management'))
                  
+        data_versions.bump(c, data_versions.PROJECTS, data_versions.RECEIPTS, data_versions.PENDING_RECEIPTS,
+                           data_versions.COMMISSIONS, data_versions.PLOT_LAYOUTS, data_versions.COMMISSION_RULES)
         conn.commit()
         conn.close()
+        plot_index.invalidate()
         
         flash(f"Project updated to '{new_name}' successfully", "success")
         
@@ -2209,6 +2343,7 @@ def archive_project():
         c = conn.cursor()
         
         c.execute("UPDATE projects SET is_archived = 1 WHERE id = %s", (project_id,))
+        data_versions.bump(c, data_versions.PROJECTS)
         conn.commit()
         conn.close()
         
@@ -2239,6 +2374,7 @@ def unarchive_project():
         c = conn.cursor()
         
         c.execute("UPDATE projects SET is_archived = 0 WHERE id = %s", (project_id,))
+        data_versions.bump(c, data_versions.PROJECTS)
         conn.commit()
         conn.close()
         
@@ -2279,7 +2415,7 @@ def delete_project():
         project_name = row[0]
         
         # Check for dependencies (receipts)
-        c.execute("SELECT COUNT(*) FROM receipts WHERE project_name = %s", (project_name,))
+        c.execute("SELECT COUNT(*) FROM receipts WHERE project_id = %s", (project_id,))
         receipt_count = c.fetchone()[0]
         
         if receipt_count > 0:
@@ -2289,6 +2425,7 @@ def delete_project():
             
         # Delete project
         c.execute("DELETE FROM projects WHERE id = %s", (project_id,))
+        data_versions.bump(c, data_versions.PROJECTS)
         conn.commit()
         conn.close()
         
@@ -2325,12 +2462,12 @@ def mediator_performance():
     
     # Get all unique CGM names for the dropdown
     if selected_project:
-        c.execute("""
+        c.execute(f"""
             SELECT DISTINCT cgm_name 
             FROM commissions 
             WHERE cgm_name IS NOT NULL 
             AND cgm_name != '' 
-            AND project_name = %s
+            AND {project_ids.filter_sql()}
             ORDER BY cgm_name
         """, (selected_project,))
     else:
@@ -2348,7 +2485,7 @@ def mediator_performance():
     params = []
     
     if selected_project:
-        where_clauses.append("project_name = %s")
+        where_clauses.append(project_ids.filter_sql())
         params.append(selected_project)
     
     if selected_cgm:
@@ -2437,7 +2574,7 @@ def mediator_performance():
             SUM(e.total_amount) as total_earnings
         FROM commission_srgm_entries e
         INNER JOIN commissions c ON e.commission_id = c.id
-        WHERE {where_sql.replace('cgm_name', 'c.cgm_name').replace('project_name', 'c.project_name').replace('created_at', 'c.created_at')}
+        WHERE {where_sql.replace('cgm_name', 'c.cgm_name').replace('project_id', 'c.project_id').replace('created_at', 'c.created_at')}
         GROUP BY e.name
     """, params)
     overall_earners.extend([{"name": row[0], "role": row[1], "total": row[2] or 0} for row in database.fetch_all(c)])
@@ -2450,7 +2587,7 @@ def mediator_performance():
             SUM(e.total_amount) as total_earnings
         FROM commission_gm_entries e
         INNER JOIN commissions c ON e.commission_id = c.id
-        WHERE {where_sql.replace('cgm_name', 'c.cgm_name').replace('project_name', 'c.project_name').replace('created_at', 'c.created_at')}
+        WHERE {where_sql.replace('cgm_name', 'c.cgm_name').replace('project_id', 'c.project_id').replace('created_at', 'c.created_at')}
         GROUP BY e.name
     """, params)
     overall_earners.extend([{"name": row[0], "role": row[1], "total": row[2] or 0} for row in database.fetch_all(c)])
@@ -2463,7 +2600,7 @@ def mediator_performance():
             SUM(e.total_amount) as total_earnings
         FROM commission_dgm_entries e
         INNER JOIN commissions c ON e.commission_id = c.id
-        WHERE {where_sql.replace('cgm_name', 'c.cgm_name').replace('project_name', 'c.project_name').replace('created_at', 'c.created_at')}
+        WHERE {where_sql.replace('cgm_name', 'c.cgm_name').replace('project_id', 'c.project_id').replace('created_at', 'c.created_at')}
         GROUP BY e.name
     """, params)
     overall_earners.extend([{"name": row[0], "role": row[1], "total": row[2] or 0} for row in database.fetch_all(c)])
@@ -2476,7 +2613,7 @@ def mediator_performance():
             SUM(e.total_amount) as total_earnings
         FROM commission_agm_entries e
         INNER JOIN commissions c ON e.commission_id = c.id
-        WHERE {where_sql.replace('cgm_name', 'c.cgm_name').replace('project_name', 'c.project_name').replace('created_at', 'c.created_at')}
+        WHERE {where_sql.replace('cgm_name', 'c.cgm_name').replace('project_id', 'c.project_id').replace('created_at', 'c.created_at')}
         GROUP BY e.name
     """, params)
     overall_earners.extend([{"name": row[0], "role": row[1], "total": row[2] or 0} for row in database.fetch_all(c)])
@@ -2510,7 +2647,7 @@ def mediator_performance():
             SUM(e.total_amount) as total_earnings
         FROM commission_srgm_entries e
         INNER JOIN commissions c ON e.commission_id = c.id
-        WHERE {where_sql.replace('cgm_name', 'c.cgm_name').replace('project_name', 'c.project_name').replace('created_at', 'c.created_at')}
+        WHERE {where_sql.replace('cgm_name', 'c.cgm_name').replace('project_id', 'c.project_id').replace('created_at', 'c.created_at')}
         GROUP BY e.name
         ORDER BY total_earnings DESC
         {limit_sql}
@@ -2524,7 +2661,7 @@ def mediator_performance():
             SUM(e.total_amount) as total_earnings
         FROM commission_gm_entries e
         INNER JOIN commissions c ON e.commission_id = c.id
-        WHERE {where_sql.replace('cgm_name', 'c.cgm_name').replace('project_name', 'c.project_name').replace('created_at', 'c.created_at')}
+        WHERE {where_sql.replace('cgm_name', 'c.cgm_name').replace('project_id', 'c.project_id').replace('created_at', 'c.created_at')}
         GROUP BY e.name
         ORDER BY total_earnings DESC
         {limit_sql}
@@ -2538,7 +2675,7 @@ def mediator_performance():
             SUM(e.total_amount) as total_earnings
         FROM commission_dgm_entries e
         INNER JOIN commissions c ON e.commission_id = c.id
-        WHERE {where_sql.replace('cgm_name', 'c.cgm_name').replace('project_name', 'c.project_name').replace('created_at', 'c.created_at')}
+        WHERE {where_sql.replace('cgm_name', 'c.cgm_name').replace('project_id', 'c.project_id').replace('created_at', 'c.created_at')}
         GROUP BY e.name
         ORDER BY total_earnings DESC
         {limit_sql}
@@ -2552,7 +2689,7 @@ def mediator_performance():
             SUM(e.total_amount) as total_earnings
         FROM commission_agm_entries e
         INNER JOIN commissions c ON e.commission_id = c.id
-        WHERE {where_sql.replace('cgm_name', 'c.cgm_name').replace('project_name', 'c.project_name').replace('created_at', 'c.created_at')}
+        WHERE {where_sql.replace('cgm_name', 'c.cgm_name').replace('project_id', 'c.project_id').replace('created_at', 'c.created_at')}
         GROUP BY e.name
         ORDER BY total_earnings DESC
         {limit_sql}
@@ -2605,7 +2742,7 @@ def mediator_details():
     params = []
 
     if project:
-        where_clauses.append("c.project_name = %s")
+        where_clauses.append(project_ids.filter_sql('c'))
         params.append(project)
     
     if month and month != 'all':
@@ -2626,7 +2763,7 @@ def mediator_details():
             query = f"""
                 SELECT 
                     c.plot_no,
-                    c.project_name,
+                    {project_ids.name_sql('c')} AS project_name,
                     c.cgm_total as earnings,
                     c.cgm_name as team_lead,
                     c.created_at,
@@ -2643,7 +2780,7 @@ def mediator_details():
             query = f"""
                 SELECT 
                     c.plot_no,
-                    c.project_name,
+                    {project_ids.name_sql('c')} AS project_name,
                     e.total_amount as earnings,
                     c.cgm_name as team_lead,
                     c.created_at,
@@ -2660,7 +2797,7 @@ def mediator_details():
             query = f"""
                 SELECT 
                     c.plot_no,
-                    c.project_name,
+                    {project_ids.name_sql('c')} AS project_name,
                     e.total_amount as earnings,
                     c.cgm_name as team_lead,
                     c.created_at,
@@ -2677,7 +2814,7 @@ def mediator_details():
             query = f"""
                 SELECT 
                     c.plot_no,
-                    c.project_name,
+                    {project_ids.name_sql('c')} AS project_name,
                     e.total_amount as earnings,
                     c.cgm_name as team_lead,
                     c.created_at,
@@ -2694,7 +2831,7 @@ def mediator_details():
             query = f"""
                 SELECT 
                     c.plot_no,
-                    c.project_name,
+                    {project_ids.name_sql('c')} AS project_name,
                     e.total_amount as earnings,
                     c.cgm_name as team_lead,
                     c.created_at,
@@ -2801,10 +2938,10 @@ def account_summary():
     
     # 1. Get number of plots sold
     if selected_project:
-        c.execute("""
+        c.execute(f"""
             SELECT COUNT(DISTINCT plot_no) 
             FROM receipts 
-            WHERE project_name = %s AND plot_no IS NOT NULL AND plot_no != ''
+            WHERE {project_ids.filter_sql()} AND plot_no IS NOT NULL AND plot_no != ''
         """, (selected_project,))
     else:
         c.execute("""
@@ -2815,78 +2952,16 @@ def account_summary():
     
     plots_sold = database.fetch_one(c)[0] or 0
     
-    # 2-4. Calculate financial metrics by aggregating plot-level data
-    # We need to get unique plots and calculate their metrics
-    if selected_project:
-        c.execute("""
-            SELECT DISTINCT plot_no 
-            FROM receipts 
-            WHERE project_name = %s AND plot_no IS NOT NULL AND plot_no != ''
-        """, (selected_project,))
-    else:
-        c.execute("""
-            SELECT DISTINCT plot_no, project_name
-            FROM receipts 
-            WHERE plot_no IS NOT NULL AND plot_no != ''
-        """)
-    
-    plot_rows = database.fetch_all(c)
-    
+    # 2-4. Calculate financial metrics by aggregating plot-level data:
+    # paid per plot in one grouped query, price / sq. yards from the plots table
     total_revenue = 0
     total_paid = 0
     total_balance = 0
     
-    idx_basic = get_column_index("receipts", "basic_price")
-    
-    for plot_row in plot_rows:
-        if selected_project:
-            plot_no = plot_row[0]
-            project_name = selected_project
-        else:
-            plot_no = plot_row[0]
-            project_name = plot_row[1]
-        
-        # Get all receipts for this plot
-        c.execute("""
-            SELECT * FROM receipts 
-            WHERE plot_no = %s AND project_name = %s
-            ORDER BY date DESC, id DESC
-        """, (plot_no, project_name))
-        
-        rows = database.fetch_all(c)
-        
-        if not rows:
-            continue
-        
-        # Get basic info from latest receipt
-        latest = dict_from_row(rows[0])
-        sq_yards = latest.get('square_yards', '0')
-        
-        try:
-            sq_yards_value = float(sq_yards) if sq_yards else 0
-        except (ValueError, TypeError):
-            sq_yards_value = 0
-        
-        # Get basic price
-        basic_price = 0
-        if idx_basic is not None:
-            for row in rows:
-                if len(row) <= idx_basic:
-                    continue
-                raw_basic = row[idx_basic]
-                if raw_basic is None or raw_basic == "":
-                    continue
-                try:
-                    basic_price = float(raw_basic)
-                    break
-                except (ValueError, TypeError):
-                    continue
-        
-        # Calculate total paid for this plot
-        plot_total_paid = 0
-        for row in rows:
-            r = dict_from_row(row)
-            plot_total_paid += (r.get("amount_numeric", 0) or 0)
+    for project_name, plot_no, plot_total_paid, basic_price, sq_yards_value in \
+            plot_master.plot_totals(c, selected_project or None):
+        basic_price = basic_price or 0
+        sq_yards_value = sq_yards_value or 0
         
         # If basic_price not found, use heuristic
         if (not basic_price) and sq_yards_value > 0 and plot_total_paid > 0:
@@ -2916,6 +2991,68 @@ def account_summary():
     )
 
 
+@app.route("/export/<dataset>")
+def export_data(dataset):
+    """Download receipts / commissions / plot ledger as CSV or XLSX, streamed from the DB (see exports)"""
+    if not (session.get("role") == "admin" or session.get("can_view_dashboard")):
+        abort(403)
+    rows_for = exports.DATASETS.get(dataset)
+    fmt = request.args.get("format", "csv").lower()
+    if rows_for is None or fmt not in exports.FORMATS:
+        abort(404)
+    try:
+        filters = exports.parse_filters(request.args)
+    except ValueError:
+        return jsonify({"error": "Dates must be YYYY-MM-DD"}), 400
+    download_name = exports.filename(dataset, filters, fmt)
+
+    conn = database.get_db_connection()
+    if fmt == "xlsx":
+        try:
+            out = exports.write_xlsx(rows_for(conn.cursor(), filters), dataset)
+        finally:
+            conn.close()
+        return send_file(out, as_attachment=True, download_name=download_name,
+                         mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+    def generate():
+        try:
+            yield from exports.csv_chunks(rows_for(conn.cursor(), filters))
+        finally:
+            conn.close()
+
+    response = app.response_class(generate(), mimetype="text/csv")
+    response.headers["Content-Disposition"] = f'attachment; filename="{download_name}"'
+    # Send chunks as they are produced instead of buffering the whole file in nginx
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@app.route("/api/changes")
+def api_changes():
+    """
+    Receipt / commission change feed for accounting syncs (see change_log).
+
+    Pass back `next_cursor` as `?cursor=` to get the changes after it; keep
+    paging while `has_more` is true. `limit` caps the page size.
+    """
+    if session.get("role") != "admin":
+        return jsonify({"error": "Unauthorized"}), 403
+    try:
+        after = change_log.decode_cursor(request.args.get("cursor", "").strip())
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    limit = request.args.get("limit", change_log.PAGE_SIZE, type=int)
+    limit = max(1, min(limit, change_log.MAX_PAGE_SIZE))
+
+    conn = database.get_db_connection()
+    try:
+        page = change_log.changes_since(conn.cursor(), after, limit)
+    finally:
+        conn.close()
+    return jsonify(page)
+
+
 @app.route("/plots_list")
 def plots_list():
     if not (session.get("role") == "admin" or session.get("can_view_dashboard")):
@@ -2931,42 +3068,31 @@ def plots_list():
     projects = get_projects()
     
     # Fetch unique plot numbers with search filter
-    if selected_project and search_plot:
-        # Both project and plot number specified
-        c.execute("""
-            SELECT DISTINCT plot_no 
-            FROM receipts 
-            WHERE project_name = %s AND plot_no LIKE %s AND plot_no IS NOT NULL AND plot_no != ''
-            ORDER BY plot_no
-        """, (selected_project, f"%{search_plot}%"))
+    if search_plot:
+        # Plot search is answered from the in-memory plot index
+        matches = plot_index.suggest(search_plot, selected_project or None, limit=None,
+                                     source=plot_index.SOURCE_RECEIPT, plots_only=True)
+        rows = [(m["plot_no"], m["project_name"]) for m in matches]
     elif selected_project:
         # Only project specified
-        c.execute("""
+        c.execute(f"""
             SELECT DISTINCT plot_no 
             FROM receipts 
-            WHERE project_name = %s AND plot_no IS NOT NULL AND plot_no != ''
+            WHERE {project_ids.filter_sql()} AND plot_no IS NOT NULL AND plot_no != ''
             ORDER BY plot_no
         """, (selected_project,))
-    elif search_plot:
-        # Only plot number specified
-        c.execute("""
-            SELECT DISTINCT plot_no, project_name
-            FROM receipts 
-            WHERE plot_no LIKE %s AND plot_no IS NOT NULL AND plot_no != ''
-            ORDER BY plot_no
-        """, (f"%{search_plot}%",))
+        rows = sorted(database.fetch_all(c), key=lambda row: natural_sort_key(row[0]))
     else:
         # No filters - show all
-        c.execute("""
-            SELECT DISTINCT plot_no, project_name
-            FROM receipts 
-            WHERE plot_no IS NOT NULL AND plot_no != ''
-            ORDER BY plot_no
+        c.execute(f"""
+            SELECT DISTINCT r.plot_no, {project_ids.name_sql('r')}
+            FROM receipts r
+            WHERE r.plot_no IS NOT NULL AND r.plot_no != ''
         """)
+        rows = sorted(database.fetch_all(c), key=lambda row: (natural_sort_key(row[0]), row[1]))
     
     # If specific project: list of strings [plot1, plot2]
     # If all projects: list of tuples [(plot1, projA), (plot1, projB)]
-    rows = database.fetch_all(c)
     if selected_project:
         plot_numbers = [row[0] for row in rows]
     else:
@@ -2991,25 +3117,27 @@ def plot_detail(plot_no):
     conn = database.get_db_connection()
     c = conn.cursor()
     
-    c.execute("""
-        SELECT * FROM receipts 
-        WHERE plot_no = %s 
+    c.execute(f"""
+        SELECT {project_ids.columns('receipts')} FROM receipts 
+        WHERE plot_key = %s 
         ORDER BY date DESC, id DESC
-    """, (plot_no,))
+    """, (normalize_plot_key(plot_no),))
     
     rows = database.fetch_all(c)
-    conn.close()
-    
     if not rows:
+        conn.close()
         abort(404)
     
     # Get the latest receipt for basic info
     latest = dict_from_row(rows[0])
-    
-    # Extract basic information from latest receipt
-    customer_name = latest.get('customer_name', '-')
     project_name = latest.get('project_name', '-')
-    sq_yards = latest.get('square_yards', '0')
+    
+    # Price, sq. yards and customer of the plot come from its plots row;
+    # a plot without one (not backfilled yet) falls back to the latest receipt
+    plot = plot_master.get(c, project_name, plot_no) or {}
+    conn.close()
+    customer_name = plot.get('customer_name') or latest.get('customer_name', '-')
+    sq_yards = plot.get('square_yards') or latest.get('square_yards', '0')
     
     # Try to parse sq_yards as float
     try:
@@ -3017,18 +3145,7 @@ def plot_detail(plot_no):
     except (ValueError, TypeError):
         sq_yards_value = 0
     
-    # Try to read basic price per sq yard from the DB column
-    # We scan rows in order (newest first) and take the first non-empty value
-    basic_price = 0
-    for row in rows:
-        # Access using column name directly via MySQLRow dict-like interface
-        val = row.get('basic_price')
-        if val is not None and val != "":
-            try:
-                basic_price = float(val)
-                break
-            except (ValueError, TypeError):
-                continue
+    basic_price = plot.get('basic_price') or 0
 
     # Let's calculate total amount paid (sum of all receipts)
     total_paid = 0
@@ -3107,7 +3224,8 @@ def commission_calculator():
     """Commission calculator with PDF generation"""
     if request.method == "GET":
         projects = get_projects()
-        return render_template("commission_calculator.html", projects=projects)
+        return render_template("commission_calculator.html", projects=projects,
+                               default_commission_rules=commission_rules.DEFAULT_EVALUATOR.javascript())
 
 
 
@@ -3243,6 +3361,8 @@ def commission_calculator():
             'docx_filename': filename_docx
         })
         
+    except commission_rules.RuleError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         app.logger.exception("Error generating commission PDF")
         return jsonify({
@@ -3257,7 +3377,7 @@ def edit_commission(commission_id):
     conn = database.get_db_connection()
     c = conn.cursor()
     
-    c.execute("SELECT * FROM commissions WHERE id = %s", (commission_id,))
+    c.execute(f"SELECT {project_ids.columns('commissions')} FROM commissions WHERE id = %s", (commission_id,))
     row = database.fetch_one(c)
     conn.close()
     
@@ -3343,6 +3463,7 @@ def edit_commission(commission_id):
         commission_id=commission_id,
         commission_data=commission_data,
         projects=projects,
+        default_commission_rules=commission_rules.DEFAULT_EVALUATOR.javascript(),
     )
 
 
@@ -3376,7 +3497,7 @@ def raw_commission_pdf(commission_id, filename):
     conn = database.get_db_connection()
     c = conn.cursor()
     
-    c.execute("SELECT * FROM commissions WHERE id = %s", (commission_id,))
+    c.execute(f"SELECT {project_ids.columns('commissions')} FROM commissions WHERE id = %s", (commission_id,))
     row = database.fetch_one(c)
     conn.close()
     
@@ -3466,32 +3587,15 @@ def raw_commission_pdf(commission_id, filename):
             
 
     
-    # Calculate fallback values if missing (Logic matches frontend JS)
+    # Calculate fallback values if missing, with the project's commission rules
     try:
-        sq_yards = float(commission_data.get('sq_yards') or 0)
-        negotiated_price = float(commission_data.get('negotiated_price') or 0)
-        amc_charges = float(commission_data.get('amc_charges') or 0)
-        
-        # JS: const totalAmount = (inp.sqYards * inp.negotiatedPrice) + (inp.amcCharges * inp.sqYards);
-        calc_total_amount = (sq_yards * negotiated_price) + (amc_charges * sq_yards)
-        
-        # JS: const wValue = inp.sqYards * 5500;
-        calc_w_value = sq_yards * 5500
-        
-        # JS: const bValue = totalAmount - wValue;
-        calc_b_value = calc_total_amount - calc_w_value
-        
-        # JS: const balanceAmount = totalAmount - advanceReceived;
-        advance_received = float(commission_data.get('advance_received') or 0)
-        calc_balance_amount = calc_total_amount - advance_received
-        
-        # JS: const actualAgreementAmount = totalAmount * agreementPercentage;
-        agreement_percentage = float(commission_data.get('agreement_percentage') or 0)
-        calc_actual_agreement_amount = calc_total_amount * agreement_percentage
-        
-        # JS: const agreementBalance = actualAgreementAmount - amountPaidAtAgreement - advanceReceived;
-        amount_paid_at_agreement = float(commission_data.get('amount_paid_at_agreement') or 0)
-        calc_agreement_balance = calc_actual_agreement_amount - amount_paid_at_agreement - advance_received
+        fallback = calculate_commission(commission_data)
+        calc_total_amount = fallback['total_amount']
+        calc_w_value = fallback['w_value']
+        calc_b_value = fallback['b_value']
+        calc_balance_amount = fallback['balance_amount']
+        calc_actual_agreement_amount = fallback['actual_agreement_amount']
+        calc_agreement_balance = fallback['agreement_balance']
         
     except Exception as e:
         app.logger.error(f"Error calculating fallbacks: {e}")
@@ -3730,24 +3834,32 @@ def approve_receipt(pending_id):
             created_at = datetime.utcnow().isoformat()
             
             # Insert into main receipts table
+            project_ids.ensure(c, project_name)
             c.execute(
-                """
+                f"""
                 INSERT INTO receipts
                 (no, project_name, date, venture, customer_name, amount_numeric, amount_words,
-                 plot_no, square_yards, purpose, drawn_bank, branch, payment_mode, instrument_no, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                 plot_no, square_yards, purpose, drawn_bank, branch, payment_mode, instrument_no, created_at,
+                 project_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, {project_ids.ID_SQL})
             """,
                 (
                     no, project_name, date, venture, customer_name, amount_numeric, amount_words,
-                    plot_no, square_yards, purpose, drawn_bank, branch, payment_mode, instrument_no, created_at
+                    plot_no, square_yards, purpose, drawn_bank, branch, payment_mode, instrument_no, created_at,
+                    project_name
                 ),
             )
             receipt_id = c.lastrowid
+            change_log.record_receipts(c, change_log.INSERT, "r.id = %s", (receipt_id,), session.get("username"))
+            plot_master.record(c, [(project_name, plot_no, None, square_yards, customer_name)])
             
             # Mark pending receipt as approved and delete
             c.execute("DELETE FROM pending_receipts WHERE id = %s", (pending_id,))
+            plot_status_log.record(c, [(project_name, plot_no)])
+            data_versions.bump(c, data_versions.RECEIPTS, data_versions.PENDING_RECEIPTS)
             conn.commit()
             conn.close()
+            plot_index.note_plot(project_name, plot_no, customer_name)
             
             flash("Receipt approved and saved successfully!", "success")
             return redirect(url_for("view_receipt", receipt_id=receipt_id))
@@ -3755,6 +3867,7 @@ def approve_receipt(pending_id):
         elif action == "reject":
             # Delete the pending receipt
             c.execute("DELETE FROM pending_receipts WHERE id = %s", (pending_id,))
+            data_versions.bump(c, data_versions.PENDING_RECEIPTS)
             conn.commit()
             conn.close()
             
@@ -3767,7 +3880,7 @@ def approve_receipt(pending_id):
     conn = database.get_db_connection()
     c = conn.cursor()
     
-    c.execute("SELECT * FROM commissions WHERE id = %s", (commission_id,))
+    c.execute(f"SELECT {project_ids.columns('commissions')} FROM commissions WHERE id = %s", (commission_id,))
     row = database.fetch_one(c)
     conn.close()
     
@@ -3903,94 +4016,31 @@ def approve_receipt(pending_id):
     return response
 
 
-def calculate_commission(form_data):
-    """Calculate all commission values based on input data"""
-    sq_yards = form_data['sq_yards']
-    negotiated_price = form_data['negotiated_price']
-    original_price = form_data['original_price']
-    advance_received = form_data['advance_received']
+def _commission_inputs(form_data):
+    """Rule inputs (see commission_rules.INPUTS) of a calculator form."""
+    return {name: float(form_data.get(name) or 0) for name in commission_rules.INPUTS}
 
-    agreement_percentage = form_data['agreement_percentage']
-    amount_paid_at_agreement = form_data['amount_paid_at_agreement']
-    amc_charges = form_data['amc_charges']
-    
-    # Basic calculations
-    total_amount = (sq_yards * negotiated_price) + (amc_charges * sq_yards)
-    w_value = sq_yards * 5500
-    b_value = total_amount - w_value
-    balance_amount = total_amount - advance_received
-    actual_agreement_amount = total_amount * agreement_percentage
-    agreement_balance = actual_agreement_amount - amount_paid_at_agreement - advance_received
-    
 
-    
-    # CGM calculations
-    cgm_total = form_data['cgm_rate'] * sq_yards
-    cgm_at_agreement = cgm_total * agreement_percentage
-    cgm_at_registration = cgm_total - cgm_at_agreement
-    
-    # SrGM calculations
-    srgm_total = form_data['srgm_rate'] * sq_yards
-    srgm_at_agreement = srgm_total * agreement_percentage
-    srgm_at_registration = srgm_total - srgm_at_agreement
-    
-    # GM calculations
-    gm_total = form_data['gm_rate'] * sq_yards
-    gm_at_agreement = gm_total * agreement_percentage
-    gm_at_registration = gm_total - gm_at_agreement
-
-    # DGM calculations
-    dgm_total = form_data['dgm_rate'] * sq_yards
-    dgm_at_agreement = dgm_total * agreement_percentage
-    dgm_at_registration = dgm_total - dgm_at_agreement
-
-    # AGM calculations
-    agm_total = form_data['agm_rate'] * sq_yards
-    agm_at_agreement = agm_total * agreement_percentage
-    agm_at_registration = agm_total - agm_at_agreement
-    
-
-    
-    return {
-        'total_amount': total_amount,
-        'w_value': w_value,
-        'b_value': b_value,
-        'balance_amount': balance_amount,
-        'actual_agreement_amount': actual_agreement_amount,
-        'agreement_balance': agreement_balance,
-
-        'cgm_total': cgm_total,
-        'cgm_at_agreement': cgm_at_agreement,
-        'cgm_at_registration': cgm_at_registration,
-        'srgm_total': srgm_total,
-        'srgm_at_agreement': srgm_at_agreement,
-        'srgm_at_registration': srgm_at_registration,
-        'gm_total': gm_total,
-        'gm_at_agreement': gm_at_agreement,
-        'gm_at_registration': gm_at_registration,
-        'dgm_total': dgm_total,
-        'dgm_at_agreement': dgm_at_agreement,
-        'dgm_at_registration': dgm_at_registration,
-        'agm_total': agm_total,
-        'agm_at_agreement': agm_at_agreement,
-        'agm_at_registration': agm_at_registration,
-
-    }
+def calculate_commission(form_data, rules=None):
+    """Calculate all commission values with the project's commission rules"""
+    rules = rules or commission_rules.evaluator_for(form_data.get('project_name'))
+    rates = {f"{role}_rate": float(form_data.get(f"{role}_rate") or 0) for role in commission_rules.ROLES}
+    return rules.calculate(**_commission_inputs(form_data), **rates)
 
 
 def save_commission_to_db(form_data, calculations):
     """Save commission calculation to database"""
     conn = database.get_db_connection()
     c = conn.cursor()
+    rules = commission_rules.evaluator_for(form_data.get('project_name'), conn)
+    inputs = _commission_inputs(form_data)
+    project_ids.ensure(c, form_data.get('project_name'))
     
-    c.execute("""
+    c.execute(f"""
         INSERT INTO commissions (
             plot_no, project_name, sq_yards, original_price, negotiated_price,
             advance_received,
             agreement_percentage,
-            amount_paid_at_agreement, amc_charges, mediator_deduction, cgm_rate, srgm_rate,
-            gm_rate, dgm_rate, agm_rate, 
-            cgm_name, srgm_name, gm_name, dgm_name, agm_name,
             amount_paid_at_agreement, amc_charges, mediator_deduction, broker_commission, cgm_rate, srgm_rate,
             gm_rate, dgm_rate, agm_rate, agent_rate,
             cgm_name, srgm_name, gm_name, dgm_name, agm_name, agent_name,
@@ -4001,9 +4051,10 @@ def save_commission_to_db(form_data, calculations):
             srgm_at_registration, gm_total, gm_at_agreement,
             gm_at_registration, dgm_total, dgm_at_agreement, dgm_at_registration,
             agm_total, agm_at_agreement, agm_at_registration,
-            created_by, commission_breakdown
+            created_by, commission_breakdown, project_id
         ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                  %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                  %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+                  {project_ids.ID_SQL})
     """, (
         form_data['plot_no'], form_data.get('project_name', ''), form_data['sq_yards'], form_data['original_price'],
         form_data['negotiated_price'], form_data['advance_received'],
@@ -4025,58 +4076,19 @@ def save_commission_to_db(form_data, calculations):
         calculations['dgm_total'], calculations['dgm_at_agreement'], calculations['dgm_at_registration'],
         calculations['agm_total'], calculations['agm_at_agreement'], calculations['agm_at_registration'],
         session.get('username', 'admin'),
-        form_data.get('commission_breakdown', '')
+        form_data.get('commission_breakdown', ''),
+        form_data.get('project_name', '')
     ))
     
     commission_id = c.lastrowid
-    
-    # Save individual Sr.GM entries
-    srgm_entries = form_data.get('srgm_entries', [])
-    if srgm_entries:
-        for entry in srgm_entries:
-            name = entry[0] if isinstance(entry, (list, tuple)) else entry.get('name', '')
-            rate = entry[1] if isinstance(entry, (list, tuple)) and len(entry) > 1 else entry.get('rate', 0)
-            
-            if name and rate:
-                sq_yards = form_data['sq_yards']
-                agreement_pct = form_data['agreement_percentage']
-                
-                total = rate * sq_yards
-                agreement = total * agreement_pct
-                registration = total - agreement
-                
-                c.execute("""
-                    INSERT INTO commission_srgm_entries 
-                    (commission_id, name, total_amount, at_agreement, at_registration)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (commission_id, name.strip(), total, agreement, registration))
-    
-    # Save individual GM entries
-    gm_entries = form_data.get('gm_entries', [])
-    if gm_entries:
-        for entry in gm_entries:
-            name = entry[0] if isinstance(entry, (list, tuple)) else entry.get('name', '')
-            rate = entry[1] if isinstance(entry, (list, tuple)) and len(entry) > 1 else entry.get('rate', 0)
-            
-            if name and rate:
-                sq_yards = form_data['sq_yards']
-                agreement_pct = form_data['agreement_percentage']
-                
-                total = rate * sq_yards
-                agreement = total * agreement_pct
-                registration = total - agreement
-                
-                c.execute("""
-                    INSERT INTO commission_gm_entries 
-                    (commission_id, name, total_amount, at_agreement, at_registration)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (commission_id, name.strip(), total, agreement, registration))
-    
-    # Save individual Agent entries
+    commission_entries.write_entries(c, commission_id, form_data, rules, inputs, new=True)
 
-    
+    change_log.record_commissions(c, change_log.INSERT, "c.id = %s", (commission_id,), session.get("username"))
+    data_versions.bump(c, data_versions.COMMISSIONS)
     conn.commit()
     conn.close()
+    plot_index.note_plot(form_data.get('project_name', ''), form_data['plot_no'],
+                         source=plot_index.SOURCE_COMMISSION)
     
     return commission_id
 
@@ -4085,8 +4097,11 @@ def update_commission_in_db(commission_id, form_data, calculations):
     """Update existing commission calculation in database"""
     conn = database.get_db_connection()
     c = conn.cursor()
+    rules = commission_rules.evaluator_for(form_data.get('project_name'), conn)
+    inputs = _commission_inputs(form_data)
+    project_ids.ensure(c, form_data.get('project_name'))
     
-    c.execute("""
+    c.execute(f"""
         UPDATE commissions SET
             plot_no = %s, project_name = %s, sq_yards = %s, original_price = %s, negotiated_price = %s,
             advance_received = %s,
@@ -4106,7 +4121,7 @@ def update_commission_in_db(commission_id, form_data, calculations):
             srgm_at_registration = %s, gm_total = %s, gm_at_agreement = %s,
             gm_at_registration = %s, dgm_total = %s, dgm_at_agreement = %s, dgm_at_registration = %s,
             agm_total = %s, agm_at_agreement = %s, agm_at_registration = %s,
-            commission_breakdown = %s
+            commission_breakdown = %s, project_id = {project_ids.ID_SQL}
         WHERE id = %s
     """, (
         form_data['plot_no'], form_data.get('project_name', ''), form_data['sq_yards'], form_data['original_price'],
@@ -4129,55 +4144,17 @@ def update_commission_in_db(commission_id, form_data, calculations):
         calculations['dgm_total'], calculations['dgm_at_agreement'], calculations['dgm_at_registration'],
         calculations['agm_total'], calculations['agm_at_agreement'], calculations['agm_at_registration'],
         form_data.get('commission_breakdown', ''),
+        form_data.get('project_name', ''),
         commission_id
     ))
     
-    # Update DGM entries (Delete all and re-insert)
-    c.execute("DELETE FROM commission_dgm_entries WHERE commission_id = %s", (commission_id,))
-    dgm_entries = form_data.get('dgm_entries', [])
-    if dgm_entries:
-        for entry in dgm_entries:
-            name = entry[0] if isinstance(entry, (list, tuple)) else entry.get('name', '')
-            rate = entry[1] if isinstance(entry, (list, tuple)) and len(entry) > 1 else entry.get('rate', 0)
-            
-            if name and rate:
-                sq_yards = form_data['sq_yards']
-                agreement_pct = form_data['agreement_percentage']
-                
-                total = rate * sq_yards
-                agreement = total * agreement_pct
-                registration = total - agreement
-                
-                c.execute("""
-                    INSERT INTO commission_dgm_entries 
-                    (commission_id, name, total_amount, at_agreement, at_registration)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (commission_id, name.strip(), total, agreement, registration))
+    commission_entries.write_entries(c, commission_id, form_data, rules, inputs)
 
-    # Update AGM entries (Delete all and re-insert)
-    c.execute("DELETE FROM commission_agm_entries WHERE commission_id = %s", (commission_id,))
-    agm_entries = form_data.get('agm_entries', [])
-    if agm_entries:
-        for entry in agm_entries:
-            name = entry[0] if isinstance(entry, (list, tuple)) else entry.get('name', '')
-            rate = entry[1] if isinstance(entry, (list, tuple)) and len(entry) > 1 else entry.get('rate', 0)
-            
-            if name and rate:
-                sq_yards = form_data['sq_yards']
-                agreement_pct = form_data['agreement_percentage']
-                
-                total = rate * sq_yards
-                agreement = total * agreement_pct
-                registration = total - agreement
-                
-                c.execute("""
-                    INSERT INTO commission_agm_entries 
-                    (commission_id, name, total_amount, at_agreement, at_registration)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (commission_id, name.strip(), total, agreement, registration))
-    
+    change_log.record_commissions(c, change_log.UPDATE, "c.id = %s", (commission_id,), session.get("username"))
+    data_versions.bump(c, data_versions.COMMISSIONS)
     conn.commit()
     conn.close()
+    plot_index.invalidate()
 
 
 
@@ -4190,6 +4167,8 @@ def generate_commission_pdf_bytes(form_data, calculations):
     from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
     from reportlab.lib.enums import TA_CENTER, TA_LEFT
     
+    rules = commission_rules.evaluator_for(form_data.get('project_name'))
+    inputs = _commission_inputs(form_data)
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.5*inch, bottomMargin=0.5*inch)
     
@@ -4382,9 +4361,7 @@ def generate_commission_pdf_bytes(form_data, calculations):
     
     # Add individual Sr. GM rows
     for name, rate in srgm_entries:
-        total = rate * sq_yards
-        agreement = total * agreement_percentage
-        registration = total - agreement
+        total, agreement, registration = rules.entry('srgm', rate, **inputs)
         distribution_data.append([
             name or '-', 'SrGM',
             format_currency(total),
@@ -4394,9 +4371,7 @@ def generate_commission_pdf_bytes(form_data, calculations):
     
     # Add individual GM rows
     for name, rate in gm_entries:
-        total = rate * sq_yards
-        agreement = total * agreement_percentage
-        registration = total - agreement
+        total, agreement, registration = rules.entry('gm', rate, **inputs)
         distribution_data.append([
             name or '-', 'GM',
             format_currency(total),
@@ -4406,9 +4381,7 @@ def generate_commission_pdf_bytes(form_data, calculations):
     
     # Add individual DGM rows
     for name, rate in dgm_entries:
-        total = rate * sq_yards
-        agreement = total * agreement_percentage
-        registration = total - agreement
+        total, agreement, registration = rules.entry('dgm', rate, **inputs)
         distribution_data.append([
             name or '-', 'DGM',
             format_currency(total),
@@ -4418,9 +4391,7 @@ def generate_commission_pdf_bytes(form_data, calculations):
     
     # Add individual AGM rows
     for name, rate in agm_entries:
-        total = rate * sq_yards
-        agreement = total * agreement_percentage
-        registration = total - agreement
+        total, agreement, registration = rules.entry('agm', rate, **inputs)
         distribution_data.append([
             name or '-', 'AGM',
             format_currency(total),
@@ -4456,6 +4427,8 @@ def generate_commission_pdf_bytes(form_data, calculations):
 
 def generate_commission_docx_bytes(form_data, calculations):
     """Generate commission Word document using python-docx"""
+    rules = commission_rules.evaluator_for(form_data.get('project_name'))
+    inputs = _commission_inputs(form_data)
     doc = docx.Document()
     
     # Title
@@ -4605,9 +4578,7 @@ def generate_commission_docx_bytes(form_data, calculations):
     
     # Add individual Sr. GM rows
     for name, rate in srgm_entries:
-        total = rate * sq_yards
-        agreement = total * agreement_percentage
-        registration = total - agreement
+        total, agreement, registration = rules.entry('srgm', rate, **inputs)
         row_cells = table.add_row().cells
         row_cells[0].text = name or '-'
         row_cells[1].text = 'SrGM'
@@ -4617,9 +4588,7 @@ def generate_commission_docx_bytes(form_data, calculations):
     
     # Add individual GM rows
     for name, rate in gm_entries:
-        total = rate * sq_yards
-        agreement = total * agreement_percentage
-        registration = total - agreement
+        total, agreement, registration = rules.entry('gm', rate, **inputs)
         row_cells = table.add_row().cells
         row_cells[0].text = name or '-'
         row_cells[1].text = 'GM'
@@ -4629,9 +4598,7 @@ def generate_commission_docx_bytes(form_data, calculations):
     
     # Add individual DGM rows
     for name, rate in dgm_entries:
-        total = rate * sq_yards
-        agreement = total * agreement_percentage
-        registration = total - agreement
+        total, agreement, registration = rules.entry('dgm', rate, **inputs)
         row_cells = table.add_row().cells
         row_cells[0].text = name or '-'
         row_cells[1].text = 'DGM'
@@ -4641,9 +4608,7 @@ def generate_commission_docx_bytes(form_data, calculations):
     
     # Add individual AGM rows
     for name, rate in agm_entries:
-        total = rate * sq_yards
-        agreement = total * agreement_percentage
-        registration = total - agreement
+        total, agreement, registration = rules.entry('agm', rate, **inputs)
         row_cells = table.add_row().cells
         row_cells[0].text = name or '-'
         row_cells[1].text = 'AGM'
@@ -4665,7 +4630,7 @@ def download_commission_docx(commission_id, filename):
     conn = database.get_db_connection()
     c = conn.cursor()
     
-    c.execute("SELECT * FROM commissions WHERE id = %s", (commission_id,))
+    c.execute(f"SELECT {project_ids.columns('commissions')} FROM commissions WHERE id = %s", (commission_id,))
     row = database.fetch_one(c)
     conn.close()
     
@@ -4736,17 +4701,17 @@ def search_commission():
         
         # Find latest commission for this plot and project
         if project_name:
-            c.execute("""
+            c.execute(f"""
                 SELECT id FROM commissions 
-                WHERE plot_no = %s AND project_name = %s
+                WHERE plot_key = %s AND {project_ids.filter_sql()}
                 ORDER BY id DESC LIMIT 1
-            """, (plot_no, project_name))
+            """, (normalize_plot_key(plot_no), project_name))
         else:
             c.execute("""
                 SELECT id FROM commissions 
-                WHERE plot_no = %s 
+                WHERE plot_key = %s 
                 ORDER BY id DESC LIMIT 1
-            """, (plot_no,))
+            """, (normalize_plot_key(plot_no),))
         
         row = database.fetch_one(c)
         conn.close()
@@ -4763,6 +4728,60 @@ def search_commission():
     return render_template("commission_search.html", projects=projects)
 
 
+@app.route("/api/commissions/recompute/<project_name>", methods=["POST"])
+def recompute_commissions(project_name):
+    """
+    Recompute every stored commission of a project (see commission_recompute).
+    A dry run unless `apply=1`; either way the JSON report lists what changed.
+    A dry run may pass candidate `rules` to preview them before saving.
+    """
+    if session.get("role") != "admin":
+        return jsonify({"error": "Unauthorized"}), 403
+    data = request.get_json(silent=True) or request.form
+    dry_run = str(data.get("apply", "")).lower() not in ("1", "true", "yes", "on")
+
+    conn = database.get_db_connection()
+    try:
+        report = commission_recompute.recompute(conn, project_name, data.get("rules"), dry_run=dry_run,
+                                                changed_by=session.get("username"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+    finally:
+        conn.close()
+    return jsonify(report)
+
+
+@app.route("/api/commission-rules/<project_name>", methods=["GET", "PUT"])
+def commission_rules_api(project_name):
+    """
+    GET: the project's commission rules (defaults if none are saved), with
+    the formulas as JavaScript for the calculator page. PUT (admin): validate
+    and save new rules.
+    """
+    if request.method == "GET":
+        rules = commission_rules.evaluator_for(project_name)
+        return jsonify({"project": project_name, "rules": rules.rules, "js": rules.javascript()})
+
+    if session.get("role") != "admin":
+        return jsonify({"error": "Unauthorized"}), 403
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON rule definition"}), 400
+    conn = database.get_db_connection()
+    try:
+        rules = commission_rules.save_rules(conn.cursor(), project_name, data.get("rules", data),
+                                            session.get("username"))
+        conn.commit()
+    except commission_rules.RuleError as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        conn.close()
+    commission_rules.invalidate(project_name)
+    return jsonify({"project": project_name, "rules": rules.rules, "js": rules.javascript()})
+
+
 @app.route("/commissions/view")
 def view_commissions():
     """View commissions by project and plot"""
@@ -4783,18 +4802,30 @@ def view_commissions():
     params = []
     
     if selected_project:
-        where_clauses.append("project_name = %s")
+        where_clauses.append(project_ids.filter_sql())
         params.append(selected_project)
     
     if search_plot:
-        where_clauses.append("plot_no LIKE %s")
-        params.append(f"%{search_plot}%")
+        # Resolve matching plots in memory, then filter on the indexed plot_key
+        matches = plot_index.suggest(search_plot, selected_project or None, limit=None,
+                                     source=plot_index.SOURCE_COMMISSION, plots_only=True)
+        plot_keys = sorted({normalize_plot_key(m["plot_no"]) for m in matches})
+        if not plot_keys:
+            conn.close()
+            return render_template("commission_view.html",
+                                   projects=projects,
+                                   selected_project=selected_project,
+                                   search_plot=search_plot,
+                                   plots=plots)
+        where_clauses.append(f"plot_key IN ({','.join(['%s'] * len(plot_keys))})")
+        params.extend(plot_keys)
     
     where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
     
     # Get all plots that have commissions
     c.execute(f"""
-        SELECT DISTINCT plot_no, project_name, cgm_name, srgm_name, gm_name, total_amount
+        SELECT DISTINCT plot_no, {project_ids.name_sql('commissions')} AS project_name, cgm_name, srgm_name,
+            gm_name, total_amount
         FROM commissions 
         WHERE {where_sql}
         AND project_name IS NOT NULL AND project_name != ''
@@ -4833,11 +4864,11 @@ def view_commission_detail(project_name, plot_no):
     c = conn.cursor()
     
     # Get commission details
-    c.execute("""
-        SELECT * FROM commissions 
-        WHERE project_name = %s AND plot_no = %s
+    c.execute(f"""
+        SELECT {project_ids.columns('commissions')} FROM commissions 
+        WHERE {project_ids.filter_sql()} AND plot_key = %s
         ORDER BY id DESC LIMIT 1
-    """, (project_name, plot_no))
+    """, (project_name, normalize_plot_key(plot_no)))
     
     commission = database.fetch_one(c)
     conn.close()
@@ -4851,53 +4882,151 @@ def view_commission_detail(project_name, plot_no):
     return redirect(url_for('preview_commission_pdf', commission_id=commission['id']))
 
 
+def _can_view_layout(project_name):
+    """Admin OR user with 'can_view_vishvam_layout' permission (for Vishvam project)"""
+    if session.get("role") == "admin":
+        return True
+    if project_name.lower() == "vishvam":
+        return bool(session.get("can_view_vishvam_layout"))
+    # For other projects, default to admin-only or dashboard view permission (adjust as needed)
+    return bool(session.get("can_view_dashboard"))
+
+
+def _layout_svg_file(project_name):
+    """Path of the project's ingested (minified) layout SVG, or None."""
+    from werkzeug.utils import secure_filename
+    layout_dir = os.path.join(app.root_path, 'static', 'layouts')
+    # The viewer historically looked up the lower-cased name; uploads use secure_filename
+    for base in (project_name.lower(), secure_filename(project_name)):
+        original = os.path.join(layout_dir, f"{base}_layout.svg")
+        minified = layout_ingest.variant_paths(original)["min"]
+        if os.path.exists(minified) and (not os.path.exists(original)
+                                         or os.path.getmtime(minified) >= os.path.getmtime(original)):
+            return minified
+    return None
+
+
+def _layout_tiles(project_name):
+    """Tile manifest (see layout_tiles) of the project's current layout, or None."""
+    layout_dir = os.path.join(app.root_path, 'static', 'layouts')
+    source = _layout_svg_file(project_name)
+    if source is None:
+        pdf = os.path.join(layout_dir, f"{project_name.lower()}_layout.pdf")
+        source = pdf if os.path.exists(pdf) else None
+    if source is None:
+        return None
+    tiles_path = layout_tiles.tiles_dir(layout_dir, source)
+    manifest = layout_tiles.load_manifest(tiles_path)
+    # Tiles of an older upload are ignored until they are regenerated
+    if not manifest or manifest.get("version") != f"{os.stat(source).st_mtime_ns:x}":
+        return None
+    base = url_for('static', filename=f"layouts/tiles/{os.path.basename(tiles_path)}/{manifest['version']}/")
+    return dict(manifest, url=base + "{z}/{x}/{y}." + manifest["format"])
+
+
+@app.route("/api/layout-elements/<project_name>")
+def layout_elements_api(project_name):
+    """Element ids and bounding boxes of the ingested layout, for hit-testing over tiles."""
+    if not _can_view_layout(project_name):
+        abort(403)
+    minified = _layout_svg_file(project_name)
+    etag = f"{os.stat(minified).st_mtime_ns:x}" if minified else "none"
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+        response.set_etag(etag)
+        return response
+
+    conn = database.get_db_connection()
+    try:
+        c = conn.cursor()
+        c.execute("""
+            SELECT element_id, tag, min_x, min_y, max_x, max_y
+            FROM layout_elements
+            WHERE project_name = %s AND min_x IS NOT NULL
+            ORDER BY id
+        """, (project_name,))
+        rows = c.fetchall()
+    except database.Error as e:
+        if e.errno != 1146:
+            raise
+        rows = []
+    finally:
+        conn.close()
+
+    response = jsonify({"elements": [[r[0], r[1], r[2], r[3], r[4], r[5]] for r in rows]})
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.route("/plot-layout/<project_name>/layout.svg")
+def layout_svg(project_name):
+    """Serve the ingested layout, precompressed as brotli or gzip when the client accepts it."""
+    if not _can_view_layout(project_name):
+        abort(403)
+    minified = _layout_svg_file(project_name)
+    if not minified:
+        abort(404)
+
+    variants = layout_ingest.variant_paths(minified[:-len(".min.svg")] + ".svg")
+    accepted = request.accept_encodings
+    path, encoding = minified, None
+    for enc, key in (("br", "br"), ("gzip", "gzip")):
+        if accepted[enc] and os.path.exists(variants[key]):
+            path, encoding = variants[key], enc
+            break
+
+    # Each variant is its own file, so its ETag already differs per encoding.
+    # Versioned URLs (?v=mtime) can be cached for a long time.
+    response = send_file(path, mimetype="image/svg+xml", conditional=True, etag=True,
+                         max_age=31536000 if request.args.get("v") else 0)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+@app.route("/plot-layout/<project_name>/status.svg")
+def layout_status_svg(project_name):
+    """The ingested layout pre-coloured with current plot statuses (see layout_status)."""
+    if not _can_view_layout(project_name):
+        abort(403)
+    minified = _layout_svg_file(project_name)
+    if not minified:
+        abort(404)
+
+    encoding = "gzip" if request.accept_encodings["gzip"] else None
+    conn = database.get_db_connection()
+    try:
+        c = conn.cursor()
+        seq = plot_status_log.high_water(c, project_name)
+        etag = layout_status.etag(minified, seq, encoding)
+        if request.if_none_match.contains(etag):
+            response = make_response("", 304)
+        else:
+            path = layout_status.ensure_variant(c, project_name, minified, seq)
+            response = send_file(path + ".gz" if encoding else path, mimetype="image/svg+xml",
+                                 conditional=False, etag=False)
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+    finally:
+        conn.close()
+
+    response.set_etag(etag)
+    # Must revalidate: the variant changes with every plot status change
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
 @app.route("/plot-layout/<project_name>")
 def plot_layout_viewer(project_name):
     """Interactive plot layout viewer with real-time status"""
-    # Access control: Admin OR user with 'can_view_vishvam_layout' permission (for Vishvam project)
-    if session.get("role") != "admin":
-        if project_name.lower() == "vishvam" and not session.get("can_view_vishvam_layout"):
-            abort(403)
-        # For other projects, default to admin-only or dashboard view permission (adjust as needed)
-        elif project_name.lower() != "vishvam" and not session.get("can_view_dashboard"):
-             abort(403)
-    
-    # Get all plots with their status from receipts
-    conn = database.get_db_connection()
-    c = conn.cursor()
-    
-    # Get sold plots
-    c.execute("""
-        SELECT DISTINCT plot_no 
-        FROM receipts 
-        WHERE project_name = %s AND plot_no IS NOT NULL AND plot_no != ''
-    """, (project_name,))
-    
-    rows = database.fetch_all(c)
-    print(f"DEBUG: Raw rows from database: {rows}")
-    
-    sold_plots = []
-    for row in rows:
-        if row and 'plot_no' in row:
-            plot_no = row['plot_no']
-            if plot_no:  # Make sure it's not None or empty
-                sold_plots.append(str(plot_no))
-    
-    print(f"DEBUG: Final sold_plots list: {sold_plots}")
-    print(f"DEBUG: sold_plots type: {type(sold_plots)}")
-    print(f"DEBUG: sold_plots length: {len(sold_plots)}")
-    
-    # Get plot metadata if exists
-    c.execute("""
-        SELECT plot_no, facing, length, width, area, sq_yards, status, notes, svg_element_id,
-               boundary_east, boundary_west, boundary_north, boundary_south
-        FROM plot_layouts
-        WHERE project_name = %s
-    """, (project_name,))
-    plot_metadata = {row['plot_no']: dict(row) for row in database.fetch_all(c)}
-    
-    conn.close()
+    if not _can_view_layout(project_name):
+        abort(403)
     
+    # Sold plots and plot mappings are fetched by the page from /api/plot-state
+
     # Check if SVG layout exists (preferred) or PDF fallback
     svg_path = f"layouts/{project_name.lower()}_layout.svg"
     pdf_path = f"layouts/{project_name.lower()}_layout.pdf"
@@ -4905,6 +5034,7 @@ def plot_layout_viewer(project_name):
     # Check if SVG exists first
     import os
     svg_full_path = os.path.join('static', svg_path)
+    ingested_svg = _layout_svg_file(project_name)
     pdf_full_path = os.path.join('static', pdf_path)
     
     print(f"DEBUG: Checking for layout files...")
@@ -4914,7 +5044,12 @@ def plot_layout_viewer(project_name):
     print(f"DEBUG: PDF exists: {os.path.exists(pdf_full_path)}")
     print(f"DEBUG: Current working dir: {os.getcwd()}")
     
-    if os.path.exists(svg_full_path):
+    if ingested_svg:
+        # Minified layout already painted with the current plot statuses
+        layout_file = url_for('layout_status_svg', project_name=project_name)
+        layout_type = 'svg'
+        print(f"Loading ingested SVG layout: {layout_file}")
+    elif os.path.exists(svg_full_path):
         layout_file = url_for('static', filename=svg_path)
         layout_type = 'svg'
         print(f"Loading SVG layout: {layout_file}")
@@ -4929,8 +5064,6 @@ def plot_layout_viewer(project_name):
                              project_name=project_name,
                              layout_file=None,
                              layout_type=None,
-                             sold_plots=sold_plots,
-                             plot_metadata=plot_metadata,
                              user_role=session.get("role", ""))
     
     print(f"DEBUG: Returning with layout_file={layout_file}, layout_type={layout_type}")
@@ -4938,31 +5071,176 @@ def plot_layout_viewer(project_name):
                          project_name=project_name,
                          layout_file=layout_file,
                          layout_type=layout_type,
-                         sold_plots=sold_plots,
-                         plot_metadata=plot_metadata,
+                         layout_tiles=_layout_tiles(project_name),
                          user_role=session.get("role", ""))
 
 
+@app.route("/api/plot-state/<project_name>")
+def get_plot_state(project_name):
+    """
+    Columnar sold/mapping/commission state of every plot of a project for the
+    layout viewer (see plot_state), gzip-compressed when accepted.
+    """
+    if not _can_view_layout(project_name):
+        abort(403)
+    accept_gzip = bool(request.accept_encodings["gzip"])
+
+    conn = database.get_db_connection()
+    try:
+        c = conn.cursor()
+        # High-water mark first, as in get_plot_status, and part of the ETag
+        seq = plot_status_log.high_water(c, project_name)
+        etag = data_versions.etag_for(
+            (data_versions.RECEIPTS, data_versions.PLOT_LAYOUTS, data_versions.COMMISSIONS),
+            project_name, "gzip" if accept_gzip else "identity", seq, conn=conn)
+        if request.if_none_match.contains_raw(etag):
+            response = make_response("", 304)
+            response.headers["ETag"] = etag
+            return response
+        payload = plot_state.load_columns(c, project_name)
+    finally:
+        conn.close()
+    payload["seq"] = seq
+
+    body, encoding = plot_state.encode(payload, accept_gzip)
+    response = app.response_class(body, mimetype="application/json")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
 @app.route("/api/plot-status/<project_name>")
 def get_plot_status(project_name):
-    """API endpoint to get real-time plot status"""
+    """
+    API endpoint to get real-time plot status.
+
+    Without `since` the full sold-plot list is returned. With `?since=<seq>`
+    only plots whose sold state or plot_layouts mapping changed after that
+    sequence are returned. Either way `seq` is the new high-water mark to
+    send next time.
+    """
+    since = request.args.get("since", type=int)
+
     conn = database.get_db_connection()
     c = conn.cursor()
     
-    # Get sold plots
-    c.execute("""
-        SELECT DISTINCT plot_no 
-        FROM receipts 
-        WHERE project_name = %s AND plot_no IS NOT NULL AND plot_no != ''
-    """, (project_name,))
-    sold_plots = [row['plot_no'] for row in database.fetch_all(c)]
+    # Read the high-water mark first so nothing logged meanwhile is skipped
+    seq = plot_status_log.high_water(c, project_name)
+
+    # Answer conditional polls from the data versions and the high-water mark.
+    # The mark is part of the tag: it can stop below a change that is still
+    # settling, and the poll after it settles must not get a 304.
+    etag = data_versions.etag_for((data_versions.RECEIPTS, data_versions.PLOT_LAYOUTS),
+                                  project_name, since, seq, conn=conn)
+    if request.if_none_match.contains_raw(etag):
+        conn.close()
+        response = make_response("", 304)
+        response.headers["ETag"] = etag
+        return response
+
+    if since is not None and 0 < since <= seq:
+        payload = {
+            'since': since,
+            'changes': plot_status_log.changes_since(c, project_name, since, seq),
+        }
+    else:
+        # Get sold plots
+        c.execute(f"""
+            SELECT DISTINCT plot_no 
+            FROM receipts 
+            WHERE {project_ids.filter_sql()} AND plot_no IS NOT NULL AND plot_no != ''
+        """, (project_name,))
+        payload = {'sold_plots': [row['plot_no'] for row in database.fetch_all(c)]}
     
     conn.close()
     
-    return jsonify({
-        'sold_plots': sold_plots,
-        'timestamp': datetime.now().isoformat()
-    })
+    payload['seq'] = seq
+    payload['timestamp'] = datetime.now().isoformat()
+    response = jsonify(payload)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def _sync_projects():
+    """Projects the logged-in agent may sync (those whose layout they may view)."""
+    return [name for name in get_projects() if _can_view_layout(name)]
+
+
+@app.route("/api/sync")
+def field_sync_state():
+    """
+    Offline sync for field agents (see field_sync): the compact state of
+    every permitted project, or with `?token=` only what changed since.
+    """
+    projects = _sync_projects()
+    if not projects:
+        return jsonify({"error": "No projects available"}), 403
+
+    conn = database.get_db_connection()
+    try:
+        payload = field_sync.sync_payload(conn.cursor(), projects, request.args.get("token", "").strip())
+    finally:
+        conn.close()
+
+    body, encoding = plot_state.encode(payload, bool(request.accept_encodings["gzip"]))
+    response = app.response_class(body, mimetype="application/json")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Cache-Control"] = "no-store"
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+@app.route("/api/sync/receipts", methods=["POST"])
+def field_sync_receipts():
+    """Bulk upload of receipts queued offline into pending_receipts for approval."""
+    data = request.get_json(silent=True) or {}
+    receipts = data.get("receipts")
+    if not isinstance(receipts, list) or not receipts:
+        return jsonify({"error": "receipts must be a non-empty list"}), 400
+    if len(receipts) > field_sync.MAX_UPLOAD:
+        return jsonify({"error": f"At most {field_sync.MAX_UPLOAD} receipts per upload"}), 413
+
+    conn = database.get_db_connection()
+    try:
+        c = conn.cursor()
+        result = field_sync.upload_receipts(c, receipts, set(_sync_projects()),
+                                            session.get("username", "unknown"), number_to_words)
+        if result["accepted"]:
+            data_versions.bump(c, data_versions.PENDING_RECEIPTS)
+            conn.commit()
+    except database.Error as e:
+        conn.rollback()
+        print(f"Sync upload failed: {e}")
+        return jsonify({"error": "Upload failed, please retry"}), 503
+    finally:
+        conn.close()
+    return jsonify(result)
+
+
+@app.route("/api/plot-events/<project_name>")
+def plot_events_stream(project_name):
+    """Server-sent events with plot status changes for the layout viewer"""
+    if not _can_view_layout(project_name):
+        abort(403)
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        sub, initial = plot_events.hub.subscribe(project_name, last_event_id)
+    except plot_events.StreamLimitError:
+        # The viewer falls back to polling /api/plot-status
+        response = make_response("Too many open plot event streams", 503)
+        response.headers["Retry-After"] = "30"
+        return response
+    response = app.response_class(plot_events.hub.stream(sub, initial), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # Let nginx pass events through without buffering
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
 
 @app.route("/api/plot-mapping/save", methods=["POST"])
@@ -4980,53 +5258,58 @@ def save_plot_mapping():
         return jsonify({'error': 'Missing required fields'}), 400
         
     conn = database.get_db_connection()
-    c = conn.cursor()
-    
-    # Get all fields
-    facing = data.get('facing')
-    length = float(data.get('length') or 0)
-    width = float(data.get('width') or 0)
-    sq_yards = float(data.get('sq_yards') or 0)
-    status = data.get('status', 'available')  # Default to available
-    boundary_east = data.get('boundary_east', '')
-    boundary_west = data.get('boundary_west', '')
-    boundary_north = data.get('boundary_north', '')
-    boundary_south = data.get('boundary_south', '')
-    
-    # Calculate area if dimensions provided (fallback if sq_yards not provided)
-    area = sq_yards if sq_yards > 0 else (length * width if length and width else 0)
-    
     try:
-        # Check if exists
-        c.execute("SELECT id FROM plot_layouts WHERE project_name = %s AND plot_no = %s", (project_name, plot_no))
-        existing = database.fetch_one(c)
-        
-        if existing:
-            c.execute("""
-                UPDATE plot_layouts 
-                SET facing = %s, length = %s, width = %s, area = %s, sq_yards = %s, status = %s, 
-                    boundary_east = %s, boundary_west = %s, boundary_north = %s, boundary_south = %s,
-                    svg_element_id = %s
-                WHERE project_name = %s AND plot_no = %s
-            """, (facing, length, width, area, sq_yards, status, 
-                  boundary_east, boundary_west, boundary_north, boundary_south,
-                  data.get('element_id'), project_name, plot_no))
-        else:
-            c.execute("""
-                INSERT INTO plot_layouts (project_name, plot_no, facing, length, width, area, sq_yards, status, 
-                                         boundary_east, boundary_west, boundary_north, boundary_south, svg_element_id)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (project_name, plot_no, facing, length, width, area, sq_yards, status,
-                  boundary_east, boundary_west, boundary_north, boundary_south, data.get('element_id')))
-            
-        conn.commit()
-        return jsonify({'success': True, 'message': f'Plot {plot_no} mapped successfully', 'status': status})
+        result = plot_mappings.upsert_mappings(conn, project_name, [data])[0]
+        if result['result'] == 'error':
+            return jsonify({'error': result['error']}), 400
+        return jsonify({'success': True, 'message': f'Plot {plot_no} mapped successfully',
+                        'status': data.get('status', 'available')})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
 
 
+@app.route("/api/plot-mapping/bulk-save", methods=["POST"])
+def bulk_save_plot_mappings():
+    """
+    Save many plot mappings of one project in a single transaction (Admin only).
+
+    Body: {"project_name": ..., "mappings": [{"plot_no", "element_id", "facing", ...}, ...]}
+    Returns a result per mapping: inserted, updated, or error (invalid rows are
+    skipped, the rest are still saved).
+    """
+    if not session.get("role") == "admin":
+        return jsonify({'error': 'Unauthorized. Only admins can edit plot mappings.'}), 403
+
+    data = request.get_json(silent=True) or {}
+    project_name = data.get('project_name')
+    mappings = data.get('mappings')
+    if not project_name or not isinstance(mappings, list) or not mappings:
+        return jsonify({'error': 'project_name and a non-empty mappings list are required'}), 400
+    if len(mappings) > plot_mappings.MAX_BATCH:
+        return jsonify({'error': f'At most {plot_mappings.MAX_BATCH} mappings per request'}), 400
+
+    conn = database.get_db_connection()
+    try:
+        results = plot_mappings.upsert_mappings(conn, project_name, mappings)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+    counts = {}
+    for r in results:
+        counts[r['result']] = counts.get(r['result'], 0) + 1
+    return jsonify({
+        'success': 'error' not in counts,
+        'inserted': counts.get('inserted', 0),
+        'updated': counts.get('updated', 0),
+        'errors': counts.get('error', 0),
+        'results': results,
+    })
+
+
 # -----------------------------
 
 @app.route("/debug-logs")
@@ -5084,41 +5367,31 @@ def import_receipts():
             flash('No selected file', 'danger')
             return redirect(request.url)
             
-        if file and (file.filename.endswith('.xlsx') or file.filename.endswith('.xls')):
+        if file and receipt_import.is_supported(file.filename):
             try:
+                upload_folder = import_jobs.upload_dir(app.config["UPLOAD_FOLDER"])
+                # Drop uploads abandoned on the mapping page (or by failed jobs nobody resumed)
+                conn = database.get_db_connection()
+                try:
+                    import_jobs.remove_stale_uploads(conn.cursor(), upload_folder)
+                finally:
+                    conn.close()
+
                 # Save file temporarily to process in next step
                 filename = f"import_{int(datetime.now().timestamp())}_{file.filename}"
-                filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+                filepath = os.path.join(upload_folder, filename)
                 file.save(filepath)
                 
-                # Load headers
-                wb = openpyxl.load_workbook(filepath, data_only=True)
-                ws = wb.active
-                # Assume headers are in Row 2 (Index 1) as per standard project file, 
-                # or Row 1 if standard excel. Let's grab first few rows and try to find header row?
-                # For simplicity/consistency with previous analysis: Reading Row 2 (index 1) as headers.
-                # But to be safer, we can pass the first few rows to UI? 
-                # Let's just grab Row 2 as headers for now, matching the standard format.
-                rows = list(ws.iter_rows(values_only=True))
-                
-                headers = []
-                if len(rows) > 1:
-                    headers = list(rows[1]) # Row 2
-                elif len(rows) > 0:
-                    headers = list(rows[0]) # Row 1 if small file
+                # Load headers (reads only the header row; see receipt_import)
+                clean_headers = receipt_import.read_headers(filepath)
                     
-                # Clean headers (None -> Column X)
-                clean_headers = []
-                for idx, h in enumerate(headers):
-                    clean_headers.append(str(h) if h else f"Column {idx+1}")
-                
                 return render_template("import_mapping.html", headers=clean_headers, filename=filename)
                 
             except Exception as e:
                 flash(f"Error reading file: {str(e)}", "danger")
                 return redirect(request.url)
 
-    return render_template("import_receipts.html")
+    return render_template("import_receipts.html", job_id=request.args.get("job", type=int))
 
 
 @app.route("/import_receipts/process", methods=["POST"])
@@ -5127,7 +5400,8 @@ def process_import_mapping():
         abort(403)
         
     filename = request.form.get("filename")
-    filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+    upload_folder = import_jobs.upload_dir(app.config["UPLOAD_FOLDER"])
+    filepath = os.path.join(upload_folder, filename)
     
     if not os.path.exists(filepath):
         flash("File processing error: Temporary file not found.", "danger")
@@ -5135,176 +5409,60 @@ def process_import_mapping():
 
     # Get mappings (Column Indices)
     try:
-        col_plot = int(request.form.get("col_plot_no"))
-        col_date = int(request.form.get("col_date"))
-        col_amount = int(request.form.get("col_amount"))
-        
-        # Optional fields
-        col_customer = request.form.get("col_customer")
-        col_payment_mode = request.form.get("col_payment_mode")
-        col_receipt_no = request.form.get("col_receipt_no")
-        col_sq_yards = request.form.get("col_sq_yards")
-        
-        col_customer = int(col_customer) if col_customer else None
-        col_payment_mode = int(col_payment_mode) if col_payment_mode else None
-        col_receipt_no = int(col_receipt_no) if col_receipt_no else None
-        col_sq_yards = int(col_sq_yards) if col_sq_yards else None
-        
-        col_basic_price = request.form.get("col_basic_price")
-        col_basic_price = int(col_basic_price) if col_basic_price else None
-        
-        import_summary = {
-            'total_rows': 0,
-            'imported': 0,
-            'skipped': 0,
-            'errors': []
-        }
-        
-        wb = openpyxl.load_workbook(filepath, data_only=True)
-        ws = wb.active
-        rows = list(ws.iter_rows(values_only=True))
-        
-        # Context for grouped data
-        current_plot_no = None
-        current_sq_yards = None
-        current_basic_price = None
-        current_customer_name = None
-        
-        conn = database.get_db_connection()
-        c = conn.cursor()
-        
-        # Start iterating from Row 3 (Index 2) - Data
-        for i, row in enumerate(rows[2:], start=3):
-            import_summary['total_rows'] += 1
-            if not row: continue
-
-            # 1. Plot No
-            if col_plot < len(row):
-                raw_plot = row[col_plot]
-                if raw_plot not in [None, 0, '0', 0.0, '']:
-                    current_plot_no = str(raw_plot).strip()
-                    if current_plot_no.endswith('.0'):
-                        current_plot_no = current_plot_no[:-2]
-                    # Reset context specific to new plot
-                    current_customer_name = None 
-                    current_sq_yards = None
-                    current_basic_price = None
-                    
-                    # Update customer if mapped and present on this plot row
-                    if col_customer is not None and col_customer < len(row) and row[col_customer]:
-                         current_customer_name = str(row[col_customer]).strip()
-                                        # Update sq yards if mapped and present
-                    if col_sq_yards is not None and col_sq_yards < len(row) and row[col_sq_yards]:
-                         current_sq_yards = str(row[col_sq_yards]).strip()
-
-                    # Update basic price if mapped and present
-                    if col_basic_price is not None and col_basic_price < len(row) and row[col_basic_price]:
-                         try:
-                             current_basic_price = float(row[col_basic_price])
-                         except (ValueError, TypeError):
-                             pass
-
-
-            # 2. Amount
-            amount = 0
-            if col_amount < len(row):
-                raw_amount = row[col_amount]
-                try:
-                    amount = float(raw_amount) if raw_amount else 0
-                except (ValueError, TypeError):
-                    amount = 0
-            
-            if amount > 0:
-                if not current_plot_no:
-                    import_summary['errors'].append(f"Row {i}: Found amount {amount} but no Plot No context.")
-                    continue
-                
-                # 3. Date
-                date_str = datetime.now().strftime("%Y-%m-%d")
-                if col_date < len(row):
-                    raw_date = row[col_date]
-                    if isinstance(raw_date, datetime):
-                        date_str = raw_date.strftime("%Y-%m-%d")
-                    elif isinstance(raw_date, str):
-                        try:
-                            # Try common formats
-                            for fmt in ["%d.%m.%Y", "%Y-%m-%d", "%d-%m-%Y", "%m/%d/%Y"]:
-                                try:
-                                    date_str = datetime.strptime(raw_date, fmt).strftime("%Y-%m-%d")
-                                    break
-                                except ValueError:
-                                    continue
-                        except:
-                            pass
-                            
-                # 4. Receipt No
-                receipt_no = None
-                if col_receipt_no is not None and col_receipt_no < len(row):
-                    raw_no = row[col_receipt_no]
-                    if raw_no:
-                        # integer cleaning
-                        digits = re.findall(r'\d+', str(raw_no))
-                        if digits:
-                            receipt_no = "".join(digits)
-                        else:
-                            receipt_no = str(raw_no).strip()
-                            
-                if not receipt_no:
-                     receipt_no = f"IMP-{current_plot_no}-{int(datetime.now().timestamp())}-{i}"
-
-                # 5. Payment Mode
-                payment_mode = "Unknown"
-                if col_payment_mode is not None and col_payment_mode < len(row):
-                    val = row[col_payment_mode]
-                    if val:
-                        payment_mode = str(val).strip()
-
-                # Deduplication
-                exists = False
-                c.execute("SELECT id FROM receipts WHERE no = %s OR instrument_no = %s", (receipt_no, receipt_no))
-                if database.fetch_one(c):
-                    exists = True
-                
-                if exists:
-                    import_summary['skipped'] += 1
-                else:
-                    try:
-                        c.execute("""
-                            INSERT INTO receipts (
-                                date, plot_no, customer_name, amount_numeric, amount_words, 
-                                payment_mode, no, project_name, square_yards, basic_price
-                            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        """, (
-                            date_str, 
-                            current_plot_no, 
-                            current_customer_name or "Unknown", 
-                            amount, 
-                            number_to_words(amount), 
-                            payment_mode, 
-                            receipt_no, 
-                            "Vishvam", 
-                            current_sq_yards,
-                            current_basic_price
-                        ))
-                        import_summary['imported'] += 1
-                    except Exception as e:
-                        import_summary['errors'].append(f"Row {i}: DB Error - {str(e)}")
+        mapping = receipt_import.mapping_from_form(request.form)
+    except (TypeError, ValueError):
+        flash("Please map the Plot No, Date and Amount columns.", "danger")
+        return redirect(url_for("import_receipts"))
 
-        conn.commit()
-        conn.close()
-        
-        # cleanup
+    # Runs in the background (see import_jobs); the page polls for progress
+    try:
+        conn = database.get_db_connection()
         try:
-            os.remove(filepath)
-        except:
-            pass
-            
-        return render_template("import_receipts.html", summary=import_summary)
+            job_id = import_jobs.create_job(conn, filename, mapping, session.get("username"))
+        finally:
+            conn.close()
+        import_jobs.start(database.get_tenant_db_config(), job_id, upload_folder, number_to_words)
+        return redirect(url_for("import_receipts", job=job_id))
 
     except Exception as e:
         flash(f"Error processing import: {str(e)}", "danger")
         return redirect(url_for("import_receipts"))
 
+
+@app.route("/api/import-jobs/<int:job_id>")
+def import_job_progress(job_id):
+    if not (session.get("role") == "admin"):
+        return jsonify({"error": "Unauthorized"}), 403
+    conn = database.get_db_connection()
+    try:
+        job = import_jobs.get_job(conn.cursor(), job_id)
+    finally:
+        conn.close()
+    if not job:
+        return jsonify({"error": "Import job not found"}), 404
+    return jsonify(import_jobs.progress(job))
+
+
+@app.route("/import_receipts/jobs/<int:job_id>/resume", methods=["POST"])
+def resume_import_job(job_id):
+    if not (session.get("role") == "admin"):
+        abort(403)
+    conn = database.get_db_connection()
+    try:
+        job = import_jobs.get_job(conn.cursor(), job_id)
+    finally:
+        conn.close()
+    if not job:
+        flash("Import job not found.", "danger")
+        return redirect(url_for("import_receipts"))
+    if not import_jobs.is_resumable(job):
+        flash("This import is not in a resumable state.", "warning")
+    else:
+        import_jobs.start(database.get_tenant_db_config(), job_id,
+                          import_jobs.upload_dir(app.config["UPLOAD_FOLDER"]), number_to_words)
+        flash(f"Resuming import after row {job['checkpoint_row']}.", "info")
+    return redirect(url_for("import_receipts", job=job_id))
+
 @app.route("/delete_receipts")
 def delete_receipts():
     """List plots for receipt deletion"""
@@ -5317,11 +5475,12 @@ def delete_receipts():
     
     # Get plots with receipts count
     c.execute("""
-        SELECT plot_no, project_name, COUNT(*) as receipt_count 
-        FROM receipts 
-        WHERE plot_no IS NOT NULL AND plot_no != '' 
-        GROUP BY plot_no, project_name 
-        ORDER BY CAST(plot_no AS UNSIGNED)
+        SELECT r.plot_no, COALESCE(p.name, r.project_name) AS project_name, COUNT(*) as receipt_count 
+        FROM receipts r
+        LEFT JOIN projects p ON p.id = r.project_id
+        WHERE r.plot_no IS NOT NULL AND r.plot_no != '' 
+        GROUP BY r.plot_no, r.project_id, 2 
+        ORDER BY CAST(r.plot_no AS UNSIGNED)
     """)
     
     rows = database.fetch_all(c)
@@ -5352,17 +5511,17 @@ def delete_receipts_detail(plot_no):
     
     # Get receipts
     if project_name:
-        c.execute("""
-            SELECT * FROM receipts 
-            WHERE plot_no = %s AND project_name = %s
+        c.execute(f"""
+            SELECT {project_ids.columns('receipts')} FROM receipts 
+            WHERE plot_key = %s AND {project_ids.filter_sql()}
             ORDER BY date DESC, id DESC
-        """, (plot_no, project_name))
+        """, (normalize_plot_key(plot_no), project_name))
     else:
-        c.execute("""
-            SELECT * FROM receipts 
-            WHERE plot_no = %s 
+        c.execute(f"""
+            SELECT {project_ids.columns('receipts')} FROM receipts 
+            WHERE plot_key = %s 
             ORDER BY date DESC, id DESC
-        """, (plot_no,))
+        """, (normalize_plot_key(plot_no),))
         
     rows = database.fetch_all(c)
     conn.close()
@@ -5401,11 +5560,17 @@ def bulk_delete_receipts():
         ids = [int(rid) for rid in receipt_ids]
         format_strings = ','.join(['%s'] * len(ids))
         
+        plot_status_log.record(c, plot_status_log.receipt_plots(c, f"id IN ({format_strings})", tuple(ids)))
+        change_log.record_receipts(c, change_log.DELETE, f"r.id IN ({format_strings})", tuple(ids),
+                                   session.get("username"))
+
         # Delete
         c.execute(f"DELETE FROM receipts WHERE id IN ({format_strings})", tuple(ids))
         deleted_count = c.rowcount
+        data_versions.bump(c, data_versions.RECEIPTS)
         conn.commit()
         conn.close()
+        plot_index.invalidate()
         
         flash(f"Successfully deleted {deleted_count} receipt(s).", "success")
         
@@ -5442,15 +5607,24 @@ def bulk_delete_plots():
             project_name = parts[1] if len(parts) > 1 else ""
             
             if project_name:
-                c.execute("DELETE FROM receipts WHERE plot_no = %s AND project_name = %s", (plot_no, project_name))
+                plot_status_log.record(c, [(project_name, plot_no)])
+                change_log.record_receipts(c, change_log.DELETE, f"r.plot_key = %s AND {project_ids.filter_sql('r')}",
+                                           (normalize_plot_key(plot_no), project_name), session.get("username"))
+                c.execute(f"DELETE FROM receipts WHERE plot_key = %s AND {project_ids.filter_sql()}",
+                          (normalize_plot_key(plot_no), project_name))
             else:
-                c.execute("DELETE FROM receipts WHERE plot_no = %s", (plot_no,))
+                plot_status_log.record(c, plot_status_log.receipt_plots(c, "plot_key = %s", (normalize_plot_key(plot_no),)))
+                change_log.record_receipts(c, change_log.DELETE, "r.plot_key = %s", (normalize_plot_key(plot_no),),
+                                           session.get("username"))
+                c.execute("DELETE FROM receipts WHERE plot_key = %s", (normalize_plot_key(plot_no),))
                 
             deleted_count += c.rowcount
             plots_affected += 1
             
+        data_versions.bump(c, data_versions.RECEIPTS)
         conn.commit()
         conn.close()
+        plot_index.invalidate()
         
         flash(f"Successfully deleted {deleted_count} receipts across {plots_affected} plots.", "success")
         
@@ -0,0 +1,466 @@
+"""
+Streaming spreadsheet import of receipts (/import_receipts).
+
+The workbook is opened in openpyxl read_only mode and never materialised:
+read_headers() reads just the header row for the column-mapping page, and
+the import streams data rows through a generator pipeline
+
+    iter_sheet_rows()  ->  parse_rows()  ->  batches of BATCH_SIZE  ->  write_batch()
+
+so memory stays flat however long the booking sheet is. Duplicates are found
+against a set of the tenant's receipt and instrument numbers loaded once up
+front, and each batch is inserted with one executemany and committed on its
+own, so a 20k-row sheet costs a few dozen round trips instead of 40k.
+
+Sheet layout (unchanged from the original importer): headers on row 2, data
+from row 3. Rows are grouped per plot: a row with a plot number starts a new
+plot context (customer, sq. yards, basic price) and every following row with
+a positive amount is a receipt for that plot.
+
+CSV/TSV exports skip openpyxl entirely: iter_rows() streams them through the
+stdlib csv reader, with the encoding and delimiter detected from the first
+SNIFF_BYTES. Their header is row 1, or row 2 when row 1 is a title line (as
+in a CSV saved from the booking sheet); data follows the header.
+
+Throughput of the two readers on the same data:
+    python receipt_import.py --benchmark [rows]
+"""
+
+import codecs
+import csv
+import os
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime
+from itertools import chain, islice
+
+import openpyxl
+
+import change_log
+import data_versions
+import plot_master
+import plot_status_log
+import project_ids
+from plot_utils import clean_plot_no
+
+HEADER_ROW = 2
+DATA_START_ROW = 3
+
+# Receipts validated, deduplicated, inserted and committed together
+BATCH_SIZE = 500
+
+# Rows fetched per round trip while preloading existing numbers
+FETCH_SIZE = 5000
+
+# Imported receipts have always been filed under this project
+IMPORT_PROJECT = "Vishvam"
+
+DATE_FORMATS = ["%d.%m.%Y", "%Y-%m-%d", "%d-%m-%Y", "%m/%d/%Y"]
+
+INSERT_SQL = f"""
+    INSERT INTO receipts (
+        date, plot_no, customer_name, amount_numeric, amount_words,
+        payment_mode, no, project_name, square_yards, basic_price, project_id
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, {project_ids.ID_SQL})
+"""
+
+REQUIRED_COLUMNS = ("plot_no", "date", "amount")
+OPTIONAL_COLUMNS = ("customer", "payment_mode", "receipt_no", "sq_yards", "basic_price")
+
+
+def new_summary():
+    return {'total_rows': 0, 'imported': 0, 'skipped': 0, 'errors': []}
+
+
+def mapping_from_form(form):
+    """Column indices chosen on import_mapping.html (None = not mapped). Raises ValueError."""
+    mapping = {}
+    for name in REQUIRED_COLUMNS:
+        mapping[name] = int(form.get(f"col_{name}"))
+    for name in OPTIONAL_COLUMNS:
+        value = form.get(f"col_{name}")
+        mapping[name] = int(value) if value else None
+    return mapping
+
+
+CSV_EXTENSIONS = (".csv", ".tsv")
+SHEET_EXTENSIONS = (".xlsx", ".xls")
+
+# Bytes read up front to detect a CSV's encoding and delimiter
+SNIFF_BYTES = 64 * 1024
+CSV_DELIMITERS = ",\t;|"
+
+
+def is_csv(path):
+    return os.path.splitext(path)[1].lower() in CSV_EXTENSIONS
+
+
+def is_supported(filename):
+    return os.path.splitext(filename)[1].lower() in CSV_EXTENSIONS + SHEET_EXTENSIONS
+
+
+def _open_sheet(path, trust_dimensions=False):
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    ws = wb.active
+    if not trust_dimensions or ws.max_column is None:
+        # Some exporters write a wrong (or no) <dimension>; read until the real last row
+        ws.reset_dimensions()
+    return wb, ws
+
+
+def detect_encoding(sample):
+    """Encoding of a CSV from its first bytes: BOM, else UTF-8 if it decodes, else Windows-1252."""
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    try:
+        # Not final: the sample may end inside a multi-byte character
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1252"
+
+
+def _open_csv(path):
+    """Open a CSV/TSV for streaming. Returns (file, csv reader)."""
+    with open(path, "rb") as f:
+        sample = f.read(SNIFF_BYTES)
+    encoding = detect_encoding(sample)
+    if path.lower().endswith(".tsv"):
+        delimiter = "\t"
+    else:
+        text = sample.decode(encoding, errors="ignore")
+        # Only sniff whole lines
+        text = text[:text.rfind("\n") + 1] or text
+        try:
+            delimiter = csv.Sniffer().sniff(text, delimiters=CSV_DELIMITERS).delimiter
+        except csv.Error:
+            delimiter = ","
+    f = open(path, newline="", encoding=encoding, errors="replace")
+    return f, csv.reader(f, delimiter=delimiter)
+
+
+def _filled(row):
+    return sum(1 for value in row if value.strip())
+
+
+def _csv_header(reader):
+    """
+    Read up to a CSV's header: row 1, or row 2 when row 1 is a title line.
+    Returns (header row number, header values, rows read past the header).
+    """
+    first = next(reader, [])
+    if _filled(first) >= 2:
+        return 1, first, []
+    second = next(reader, None)
+    if second is not None and _filled(second) >= 2:
+        return 2, second, []
+    return 1, first, [second] if second is not None else []
+
+
+def _clean_headers(headers):
+    # Clean headers (None -> Column X)
+    return [str(h) if h else f"Column {idx + 1}" for idx, h in enumerate(headers)]
+
+
+def read_headers(path):
+    """Header labels for the mapping page, reading no more than the header row."""
+    if is_csv(path):
+        f, reader = _open_csv(path)
+        with f:
+            return _clean_headers(_csv_header(reader)[1])
+
+    # The declared dimension pads the header row to the sheet's widest row
+    wb, ws = _open_sheet(path, trust_dimensions=True)
+    try:
+        rows = list(ws.iter_rows(max_row=HEADER_ROW, values_only=True))
+    finally:
+        wb.close()
+    headers = []
+    if len(rows) > 1:
+        headers = list(rows[1])  # Row 2
+    elif rows:
+        headers = list(rows[0])  # Row 1 if small file
+    return _clean_headers(headers)
+
+
+def iter_sheet_rows(path):
+    """Yield (row number, values) for every data row, streaming from disk."""
+    wb, ws = _open_sheet(path)
+    try:
+        yield from enumerate(ws.iter_rows(min_row=DATA_START_ROW, values_only=True), start=DATA_START_ROW)
+    finally:
+        wb.close()
+
+
+def iter_csv_rows(path):
+    """Yield (row number, values) for every row after the CSV's header."""
+    f, reader = _open_csv(path)
+    with f:
+        header_row, _, pending = _csv_header(reader)
+        yield from enumerate(chain(pending, reader), start=header_row + 1)
+
+
+def iter_rows(path):
+    """Data rows of an uploaded CSV/TSV or workbook."""
+    return iter_csv_rows(path) if is_csv(path) else iter_sheet_rows(path)
+
+
+def _cell(row, index):
+    if index is None or index >= len(row):
+        return None
+    return row[index]
+
+
+def _parse_date(raw_date, default):
+    if isinstance(raw_date, datetime):
+        return raw_date.strftime("%Y-%m-%d")
+    if isinstance(raw_date, str):
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.strptime(raw_date.strip(), fmt).strftime("%Y-%m-%d")
+            except ValueError:
+                continue
+    return default
+
+
+def _number(raw):
+    """float of a cell; text cells (CSV) may carry thousands separators or a rupee sign."""
+    if isinstance(raw, str):
+        raw = raw.replace(",", "").replace("\u20b9", "").strip()
+    return float(raw) if raw else 0
+
+
+def _receipt_no(raw_no):
+    if not raw_no:
+        return None
+    # integer cleaning
+    digits = re.findall(r'\d+', str(raw_no))
+    return "".join(digits) if digits else str(raw_no).strip()
+
+
+def parse_rows(rows, mapping, summary, amount_words, resume_after=0):
+    """
+    Turn (row number, values) pairs into receipt dicts, carrying the grouped
+    plot context forward. Rows without an amount are counted but yield
+    nothing; problems are appended to summary['errors']. Rows up to
+    `resume_after` (an earlier run's checkpoint) only rebuild the context.
+    """
+    now = datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    stamp = int(now.timestamp())
+    plot_no = customer_name = sq_yards = basic_price = None
+
+    for i, row in rows:
+        if i > resume_after:
+            summary['total_rows'] += 1
+        if not row:
+            continue
+
+        # 1. Plot No (starts a new plot context)
+        raw_plot = _cell(row, mapping["plot_no"])
+        if raw_plot not in [None, 0, '0', 0.0, '']:
+            plot_no = clean_plot_no(raw_plot)
+            customer_name = sq_yards = basic_price = None
+            raw_customer = _cell(row, mapping["customer"])
+            if raw_customer:
+                customer_name = str(raw_customer).strip()
+            raw_sq_yards = _cell(row, mapping["sq_yards"])
+            if raw_sq_yards:
+                sq_yards = str(raw_sq_yards).strip()
+            raw_price = _cell(row, mapping["basic_price"])
+            if raw_price:
+                try:
+                    basic_price = _number(raw_price)
+                except (ValueError, TypeError):
+                    pass
+        if i <= resume_after:
+            continue
+
+        # 2. Amount
+        try:
+            raw_amount = _cell(row, mapping["amount"])
+            amount = _number(raw_amount)
+        except (ValueError, TypeError):
+            amount = 0
+        if amount <= 0:
+            continue
+        if not plot_no:
+            summary['errors'].append(f"Row {i}: Found amount {amount} but no Plot No context.")
+            continue
+
+        payment_mode = _cell(row, mapping["payment_mode"])
+        yield {
+            "row": i,
+            "date": _parse_date(_cell(row, mapping["date"]), today),
+            "plot_no": plot_no,
+            "customer_name": customer_name or "Unknown",
+            "amount": amount,
+            "amount_words": amount_words(amount),
+            "payment_mode": str(payment_mode).strip() if payment_mode else "Unknown",
+            "no": _receipt_no(_cell(row, mapping["receipt_no"])) or f"IMP-{plot_no}-{stamp}-{i}",
+            "project_name": IMPORT_PROJECT,
+            "sq_yards": sq_yards,
+            "basic_price": basic_price,
+        }
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _params(receipt):
+    return (receipt["date"], receipt["plot_no"], receipt["customer_name"], receipt["amount"],
+            receipt["amount_words"], receipt["payment_mode"], receipt["no"], receipt["project_name"],
+            receipt["sq_yards"], receipt["basic_price"], receipt["project_name"])
+
+
+def existing_numbers(cursor):
+    """
+    Every receipt and instrument number already used by the tenant, lowercased
+    (compared the way the column collation does). Streamed in FETCH_SIZE rows.
+    """
+    cursor.execute(
+        "SELECT no FROM receipts WHERE no IS NOT NULL AND no != '' "
+        "UNION SELECT instrument_no FROM receipts WHERE instrument_no IS NOT NULL AND instrument_no != ''"
+    )
+    numbers = set()
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            return numbers
+        numbers.update(str(row[0]).lower() for row in rows)
+
+
+def write_batch(cursor, batch, existing, summary):
+    """
+    Insert the receipts of `batch` whose number is not in `existing` (numbers
+    in the DB or earlier in this file), adding the inserted numbers to it.
+    Returns the inserted receipts.
+    """
+    fresh = []
+    for receipt in batch:
+        key = receipt["no"].lower()
+        if key in existing:
+            summary['skipped'] += 1
+            continue
+        existing.add(key)
+        fresh.append(receipt)
+    if not fresh:
+        return []
+
+    project_ids.ensure(cursor, *(r["project_name"] for r in fresh))
+    try:
+        cursor.executemany(INSERT_SQL, [_params(r) for r in fresh])
+        summary['imported'] += len(fresh)
+        return fresh
+    except Exception:
+        # Fall back to row by row so one bad row does not lose the batch
+        inserted = []
+        for receipt in fresh:
+            try:
+                cursor.execute(INSERT_SQL, _params(receipt))
+                inserted.append(receipt)
+            except Exception as e:
+                summary['errors'].append(f"Row {receipt['row']}: DB Error - {str(e)}")
+        summary['imported'] += len(inserted)
+        return inserted
+
+
+def _log_inserted(cursor, inserted, changed_by):
+    # Receipt numbers are unique against the tenant (see write_batch), so they identify the new rows
+    by_project = {}
+    for receipt in inserted:
+        by_project.setdefault(receipt["project_name"], []).append(receipt["no"])
+    for project, numbers in by_project.items():
+        change_log.record_receipts(
+            cursor, change_log.INSERT,
+            f"{project_ids.filter_sql('r')} AND r.no IN ({','.join(['%s'] * len(numbers))})",
+            (project, *numbers), changed_by)
+
+
+def import_rows(conn, rows, mapping, summary, amount_words, resume_after=0, checkpoint=None, changed_by=None):
+    """
+    Run the pipeline over `rows`, committing after every batch (with its
+    plot status log and change log entries and receipts version bump, so
+    each commit is complete on its own). `checkpoint(cursor, last_row)`, if
+    given, runs in each batch's transaction with the last sheet row the
+    batch covers. Returns the set of (project, plot_no) imported.
+    """
+    c = conn.cursor()
+    imported_plots = set()
+    existing = existing_numbers(c)
+    try:
+        for batch in batched(parse_rows(rows, mapping, summary, amount_words, resume_after), BATCH_SIZE):
+            inserted = write_batch(c, batch, existing, summary)
+            plots = {(r["project_name"], r["plot_no"]) for r in inserted}
+            if plots:
+                _log_inserted(c, inserted, changed_by)
+                plot_master.record(c, [(r["project_name"], r["plot_no"], r["basic_price"], r["sq_yards"],
+                                        r["customer_name"]) for r in inserted])
+                plot_status_log.record(c, plots)
+                data_versions.bump(c, data_versions.RECEIPTS)
+            if checkpoint:
+                checkpoint(c, batch[-1]["row"])
+            if plots or checkpoint:
+                conn.commit()
+            imported_plots |= plots
+    except Exception:
+        conn.rollback()
+        raise
+    return imported_plots
+
+
+def benchmark(rows=20000):
+    """Parse the same generated bookings as .xlsx and .csv; print rows/s of each reader."""
+    tmp = tempfile.mkdtemp()
+    header = ["Plot", "Date", "Amount", "Customer", "Mode", "Receipt", "Sq Yds", "Price"]
+    data = []
+    for i in range(rows):
+        plot = [i // 4 + 1, "", "", f"Customer {i // 4}", "", "", 200, 5500] if i % 4 == 0 else [""] * 8
+        plot[1:3] = [f"{i % 28 + 1:02d}.01.2024", 10000 + i]
+        plot[4:6] = ["Cash", f"R-{i}"]
+        data.append(plot)
+    mapping = dict(zip(REQUIRED_COLUMNS + OPTIONAL_COLUMNS, (0, 1, 2, 3, 4, 5, 6, 7)))
+
+    xlsx_path = os.path.join(tmp, "bench.xlsx")
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(["Bookings"])
+    ws.append(header)
+    for row in data:
+        ws.append([v if v != "" else None for v in row])
+    wb.save(xlsx_path)
+    csv_path = os.path.join(tmp, "bench.csv")
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(data)
+
+    try:
+        for label, path in (("xlsx", xlsx_path), ("csv", csv_path)):
+            summary = new_summary()
+            start = time.perf_counter()
+            receipts = sum(1 for _ in parse_rows(iter_rows(path), mapping, summary, str))
+            elapsed = time.perf_counter() - start
+            print(f"{label:>5}: {summary['total_rows']} rows, {receipts} receipts in {elapsed:.2f}s "
+                  f"({summary['total_rows'] / elapsed:,.0f} rows/s)")
+    finally:
+        for name in os.listdir(tmp):
+            os.remove(os.path.join(tmp, name))
+        os.rmdir(tmp)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["--benchmark"]:
+        print(__doc__)
+        sys.exit(1)
+    benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 20000)
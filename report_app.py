@@ -1,4 +1,5 @@
 import database
+import project_ids
 from flask import Flask, render_template, request, redirect, url_for, send_file, abort
 from datetime import datetime
 import io
@@ -112,13 +113,14 @@ def create():
 
     conn = database.get_db_connection()
     c = conn.cursor()
-    c.execute('''
+    project_ids.ensure(c, project_name)
+    c.execute(f'''
         INSERT INTO receipts
         (no, project_name, date, venture, customer_name, amount_numeric, amount_words,
-         plot_no, square_yards, purpose, drawn_bank, branch, payment_mode, created_at)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+         plot_no, square_yards, purpose, drawn_bank, branch, payment_mode, created_at, project_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, {project_ids.ID_SQL})
     ''', (no, project_name, date, venture, customer_name, amount_numeric, amount_words,
-          plot_no, square_yards, purpose, drawn_bank, branch, payment_mode, created_at))
+          plot_no, square_yards, purpose, drawn_bank, branch, payment_mode, created_at, project_name))
     conn.commit()
     rid = c.lastrowid
     conn.close()
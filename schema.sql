@@ -189,10 +189,34 @@ CREATE TABLE `commissions` (
   `agent_at_agreement` double DEFAULT '0',
   `agent_at_registration` double DEFAULT '0',
   `broker_commission` double DEFAULT '0',
-  PRIMARY KEY (`id`)
+  `plot_key` varchar(255) GENERATED ALWAYS AS (if((trim(`plot_no`) like _utf8mb4'%.0'),lower(left(trim(`plot_no`),(char_length(trim(`plot_no`)) - 2))),lower(trim(`plot_no`)))) STORED,
+  `plot_num` int unsigned GENERATED ALWAYS AS (cast(regexp_substr(`plot_no`,_utf8mb4'[0-9]+') as unsigned)) STORED,
+  `project_id` int DEFAULT NULL,
+  PRIMARY KEY (`id`),
+  KEY `idx_commissions_project_plot_id` (`project_name`,`plot_no`,`id`),
+  KEY `idx_commissions_project_plot_key` (`project_name`,`plot_key`,`plot_num`),
+  KEY `idx_commissions_plot_key` (`plot_key`),
+  KEY `idx_commissions_project_id` (`project_id`,`plot_no`),
+  KEY `idx_commissions_project_id_plot_key` (`project_id`,`plot_key`,`plot_num`),
+  CONSTRAINT `fk_commissions_project` FOREIGN KEY (`project_id`) REFERENCES `projects` (`id`) ON DELETE SET NULL
 ) ENGINE=InnoDB AUTO_INCREMENT=36 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
+--
+-- Table structure for table `data_versions`
+--
+
+DROP TABLE IF EXISTS `data_versions`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!50503 SET character_set_client = utf8mb4 */;
+CREATE TABLE `data_versions` (
+  `table_name` varchar(64) NOT NULL,
+  `version` bigint unsigned NOT NULL DEFAULT '0',
+  `updated_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`table_name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
 --
 -- Table structure for table `pending_receipts`
 --
@@ -250,8 +274,10 @@ CREATE TABLE `plot_layouts` (
   `boundary_west` text,
   `boundary_north` text,
   `boundary_south` text,
+  `project_id` int DEFAULT NULL,
   PRIMARY KEY (`id`),
-  UNIQUE KEY `unique_plot` (`project_name`,`plot_no`)
+  UNIQUE KEY `unique_project_plot` (`project_id`,`plot_no`),
+  CONSTRAINT `fk_plot_layouts_project` FOREIGN KEY (`project_id`) REFERENCES `projects` (`id`) ON DELETE SET NULL
 ) ENGINE=InnoDB AUTO_INCREMENT=50 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
@@ -301,7 +327,18 @@ CREATE TABLE `receipts` (
   `aadhar_no` varchar(255) DEFAULT NULL,
   `instrument_no` varchar(255) DEFAULT NULL,
   `basic_price` varchar(255) DEFAULT NULL,
-  PRIMARY KEY (`id`)
+  `plot_key` varchar(255) GENERATED ALWAYS AS (if((trim(`plot_no`) like _utf8mb4'%.0'),lower(left(trim(`plot_no`),(char_length(trim(`plot_no`)) - 2))),lower(trim(`plot_no`)))) STORED,
+  `plot_num` int unsigned GENERATED ALWAYS AS (cast(regexp_substr(`plot_no`,_utf8mb4'[0-9]+') as unsigned)) STORED,
+  `project_id` int DEFAULT NULL,
+  PRIMARY KEY (`id`),
+  KEY `idx_receipts_project_plot` (`project_name`,`plot_no`),
+  KEY `idx_receipts_no` (`no`),
+  KEY `idx_receipts_instrument_no` (`instrument_no`),
+  KEY `idx_receipts_project_plot_key` (`project_name`,`plot_key`,`plot_num`),
+  KEY `idx_receipts_plot_key` (`plot_key`),
+  KEY `idx_receipts_project_id` (`project_id`,`plot_no`),
+  KEY `idx_receipts_project_id_plot_key` (`project_id`,`plot_key`,`plot_num`),
+  CONSTRAINT `fk_receipts_project` FOREIGN KEY (`project_id`) REFERENCES `projects` (`id`) ON DELETE SET NULL
 ) ENGINE=InnoDB AUTO_INCREMENT=184 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
@@ -199,6 +199,10 @@ def seed_data():
                       (commission_id, srgm_name, srgm_total))
 
         print(f"✅ Generated Commissions for {len(receipts_fetched)} plots")
+
+        # Give the seeded rows their project ids
+        for table in ("receipts", "commissions"):
+            c.execute(f"UPDATE {table} t JOIN projects p ON p.name = t.project_name SET t.project_id = p.id")
         
         conn.commit()
         conn.close()
@@ -1,7 +1,4 @@
 #!/bin/bash
-# Stop existing process
-pkill -9 -f gunicorn
-
 # Go to folder
 cd /var/www/plotpro || exit
 
@@ -11,9 +8,21 @@ source venv/bin/activate
 # Install requirements just in case
 pip install -r requirements.txt
 
+# Apply pending schema migrations to the default DB and every tenant.
+# The new code needs them, so keep the running server if any DB failed.
+echo "Applying database migrations..."
+if ! python migrate_tenants.py
+then
+    echo "❌ Migrations failed; the running server was left untouched."
+    exit 1
+fi
+
+# Stop existing process
+pkill -9 -f gunicorn
+
 # Start Gunicorn in Background
 echo "Starting Gunicorn..."
-gunicorn --workers 3 --bind 127.0.0.1:8000 receipt_app:app --daemon --access-logfile server.log --error-logfile server.log --capture-output
+gunicorn --workers 3 --worker-class gthread --threads 16 --bind 127.0.0.1:8000 receipt_app:app --daemon --access-logfile server.log --error-logfile server.log --capture-output
 
 # Check if it is running
 sleep 2
@@ -23,5 +32,5 @@ then
 else
     echo "❌ Failed to start. Showing logs:"
     # Try running in foreground to show error
-    gunicorn --workers 3 --bind 127.0.0.1:8000 receipt_app:app
+    gunicorn --workers 3 --worker-class gthread --threads 16 --bind 127.0.0.1:8000 receipt_app:app
 fi
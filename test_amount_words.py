@@ -0,0 +1,50 @@
+import random
+import unittest
+
+import amount_words
+from receipt_app import number_to_words
+
+try:
+    from num2words import num2words
+except ImportError:
+    num2words = None
+
+
+def _reference(n):
+    """What number_to_words returned when it called num2words directly."""
+    out = num2words(int(float(n)), lang="en_IN")
+    return out.replace("  ", " ").strip().title() + " Only"
+
+
+class AmountWordsTestCase(unittest.TestCase):
+    def test_known_amounts(self):
+        self.assertEqual(amount_words.rupees_in_words(0), "Zero Only")
+        self.assertEqual(amount_words.rupees_in_words(100001), "One Lakh And One Only")
+        self.assertEqual(amount_words.rupees_in_words(1234567),
+                         "Twelve Lakh, Thirty-Four Thousand, Five Hundred And Sixty-Seven Only")
+        self.assertEqual(amount_words.rupees_in_words(-21), "Minus Twenty-One Only")
+
+    def test_overflow_falls_back_to_figure(self):
+        with self.assertRaises(OverflowError):
+            amount_words.rupees_in_words(amount_words.MAX_AMOUNT)
+        self.assertEqual(number_to_words(12345678901), "12,34,56,78,901 Only")
+        self.assertEqual(number_to_words("n/a"), "n/a Only")
+
+    @unittest.skipIf(num2words is None, "num2words not installed")
+    def test_matches_num2words(self):
+        rng = random.Random(20240601)
+        amounts = list(range(0, 2500)) + [10 ** k for k in range(10)] + [10 ** k - 1 for k in range(1, 11)]
+        for digits in range(1, 11):
+            amounts += [rng.randrange(10 ** (digits - 1), 10 ** digits) for _ in range(300)]
+        amounts += [-a for a in rng.sample(amounts, 200)]
+        for amount in amounts:
+            self.assertEqual(amount_words.rupees_in_words(amount), _reference(amount), amount)
+
+    @unittest.skipIf(num2words is None, "num2words not installed")
+    def test_number_to_words_accepts_form_values(self):
+        for value in ("25000", "25000.75", 1500.5, "0", 99999.99):
+            self.assertEqual(number_to_words(value), _reference(value))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import change_log
+from receipt_app import app
+
+FEED_COLUMNS = ("seq", "entity", "entity_id", "op", "changed_by", "changed_at", "data", "age")
+
+
+def _feed_cursor(rows):
+    cursor = MagicMock()
+    cursor.description = [(name,) for name in FEED_COLUMNS]
+    cursor.fetchall.return_value = rows
+    return cursor
+
+
+def _row(seq, age=300, op="insert"):
+    return (seq, "receipt", seq * 10, op, "admin", datetime(2024, 1, 5, 10, 30), '{"no": "%d"}' % seq, age)
+
+
+class RecordTestCase(unittest.TestCase):
+    def test_receipt_snapshot_leaves_out_pii(self):
+        cursor = MagicMock()
+        change_log.record_receipts(cursor, change_log.DELETE, "r.id IN (%s, %s)", (4, 5), "admin")
+        sql, params = cursor.execute.call_args[0]
+        self.assertTrue(sql.startswith("INSERT INTO change_log"))
+        self.assertIn("FROM receipts r WHERE r.id IN (%s, %s)", sql)
+        self.assertNotIn("pan_no", sql)
+        self.assertNotIn("aadhar_no", sql)
+        self.assertEqual(params, ("receipt", "delete", "admin", 4, 5))
+
+    def test_commission_snapshot_has_role_entries(self):
+        cursor = MagicMock()
+        change_log.record_commissions(cursor, change_log.UPDATE, "c.id = %s", (9,))
+        sql = cursor.execute.call_args[0][0]
+        for table in ("srgm", "gm", "dgm", "agm"):
+            self.assertIn(f"FROM commission_{table}_entries e WHERE e.commission_id = c.id", sql)
+
+    def test_creates_table_on_first_use(self):
+        cursor = MagicMock()
+        missing = change_log.database.Error(errno=1146)
+        cursor.execute.side_effect = [missing, None, None]
+        change_log.record_receipts(cursor, change_log.INSERT, "r.id = %s", (1,))
+        self.assertEqual(cursor.execute.call_args_list[1][0][0], change_log.CREATE_SQL)
+        self.assertEqual(cursor.execute.call_count, 3)
+
+
+class FeedTestCase(unittest.TestCase):
+    def test_cursor_round_trip(self):
+        self.assertEqual(change_log.decode_cursor(change_log.encode_cursor(812)), 812)
+        self.assertEqual(change_log.decode_cursor(""), 0)
+        for bad in ("812", "v1.x", "v1.-3", "v2.5"):
+            with self.assertRaises(ValueError):
+                change_log.decode_cursor(bad)
+
+    def test_page_and_has_more(self):
+        cursor = _feed_cursor([_row(11), _row(12), _row(13)])
+        page = change_log.changes_since(cursor, 10, limit=2)
+        self.assertEqual([c["seq"] for c in page["changes"]], [11, 12])
+        self.assertEqual(page["next_cursor"], "v1.12")
+        self.assertTrue(page["has_more"])
+        self.assertEqual(page["changes"][0]["data"], {"no": "11"})
+        self.assertEqual(page["changes"][0]["changed_at"], "2024-01-05T10:30:00")
+        self.assertEqual(cursor.execute.call_args[0][1], (10, 3))
+
+    def test_stops_at_young_gap(self):
+        # 12 may still be in an uncommitted transaction; an old gap (rolled back) is skipped
+        cursor = _feed_cursor([_row(11), _row(13, age=2), _row(14, age=1)])
+        page = change_log.changes_since(cursor, 10)
+        self.assertEqual([c["seq"] for c in page["changes"]], [11])
+        self.assertEqual(page["next_cursor"], "v1.11")
+        self.assertFalse(page["has_more"])
+
+        page = change_log.changes_since(_feed_cursor([_row(13), _row(14)]), 11)
+        self.assertEqual(page["next_cursor"], "v1.14")
+
+
+class HighWaterTestCase(unittest.TestCase):
+    def test_stops_below_young_gap(self):
+        cursor = MagicMock()
+        cursor.fetchone.return_value = (10,)
+        cursor.fetchall.return_value = [(11,), (13,)]
+        self.assertEqual(change_log.high_water(cursor), 11)
+
+
+class ChangesRouteTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+
+    @patch('receipt_app.change_log.changes_since')
+    @patch('receipt_app.database.get_db_connection')
+    def test_pages_from_cursor(self, mock_conn, mock_changes):
+        mock_changes.return_value = {"changes": [], "next_cursor": "v1.40", "has_more": False}
+        data = self.client.get('/api/changes?cursor=v1.40&limit=100000').get_json()
+        self.assertEqual(data["next_cursor"], "v1.40")
+        mock_changes.assert_called_once_with(mock_conn.return_value.cursor.return_value, 40,
+                                             change_log.MAX_PAGE_SIZE)
+        mock_conn.return_value.close.assert_called_once()
+
+    def test_rejects_bad_cursor_and_non_admin(self):
+        self.assertEqual(self.client.get('/api/changes?cursor=abc').status_code, 400)
+        with self.client.session_transaction() as sess:
+            sess['role'] = 'user'
+        self.assertEqual(self.client.get('/api/changes').status_code, 403)
+
+    @patch('receipt_app.change_log.record_receipts')
+    @patch('receipt_app.plot_status_log.record')
+    @patch('receipt_app.database.get_db_connection')
+    def test_delete_receipt_logs_before_deleting(self, mock_conn, mock_record, mock_log):
+        cursor = mock_conn.return_value.cursor.return_value
+        cursor.fetchall.return_value = []
+        mock_log.side_effect = lambda *a, **k: self.assertFalse(
+            any("DELETE" in c[0][0] for c in cursor.execute.call_args_list))
+        self.assertEqual(self.client.post('/receipt/5/delete').status_code, 200)
+        mock_log.assert_called_once_with(cursor, change_log.DELETE, "r.id = %s", (5,), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
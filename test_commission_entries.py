@@ -0,0 +1,63 @@
+import unittest
+from unittest.mock import MagicMock
+
+import commission_entries
+from commission_rules import DEFAULT_EVALUATOR
+
+INPUTS = {"sq_yards": 200.0, "agreement_percentage": 0.3}
+
+
+def entry(name, rate):
+    return (name, *DEFAULT_EVALUATOR.entry("gm", rate, **INPUTS))
+
+
+class DiffTestCase(unittest.TestCase):
+    def test_unchanged_entries_write_nothing(self):
+        stored = [(1, "Ravi", 20000.0, 6000.0, 14000.0), (2, "Sita", 10000.0, 3000.0, 7000.0)]
+        self.assertEqual(commission_entries.diff(stored, [entry("Sita", 50), entry("Ravi", 100)]), ([], [], []))
+
+    def test_changed_renamed_added_and_removed(self):
+        stored = [(1, "Ravi", 20000.0, 6000.0, 14000.0), (2, "Sita", 10000.0, 3000.0, 7000.0),
+                  (3, "Old", 10000.0, None, None)]
+        submitted = [entry("Ravi", 120), entry("New", 50), entry("Other", 10)]
+        inserts, updates, deletes = commission_entries.diff(stored, submitted)
+        # Ravi's amounts changed; "New" reuses Sita's row, "Other" reuses Old's
+        self.assertEqual(updates, [(submitted[0], 1), (submitted[1], 2), (submitted[2], 3)])
+        self.assertEqual((inserts, deletes), ([], []))
+
+        inserts, updates, deletes = commission_entries.diff(stored, [entry("Ravi", 100)])
+        self.assertEqual((inserts, updates, deletes), ([], [], [2, 3]))
+        inserts, updates, deletes = commission_entries.diff([], [entry("Ravi", 100)])
+        self.assertEqual(inserts, [entry("Ravi", 100)])
+
+
+class WriteEntriesTestCase(unittest.TestCase):
+    FORM = {"srgm_entries": [("Ravi", 100.0), ("", 50.0)], "gm_entries": [{"name": " Sita ", "rate": 50}],
+            "dgm_entries": [("Kiran", 20.0)], "agm_entries": [("Anil", 0)]}
+
+    def test_new_commission_inserts_all_roles(self):
+        cursor = MagicMock()
+        written = commission_entries.write_entries(cursor, 7, self.FORM, DEFAULT_EVALUATOR, INPUTS, new=True)
+        cursor.execute.assert_not_called()
+        self.assertEqual(written, {"commission_srgm_entries": 1, "commission_gm_entries": 1,
+                                   "commission_dgm_entries": 1})
+        sql, rows = cursor.executemany.call_args_list[1][0]
+        self.assertIn("INSERT INTO commission_gm_entries", sql)
+        self.assertEqual(rows, [(7, "Sita", 10000.0, 3000.0, 7000.0)])
+
+    def test_update_reads_once_and_writes_only_the_diff(self):
+        cursor = MagicMock()
+        cursor.fetchall.return_value = [("srgm", 1, "Ravi", 20000.0, 6000.0, 14000.0),
+                                        ("gm", 2, "Sita", 10000.0, 3000.0, 7000.0),
+                                        ("agm", 3, "Anil", 500.0, 150.0, 350.0)]
+        written = commission_entries.write_entries(cursor, 7, self.FORM, DEFAULT_EVALUATOR, INPUTS)
+        self.assertEqual(written, {"commission_dgm_entries": 1, "commission_agm_entries": 1})
+        (select_sql, params), (delete_sql, deleted) = [c.args for c in cursor.execute.call_args_list]
+        self.assertEqual(select_sql.count("UNION ALL"), 3)
+        self.assertEqual(params, (7,) * 4)
+        self.assertEqual((delete_sql, deleted), ("DELETE FROM commission_agm_entries WHERE id IN (%s)", (3,)))
+        self.assertEqual(cursor.executemany.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import importlib.util
+import unittest
+from unittest.mock import MagicMock, patch
+
+import commission_recompute
+from receipt_app import app, calculate_commission
+
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+FORM = {"sq_yards": 200.0, "negotiated_price": 6000.0, "amc_charges": 100.0, "advance_received": 50000.0,
+        "agreement_percentage": 0.3, "amount_paid_at_agreement": 100000.0, "cgm_rate": 500.0,
+        "srgm_rate": 300.0, "gm_rate": 200.0, "dgm_rate": 100.0, "agm_rate": 0.0, "original_price": 6500.0}
+
+
+def _commission_row(commission_id, plot_no, form, derived):
+    return ((commission_id, plot_no) + tuple(form[col] for col in commission_recompute.INPUT_COLUMNS)
+            + tuple(derived[col] for col in commission_recompute.DERIVED_COLUMNS))
+
+
+@unittest.skipUnless(HAS_NUMPY, "numpy not installed")
+class RecomputeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.expected = calculate_commission(FORM)
+        stale = dict(self.expected, w_value=0.0, b_value=None)
+        self.commissions = [_commission_row(1, "12", FORM, self.expected),
+                            _commission_row(2, "14", FORM, stale)]
+        # Entry 7 is current, entry 8 still has the split of a 50% agreement
+        self.entries = [(7, 1, 60000.0, 18000.0, 42000.0, 0.3), (8, 2, 60000.0, 30000.0, 30000.0, 0.3)]
+        self.conn = MagicMock()
+        self.cursor = self.conn.cursor.return_value
+        self.cursor.fetchall.side_effect = [self.commissions, self.entries, [], [], []]
+        rules = patch("commission_recompute.commission_rules.evaluator_for",
+                      return_value=commission_recompute.commission_rules.DEFAULT_EVALUATOR)
+        rules.start()
+        self.addCleanup(rules.stop)
+
+    def test_matches_calculate_commission(self):
+        import numpy as np
+        inputs = {col: np.array([FORM[col]]) for col in commission_recompute.INPUT_COLUMNS}
+        computed = commission_recompute.compute(inputs)
+        for col in commission_recompute.DERIVED_COLUMNS:
+            self.assertAlmostEqual(computed[col][0], self.expected[col], msg=col)
+
+    def test_dry_run_reports_without_writing(self):
+        report = commission_recompute.recompute(self.conn, "Vishvam")
+        self.assertEqual((report["commissions"], report["changed"]), (2, 1))
+        self.assertEqual(report["fields"], {"w_value": 1, "b_value": 1})
+        self.assertEqual(report["entries_changed"], {"commission_srgm_entries": 1})
+        self.assertEqual(report["rows"][0]["changes"]["w_value"], [0.0, 1100000.0])
+        self.assertEqual(report["rows"][0]["changes"]["b_value"][0], None)
+        self.cursor.executemany.assert_not_called()
+        self.conn.commit.assert_not_called()
+
+    @patch("commission_recompute.data_versions.bump")
+    @patch("commission_recompute.change_log.record_commissions")
+    def test_apply_writes_only_changed_rows(self, mock_log, mock_bump):
+        commission_recompute.recompute(self.conn, "Vishvam", dry_run=False)
+        (sql, rows), (entry_sql, entry_rows) = [c.args for c in self.cursor.executemany.call_args_list]
+        self.assertTrue(sql.startswith("UPDATE commissions SET total_amount = %s"))
+        self.assertEqual([row[-1] for row in rows], [2])
+        self.assertEqual(entry_rows, [(18000.0, 42000.0, 8)])
+        self.assertEqual(mock_log.call_args[0][3], (2,))
+        self.conn.commit.assert_called_once()
+
+
+class RecomputeRouteTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+            sess['username'] = 'admin'
+
+    @patch('receipt_app.commission_recompute.recompute', return_value={"changed": 0, "entries_changed": {}})
+    @patch('receipt_app.database.get_db_connection')
+    def test_dry_run_by_default(self, mock_conn, mock_recompute):
+        rules = {"w_rate": 6000}
+        self.client.post('/api/commissions/recompute/Vishvam', json={"rules": rules})
+        mock_recompute.assert_called_once_with(mock_conn.return_value, "Vishvam", rules, dry_run=True,
+                                               changed_by="admin")
+        self.client.post('/api/commissions/recompute/Vishvam', data={"apply": "1"})
+        self.assertFalse(mock_recompute.call_args.kwargs["dry_run"])
+
+    @patch('receipt_app.database.get_db_connection')
+    def test_candidate_rules_cannot_be_applied(self, mock_conn):
+        response = self.client.post('/api/commissions/recompute/Vishvam', json={"rules": {"w_rate": 1}, "apply": True})
+        self.assertEqual(response.status_code, 400)
+
+    def test_admin_only(self):
+        with self.client.session_transaction() as sess:
+            sess['role'] = 'user'
+        self.assertEqual(self.client.post('/api/commissions/recompute/Vishvam').status_code, 403)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import commission_rules
+from receipt_app import app, calculate_commission
+
+FORM = {"sq_yards": 200.0, "negotiated_price": 6000.0, "amc_charges": 100.0, "advance_received": 50000.0,
+        "agreement_percentage": 0.3, "amount_paid_at_agreement": 100000.0, "cgm_rate": 500.0,
+        "srgm_rate": 300.0, "gm_rate": 200.0, "dgm_rate": 100.0, "agm_rate": 0.0, "original_price": 6500.0}
+
+INPUTS = {name: FORM[name] for name in commission_rules.INPUTS}
+
+
+class EvaluatorTestCase(unittest.TestCase):
+    def test_defaults_are_the_original_formula(self):
+        result = calculate_commission(FORM)
+        self.assertEqual(result["total_amount"], 200 * 6000 + 100 * 200)
+        self.assertEqual(result["w_value"], 200 * 5500)
+        self.assertEqual(result["cgm_total"], 500 * 200)
+        self.assertAlmostEqual(result["cgm_at_agreement"], 500 * 200 * 0.3)
+        self.assertEqual(commission_rules.DEFAULT_EVALUATOR.entry("gm", 150.0, **INPUTS),
+                         (30000.0, 9000.0, 21000.0))
+
+    def test_custom_rules(self):
+        rules = commission_rules.Evaluator({
+            "w_rate": 6000, "agreement_percentage": 0.5,
+            "roles": {"gm": "min(rate * sq_yards, total_amount * 0.02)"},
+        })
+        result = calculate_commission(FORM, rules)
+        self.assertEqual(result["w_value"], 200 * 6000)
+        self.assertEqual(result["gm_total"], min(200 * 200, 1220000 * 0.02))
+        self.assertEqual(result["gm_at_agreement"], result["gm_total"] * 0.5)
+        self.assertEqual(rules.entry("gm", 10.0, **INPUTS), (2000.0, 1000.0, 1000.0))
+        self.assertEqual(rules.javascript()["roles"]["gm"], "(Math.min(rate * sq_yards, total_amount * 0.02))")
+
+    def test_rejects_anything_but_arithmetic(self):
+        for rules in ({"total_amount": "__import__('os').system('true')"},
+                      {"total_amount": "sq_yards.__class__"},
+                      {"total_amount": "sq_yards ** 2"},
+                      {"total_amount": "rate * sq_yards"},
+                      {"roles": {"cgm": "bonus * sq_yards"}},
+                      {"roles": {"ceo": "rate"}},
+                      {"w_rate": "5500"},
+                      {"agreement_percentage": 30},
+                      {"discount": 1},
+                      "not json"):
+            with self.assertRaises(commission_rules.RuleError, msg=rules):
+                commission_rules.Evaluator(rules)
+
+    def test_evaluation_errors_are_rule_errors(self):
+        rules = commission_rules.Evaluator({"roles": {"gm": "rate * sq_yards / amc_charges"},
+                                            "total_amount": "sq_yards / 0"})
+        with self.assertRaises(commission_rules.RuleError):
+            rules.check()
+        with self.assertRaises(commission_rules.RuleError):
+            rules.entry("gm", 1.0, **dict(INPUTS, amc_charges=0))
+        commission_rules.Evaluator({"roles": {"gm": "rate * sq_yards / amc_charges"}}).check()
+
+
+@patch('commission_rules.database.get_tenant_key', return_value="tenant_a")
+@patch('commission_rules.data_versions.get_versions')
+class EvaluatorCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        commission_rules._cache.clear()
+        self.conn = MagicMock()
+        self.cursor = self.conn.cursor.return_value
+        self.cursor.fetchone.return_value = ('{"w_rate": 6000}',)
+
+    def test_compiled_once_per_version(self, mock_versions, mock_tenant):
+        mock_versions.return_value = {commission_rules.data_versions.COMMISSION_RULES: 3}
+        first = commission_rules.evaluator_for("Vishvam", self.conn)
+        self.assertIs(commission_rules.evaluator_for("Vishvam", self.conn), first)
+        self.assertEqual(first.w_rate, 6000.0)
+        self.assertEqual(self.cursor.execute.call_count, 1)
+
+        mock_versions.return_value = {commission_rules.data_versions.COMMISSION_RULES: 4}
+        self.assertIsNot(commission_rules.evaluator_for("Vishvam", self.conn), first)
+
+    def test_invalid_stored_rules_use_defaults(self, mock_versions, mock_tenant):
+        mock_versions.return_value = {commission_rules.data_versions.COMMISSION_RULES: 1}
+        self.cursor.fetchone.return_value = ('{"total_amount": "open(1)"}',)
+        self.assertIs(commission_rules.evaluator_for("Vishvam", self.conn), commission_rules.DEFAULT_EVALUATOR)
+
+
+class CommissionRulesRouteTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+            sess['username'] = 'admin'
+
+    @patch('receipt_app.commission_rules.invalidate')
+    @patch('receipt_app.commission_rules.data_versions.bump')
+    @patch('receipt_app.database.get_db_connection')
+    def test_put_validates_and_saves(self, mock_conn, mock_bump, mock_invalidate):
+        response = self.client.put('/api/commission-rules/Vishvam', json={"rules": {"w_rate": 6000}})
+        self.assertEqual(response.get_json()["js"]["w_rate"], 6000.0)
+        sql, params = mock_conn.return_value.cursor.return_value.execute.call_args[0]
+        self.assertIn("INSERT INTO commission_rules", sql)
+        self.assertEqual((params[0], params[2]), ("Vishvam", "admin"))
+        mock_conn.return_value.commit.assert_called_once()
+        mock_invalidate.assert_called_once_with("Vishvam")
+
+        response = self.client.put('/api/commission-rules/Vishvam', json={"rules": {"w_rate": -1}})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.put('/api/commission-rules/Vishvam', json={"rules": {"total_amount": "sq_yards / 0"}})
+        self.assertEqual(response.status_code, 400)
+
+    def test_put_admin_only(self):
+        with self.client.session_transaction() as sess:
+            sess['role'] = 'user'
+        self.assertEqual(self.client.put('/api/commission-rules/Vishvam', json={}).status_code, 403)
+
+
+if __name__ == "__main__":
+    unittest.main()
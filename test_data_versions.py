@@ -0,0 +1,27 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import data_versions
+import database
+
+
+class BumpTestCase(unittest.TestCase):
+    def test_bumps_in_callers_transaction(self):
+        cursor = MagicMock()
+        data_versions.bump(cursor, data_versions.RECEIPTS, data_versions.PROJECTS)
+        self.assertEqual([c.args[1] for c in cursor.execute.call_args_list], [("receipts",), ("projects",)])
+
+    @patch("data_versions.init_data_versions")
+    def test_missing_table_is_created_on_another_connection(self, mock_init):
+        missing = database.Error("no table")
+        missing.errno = 1146
+        cursor = MagicMock()
+        cursor.execute.side_effect = [missing, None]
+        data_versions.bump(cursor, data_versions.RECEIPTS)
+        mock_init.assert_called_once_with()
+        self.assertEqual(cursor.execute.call_count, 2)
+        self.assertNotIn("CREATE", " ".join(c.args[0] for c in cursor.execute.call_args_list))
+
+
+if __name__ == "__main__":
+    unittest.main()
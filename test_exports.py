@@ -0,0 +1,98 @@
+import io
+import unittest
+from unittest.mock import MagicMock, patch
+
+import openpyxl
+
+import exports
+from receipt_app import app
+
+
+def _cursor(rows):
+    """Cursor whose fetchmany hands out `rows` two at a time."""
+    cursor = MagicMock()
+    batches = [rows[i:i + 2] for i in range(0, len(rows), 2)] + [[]]
+    cursor.fetchmany.side_effect = batches
+    return cursor
+
+
+class DatasetsTestCase(unittest.TestCase):
+    def test_filters(self):
+        filters = exports.parse_filters({"project": " Vishvam ", "from": "2024-01-01", "to": ""})
+        self.assertEqual(filters, {"project": "Vishvam", "date_from": "2024-01-01", "date_to": None})
+        with self.assertRaises(ValueError):
+            exports.parse_filters({"to": "01/02/2024"})
+
+    def test_plot_ledger_folds_receipts_per_plot(self):
+        cursor = _cursor([
+            ("Vishvam", "12", "Ravi", "200", None, 50000.0),
+            ("Vishvam", "12", "Old name", "180", "5500", 25000.0),
+            ("Vishvam", "14", "Sita", "100", "", 10000.0),
+        ])
+        rows = list(exports.plot_ledger_rows(cursor, {"project": "Vishvam", "date_from": "2024-01-01",
+                                                      "date_to": "2024-03-31"}))
+        self.assertEqual(rows[0], exports.PLOT_LEDGER_HEADER)
+        self.assertEqual(rows[1], ("Vishvam", "12", "Ravi", 200.0, 5500.0, 1100000.0, 75000.0, 1025000.0, 2))
+        # No basic price: implied by what was paid, so nothing is outstanding
+        self.assertEqual(rows[2], ("Vishvam", "14", "Sita", 100.0, 100.0, 10000.0, 10000.0, 0.0, 1))
+        sql, params = cursor.execute.call_args[0]
+        self.assertIn("date <= %s", sql)
+        self.assertNotIn("date >= %s", sql)
+        self.assertEqual(params, ["Vishvam", "2024-03-31"])
+
+    def test_commissions_one_row_per_payee(self):
+        cursor = _cursor([(1, "Vishvam", "12", None, 200, 6000, 1200000, "CGM", 0, "Anil", 1000, 600, 400),
+                          (1, "Vishvam", "12", None, 200, 6000, 1200000, "GM", 2, "Kiran", 500, 300, 200)])
+        rows = list(exports.commissions_rows(cursor, {"project": "Vishvam", "date_from": None, "date_to": None}))
+        self.assertEqual(len(rows[1]), len(exports.COMMISSION_HEADER))
+        self.assertEqual(rows[2][7:9], ("GM", "Kiran"))
+        sql, params = cursor.execute.call_args[0]
+        self.assertEqual(sql.count("UNION ALL"), 4)
+        self.assertEqual(params, ["Vishvam"] * 5)
+
+    def test_csv_chunks(self):
+        rows = [("a", "b")] + [(i, "x,y") for i in range(5)]
+        chunks = list(exports.csv_chunks(iter(rows), chunk_rows=2))
+        self.assertEqual(len(chunks), 3)
+        text = b"".join(chunks).decode("utf-8")
+        self.assertTrue(text.startswith("\ufeffa,b\r\n0,\"x,y\"\r\n"))
+
+
+class ExportRouteTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+
+    @patch('receipt_app.database.get_db_connection')
+    def test_csv_streams_and_closes(self, mock_conn):
+        conn = mock_conn.return_value
+        conn.cursor.return_value = _cursor([(1, "101", "2024-01-05", "Vishvam", "12", "Ravi", 50000.0,
+                                             "Cash", None, None, None, "200", "5500", None, None)])
+        response = self.client.get('/export/receipts?format=csv&project=Vishvam')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('receipts_Vishvam.csv', response.headers['Content-Disposition'])
+        body = response.get_data(as_text=True)
+        self.assertIn("Receipt No", body)
+        self.assertIn("101,2024-01-05,Vishvam,12,Ravi,50000.0", body)
+        conn.close.assert_called_once()
+
+    @patch('receipt_app.database.get_db_connection')
+    def test_xlsx(self, mock_conn):
+        mock_conn.return_value.cursor.return_value = _cursor([("Vishvam", "12", "Ravi", "200", "5500", 1000.0)])
+        response = self.client.get('/export/plot_ledger?format=xlsx&to=2024-12-31')
+        self.assertEqual(response.status_code, 200)
+        ws = openpyxl.load_workbook(io.BytesIO(response.data)).active
+        self.assertEqual(ws.max_row, 2)
+        self.assertEqual(ws.cell(2, 8).value, 1099000)
+
+    def test_rejects_unknown_dataset_and_bad_dates(self):
+        self.assertEqual(self.client.get('/export/users').status_code, 404)
+        self.assertEqual(self.client.get('/export/receipts?format=pdf').status_code, 404)
+        self.assertEqual(self.client.get('/export/receipts?from=5-1-2024').status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import field_sync
+from receipt_app import app
+
+PROJECTS = ["Vishvam", "Srinidhi"]
+
+
+def words(amount):
+    return f"{amount} words"
+
+
+class SyncPayloadTestCase(unittest.TestCase):
+    @patch('field_sync.plot_status_log.high_water', return_value=42)
+    @patch('field_sync.plot_state.load_columns', side_effect=lambda cursor, name: {"plots": [name]})
+    def test_full_snapshot_without_token(self, mock_load, mock_hw):
+        cursor = MagicMock()
+        payload = field_sync.sync_payload(cursor, PROJECTS)
+        self.assertTrue(payload["full"])
+        self.assertEqual(payload["projects"], {"Srinidhi": {"plots": ["Srinidhi"]}, "Vishvam": {"plots": ["Vishvam"]}})
+        self.assertEqual(field_sync.parse_token(payload["token"])[0], 42)
+
+    @patch('field_sync.plot_status_log.high_water', return_value=50)
+    @patch('field_sync.plot_status_log.changes_since')
+    def test_delta_only_for_changed_projects(self, mock_changes, mock_hw):
+        cursor = MagicMock()
+        cursor.fetchall.return_value = [("Vishvam",), ("Not permitted",)]
+        mock_changes.return_value = [{"plot_no": "12", "sold": True, "layout": None}]
+        payload = field_sync.sync_payload(cursor, PROJECTS, field_sync.make_token(42, PROJECTS))
+        self.assertFalse(payload["full"])
+        self.assertEqual(list(payload["projects"]), ["Vishvam"])
+        mock_changes.assert_called_once_with(cursor, "Vishvam", 42, 50)
+        # Gap-safe watermark over every project, not a raw MAX(seq)
+        mock_hw.assert_called_once_with(cursor)
+
+    @patch('field_sync.plot_status_log.high_water', return_value=50)
+    @patch('field_sync.plot_state.load_columns', return_value={})
+    def test_stale_token_falls_back_to_snapshot(self, mock_load, mock_hw):
+        cursor = MagicMock()
+        for token in (field_sync.make_token(42, ["Vishvam"]),   # permissions changed
+                      field_sync.make_token(90, PROJECTS),      # log behind the device
+                      "garbage"):
+            self.assertTrue(field_sync.sync_payload(cursor, PROJECTS, token)["full"], token)
+
+
+class UploadTestCase(unittest.TestCase):
+    def test_bulk_insert_skips_seen_refs_and_invalid_rows(self):
+        cursor = MagicMock()
+        cursor.fetchall.return_value = [("dev1-2",)]
+        receipts = [
+            {"client_ref": "dev1-1", "project_name": "Vishvam", "plot_no": "12", "amount": "25,000"},
+            {"client_ref": "dev1-2", "project_name": "Vishvam", "plot_no": "13", "amount": 100},
+            {"client_ref": "dev1-3", "project_name": "Elsewhere", "plot_no": "1", "amount": 100},
+            {"client_ref": "dev1-1", "project_name": "Vishvam", "plot_no": "12", "amount": 25000},
+            {"project_name": "Vishvam", "plot_no": "14", "amount": 100},
+        ]
+        result = field_sync.upload_receipts(cursor, receipts, set(PROJECTS), "agent7", words)
+        self.assertEqual(result["accepted"], ["dev1-1"])
+        self.assertEqual(result["duplicates"], ["dev1-1", "dev1-2"])
+        self.assertEqual([e["index"] for e in result["errors"]], [2, 4])
+
+        (insert_sql, rows), (ref_sql, refs) = [c.args for c in cursor.executemany.call_args_list]
+        self.assertIn("INSERT INTO pending_receipts", insert_sql)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0][1], rows[0][5], rows[0][6], rows[0][14]),
+                         ("Vishvam", 25000.0, "25000.0 words", "agent7"))
+        self.assertEqual(refs, [("agent7", "dev1-1")])
+
+
+class SyncRoutesTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'user'
+            sess['username'] = 'agent7'
+            sess['can_view_vishvam_layout'] = True
+
+    @patch('receipt_app.field_sync.sync_payload', return_value={"full": False, "projects": {}, "token": "s1.5.x"})
+    @patch('receipt_app.get_projects', return_value=PROJECTS)
+    @patch('receipt_app.database.get_db_connection')
+    def test_state_only_for_permitted_projects(self, mock_conn, mock_projects, mock_payload):
+        data = self.client.get('/api/sync?token=s1.4.x').get_json()
+        self.assertEqual(data["token"], "s1.5.x")
+        mock_payload.assert_called_once_with(mock_conn.return_value.cursor.return_value, ["Vishvam"], "s1.4.x")
+
+    @patch('receipt_app.data_versions.bump')
+    @patch('receipt_app.field_sync.upload_receipts', return_value={"accepted": ["a"], "duplicates": [], "errors": []})
+    @patch('receipt_app.get_projects', return_value=PROJECTS)
+    @patch('receipt_app.database.get_db_connection')
+    def test_upload_commits_accepted(self, mock_conn, mock_projects, mock_upload, mock_bump):
+        response = self.client.post('/api/sync/receipts', json={"receipts": [{"client_ref": "a"}]})
+        self.assertEqual(response.get_json()["accepted"], ["a"])
+        self.assertEqual(mock_upload.call_args[0][2], {"Vishvam"})
+        self.assertEqual(mock_upload.call_args[0][3], "agent7")
+        mock_conn.return_value.commit.assert_called_once()
+
+    def test_upload_rejects_bad_body(self):
+        self.assertEqual(self.client.post('/api/sync/receipts', json={"receipts": []}).status_code, 400)
+        too_many = {"receipts": [{}] * (field_sync.MAX_UPLOAD + 1)}
+        self.assertEqual(self.client.post('/api/sync/receipts', json=too_many).status_code, 413)
+
+
+if __name__ == '__main__':
+    unittest.main()
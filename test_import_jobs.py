@@ -0,0 +1,142 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import import_jobs
+from receipt_app import app
+
+MAPPING = {"plot_no": 0, "date": 1, "amount": 2, "customer": None, "payment_mode": None,
+           "receipt_no": 3, "sq_yards": None, "basic_price": None}
+
+
+def _job(**overrides):
+    job = {"id": 7, "filename": "import_1_sheet.xlsx", "mapping": json.dumps(MAPPING), "status": "running",
+           "checkpoint_row": 0, "rows_read": 0, "imported": 0, "skipped": 0, "error_count": 0,
+           "errors": None, "message": None, "created_by": "admin", "idle_seconds": 0}
+    job.update(overrides)
+    return job
+
+
+class RunJobTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.sheet = os.path.join(self.tmp, "import_1_sheet.xlsx")
+        open(self.sheet, "wb").close()
+        self.conn = MagicMock()
+        self.cursor = self.conn.cursor.return_value
+        self.cursor.rowcount = 1
+        self.cursor.fetchmany.return_value = []
+        patches = [
+            patch("import_jobs.database.get_db_connection", return_value=self.conn),
+            patch("receipt_import.plot_status_log.record"),
+            patch("receipt_import.data_versions.bump"),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _checkpoints(self):
+        return [c.args[1] for c in self.cursor.execute.call_args_list
+                if c.args[0] == import_jobs._CHECKPOINT_SQL]
+
+    @patch("import_jobs.receipt_import.iter_rows")
+    @patch("import_jobs.get_job")
+    def test_resume_skips_checkpointed_rows(self, mock_get, mock_rows):
+        # Rows 3-4 were committed by the first run; plot 12's context still applies to row 5
+        mock_get.return_value = _job(checkpoint_row=4, rows_read=2, imported=2)
+        mock_rows.return_value = [(3, (12, None, 100, "A1")), (4, (None, None, 100, "A2")),
+                                  (5, (None, None, 100, "A3")), (6, (14, None, 100, "A4"))]
+        status = import_jobs.run_job({"database": "t1"}, 7, self.tmp, lambda n: "words")
+
+        self.assertEqual(status, "done")
+        inserted = self.cursor.executemany.call_args_list[1].args[1]
+        self.assertEqual([(r[1], r[6]) for r in inserted], [("12", "3"), ("14", "4")])
+        # last row, rows read, imported, skipped, error count, errors, job id
+        self.assertEqual(self._checkpoints(), [(6, 4, 4, 0, 0, "[]", 7)])
+        self.assertFalse(os.path.exists(self.sheet))
+
+    @patch("import_jobs.get_job")
+    def test_job_held_elsewhere_is_left_alone(self, mock_get):
+        self.cursor.rowcount = 0
+        self.assertIsNone(import_jobs.run_job({"database": "t1"}, 7, self.tmp, str))
+        mock_get.assert_not_called()
+
+    @patch("import_jobs._mark_failed")
+    @patch("import_jobs.receipt_import.iter_rows")
+    @patch("import_jobs.get_job")
+    def test_failure_keeps_upload_for_resume(self, mock_get, mock_rows, mock_failed):
+        mock_get.return_value = _job()
+        mock_rows.side_effect = OSError("truncated file")
+        self.assertEqual(import_jobs.run_job({"database": "t1"}, 7, self.tmp, str), "failed")
+        mock_failed.assert_called_once_with({"database": "t1"}, 7, "truncated file")
+        self.assertTrue(os.path.exists(self.sheet))
+
+
+class HelpersTestCase(unittest.TestCase):
+    def test_resumable_states(self):
+        self.assertTrue(import_jobs.is_resumable(_job(status="failed")))
+        self.assertFalse(import_jobs.is_resumable(_job(status="running", idle_seconds=5)))
+        self.assertTrue(import_jobs.is_resumable(_job(status="running", idle_seconds=import_jobs.STALE_SECONDS + 1)))
+        self.assertFalse(import_jobs.is_resumable(_job(status="done", idle_seconds=10 ** 6)))
+
+    @patch('import_jobs.database.get_tenant_db_config', return_value={"database": "t1"})
+    def test_remove_stale_uploads(self, mock_tenant):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        tmp = import_jobs.upload_dir(root)
+        other = import_jobs.upload_dir(root, {"database": "t2"})
+        self.assertNotEqual(tmp, other)
+        old = time.time() - import_jobs.UPLOAD_MAX_AGE - 60
+        for folder, name in ((tmp, "import_1_old.xlsx"), (tmp, "import_2_failed.xlsx"),
+                             (tmp, "import_3_new.xlsx"), (tmp, "logo.png"), (other, "import_4_other.xlsx")):
+            with open(os.path.join(folder, name), "wb"):
+                pass
+            if name != "import_3_new.xlsx":
+                os.utime(os.path.join(folder, name), (old, old))
+        cursor = MagicMock()
+        cursor.fetchall.return_value = [("import_2_failed.xlsx",)]
+        self.assertEqual(import_jobs.remove_stale_uploads(cursor, tmp), 1)
+        self.assertEqual(sorted(os.listdir(tmp)), ["import_2_failed.xlsx", "import_3_new.xlsx", "logo.png"])
+        self.assertEqual(os.listdir(other), ["import_4_other.xlsx"])
+
+
+class ImportJobRoutesTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+
+    @patch('receipt_app.import_jobs.upload_dir', return_value="uploads/t1")
+    @patch('receipt_app.import_jobs.start')
+    @patch('receipt_app.import_jobs.create_job', return_value=42)
+    @patch('receipt_app.os.path.exists', return_value=True)
+    @patch('receipt_app.database.get_db_connection')
+    def test_process_queues_job(self, mock_conn, mock_exists, mock_create, mock_start, mock_dir):
+        form = {"filename": "import_1_sheet.xlsx", "col_plot_no": "0", "col_date": "1", "col_amount": "2"}
+        response = self.client.post('/import_receipts/process', data=form)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.headers['Location'].endswith('/import_receipts?job=42'))
+        self.assertEqual(mock_start.call_args[0][1:3], (42, "uploads/t1"))
+
+    @patch('receipt_app.import_jobs.get_job')
+    @patch('receipt_app.database.get_db_connection')
+    def test_progress(self, mock_conn, mock_get):
+        mock_get.return_value = _job(imported=5, errors='["Row 9: bad"]', error_count=1)
+        data = self.client.get('/api/import-jobs/7').get_json()
+        self.assertEqual((data['imported'], data['errors'], data['resumable']), (5, ["Row 9: bad"], False))
+
+        mock_get.return_value = None
+        self.assertEqual(self.client.get('/api/import-jobs/8').status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+import layout_ingest
+
+SAMPLE_SVG = """<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg"
+     xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape"
+     xmlns:sodipodi="http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd"
+     width="200" height="100" viewBox="0 0 200 100">
+  <metadata><rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"/></metadata>
+  <sodipodi:namedview id="base" inkscape:zoom="1"/>
+  <!-- editor comment -->
+  <g inkscape:label="Plots" transform="translate(10,20)">
+    <rect id="plot-1" x="0" y="0" width="30" height="40" inkscape:connector="x"/>
+    <path d="M 50 0 l 20 0 l 0 40 z"/>
+  </g>
+  <polygon class="lot" points="100,10 150,10 150,60"/>
+  <text x="5" y="95">  Plot 1  </text>
+</svg>
+"""
+
+
+class ProcessSvgTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "vishvam_layout.svg")
+        with open(self.path, "w") as f:
+            f.write(SAMPLE_SVG)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_ids_follow_viewer_numbering(self):
+        _, elements, _ = layout_ingest.process_svg(self.path)
+        # Document order of the viewer's selector; existing ids are kept
+        self.assertEqual([e[0] for e in elements],
+                         ["gen-shape-0", "plot-1", "gen-shape-2", "gen-shape-3", "gen-shape-4"])
+        self.assertEqual([e[1] for e in elements], ["g", "rect", "path", "polygon", "text"])
+
+    def test_bboxes_apply_transforms(self):
+        _, elements, _ = layout_ingest.process_svg(self.path)
+        boxes = {e[0]: e[2] for e in elements}
+        self.assertEqual(boxes["plot-1"], (10, 20, 40, 60))
+        self.assertEqual(boxes["gen-shape-2"], (60, 20, 80, 60))
+        self.assertEqual(boxes["gen-shape-0"], (10, 20, 80, 60))
+        self.assertEqual(boxes["gen-shape-3"], (100, 10, 150, 60))
+
+    def test_editor_metadata_is_stripped(self):
+        svg_bytes, _, stripped = layout_ingest.process_svg(self.path)
+        text = svg_bytes.decode("utf-8")
+        self.assertEqual(stripped, 2)
+        self.assertNotIn("inkscape", text)
+        self.assertNotIn("sodipodi", text)
+        self.assertNotIn("metadata", text)
+        self.assertNotIn("editor comment", text)
+        self.assertIn('data-plot-index="2"', text)
+        # Shapes carry the viewer's class, existing classes kept
+        self.assertEqual(text.count('plot-shape'), 5)
+        self.assertIn('class="lot plot-shape"', text)
+        # Text content is kept verbatim
+        self.assertIn(">  Plot 1  <", text)
+
+    def test_variants_written(self):
+        svg_bytes, _, _ = layout_ingest.process_svg(self.path)
+        sizes = layout_ingest.write_variants(svg_bytes, self.path)
+        paths = layout_ingest.variant_paths(self.path)
+        self.assertTrue(paths["min"].endswith("vishvam_layout.min.svg"))
+        with gzip.open(paths["gzip"]) as f:
+            self.assertEqual(f.read(), svg_bytes)
+        self.assertLess(sizes["min"], len(SAMPLE_SVG))
+
+    def test_store_elements_replaces_project_rows(self):
+        conn = MagicMock()
+        cursor = conn.cursor.return_value
+        layout_ingest.store_elements(conn, "Vishvam", [("plot-1", "rect", (0, 0, 1, 1)), ("g1", "g", None)])
+        self.assertIn("DELETE FROM layout_elements", cursor.execute.call_args_list[0][0][0])
+        rows = cursor.executemany.call_args[0][1]
+        self.assertEqual(rows, [("Vishvam", "plot-1", "rect", 0, 0, 1, 1),
+                                ("Vishvam", "g1", "g", None, None, None, None)])
+
+
+class PathPointsTestCase(unittest.TestCase):
+    def test_relative_and_implicit_commands(self):
+        points = layout_ingest.path_points("m10 10 5 0 h5 v5 Z")
+        self.assertEqual(points, [(10, 10), (15, 10), (20, 10), (20, 15)])
+
+    def test_rotate_about_point(self):
+        m = layout_ingest.parse_transform("rotate(90 10 10)")
+        x, y = layout_ingest._apply(m, 20, 10)
+        self.assertAlmostEqual(x, 10)
+        self.assertAlmostEqual(y, 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
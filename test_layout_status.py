@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import layout_status
+
+MINIFIED = b'<svg xmlns="http://www.w3.org/2000/svg"><rect id="p1"/><rect id="gen-shape-2"/></svg>'
+
+
+def _layout(plot_no, element_id, status=None):
+    return {"plot_no": plot_no, "svg_element_id": element_id, "status": status}
+
+
+class StyleTestCase(unittest.TestCase):
+    def test_plot_status_matches_viewer(self):
+        self.assertEqual(layout_status.plot_status(_layout("1", "p1"), {"1"}), "sold")
+        self.assertEqual(layout_status.plot_status(_layout("1.0", "p1"), {"1"}), "sold")
+        self.assertEqual(layout_status.plot_status(_layout("1", "p1", "hold"), {"1"}), "hold")
+        self.assertEqual(layout_status.plot_status(_layout("2", "p2", "reserved"), set()), "available")
+
+    def test_style_groups_ids_and_escapes(self):
+        style = layout_status.build_style({"p1": "sold", "9x": "sold", "a.b": "available"}).decode()
+        self.assertTrue(style.startswith('<style id="plot-status-style">'))
+        self.assertIn("#a\\2e b{fill:#dcfce7!important", style)
+        self.assertIn("#\\39 x,#p1{fill:#fee2e2!important", style)
+
+    def test_splice_inserts_first_child(self):
+        out = layout_status.splice(MINIFIED, b"<style/>")
+        self.assertTrue(out.startswith(b'<svg xmlns="http://www.w3.org/2000/svg"><style/><rect'))
+        self.assertEqual(layout_status.splice(b"<svg/>", b"<style/>"), b"<svg><style/></svg>")
+
+
+class EnsureVariantTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.minified = os.path.join(self.tmp, "vishvam_layout.min.svg")
+        with open(self.minified, "wb") as f:
+            f.write(MINIFIED)
+        layout_status._variants.clear()
+        self.tenant = patch("layout_status.database.get_tenant_key", return_value="t1")
+        self.tenant.start()
+
+    def tearDown(self):
+        self.tenant.stop()
+        shutil.rmtree(self.tmp)
+
+    @patch("layout_status.plot_status_log.changes_since")
+    @patch("layout_status.plot_events.load_project_state")
+    def test_full_then_incremental(self, mock_state, mock_changes):
+        mock_state.return_value = ({"1"}, {"1": _layout("1", "p1"), "2": _layout("2", "gen-shape-2")})
+        cursor = MagicMock()
+        path = layout_status.ensure_variant(cursor, "Vishvam", self.minified, 5)
+        with open(path, "rb") as f:
+            data = f.read()
+        self.assertIn(b"#p1{fill:#fee2e2", data)
+        self.assertIn(b"#gen-shape-2{fill:#dcfce7", data)
+        self.assertTrue(os.path.exists(path + ".gz"))
+
+        # Same seq is served from disk
+        self.assertEqual(layout_status.ensure_variant(cursor, "Vishvam", self.minified, 5), path)
+        mock_state.assert_called_once()
+
+        # Newer seq only reads the logged plots
+        mock_changes.return_value = [{"plot_no": "2", "sold": True, "layout": _layout("2", "gen-shape-2")}]
+        new_path = layout_status.ensure_variant(cursor, "Vishvam", self.minified, 7)
+        mock_state.assert_called_once()
+        mock_changes.assert_called_once_with(cursor, "Vishvam", 5, 7)
+        with open(new_path, "rb") as f:
+            self.assertIn(b"#gen-shape-2,#p1{fill:#fee2e2", f.read())
+        # A just-superseded variant may still be in flight from another worker
+        self.assertTrue(os.path.exists(path))
+
+        # ... and is cleaned up once it is older than the grace period
+        old = time.time() - layout_status.STALE_SECONDS - 1
+        os.utime(path, (old, old))
+        mock_changes.return_value = []
+        layout_status.ensure_variant(cursor, "Vishvam", self.minified, 8)
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(path + ".gz"))
+        self.assertTrue(os.path.exists(new_path))
+
+    @patch("layout_status.plot_events.load_project_state")
+    def test_tenants_sharing_a_layout_keep_their_own_variants(self, mock_state):
+        mock_state.return_value = ({"1"}, {"1": _layout("1", "p1")})
+        path = layout_status.ensure_variant(MagicMock(), "Vishvam", self.minified, 5)
+        old = time.time() - layout_status.STALE_SECONDS - 1
+        os.utime(path, (old, old))
+
+        with patch("layout_status.database.get_tenant_key", return_value="t2"):
+            mock_state.return_value = (set(), {"1": _layout("1", "p1")})
+            other = layout_status.ensure_variant(MagicMock(), "Vishvam", self.minified, 5)
+            layout_status.ensure_variant(MagicMock(), "Vishvam", self.minified, 6)
+        self.assertNotEqual(other, path)
+        self.assertEqual(mock_state.call_count, 2)
+        self.assertTrue(os.path.exists(path))
+
+    def test_etag_changes_with_seq_and_encoding(self):
+        tags = {layout_status.etag(self.minified, 1), layout_status.etag(self.minified, 2),
+                layout_status.etag(self.minified, 2, "gzip")}
+        self.assertEqual(len(tags), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from PIL import Image
+
+import layout_tiles
+
+
+class PyramidTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_levels_and_padding(self):
+        image = Image.new("RGB", (600, 300), "white")
+        max_zoom = layout_tiles.build_pyramid(image, self.tmp, "png")
+        self.assertEqual(max_zoom, 2)
+        # 600x300 -> 3x2 tiles, 300x150 -> 2x1, 150x75 -> 1x1
+        for z, columns, rows in ((2, 3, 2), (1, 2, 1), (0, 1, 1)):
+            self.assertEqual(len(os.listdir(os.path.join(self.tmp, str(z)))), columns)
+            self.assertEqual(len(os.listdir(os.path.join(self.tmp, str(z), "0"))), rows)
+        with Image.open(os.path.join(self.tmp, "2", "2", "1.png")) as edge:
+            self.assertEqual(edge.size, (256, 256))
+
+    def test_generate_writes_manifest_and_drops_old_versions(self):
+        source = os.path.join(self.tmp, "vishvam_layout.min.svg")
+        with open(source, "w") as f:
+            f.write('<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 50"/>')
+        out = layout_tiles.tiles_dir(self.tmp, source)
+        self.assertTrue(out.endswith(os.path.join("tiles", "vishvam_layout")))
+        os.makedirs(os.path.join(out, "old"))
+
+        render = (Image.new("RGB", (512, 256), "white"), (0.0, 0.0, 100.0, 50.0))
+        with patch("layout_tiles.render", return_value=render) as mock_render:
+            manifest = layout_tiles.generate_tiles(source, out)
+            # Up to date: not rendered again
+            layout_tiles.generate_tiles(source, out)
+        mock_render.assert_called_once()
+
+        self.assertEqual(manifest["max_zoom"], 1)
+        self.assertEqual(manifest["viewbox"], [0.0, 0.0, 100.0, 50.0])
+        with open(os.path.join(out, layout_tiles.MANIFEST_NAME)) as f:
+            self.assertEqual(json.load(f), manifest)
+        self.assertEqual(sorted(os.listdir(out)), sorted([manifest["version"], layout_tiles.MANIFEST_NAME]))
+
+    def test_svg_viewbox(self):
+        source = os.path.join(self.tmp, "a.svg")
+        with open(source, "w") as f:
+            f.write('<svg xmlns="http://www.w3.org/2000/svg" width="300px" height="200"><rect/></svg>')
+        self.assertEqual(layout_tiles._svg_viewbox(source), (0.0, 0.0, 300.0, 200.0))
+
+    def test_threshold(self):
+        self.assertFalse(layout_tiles.should_tile(100 * 1024, 500))
+        self.assertTrue(layout_tiles.should_tile(100 * 1024, layout_tiles.MIN_ELEMENTS))
+        self.assertTrue(layout_tiles.should_tile(layout_tiles.MIN_SVG_BYTES, 10))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+import plot_events
+from plot_events import PlotEventHub, _ProjectState, diff_state
+from receipt_app import app
+
+
+def _messages(texts):
+    """[(event, id, data), ...] from SSE text."""
+    out = []
+    for text in texts:
+        fields = dict(line.split(": ", 1) for line in text.strip().splitlines())
+        out.append((fields["event"], fields.get("id"), json.loads(fields["data"])))
+    return out
+
+
+class DiffStateTestCase(unittest.TestCase):
+    def test_diff(self):
+        old = ({"1", "2"}, {"1": {"plot_no": "1", "status": "available"}, "3": {"plot_no": "3"}})
+        new = ({"2", "4"}, {"1": {"plot_no": "1", "status": "hold"}})
+        self.assertEqual(diff_state(old, new), {
+            "sold": ["4"],
+            "released": ["1"],
+            "layouts": [{"plot_no": "1", "status": "hold"}],
+            "layouts_removed": ["3"],
+        })
+        self.assertIsNone(diff_state(new, new))
+
+
+class ResumeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tracked = _ProjectState((set(), {}), (1, 1))
+        self.tracked.record((2, 1), {"sold": ["5"]})
+        self.tracked.record((3, 1), {"sold": ["6"]})
+        self.tracked.versions = (3, 1)
+
+    def test_replays_only_missed_changes(self):
+        missed = _messages(self.tracked.messages_after((2, 1)))
+        self.assertEqual(missed, [("changes", "3-1", {"sold": ["6"]})])
+        self.assertEqual(self.tracked.messages_after((3, 1)), [])
+
+    def test_unknown_id_needs_snapshot(self):
+        self.assertIsNone(self.tracked.messages_after((0, 9)))
+        initial = _messages(PlotEventHub._initial_messages(self.tracked, (0, 9)))
+        self.assertEqual(initial[0][:2], ("snapshot", "3-1"))
+
+    def test_history_is_bounded(self):
+        with patch.object(plot_events, "HISTORY_SIZE", 1):
+            self.tracked.record((4, 1), {"sold": ["7"]})
+        self.assertEqual(self.tracked.since, (3, 1))
+        self.assertIsNone(self.tracked.messages_after((2, 1)))
+
+
+class HubTestCase(unittest.TestCase):
+    @patch("plot_events.database.get_db_connection", return_value=MagicMock())
+    @patch("plot_events.data_versions.get_versions", return_value={"receipts": 7, "plot_layouts": 2})
+    @patch("plot_events.load_project_state", return_value=({"12"}, {}))
+    def test_subscribe_sends_snapshot_and_fans_out(self, mock_state, mock_versions, mock_conn):
+        hub = PlotEventHub()
+        with patch.object(plot_events._TenantWatcher, "_run"):
+            sub, initial = hub.subscribe("Vishvam")
+            other, _ = hub.subscribe("Vishvam", last_event_id="7-2")
+        self.assertEqual(_messages(initial), [("snapshot", "7-2", {"sold": ["12"], "layouts": []})])
+
+        # One poll serves both subscribers
+        mock_versions.return_value = {"receipts": 8, "plot_layouts": 2}
+        mock_state.return_value = ({"12", "13"}, {})
+        watcher = next(iter(hub.watchers.values()))
+        watcher._poll(["Vishvam"])
+        for s in (sub, other):
+            self.assertEqual(_messages([s.queue.get_nowait()]),
+                             [("changes", "8-2", {"sold": ["13"], "released": [], "layouts": [],
+                                                  "layouts_removed": []})])
+
+        hub.unsubscribe(sub)
+        hub.unsubscribe(other)
+        self.assertEqual(watcher.subscribers, {})
+
+    @patch("plot_events.database.get_db_connection", return_value=MagicMock())
+    @patch("plot_events.data_versions.get_versions", return_value={"receipts": 7, "plot_layouts": 2})
+    @patch("plot_events.load_project_state")
+    def test_project_loads_outside_hub_lock(self, mock_state, mock_versions, mock_conn):
+        hub = PlotEventHub()
+
+        def load(cursor, project_name):
+            self.assertFalse(hub.lock.locked())
+            return set(), {}
+        mock_state.side_effect = load
+        with patch.object(plot_events._TenantWatcher, "_run"):
+            sub, _ = hub.subscribe("Vishvam")
+        mock_state.assert_called_once()
+        hub.unsubscribe(sub)
+
+    @patch("plot_events.database.get_db_connection", return_value=MagicMock())
+    @patch("plot_events.data_versions.get_versions", return_value={"receipts": 7, "plot_layouts": 2})
+    @patch("plot_events.load_project_state", return_value=(set(), {}))
+    def test_streams_capped_per_worker(self, mock_state, mock_versions, mock_conn):
+        hub = PlotEventHub()
+        with patch.object(plot_events._TenantWatcher, "_run"):
+            subs = [hub.subscribe("Vishvam")[0] for _ in range(plot_events.MAX_STREAMS)]
+            with self.assertRaises(plot_events.StreamLimitError):
+                hub.subscribe("Vishvam")
+            # A closed stream frees its slot
+            hub.unsubscribe(subs.pop())
+            subs.append(hub.subscribe("Vishvam")[0])
+        for sub in subs:
+            hub.unsubscribe(sub)
+        self.assertEqual(hub.streams, 0)
+
+
+class StreamRouteTestCase(unittest.TestCase):
+    @patch("receipt_app.plot_events.hub.subscribe", side_effect=plot_events.StreamLimitError("full"))
+    def test_refused_when_worker_is_full(self, mock_subscribe):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+        response = client.get('/api/plot-events/Vishvam')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "30")
+
+
+if __name__ == "__main__":
+    unittest.main()
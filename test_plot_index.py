@@ -0,0 +1,122 @@
+import unittest
+from unittest.mock import patch
+
+import plot_index
+from plot_index import SOURCE_COMMISSION, SOURCE_RECEIPT, PlotIndex
+
+
+class PlotIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = PlotIndex()
+        for n in (1, 2, 10, 12, 120, 121, 212, 2121):
+            self.index.add("Vishvam", str(n), f"Customer {n}")
+        self.index.add("Vishvam", "12A", "Ravi Kumar")
+        self.index.add("Srinidhi", "12.0", "Lakshmi Devi")
+        self.index.add("Vishvam", "10", source=SOURCE_COMMISSION)
+
+    def plots(self, term, **kwargs):
+        return [(r["project_name"], r["plot_no"]) for r in self.index.search(term, **kwargs)]
+
+    def test_exact_then_prefix_in_natural_order(self):
+        self.assertEqual(self.plots("12"), [
+            ("Srinidhi", "12"), ("Vishvam", "12"),
+            ("Vishvam", "12A"), ("Vishvam", "120"), ("Vishvam", "121"),
+        ])
+        # Three or more characters also match inside plot numbers
+        self.assertEqual(self.plots("121"), [("Vishvam", "121"), ("Vishvam", "2121")])
+
+    def test_limit_and_source_filter(self):
+        self.assertEqual(len(self.index.search("1", limit=3)), 3)
+        self.assertEqual(self.plots("1", source=SOURCE_COMMISSION), [("Vishvam", "10")])
+        self.assertIn(("Vishvam", "10"), self.plots("10", source=SOURCE_RECEIPT))
+
+    def test_customer_name_prefix_and_substring(self):
+        self.assertEqual(self.plots("ravi"), [("Vishvam", "12A")])
+        self.assertEqual(self.plots("ravi ku"), [("Vishvam", "12A")])
+        self.assertEqual(self.plots("kshmi"), [("Srinidhi", "12")])
+        self.assertEqual(self.index.search("lakshmi")[0]["customer_name"], "Lakshmi Devi")
+
+    def test_plots_only_matches_plot_substrings(self):
+        self.index.add("Vishvam", "A12", "Ravi Teja")
+        self.assertEqual(self.plots("12", limit=None, plots_only=True), [
+            ("Srinidhi", "12"), ("Vishvam", "12"),
+            ("Vishvam", "12A"), ("Vishvam", "120"), ("Vishvam", "121"),
+            ("Vishvam", "212"), ("Vishvam", "2121"), ("Vishvam", "A12"),
+        ])
+        self.assertEqual(self.plots("ravi", plots_only=True), [])
+        self.assertEqual(self.plots("ustomer", plots_only=True), [])
+
+    def test_no_match(self):
+        self.assertEqual(self.index.search("zzz"), [])
+        self.assertEqual(self.index.search("  "), [])
+
+    def test_large_layout_stops_in_natural_order(self):
+        index = PlotIndex()
+        for n in range(1, 5001):
+            index.add("Vishvam", str(n), f"Customer {n} Surname{n % 97}")
+        self.assertEqual([r["plot_no"] for r in index.search("1", limit=5)], ["1", "10", "11", "12", "13"])
+        self.assertEqual([r["plot_no"] for r in index.search("surname96", limit=3)], ["96", "193", "290"])
+
+    def test_remove_drops_every_posting(self):
+        self.index.remove(("Vishvam", "12a"))
+        self.assertEqual(self.plots("ravi"), [])
+        self.assertNotIn(("Vishvam", "12A"), self.plots("12"))
+        # Re-adding restores it
+        self.index.add("Vishvam", "12A", "Ravi Kumar")
+        self.assertEqual(self.plots("ravi"), [("Vishvam", "12A")])
+
+
+class DeltaTestCase(unittest.TestCase):
+    def setUp(self):
+        plot_index._slots.clear()
+        self.patches = [patch("plot_index.database.get_tenant_key", return_value="t1"),
+                        patch("plot_index.database.get_db_connection")]
+        for p in self.patches:
+            p.start()
+        self.versions = {"receipts": 1, "commissions": 1, "projects": 1}
+        self.patches.append(patch("plot_index.data_versions.get_versions", side_effect=lambda *a, **k: self.versions))
+        self.patches[-1].start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        plot_index._slots.clear()
+
+    @patch("plot_index.change_log.high_water", return_value=40)
+    @patch("plot_index._build")
+    def test_receipt_bump_applies_delta_without_rebuild(self, mock_build, mock_hw):
+        index = PlotIndex()
+        index.add("Vishvam", "12", "Ravi", SOURCE_RECEIPT, row_id=5)
+        index.add("Srinidhi", "7", "Sita", SOURCE_RECEIPT, row_id=6)
+        mock_build.return_value = index
+        self.assertIs(plot_index.get_index(), index)
+
+        # Receipt 5 moved from plot 12 to plot 14 in another worker
+        self.versions = dict(self.versions, receipts=2)
+        plot_index.invalidate()
+        page = {"changes": [{"seq": 41, "entity": "receipt", "id": 5, "op": "update",
+                             "data": {"project_name": "Vishvam", "plot_no": "14"}}],
+                "next_cursor": "v1.41", "has_more": False}
+        with patch("plot_index.change_log.changes_since", return_value=page) as mock_changes, \
+                patch("plot_index._read_rows", return_value=([(5, "Vishvam", "14", "Ravi")], [])) as mock_rows:
+            self.assertIs(plot_index.get_index(), index)
+        mock_build.assert_called_once()
+        mock_changes.assert_called_once()
+        self.assertEqual(mock_changes.call_args[0][1], 40)
+        self.assertEqual(mock_rows.call_args[0][2], ("Vishvam", "12", "14"))
+        self.assertEqual([r["plot_no"] for r in index.search("1")], ["14"])
+        self.assertEqual(index.search("sita")[0]["plot_no"], "7")
+        self.assertEqual(plot_index._slots[("t1", None)].seq, 41)
+
+    @patch("plot_index.change_log.high_water", return_value=40)
+    @patch("plot_index._build", side_effect=lambda project, conn: PlotIndex())
+    def test_projects_bump_rebuilds(self, mock_build, mock_hw):
+        plot_index.get_index("Vishvam")
+        self.versions = dict(self.versions, projects=2)
+        plot_index.invalidate("Vishvam")
+        plot_index.get_index("Vishvam")
+        self.assertEqual(mock_build.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
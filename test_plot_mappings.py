@@ -0,0 +1,86 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import plot_mappings
+from receipt_app import app
+
+
+class UpsertMappingsTestCase(unittest.TestCase):
+    @patch('plot_mappings.data_versions.bump')
+    @patch('plot_mappings.plot_status_log.record')
+    def test_per_row_results(self, mock_record, mock_bump):
+        conn = MagicMock()
+        cursor = conn.cursor.return_value
+        cursor.fetchall.return_value = [("12",)]
+        results = plot_mappings.upsert_mappings(conn, "Vishvam", [
+            {"plot_no": "12", "element_id": "gen-shape-4", "sq_yards": "200"},
+            {"plot_no": "13", "length": "30", "width": "40"},
+            {"plot_no": "14", "sq_yards": "big"},
+            {"plot_no": "12"},
+            {"facing": "East"},
+            "not a mapping",
+        ])
+        self.assertEqual([r["result"] for r in results],
+                         ["updated", "inserted", "error", "error", "error", "error"])
+        self.assertIn("sq_yards", results[2]["error"])
+        self.assertIn("Duplicate", results[3]["error"])
+
+        # One statement for all valid rows, in one transaction
+        sql, rows = cursor.executemany.call_args[0]
+        self.assertIn("ON DUPLICATE KEY UPDATE", sql)
+        self.assertEqual([r[1] for r in rows], ["12", "13"])
+        self.assertEqual(rows[1][5], 1200.0)  # area from length x width
+        mock_record.assert_called_once_with(cursor, [("Vishvam", "12"), ("Vishvam", "13")])
+        mock_bump.assert_called_once()
+        conn.commit.assert_called_once()
+
+    def test_nothing_valid_writes_nothing(self):
+        conn = MagicMock()
+        results = plot_mappings.upsert_mappings(conn, "Vishvam", [{"plot_no": ""}])
+        self.assertEqual(results[0]["result"], "error")
+        conn.cursor.assert_not_called()
+        conn.commit.assert_not_called()
+
+
+class PlotMappingRoutesTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+
+    @patch('receipt_app.plot_mappings.upsert_mappings')
+    @patch('receipt_app.database.get_db_connection')
+    def test_single_save_wraps_bulk(self, mock_conn, mock_upsert):
+        mock_upsert.return_value = [{"index": 0, "plot_no": "7", "result": "inserted"}]
+        payload = {"project_name": "Vishvam", "plot_no": "7", "status": "hold"}
+        data = self.client.post('/api/plot-mapping/save', json=payload).get_json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['status'], 'hold')
+        mock_upsert.assert_called_once_with(mock_conn.return_value, "Vishvam", [payload])
+
+    @patch('receipt_app.plot_mappings.upsert_mappings')
+    @patch('receipt_app.database.get_db_connection')
+    def test_bulk_save_counts(self, mock_conn, mock_upsert):
+        mock_upsert.return_value = [
+            {"index": 0, "plot_no": "1", "result": "inserted"},
+            {"index": 1, "plot_no": "2", "result": "updated"},
+            {"index": 2, "plot_no": "", "result": "error", "error": "Missing plot_no"},
+        ]
+        resp = self.client.post('/api/plot-mapping/bulk-save',
+                                json={"project_name": "Vishvam", "mappings": [{}, {}, {}]})
+        data = resp.get_json()
+        self.assertEqual((data['inserted'], data['updated'], data['errors']), (1, 1, 1))
+        self.assertFalse(data['success'])
+        self.assertEqual(len(data['results']), 3)
+
+    def test_bulk_save_requires_admin(self):
+        with self.client.session_transaction() as sess:
+            sess['role'] = 'user'
+        resp = self.client.post('/api/plot-mapping/bulk-save', json={"project_name": "V", "mappings": [{}]})
+        self.assertEqual(resp.status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import database
+import plot_master
+from receipt_app import app
+
+RECEIPT = {"id": 5, "no": "R5", "project_name": "Vishvam", "date": "2025-01-02", "customer_name": "Ravi",
+           "amount_numeric": 250000.0, "amount_words": "", "plot_no": "12", "square_yards": "180",
+           "basic_price": "", "payment_mode": "Cheque"}
+
+
+class RecordTestCase(unittest.TestCase):
+    def test_one_upsert_row_per_plot(self):
+        cursor = MagicMock()
+        plot_master.record(cursor, [("Vishvam", " 12.0", "5,500", "200", " Ravi "), ("Vishvam", "14", "", "x", ""),
+                                    ("", "3", 100, 100, "A"), ("Vishvam", None, 100, 100, "A")])
+        sql, rows = cursor.executemany.call_args[0]
+        self.assertIn("COALESCE(VALUES(basic_price), basic_price)", sql)
+        self.assertEqual(rows, [("Vishvam", "12", "12", 5500.0, 200.0, "Ravi"),
+                                ("Vishvam", "14", "14", None, None, None)])
+
+    def test_creates_table_on_first_use(self):
+        cursor = MagicMock()
+        missing = database.Error("no table")
+        missing.errno = 1146
+        cursor.executemany.side_effect = [missing, None]
+        plot_master.record(cursor, [("Vishvam", "12", 5500, 200, "Ravi")])
+        self.assertIn("CREATE TABLE IF NOT EXISTS plots", cursor.execute.call_args[0][0])
+        self.assertEqual(cursor.executemany.call_count, 2)
+
+    def test_plot_totals_is_one_query(self):
+        cursor = MagicMock()
+        cursor.fetchall.return_value = [("Vishvam", "12", 75000, 5500.0, 200.0), ("Vishvam", "14", None, None, None)]
+        totals = plot_master.plot_totals(cursor, "Vishvam")
+        self.assertEqual(totals[1], ("Vishvam", "14", 0.0, None, None))
+        sql, params = cursor.execute.call_args[0]
+        self.assertIn("LEFT JOIN plots p", sql)
+        self.assertEqual(params, ("Vishvam",))
+
+    def test_get_before_migration(self):
+        cursor = MagicMock()
+        missing = database.Error("no table")
+        missing.errno = 1146
+        cursor.execute.side_effect = missing
+        self.assertIsNone(plot_master.get(cursor, "Vishvam", "12"))
+
+
+class ReceiptRoutesTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+            sess['username'] = 'admin'
+
+    @patch('receipt_app.data_versions.bump')
+    @patch('receipt_app.plot_status_log.record')
+    @patch('receipt_app.change_log.record_receipts')
+    @patch('receipt_app.plot_master.record')
+    @patch('receipt_app.database.get_db_connection')
+    def test_update_writes_one_plot_row(self, mock_conn, mock_plots, mock_log, mock_status, mock_bump):
+        cursor = mock_conn.return_value.cursor.return_value
+        cursor.fetchall.return_value = []
+        self.client.post('/receipt/5/update', data={"project_name": "Vishvam", "plot_no": "12",
+                                                   "basic_price": "5,500", "square_yards": "200",
+                                                   "customer_name": "Ravi", "amount_numeric": "1000"})
+        mock_plots.assert_called_once_with(cursor, [("Vishvam", "12", "5500", "200", "Ravi")])
+        self.assertFalse(any("SET basic_price" in c[0][0] for c in cursor.execute.call_args_list))
+        mock_log.assert_called_once()
+
+    @patch('receipt_app.plot_master.get', return_value={"plot_no": "12", "basic_price": 5500.0,
+                                                        "square_yards": 200.0, "customer_name": "Ravi K"})
+    @patch('receipt_app.database.fetch_all', return_value=[RECEIPT])
+    @patch('receipt_app.database.get_db_connection')
+    def test_plot_detail_reads_plot_row(self, mock_conn, mock_fetch, mock_get):
+        response = self.client.get('/plot/12')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"11,00,000", response.data)
+        self.assertIn(b"Ravi K", response.data)
+        mock_get.assert_called_once_with(mock_conn.return_value.cursor.return_value, "Vishvam", "12")
+
+    @patch('receipt_app.plot_master.get', return_value={"plot_no": "12", "basic_price": 6000.0,
+                                                        "square_yards": 200.0, "customer_name": "Ravi"})
+    @patch('receipt_app.database.fetch_one', return_value=dict(RECEIPT, basic_price="5500"))
+    @patch('receipt_app.database.get_db_connection')
+    def test_autofill_uses_current_plot_price(self, mock_conn, mock_fetch, mock_get):
+        data = self.client.get('/api/plot_lookup?plot_no=12&project_name=Vishvam').get_json()
+        self.assertTrue(data["found"])
+        # Not the older receipt's own price, which would be written back on save
+        self.assertEqual(data["basic_price"], "6000")
+        mock_get.assert_called_once_with(mock_conn.return_value.cursor.return_value, "Vishvam", "12")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import gzip
+import json
+import unittest
+from unittest.mock import patch
+
+import plot_state
+from receipt_app import app
+
+
+def _layout(plot_no, facing=None, status=None, element_id=None):
+    return {"plot_no": plot_no, "facing": facing, "length": None, "width": None, "area": None,
+            "sq_yards": 200.0, "status": status, "notes": None, "svg_element_id": element_id,
+            "boundary_east": None, "boundary_west": None, "boundary_north": None, "boundary_south": None}
+
+
+class BuildColumnsTestCase(unittest.TestCase):
+    def test_merges_sources_in_natural_order(self):
+        payload = plot_state.build_columns(
+            sold_plots=["10", "2.0", "7"],
+            layouts=[_layout("2", "East", "sold", "p2"), _layout("10", "North", None, "p10"), _layout("3", "East")],
+            commission_plots=["7", "3 "],
+        )
+        self.assertEqual(payload["plots"], ["2", "3", "7", "10"])
+        self.assertEqual(payload["sold"], [1, 0, 1, 1])
+        self.assertEqual(payload["commission"], [0, 1, 1, 0])
+        self.assertEqual(payload["layout"], [1, 1, 0, 1])
+        self.assertEqual(payload["facing"], {"values": ["East", "North"], "codes": [0, 0, -1, 1]})
+        self.assertEqual(payload["status"], {"values": ["sold"], "codes": [0, -1, -1, -1]})
+        self.assertEqual(payload["svg_element_id"], ["p2", None, None, "p10"])
+        self.assertNotIn("plot_no", payload)
+
+    def test_much_smaller_than_row_dicts(self):
+        layouts = [_layout(str(i), "East", "available", f"gen-shape-{i}") for i in range(2000)]
+        rows = json.dumps({l["plot_no"]: l for l in layouts})
+        body, _ = plot_state.encode(plot_state.build_columns([], layouts, []), accept_gzip=False)
+        self.assertLess(len(body), len(rows) / 3)
+
+    def test_encode_gzip_threshold(self):
+        small, encoding = plot_state.encode({"plots": []}, accept_gzip=True)
+        self.assertIsNone(encoding)
+        big, encoding = plot_state.encode({"plots": [str(i) for i in range(1000)]}, accept_gzip=True)
+        self.assertEqual(encoding, "gzip")
+        self.assertEqual(json.loads(gzip.decompress(big))["plots"][999], "999")
+
+
+class PlotStateRouteTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+
+    @patch('receipt_app.data_versions.etag_for', return_value='"s1"')
+    @patch('receipt_app.plot_state.load_columns')
+    @patch('receipt_app.plot_status_log.high_water', return_value=9)
+    @patch('receipt_app.database.get_db_connection')
+    def test_gzip_payload_and_304(self, mock_conn, mock_hw, mock_columns, mock_etag):
+        mock_columns.return_value = plot_state.build_columns([str(i) for i in range(500)], [], [])
+        resp = self.client.get('/api/plot-state/Vishvam', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(resp.data))
+        self.assertEqual(data['seq'], 9)
+        self.assertEqual(len(data['plots']), 500)
+
+        resp = self.client.get('/api/plot-state/Vishvam', headers={'If-None-Match': '"s1"'})
+        self.assertEqual(resp.status_code, 304)
+        mock_columns.assert_called_once()
+
+    @patch('receipt_app.data_versions.get_versions', return_value={"receipts": 3, "plot_layouts": 1, "commissions": 2})
+    @patch('receipt_app.plot_state.load_columns', return_value={"plots": []})
+    @patch('receipt_app.plot_status_log.high_water')
+    @patch('receipt_app.database.get_db_connection')
+    def test_etag_follows_high_water(self, mock_conn, mock_hw, mock_columns, mock_versions):
+        mock_hw.return_value = 9
+        etag = self.client.get('/api/plot-state/Vishvam').headers['ETag']
+        mock_hw.return_value = 10
+        resp = self.client.get('/api/plot-state/Vishvam', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json()['seq'], 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
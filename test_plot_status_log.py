@@ -0,0 +1,97 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import plot_status_log
+from receipt_app import app
+
+
+class RecordTestCase(unittest.TestCase):
+    def test_record_dedupes_and_skips_blanks(self):
+        cursor = MagicMock()
+        plot_status_log.record(cursor, [("Vishvam", "12"), ("Vishvam", "12 "), ("", "3"), ("Vishvam", None)])
+        cursor.executemany.assert_called_once()
+        self.assertEqual(cursor.executemany.call_args[0][1], [("Vishvam", "12")])
+
+    def test_record_nothing(self):
+        cursor = MagicMock()
+        plot_status_log.record(cursor, [])
+        cursor.executemany.assert_not_called()
+
+
+class HighWaterTestCase(unittest.TestCase):
+    def test_stops_below_young_gap_until_it_commits(self):
+        cursor = MagicMock()
+        # 10 and below settled; 12 was taken by a transaction that has not committed yet
+        cursor.fetchone.return_value = (10,)
+        cursor.fetchall.return_value = [(11,), (13,), (14,)]
+        self.assertEqual(plot_status_log.high_water(cursor), 11)
+
+        # 12 commits late: the next read moves past it, so `since=11` still returns it
+        cursor.fetchall.return_value = [(11,), (12,), (13,), (14,)]
+        self.assertEqual(plot_status_log.high_water(cursor), 14)
+
+    def test_project_watermark_is_capped(self):
+        cursor = MagicMock()
+        cursor.fetchone.side_effect = [(10,), (9,)]
+        cursor.fetchall.return_value = [(12,)]
+        self.assertEqual(plot_status_log.high_water(cursor, "Vishvam"), 9)
+        self.assertEqual(cursor.execute.call_args[0][1], ("Vishvam", 10))
+
+    def test_missing_table(self):
+        cursor = MagicMock()
+        missing = plot_status_log.database.Error("no table")
+        missing.errno = 1146
+        cursor.execute.side_effect = missing
+        self.assertEqual(plot_status_log.high_water(cursor, "Vishvam"), 0)
+
+
+class PlotStatusDeltaTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+
+    @patch('receipt_app.data_versions.etag_for', return_value='"v1"')
+    @patch('receipt_app.plot_status_log.changes_since')
+    @patch('receipt_app.plot_status_log.high_water', return_value=42)
+    @patch('receipt_app.database.get_db_connection')
+    def test_since_returns_only_changes(self, mock_conn, mock_hw, mock_changes, mock_etag):
+        mock_changes.return_value = [{"plot_no": "12", "sold": True, "layout": None}]
+        data = self.client.get('/api/plot-status/Vishvam?since=40').get_json()
+        self.assertEqual(data['seq'], 42)
+        self.assertEqual(data['changes'], mock_changes.return_value)
+        self.assertNotIn('sold_plots', data)
+        mock_changes.assert_called_once_with(mock_conn.return_value.cursor.return_value, 'Vishvam', 40, 42)
+
+    @patch('receipt_app.data_versions.etag_for', return_value='"v1"')
+    @patch('receipt_app.plot_status_log.high_water', return_value=42)
+    @patch('receipt_app.database.get_db_connection')
+    def test_without_since_returns_full_list(self, mock_conn, mock_hw, mock_etag):
+        cursor = mock_conn.return_value.cursor.return_value
+        cursor.description = [('plot_no',)]
+        cursor.fetchall.return_value = [('12',), ('13',)]
+        data = self.client.get('/api/plot-status/Vishvam').get_json()
+        self.assertEqual(data['seq'], 42)
+        self.assertEqual(data['sold_plots'], ['12', '13'])
+
+    @patch('receipt_app.plot_status_log.changes_since', return_value=[])
+    @patch('receipt_app.data_versions.get_versions', return_value={"receipts": 3, "plot_layouts": 1})
+    @patch('receipt_app.plot_status_log.high_water')
+    @patch('receipt_app.database.get_db_connection')
+    def test_settling_change_is_not_hidden_by_304(self, mock_conn, mock_hw, mock_versions, mock_changes):
+        # The version bump is seen while its change is still settling
+        mock_hw.return_value = 41
+        first = self.client.get('/api/plot-status/Vishvam?since=40')
+        etag = first.headers['ETag']
+        self.assertEqual(self.client.get('/api/plot-status/Vishvam?since=40',
+                                         headers={'If-None-Match': etag}).status_code, 304)
+        mock_hw.return_value = 42
+        resp = self.client.get('/api/plot-status/Vishvam?since=40', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json()['seq'], 42)
+
+
+if __name__ == '__main__':
+    unittest.main()
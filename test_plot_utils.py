@@ -0,0 +1,27 @@
+import unittest
+
+from plot_utils import clean_plot_no, natural_sort_key, normalize_plot_key, plot_num
+
+
+class PlotUtilsTestCase(unittest.TestCase):
+    def test_clean_plot_no_strips_excel_float_suffix(self):
+        self.assertEqual(clean_plot_no(12.0), "12")
+        self.assertEqual(clean_plot_no(" 12A "), "12A")
+        self.assertEqual(clean_plot_no("10.05"), "10.05")
+        self.assertEqual(clean_plot_no(None), "")
+
+    def test_normalize_plot_key(self):
+        self.assertEqual(normalize_plot_key(" 12.0 "), "12")
+        self.assertEqual(normalize_plot_key("12A"), "12a")
+        self.assertEqual(normalize_plot_key("12a"), normalize_plot_key("12A"))
+        self.assertIsNone(normalize_plot_key(None))
+
+    def test_natural_sort(self):
+        plots = ["10", "B2", "B1", "2", "10A", "1"]
+        self.assertEqual(sorted(plots, key=natural_sort_key), ["1", "2", "10", "10A", "B1", "B2"])
+        self.assertEqual(plot_num("A-17"), 17)
+        self.assertIsNone(plot_num("Corner"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import database
+import project_ids
+import receipt_import
+from receipt_app import app
+
+
+class RenameTestCase(unittest.TestCase):
+    def test_renames_projects_row_and_name_keyed_tables(self):
+        cursor = MagicMock()
+        cursor.fetchone.return_value = ("Vishvam",)
+        self.assertEqual(project_ids.rename(cursor, 3, "Vishvam Phase 1"), "Vishvam")
+        calls = [c.args for c in cursor.execute.call_args_list[1:]]
+        self.assertEqual(calls[0], ("UPDATE projects SET name = %s WHERE id = %s", ("Vishvam Phase 1", 3)))
+        # Rows with a project_id follow the projects row; only the name-keyed tables are rewritten
+        self.assertEqual(len(calls), 1 + len(project_ids._NAMED_TABLES))
+        for table in project_ids.TABLES:
+            self.assertFalse(any(f"`{table}`" in sql for sql, _ in calls))
+        self.assertEqual([params for _, params in calls[1:]], [("Vishvam Phase 1", "Vishvam")] * 5)
+        self.assertIn("UPDATE `layout_elements`", calls[-2][0])
+
+    def test_missing_project_and_missing_tables(self):
+        cursor = MagicMock()
+        cursor.fetchone.return_value = None
+        self.assertIsNone(project_ids.rename(cursor, 3, "New"))
+        self.assertEqual(cursor.execute.call_count, 1)
+
+        missing = database.Error("no table")
+        missing.errno = 1146
+        cursor = MagicMock()
+        cursor.fetchone.return_value = ("Old",)
+        cursor.execute.side_effect = [None] * 5 + [missing] + [None]
+        self.assertEqual(project_ids.rename(cursor, 3, "New"), "Old")
+
+
+class EnsureTestCase(unittest.TestCase):
+    def test_creates_each_named_project_once(self):
+        cursor = MagicMock()
+        project_ids.ensure(cursor, "Vishvam", "", None, "Lake View", "Vishvam", "  ")
+        cursor.executemany.assert_called_once_with("INSERT IGNORE INTO projects (name) VALUES (%s)",
+                                                   [("Lake View",), ("Vishvam",)])
+
+    def test_nothing_to_create(self):
+        cursor = MagicMock()
+        project_ids.ensure(cursor, "", None)
+        cursor.executemany.assert_not_called()
+
+    def test_filter_and_name_sql(self):
+        self.assertEqual(project_ids.filter_sql(), f"project_id = {project_ids.ID_SQL}")
+        self.assertEqual(project_ids.filter_sql("r"), f"r.project_id = {project_ids.ID_SQL}")
+        self.assertTrue(project_ids.columns("r").startswith("r.*, "))
+        self.assertTrue(project_ids.columns("r").endswith(f"{project_ids.name_sql('r')} AS project_name"))
+
+
+class BackfillTestCase(unittest.TestCase):
+    def test_commits_each_id_range(self):
+        cursor = MagicMock()
+        cursor.fetchone.return_value = (1, 12)
+        cursor.rowcount = 4
+        self.assertEqual(project_ids.backfill(cursor, "receipts", batch_size=5), 12)
+        updates = [c.args for c in cursor.execute.call_args_list if c.args[0].startswith("UPDATE")]
+        self.assertEqual([params for _, params in updates], [(1, 5), (6, 10), (11, 15)])
+        self.assertEqual([c.args[0] for c in cursor.execute.call_args_list].count("COMMIT"), 3)
+
+    def test_nothing_to_backfill(self):
+        cursor = MagicMock()
+        cursor.fetchone.return_value = (None, None)
+        self.assertEqual(project_ids.backfill(cursor, "receipts"), 0)
+        self.assertEqual(cursor.execute.call_count, 1)
+
+    def test_import_params_fill_project_id(self):
+        receipt = {"date": "2025-01-02", "plot_no": "12", "customer_name": "Ravi", "amount": 1000.0,
+                   "amount_words": "", "payment_mode": "Cash", "no": "R1", "project_name": "Vishvam",
+                   "sq_yards": "200", "basic_price": ""}
+        params = receipt_import._params(receipt)
+        self.assertEqual(receipt_import.INSERT_SQL.count("%s"), len(params))
+        self.assertIn(project_ids.ID_SQL, receipt_import.INSERT_SQL)
+        self.assertEqual(params[-1], "Vishvam")
+
+
+class ProjectRoutesTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+            sess['username'] = 'admin'
+
+    @patch('receipt_app.plot_index.invalidate')
+    @patch('receipt_app.data_versions.bump')
+    @patch('receipt_app.project_ids.rename', return_value="Vishvam")
+    @patch('receipt_app.database.get_db_connection')
+    def test_update_project_renames_by_id(self, mock_conn, mock_rename, mock_bump, mock_invalidate):
+        cursor = mock_conn.return_value.cursor.return_value
+        cursor.fetchone.return_value = None
+        self.client.post('/projects/update', data={"project_id": "3", "new_name": " Vishvam Phase 1 "})
+        mock_rename.assert_called_once_with(cursor, "3", "Vishvam Phase 1")
+        self.assertIn("commissions", mock_bump.call_args[0])
+        mock_conn.return_value.commit.assert_called_once()
+        mock_invalidate.assert_called_once()
+
+    @patch('receipt_app.project_ids.rename', return_value=None)
+    @patch('receipt_app.database.get_db_connection')
+    def test_update_missing_project_does_not_commit(self, mock_conn, mock_rename):
+        mock_conn.return_value.cursor.return_value.fetchone.return_value = None
+        self.client.post('/projects/update', data={"project_id": "3", "new_name": "New"})
+        mock_conn.return_value.commit.assert_not_called()
+
+    @patch('receipt_app.project_ids.claim')
+    @patch('receipt_app.data_versions.bump')
+    @patch('receipt_app.database.get_db_connection')
+    def test_add_project_claims_existing_rows(self, mock_conn, mock_bump, mock_claim):
+        cursor = mock_conn.return_value.cursor.return_value
+        cursor.fetchone.return_value = None
+        cursor.lastrowid = 9
+        self.client.post('/projects/add', data={"project_name": "Lake View"})
+        mock_claim.assert_called_once_with(cursor, 9, "Lake View")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,265 @@
+"""
+Query plan regression tests.
+
+Builds a scratch tenant database from schema.sql plus migrate_tenants, seeds
+enough rows for the optimizer to prefer indexes, then runs EXPLAIN on every
+keyed query the app issues. A query whose plan touches any table with
+access type ALL (full table scan) fails the suite.
+
+Needs a MySQL server; connection details come from the usual DB_HOST /
+DB_USER / DB_PASSWORD variables. Skipped when no server is reachable.
+"""
+import os
+import unittest
+
+import mysql.connector
+from dotenv import load_dotenv
+
+import migrate_tenants
+import project_ids
+from plot_utils import PLOT_KEY_SQL, PLOT_NUM_SQL, normalize_plot_key, plot_num
+
+load_dotenv()
+
+TEST_DB = os.getenv("PLAN_TEST_DB_NAME", "plotpro_plan_test")
+
+PROJECTS = ["Vishvam", "Srinidhi", "Green Acres", "Lake View", "Sunrise"]
+PLOTS_PER_PROJECT = 300
+
+# (name, sql, params) - keep in sync with the queries in receipt_app.py
+_BY_ID = project_ids.filter_sql()
+_RECEIPT_COLUMNS = project_ids.columns("receipts")
+
+PLAN_QUERIES = [
+    ("plot_lookup",
+     f"SELECT {_RECEIPT_COLUMNS} FROM receipts WHERE plot_key = %s AND {_BY_ID} ORDER BY id DESC LIMIT 1",
+     ("12", "Vishvam")),
+    ("plot_detail",
+     f"SELECT {_RECEIPT_COLUMNS} FROM receipts WHERE plot_key = %s ORDER BY date DESC, id DESC",
+     ("12",)),
+    ("search_by_plot exact",
+     f"SELECT {_RECEIPT_COLUMNS} FROM receipts WHERE plot_key = %s AND {_BY_ID} ORDER BY id DESC",
+     ("12", "Vishvam")),
+    ("search_by_plot partial match (plot index candidates)",
+     f"SELECT {_RECEIPT_COLUMNS} FROM receipts WHERE ({_BY_ID} AND plot_key = %s) OR ({_BY_ID} AND plot_key = %s) "
+     f"ORDER BY id DESC",
+     ("Vishvam", "12", "Srinidhi", "120")),
+    ("view_commissions plot search",
+     f"SELECT DISTINCT plot_no, {project_ids.name_sql('commissions')} AS project_name FROM commissions "
+     f"WHERE {_BY_ID} AND plot_key IN (%s, %s)",
+     ("Vishvam", "12", "120")),
+    ("sold plots for project",
+     f"SELECT DISTINCT plot_no FROM receipts WHERE {_BY_ID} AND plot_no IS NOT NULL AND plot_no != ''",
+     ("Vishvam",)),
+    ("dashboard sold count",
+     f"SELECT COUNT(DISTINCT plot_no) FROM receipts WHERE {_BY_ID} AND plot_no IS NOT NULL AND plot_no != ''",
+     ("Vishvam",)),
+    ("account_summary plot totals",
+     "SELECT COALESCE(pr.name, r.project_name), r.plot_no, SUM(r.amount_numeric), p.basic_price, p.square_yards "
+     "FROM receipts r LEFT JOIN projects pr ON pr.id = r.project_id "
+     "LEFT JOIN plots p ON p.project_name = COALESCE(pr.name, r.project_name) AND p.plot_key = r.plot_key "
+     f"WHERE {project_ids.filter_sql('r')} AND r.plot_no IS NOT NULL AND r.plot_no != '' "
+     "GROUP BY COALESCE(pr.name, r.project_name), r.plot_no, p.basic_price, p.square_yards",
+     ("Vishvam",)),
+    ("plot master row",
+     "SELECT plot_no, basic_price, square_yards, customer_name FROM plots "
+     "WHERE project_name = %s AND plot_key = %s",
+     ("Vishvam", "12")),
+    ("delete_project receipt count",
+     "SELECT COUNT(*) FROM receipts WHERE project_id = %s",
+     (1,)),
+    ("update_project rename plot_status_log",
+     "UPDATE plot_status_log SET project_name = %s WHERE project_name = %s",
+     ("Vishvam Phase 1", "Vishvam")),
+    ("delete_receipts_detail",
+     f"SELECT {_RECEIPT_COLUMNS} FROM receipts WHERE plot_key = %s AND {_BY_ID} ORDER BY date DESC, id DESC",
+     ("12", "Vishvam")),
+    ("bulk_delete_plots",
+     f"DELETE FROM receipts WHERE plot_key = %s AND {_BY_ID}",
+     ("12", "Vishvam")),
+    ("bulk_delete_plots without project",
+     "DELETE FROM receipts WHERE plot_key = %s",
+     ("12",)),
+    ("import deduplication",
+     "SELECT id FROM receipts WHERE no = %s OR instrument_no = %s",
+     ("100123", "100123")),
+    ("commission search",
+     f"SELECT id FROM commissions WHERE plot_key = %s AND {_BY_ID} ORDER BY id DESC LIMIT 1",
+     ("12", "Vishvam")),
+    ("commission search without project",
+     "SELECT id FROM commissions WHERE plot_key = %s ORDER BY id DESC LIMIT 1",
+     ("12",)),
+    ("view_commission_detail",
+     f"SELECT {project_ids.columns('commissions')} FROM commissions WHERE {_BY_ID} AND plot_key = %s "
+     f"ORDER BY id DESC LIMIT 1",
+     ("Vishvam", "12")),
+    ("view_commissions for project",
+     f"SELECT DISTINCT plot_no, {project_ids.name_sql('commissions')} AS project_name, cgm_name, srgm_name, "
+     f"gm_name, total_amount FROM commissions WHERE {_BY_ID}",
+     ("Vishvam",)),
+    ("cgm_plot_sales for project",
+     "SELECT COALESCE(c.cgm_name, 'Unknown') AS cgm_name, COUNT(DISTINCT r.plot_no) FROM receipts r "
+     "LEFT JOIN commissions c ON c.project_id = r.project_id AND c.plot_key = r.plot_key "
+     f"WHERE r.plot_no IS NOT NULL AND r.plot_no != '' AND {project_ids.filter_sql('r')} GROUP BY 1",
+     ("Vishvam",)),
+    ("pending_receipts",
+     "SELECT * FROM pending_receipts WHERE status = 'pending' ORDER BY submitted_at DESC",
+     ()),
+    ("dashboard pending count",
+     "SELECT COUNT(*) FROM pending_receipts WHERE status = 'pending'",
+     ()),
+    ("plot-status high-water mark",
+     "SELECT MAX(seq) FROM plot_status_log WHERE project_name = %s",
+     ("Vishvam",)),
+    ("plot-status changes since",
+     "SELECT DISTINCT plot_no FROM plot_status_log WHERE project_name = %s AND seq > %s AND seq <= %s",
+     ("Vishvam", 100, 200)),
+    ("field sync changed projects",
+     "SELECT DISTINCT project_name FROM plot_status_log WHERE seq > %s AND seq <= %s",
+     (100, 200)),
+    ("plot-status sold state of changed plots",
+     f"SELECT DISTINCT plot_key FROM receipts WHERE {_BY_ID} AND plot_key IN (%s, %s)",
+     ("Vishvam", "12", "13")),
+    ("plot_layouts for project",
+     f"SELECT plot_no, facing, status FROM plot_layouts WHERE {_BY_ID}",
+     ("Vishvam",)),
+    ("change feed page",
+     "SELECT seq, entity, entity_id, op, changed_by, changed_at, data FROM change_log "
+     "WHERE seq > %s ORDER BY seq LIMIT %s",
+     (100, 501)),
+    ("plot mapping upsert existing rows",
+     f"SELECT plot_no FROM plot_layouts WHERE {_BY_ID} AND plot_no IN (%s, %s)",
+     ("Vishvam", "12", "13")),
+] + [
+    (f"mediator_details {role}",
+     f"SELECT c.plot_no, e.total_amount FROM commission_{role}_entries e "
+     f"JOIN commissions c ON e.commission_id = c.id WHERE e.name = %s",
+     ("Person 7",))
+    for role in ("srgm", "gm", "dgm", "agm")
+]
+
+
+def _server_connection(database=None):
+    return mysql.connector.connect(
+        host=os.getenv("DB_HOST", "localhost"),
+        user=os.getenv("DB_USER", "root"),
+        password=os.getenv("DB_PASSWORD", ""),
+        database=database,
+        connection_timeout=3,
+    )
+
+
+class QueryPlanTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        try:
+            server = _server_connection()
+        except mysql.connector.Error as e:
+            raise unittest.SkipTest(f"MySQL not reachable: {e}")
+        c = server.cursor()
+        c.execute(f"DROP DATABASE IF EXISTS `{TEST_DB}`")
+        c.execute(f"CREATE DATABASE `{TEST_DB}`")
+        server.close()
+
+        cls.conn = _server_connection(TEST_DB)
+        c = cls.conn.cursor()
+        schema_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+        with open(schema_path) as f:
+            for statement in f.read().split(";"):
+                stmt = statement.strip()
+                if stmt:
+                    try:
+                        c.execute(stmt)
+                    except mysql.connector.Error:
+                        # mysqldump SET/comment statements that do not apply
+                        pass
+        cls.conn.commit()
+        migrate_tenants.apply_migrations(cls.conn)
+        cls._seed(c)
+        cls.conn.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+        server = _server_connection()
+        server.cursor().execute(f"DROP DATABASE IF EXISTS `{TEST_DB}`")
+        server.close()
+
+    @classmethod
+    def _seed(cls, c):
+        receipts = []
+        commissions = []
+        layouts = []
+        n = 0
+        for project in PROJECTS:
+            for plot in range(1, PLOTS_PER_PROJECT + 1):
+                for _ in range(2):
+                    n += 1
+                    receipts.append((str(100000 + n), project, "2025-01-01", f"Customer {plot}",
+                                     10000.0, str(plot), "200", "Cheque", f"CHQ{n}"))
+                commissions.append((str(plot), project, 200.0, f"CGM {plot % 20}"))
+                layouts.append((project, str(plot), "East", "available"))
+        c.executemany(
+            "INSERT INTO receipts (no, project_name, date, customer_name, amount_numeric, plot_no, "
+            "square_yards, payment_mode, instrument_no) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+            receipts,
+        )
+        c.executemany(
+            "INSERT INTO commissions (plot_no, project_name, sq_yards, cgm_name) VALUES (%s, %s, %s, %s)",
+            commissions,
+        )
+        c.executemany(
+            "INSERT INTO plot_layouts (project_name, plot_no, facing, status) VALUES (%s, %s, %s, %s)",
+            layouts,
+        )
+        c.executemany(
+            "INSERT INTO pending_receipts (no, project_name, plot_no, submitted_at, status) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            [(f"P{i}", "Vishvam", str(i), f"2025-01-{i % 28 + 1:02d}",
+              "pending" if i % 50 == 0 else "approved") for i in range(1500)],
+        )
+        c.executemany(
+            "INSERT INTO plot_status_log (project_name, plot_no) VALUES (%s, %s)",
+            [(project, plot) for project, plot, _, _ in layouts],
+        )
+        for table in project_ids.TABLES:
+            project_ids.add_missing_projects(c, table)
+            project_ids.backfill(c, table)
+        c.execute("SELECT id FROM commissions")
+        ids = [row[0] for row in c.fetchall()]
+        for role in ("srgm", "gm", "dgm", "agm"):
+            c.executemany(
+                f"INSERT INTO commission_{role}_entries (commission_id, name, total_amount) VALUES (%s, %s, %s)",
+                [(cid, f"Person {cid % 200}", 1000) for cid in ids],
+            )
+        for table in ("receipts", "commissions", "plot_layouts", "pending_receipts", "plot_status_log",
+                      "commission_srgm_entries", "commission_gm_entries",
+                      "commission_dgm_entries", "commission_agm_entries"):
+            c.execute(f"ANALYZE TABLE `{table}`")
+            c.fetchall()
+
+    def test_no_full_table_scans(self):
+        c = self.conn.cursor(dictionary=True)
+        for name, sql, params in PLAN_QUERIES:
+            with self.subTest(query=name):
+                c.execute("EXPLAIN " + sql, params)
+                plan = c.fetchall()
+                scans = [row["table"] for row in plan if row.get("type") == "ALL"]
+                self.assertEqual(scans, [], f"{name} does a full scan of {scans}: {plan}")
+
+    def test_plot_key_matches_python_normalisation(self):
+        c = self.conn.cursor()
+        samples = ["12", " 12 ", "12.0", "A-7", "b12", "10.05", ".0"]
+        for raw in samples:
+            with self.subTest(plot_no=raw):
+                c.execute("SELECT " + PLOT_KEY_SQL + ", " + PLOT_NUM_SQL + " FROM (SELECT %s AS plot_no) t", (raw,))
+                key, num = c.fetchone()
+                self.assertEqual(key, normalize_plot_key(raw))
+                self.assertEqual(num, plot_num(raw))
+
+    def test_migrations_are_idempotent(self):
+        self.assertEqual(migrate_tenants.apply_migrations(self.conn), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import openpyxl
+
+import receipt_import
+
+MAPPING = {"plot_no": 0, "date": 1, "amount": 2, "customer": 3, "payment_mode": 4,
+           "receipt_no": 5, "sq_yards": 6, "basic_price": 7}
+
+
+def words(amount):
+    return f"{int(amount)} Only"
+
+
+class SheetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "import.xlsx")
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.append(["Vishvam bookings"])
+        ws.append(["Plot", "Date", "Amount", "Customer", "Mode", "Receipt", "Sq Yds", None])
+        ws.append([12, datetime(2024, 1, 5), 50000, "Ravi", "Cash", "R-101", 200, 5500])
+        ws.append([None, "06.01.2024", 25000, None, "UPI", None, None, None])
+        ws.append([None, None, None, None, None, None, None, None])
+        ws.append(["14.0", "2024-02-01", "10000", "Sita", None, "R-101", None, "n/a"])
+        ws.append([None, None, 0, None, None, None, None, None])
+        wb.save(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_headers_only_read_header_row(self):
+        headers = receipt_import.read_headers(self.path)
+        self.assertEqual(headers[:3], ["Plot", "Date", "Amount"])
+        self.assertEqual(headers[7], "Column 8")
+
+    def test_parse_groups_rows_by_plot(self):
+        summary = receipt_import.new_summary()
+        receipts = list(receipt_import.parse_rows(receipt_import.iter_sheet_rows(self.path), MAPPING,
+                                                  summary, words))
+        self.assertEqual(summary['total_rows'], 5)
+        self.assertEqual([(r["row"], r["plot_no"], r["customer_name"], r["date"]) for r in receipts], [
+            (3, "12", "Ravi", "2024-01-05"),
+            (4, "12", "Ravi", "2024-01-06"),
+            (6, "14", "Sita", "2024-02-01"),
+        ])
+        self.assertEqual(receipts[0]["no"], "101")
+        self.assertTrue(receipts[1]["no"].startswith("IMP-12-"))
+        self.assertEqual(receipts[0]["basic_price"], 5500.0)
+        self.assertIsNone(receipts[2]["basic_price"])
+        self.assertEqual(receipts[2]["payment_mode"], "Unknown")
+
+    def test_amount_without_plot_is_an_error(self):
+        summary = receipt_import.new_summary()
+        list(receipt_import.parse_rows([(3, (None, None, 100))], MAPPING, summary, words))
+        self.assertEqual(len(summary['errors']), 1)
+
+
+class CsvTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _write(self, name, text, encoding="utf-8"):
+        path = os.path.join(self.tmp, name)
+        with open(path, "w", encoding=encoding, newline="") as f:
+            f.write(text)
+        return path
+
+    def _receipts(self, path):
+        summary = receipt_import.new_summary()
+        return list(receipt_import.parse_rows(receipt_import.iter_rows(path), MAPPING, summary, words)), summary
+
+    def test_semicolon_csv_with_title_row(self):
+        path = self._write("bookings.csv", "\ufeffVishvam bookings;;;\n"
+                           "Plot;Date;Amount;Customer;Mode;Receipt\n"
+                           "12;05.01.2024;\"50,000\";Ravi;Cash;R-101\n"
+                           ";06.01.2024;25000;;UPI;\n", encoding="utf-8")
+        self.assertEqual(receipt_import.read_headers(path)[:3], ["Plot", "Date", "Amount"])
+        receipts, summary = self._receipts(path)
+        self.assertEqual([(r["row"], r["plot_no"], r["amount"], r["customer_name"]) for r in receipts],
+                         [(3, "12", 50000.0, "Ravi"), (4, "12", 25000.0, "Ravi")])
+        self.assertEqual(summary['total_rows'], 2)
+
+    def test_tsv_header_on_first_row_and_cp1252(self):
+        path = self._write("bookings.tsv", "Plot\tDate\tAmount\tCustomer\n"
+                           "7\t2024-03-01\t1000\tJos\u00e9\n", encoding="cp1252")
+        receipts, _ = self._receipts(path)
+        self.assertEqual([(r["row"], r["customer_name"]) for r in receipts], [(2, "Jos\u00e9")])
+
+    def test_detect_encoding(self):
+        self.assertEqual(receipt_import.detect_encoding("caf\u00e9".encode("utf-8")[:-1]), "utf-8")
+        self.assertEqual(receipt_import.detect_encoding("caf\u00e9 ok".encode("cp1252")), "cp1252")
+        self.assertEqual(receipt_import.detect_encoding("a".encode("utf-16")), "utf-16")
+
+
+class WriteBatchTestCase(unittest.TestCase):
+    def _receipt(self, row, no):
+        return {"row": row, "date": "2024-01-01", "plot_no": "1", "customer_name": "A", "amount": 10.0,
+                "amount_words": "Ten Only", "payment_mode": "Cash", "no": no,
+                "project_name": "Vishvam", "sq_yards": None, "basic_price": None}
+
+    def test_skips_existing_and_repeated_numbers(self):
+        cursor = MagicMock()
+        summary = receipt_import.new_summary()
+        existing = {"101", "102"}
+        batch = [self._receipt(3, "101"), self._receipt(4, "102"), self._receipt(5, "103"), self._receipt(6, "103")]
+        inserted = receipt_import.write_batch(cursor, batch, existing, summary)
+        self.assertEqual([r["no"] for r in inserted], ["103"])
+        self.assertEqual((summary['imported'], summary['skipped']), (1, 3))
+        self.assertIn("103", existing)
+        ensure, insert = cursor.executemany.call_args_list
+        self.assertEqual(ensure.args[1], [("Vishvam",)])
+        self.assertEqual(insert.args[0], receipt_import.INSERT_SQL)
+        cursor.execute.assert_not_called()
+
+    def test_existing_numbers_streams_lowercased(self):
+        cursor = MagicMock()
+        cursor.fetchmany.side_effect = [[("R-1",), ("55",)], [("abc",)], []]
+        self.assertEqual(receipt_import.existing_numbers(cursor), {"r-1", "55", "abc"})
+        self.assertEqual(cursor.execute.call_count, 1)
+
+    def test_falls_back_to_single_rows_on_error(self):
+        cursor = MagicMock()
+        cursor.executemany.side_effect = [None, Exception("bad batch")]
+        cursor.execute.side_effect = [None, Exception("Data too long")]
+        summary = receipt_import.new_summary()
+        inserted = receipt_import.write_batch(cursor, [self._receipt(3, "1"), self._receipt(4, "2")], set(), summary)
+        self.assertEqual([r["no"] for r in inserted], ["1"])
+        self.assertEqual(summary['imported'], 1)
+        self.assertIn("Row 4", summary['errors'][0])
+
+
+class ImportRowsTestCase(unittest.TestCase):
+    @patch("receipt_import.plot_master.record")
+    @patch("receipt_import.change_log.record_receipts")
+    @patch("receipt_import.data_versions.bump")
+    @patch("receipt_import.plot_status_log.record")
+    @patch("receipt_import.BATCH_SIZE", 2)
+    def test_commits_each_batch(self, mock_record, mock_bump, mock_log, mock_plots):
+        conn = MagicMock()
+        cursor = conn.cursor.return_value
+        cursor.fetchmany.side_effect = [[("3",)], []]
+        rows = [(3, (1, None, 100, None, None, 1)), (4, (None, None, 100, None, None, 2)),
+                (5, (2, None, 100, None, None, 3)), (6, (2, None, 100, None, None, 4))]
+        summary = receipt_import.new_summary()
+        plots = receipt_import.import_rows(conn, rows, MAPPING, summary, words)
+        self.assertEqual(plots, {("Vishvam", "1"), ("Vishvam", "2")})
+        self.assertEqual((summary['imported'], summary['skipped']), (3, 1))
+        # Each batch: the projects rows, then the receipts
+        self.assertEqual(cursor.executemany.call_count, 4)
+        self.assertEqual(conn.commit.call_count, 2)
+        self.assertEqual(mock_bump.call_count, 2)
+        # Second batch: receipt 3 was already there, so only 4 is logged
+        self.assertEqual(mock_log.call_args[0][3], ("Vishvam", "4"))
+        self.assertEqual([row[1] for row in mock_plots.call_args[0][1]], ["2"])
+
+    def test_rolls_back_on_failure(self):
+        conn = MagicMock()
+        cursor = conn.cursor.return_value
+        cursor.fetchmany.return_value = []
+        conn.commit.side_effect = Exception("lost connection")
+        with self.assertRaises(Exception):
+            receipt_import.import_rows(conn, [(3, (1, None, 100))], MAPPING, receipt_import.new_summary(), words)
+        conn.rollback.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()